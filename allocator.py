@@ -0,0 +1,189 @@
+"""
+跨机会资金分配
+
+一个周期内多个市场可能同时出现机会，按扫描顺序逐个下单会把资金花在先被扫描到的市场上。
+CapitalAllocator 把本周期的候选机会放进优先堆，按
+    单位资金利润 / 资金占用时间（每美元每秒的预期利润）
+从高到低依次分配资金，每个机会的预算不超过 ARBITRAGE_ORDER_USDC，
+并且每条腿所在平台的可用余额足够（各腿份数相同，见 sizing.py）。
+
+建堆 O(n)，分配 k 个机会 O(k log n)；所有平台余额用完后立即停止。
+"""
+import time
+import heapq
+import logging
+from typing import Optional, Dict, List, NamedTuple
+from config import Config, MAX_POSITION_SIZE
+from sizing import size_opportunity
+from ticks import ONE, PRICE_SCALE, price_to_ticks, size_to_units, units_to_size
+
+logger = logging.getLogger(__name__)
+
+# 资金占用时间的下限（秒），避免即将结算的市场得分无穷大
+MIN_LOCKUP_SECONDS = 60.0
+
+
+class Allocation(NamedTuple):
+    """一个机会分到的资金"""
+    opportunity: Dict
+    position_size: float          # 交给执行器的预算（USD）
+    shares: int                   # 预计份数（数量单位）
+    reserved: Dict[str, int]      # 各平台占用的资金（金额单位）
+    score: float                  # 每美元每秒的预期利润
+
+
+def leg_venues(opportunity: Dict) -> List[str]:
+    """机会每条腿所在的平台（与 sizing.opportunity_legs 的腿顺序一致）"""
+    kind = opportunity.get("type")
+    if kind == "complete_set":
+        return ["polymarket", "polymarket"]
+    if kind == "multi_outcome":
+        return [leg["venue"] for leg in opportunity["legs"]]
+    return ["polymarket", "opinion"]
+
+
+def lockup_seconds(opportunity: Dict, now: float = None) -> float:
+    """资金占用到结算的时间（秒）；机会带 end_time（Unix 秒）时按剩余时间，否则使用配置值"""
+    end_time = opportunity.get("end_time")
+    if not end_time:
+        return max(Config.CAPITAL_LOCKUP_SECONDS, MIN_LOCKUP_SECONDS)
+    now = time.time() if now is None else now
+    return max(float(end_time) - now, MIN_LOCKUP_SECONDS)
+
+
+def score(opportunity: Dict, now: float = None) -> float:
+    """每美元每秒的预期利润"""
+    cost = opportunity.get("total_cost_ticks") or price_to_ticks(opportunity["total_cost"])
+    if opportunity.get("side") == "SELL":
+        # 卖出完整组合: 先用 1 USDC 拆分出一份组合，利润 = 卖出收入 - 1，资金当场收回
+        return (cost - ONE) / ONE / MIN_LOCKUP_SECONDS
+    if cost <= 0:
+        return 0.0
+    return (ONE - cost) / cost / lockup_seconds(opportunity, now)
+
+
+class CapitalAllocator:
+    """按优先级在同时出现的机会之间分配各平台余额"""
+    
+    def __init__(self, balances: Dict[str, Optional[float]] = None, max_position_size: float = None):
+        """
+        Args:
+            balances: 平台名 -> 可用余额（USD），None 表示不限制；默认使用配置
+            max_position_size: 单个机会的最大预算（USD）
+        """
+        if balances is None:
+            balances = {"polymarket": Config.POLYMARKET_BALANCE, "opinion": Config.OPINION_BALANCE}
+        self.available: Dict[str, Optional[int]] = {
+            venue: None if balance is None else size_to_units(balance) for venue, balance in balances.items()
+        }
+        self.max_position_size = MAX_POSITION_SIZE if max_position_size is None else max_position_size
+        self.stats = {"candidates": 0, "funded": 0, "unfunded": 0}
+    
+    def set_balance(self, venue: str, balance: Optional[float]):
+        """更新平台可用余额（USD），None 表示不限制"""
+        self.available[venue] = None if balance is None else size_to_units(balance)
+    
+    def allocate(self, opportunities: List[Dict], now: float = None) -> List[Allocation]:
+        """
+        为本周期的候选机会分配资金，并从可用余额中预留
+        
+        Args:
+            opportunities: 候选机会
+            now: 当前 Unix 时间（计算剩余占用时间）
+        
+        Returns:
+            按优先级排序的分配结果；余额不足以达到最小下单量的机会不在结果中
+        """
+        now = time.time() if now is None else now
+        # 堆元素: (-得分, 序号, 机会)，序号保证同分时按原顺序且不比较字典
+        heap = [(-score(opportunity, now), i, opportunity) for i, opportunity in enumerate(opportunities)]
+        heapq.heapify(heap)
+        self.stats["candidates"] += len(heap)
+        
+        allocations = []
+        while heap and not self._exhausted():
+            neg_score, _, opportunity = heapq.heappop(heap)
+            if -neg_score <= 0:
+                break
+            allocation = self._fund(opportunity, -neg_score)
+            if allocation is None:
+                self.stats["unfunded"] += 1
+                logger.debug(f"余额不足以达到最小下单量，跳过: {opportunity.get('market_id')} {opportunity.get('strategy')}")
+                continue
+            allocations.append(allocation)
+        self.stats["funded"] += len(allocations)
+        self.stats["unfunded"] += len(heap)
+        return allocations
+    
+    def _exhausted(self) -> bool:
+        return all(balance is not None and balance <= 0 for balance in self.available.values())
+    
+    def _fund(self, opportunity: Dict, priority: float) -> Optional[Allocation]:
+        budget = self.max_position_size
+        if opportunity.get("side") == "SELL":
+            return self._fund_sell(opportunity, priority, budget)
+        
+        sized = size_opportunity(opportunity, budget)
+        if not sized.shares:
+            return None
+        # 每个平台每份需要的资金（价格单位），余额不足时按可负担的预算重新计算（仍按最小下单量 / 数量步长取整）
+        per_share = self._per_share(leg_venues(opportunity), sized.prices)
+        affordable = self._affordable_shares(per_share)
+        if affordable is not None and affordable < sized.shares:
+            sized = size_opportunity(opportunity, units_to_size(affordable * sized.cost // PRICE_SCALE))
+            if not sized.shares:
+                return None
+        # 预算向上取整，执行器按同样的规则计算出相同的份数
+        position_size = units_to_size(-(-sized.shares * sized.cost // PRICE_SCALE))
+        return self._reserve(opportunity, priority, position_size, sized.shares, per_share)
+    
+    def _fund_sell(self, opportunity: Dict, priority: float, budget: float) -> Optional[Allocation]:
+        # 卖出完整组合: 每份先占用 1 USDC 拆分，卖出收入当场收回
+        per_share = {"polymarket": ONE}
+        shares = min(size_to_units(opportunity["size"]), size_to_units(budget))
+        affordable = self._affordable_shares(per_share)
+        if affordable is not None:
+            shares = min(shares, affordable)
+        if shares <= 0:
+            return None
+        # 执行器按 预算 / total_cost 计算卖出份数
+        position_size = units_to_size(shares) * opportunity["total_cost"]
+        return self._reserve(opportunity, priority, position_size, shares, per_share)
+    
+    @staticmethod
+    def _per_share(venues: List[str], prices) -> Dict[str, int]:
+        per_share: Dict[str, int] = {}
+        for venue, price in zip(venues, prices):
+            per_share[venue] = per_share.get(venue, 0) + price
+        return per_share
+    
+    def _affordable_shares(self, per_share: Dict[str, int]) -> Optional[int]:
+        """各平台余额允许的最多份数（数量单位），都不限制时返回 None"""
+        limits = [
+            self.available[venue] * PRICE_SCALE // price_sum
+            for venue, price_sum in per_share.items()
+            if self.available.get(venue) is not None and price_sum > 0
+        ]
+        return min(limits) if limits else None
+    
+    def _reserve(self, opportunity: Dict, priority: float, position_size: float,
+                 shares: int, per_share: Dict[str, int]) -> Allocation:
+        reserved = {venue: -(-shares * price_sum // PRICE_SCALE) for venue, price_sum in per_share.items()}
+        for venue, amount in reserved.items():
+            if self.available.get(venue) is not None:
+                self.available[venue] -= amount
+        return Allocation(opportunity, position_size, shares, reserved, priority)
+    
+    def release(self, allocation: Allocation):
+        """执行失败时归还预留的资金"""
+        for venue, amount in allocation.reserved.items():
+            if self.available.get(venue) is not None:
+                self.available[venue] += amount
+    
+    def get_stats(self) -> Dict:
+        """分配统计和各平台剩余可用余额（USD）"""
+        stats = dict(self.stats)
+        stats["available"] = {
+            venue: None if balance is None else units_to_size(balance) for venue, balance in self.available.items()
+        }
+        return stats
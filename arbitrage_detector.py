@@ -3,9 +3,12 @@
 """
 import logging
 import json
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 from polymarket_client import PolymarketClient
 from opinion_trade_client import OpinionTradeClient
+from multi_outcome import detect_multi_outcome, MultiOutcomeBook
+from stale_guard import StaleGuard, opportunity_legs
+from ticks import ONE, PRICE_SCALE, SIZE_SCALE, price_to_ticks, ticks_to_price, units_to_size, quote_from_book
 from config import (
     Config,
     ARBITRAGE_MAX_SUM_PRICE, 
@@ -16,6 +19,287 @@ from config import (
 
 logger = logging.getLogger(__name__)
 
+# 随价格一起传递给 detect_arbitrage 的市场字段
+MARKET_FIELDS = ("market_id", "condition_id", "poly_up_token_id", "poly_down_token_id",
+                 "opinion_up_token_id", "tick_size", "end_time")
+
+
+def market_fields(market: Dict) -> Dict:
+    """从市场配置中取出需要随价格传递的字段"""
+    return {key: market[key] for key in MARKET_FIELDS if market.get(key)}
+
+
+# 阈值换算为整数价格单位，检测时只做整数比较
+MAX_SUM_TICKS = price_to_ticks(ARBITRAGE_MAX_SUM_PRICE)
+MIN_PROFIT_TICKS = price_to_ticks(MIN_PROFIT_MARGIN)
+
+# (策略名, Polymarket 方向, Opinion.trade 方向)
+STRATEGIES = (
+    ("Poly_UP + Opinion_DOWN", "UP", "DOWN"),
+    ("Poly_DOWN + Opinion_UP", "DOWN", "UP"),
+)
+
+
+def detect_arbitrage_ticks(poly_up: int, poly_down: int, opinion: int,
+                           opinion_bid: int = None) -> Optional[Tuple[int, int, int]]:
+    """
+    整数价格单位下的套利检测（热路径）
+    
+    买入腿一律按卖方报价（ask）计价：最优买价（bid）只是别人愿意买入的价格，
+    用它当作买入价会高估利润，产生实际无法成交的"幻影"机会
+    
+    Args:
+        poly_up: Polymarket UP 最优卖价（价格单位）
+        poly_down: Polymarket DOWN 最优卖价（价格单位）
+        opinion: Opinion.trade UP 最优卖价（价格单位）
+        opinion_bid: Opinion.trade UP 最优买价，默认与 opinion 相同（单一价格）
+    
+    Returns:
+        (策略序号, Polymarket 腿价格, Opinion.trade 腿价格)，没有机会返回 None
+    """
+    # 策略1: Polymarket UP + Opinion.trade DOWN
+    # 买入 Opinion.trade DOWN 等价于按 UP 最优买价卖出 UP: DOWN 价格 = 1 - UP bid
+    opinion_down = ONE - (opinion if opinion_bid is None else opinion_bid)
+    strategy1_cost = poly_up + opinion_down
+    
+    # 策略2: Polymarket DOWN + Opinion.trade UP
+    strategy2_cost = poly_down + opinion
+    
+    best = None
+    if strategy1_cost < MAX_SUM_TICKS and ONE - strategy1_cost >= MIN_PROFIT_TICKS:
+        best = (0, poly_up, opinion_down)
+    if strategy2_cost < MAX_SUM_TICKS and ONE - strategy2_cost >= MIN_PROFIT_TICKS:
+        if best is None or strategy2_cost < strategy1_cost:
+            best = (1, poly_down, opinion)
+    return best
+
+
+def _price_ticks(prices: Dict, key: str, *fallback_keys: str) -> Optional[int]:
+    """从价格字典取整数价格，优先使用 <key>_ticks 字段"""
+    ticks = prices.get(f"{key}_ticks")
+    if ticks is not None:
+        return ticks
+    for name in (key,) + fallback_keys:
+        value = prices.get(name)
+        if value:
+            return price_to_ticks(value)
+    return None
+
+
+def detect_arbitrage(prices: Dict) -> Optional[Dict]:
+    """
+    检测套利机会
+    
+    不依赖任何客户端，可以在多进程检测 worker 中直接调用。
+    价格先换算为整数价格单位（见 ticks.py），成本和阈值比较都是精确的整数运算。
+    
+    Args:
+        prices: 价格字典，polymarket_up / polymarket_down / opinion_trade 为买入价（ask），
+            可带 opinion_trade_bid_ticks；也可携带 market_id / condition_id / token_id 等市场信息
+    
+    Returns:
+        套利机会信息，如果没有则返回None
+    """
+    try:
+        poly_up = _price_ticks(prices, "polymarket_up", "polymarket_yes")
+        poly_down = _price_ticks(prices, "polymarket_down", "polymarket_no")
+        opinion = _price_ticks(prices, "opinion_trade")
+        
+        if not all([poly_up, poly_down, opinion]):
+            return None
+        
+        best = detect_arbitrage_ticks(poly_up, poly_down, opinion, prices.get("opinion_trade_bid_ticks"))
+        if best is None:
+            return None
+        
+        index, poly_ticks, opinion_ticks = best
+        strategy, poly_side, opinion_side = STRATEGIES[index]
+        up_token_id = prices.get("poly_up_token_id") or POLYMARKET_UP_TOKEN_ID
+        down_token_id = prices.get("poly_down_token_id") or POLYMARKET_DOWN_TOKEN_ID
+        cost_ticks = poly_ticks + opinion_ticks
+        profit = ticks_to_price(ONE - cost_ticks)
+        
+        best_strategy = {
+            "type": "cross_venue",
+            "strategy": strategy,
+            "poly_side": poly_side,
+            "poly_token_id": up_token_id if poly_side == "UP" else down_token_id,
+            "poly_hedge_token_id": down_token_id if poly_side == "UP" else up_token_id,
+            "opinion_side": opinion_side,
+            "poly_price": ticks_to_price(poly_ticks),
+            "opinion_price": ticks_to_price(opinion_ticks),
+            "total_cost": ticks_to_price(cost_ticks),
+            "profit": profit,
+            "profit_percent": profit * 100,
+            "poly_price_ticks": poly_ticks,
+            "opinion_price_ticks": opinion_ticks,
+            "total_cost_ticks": cost_ticks
+        }
+        
+        # 最优档位的可成交数量（份），供执行器按深度封顶下单份数
+        poly_quote = prices.get("polymarket_up_quote" if poly_side == "UP" else "polymarket_down_quote")
+        if poly_quote is not None and poly_quote.ask_size is not None:
+            best_strategy["poly_size"] = units_to_size(poly_quote.ask_size)
+        opinion_quote = prices.get("opinion_trade_quote")
+        if opinion_quote is not None:
+            # 买入 DOWN 对应按 UP bid 卖出 UP
+            opinion_size = opinion_quote.bid_size if opinion_side == "DOWN" else opinion_quote.ask_size
+            if opinion_size is not None:
+                best_strategy["opinion_size"] = units_to_size(opinion_size)
+        
+        if prices.get("tick_size"):
+            best_strategy["tick_size"] = prices["tick_size"]
+        opinion_topic_id = prices.get("opinion_up_token_id") or Config.OPINION_UP_TOKEN_ID
+        if opinion_topic_id:
+            best_strategy["opinion_topic_id"] = opinion_topic_id
+        if prices.get("market_id"):
+            best_strategy["market_id"] = prices["market_id"]
+            if prices.get("condition_id"):
+                best_strategy["condition_id"] = prices["condition_id"]
+        if prices.get("end_time"):
+            best_strategy["end_time"] = prices["end_time"]
+        
+        return best_strategy
+    except Exception as e:
+        logger.error(f"套利检测失败: {e}")
+        return None
+
+
+def _walk_complete_set(up_levels: List[Tuple[int, int]], down_levels: List[Tuple[int, int]],
+                       limit: int, buy: bool) -> Tuple[int, int]:
+    """
+    逐档撮合 UP / DOWN 两边，累计价格之和仍满足阈值的可成交数量
+    
+    Args:
+        up_levels: UP 档位（最优价格在前）
+        down_levels: DOWN 档位（最优价格在前）
+        limit: 价格之和的阈值（买入时上限，卖出时下限，含等号）
+        buy: True 为买入两边，False 为卖出两边
+    
+    Returns:
+        (可成交数量, 价格之和 * 数量的累计值)
+    """
+    i = j = 0
+    up_left = up_levels[0][1] if up_levels else 0
+    down_left = down_levels[0][1] if down_levels else 0
+    total_size = total_value = 0
+    while i < len(up_levels) and j < len(down_levels):
+        price_sum = up_levels[i][0] + down_levels[j][0]
+        if (price_sum > limit) if buy else (price_sum < limit):
+            break
+        size = min(up_left, down_left)
+        total_size += size
+        total_value += price_sum * size
+        up_left -= size
+        down_left -= size
+        if up_left == 0:
+            i += 1
+            up_left = up_levels[i][1] if i < len(up_levels) else 0
+        if down_left == 0:
+            j += 1
+            down_left = down_levels[j][1] if j < len(down_levels) else 0
+    return total_size, total_value
+
+
+def detect_complete_set(prices: Dict) -> Optional[Dict]:
+    """
+    检测 Polymarket 同平台完整组合套利
+    
+    UP ask + DOWN ask < 1 时买入两边（到期必得 1），UP bid + DOWN bid > 1 时卖出两边。
+    只使用本周期已经获取的订单簿，不产生额外请求。
+    
+    Args:
+        prices: get_books 返回的价格字典（需要 polymarket_up_book / polymarket_down_book）
+    
+    Returns:
+        套利机会信息，包含可成交数量 size；没有则返回 None
+    """
+    up_book = prices.get("polymarket_up_book")
+    down_book = prices.get("polymarket_down_book")
+    if not up_book or not down_book:
+        return None
+    
+    best = None
+    up_asks, down_asks = up_book.get("asks"), down_book.get("asks")
+    if up_asks and down_asks:
+        cost = up_asks[0][0] + down_asks[0][0]
+        if cost < MAX_SUM_TICKS and ONE - cost >= MIN_PROFIT_TICKS:
+            size, value = _walk_complete_set(up_asks, down_asks, min(MAX_SUM_TICKS - 1, ONE - MIN_PROFIT_TICKS), True)
+            best = ("BUY", up_asks[0][0], down_asks[0][0], cost, ONE - cost, size, size * ONE - value)
+    
+    up_bids, down_bids = up_book.get("bids"), down_book.get("bids")
+    if up_bids and down_bids:
+        proceeds = up_bids[0][0] + down_bids[0][0]
+        if proceeds - ONE >= MIN_PROFIT_TICKS and (best is None or proceeds - ONE > best[4]):
+            size, value = _walk_complete_set(up_bids, down_bids, ONE + MIN_PROFIT_TICKS, False)
+            best = ("SELL", up_bids[0][0], down_bids[0][0], proceeds, proceeds - ONE, size, value - size * ONE)
+    
+    if best is None or best[5] <= 0:
+        return None
+    
+    side, up_ticks, down_ticks, total_ticks, profit_ticks, size_units, edge_value = best
+    profit = ticks_to_price(profit_ticks)
+    opportunity = {
+        "type": "complete_set",
+        "strategy": "Poly_UP + Poly_DOWN" if side == "BUY" else "Sell Poly_UP + Poly_DOWN",
+        "side": side,
+        "up_token_id": prices.get("poly_up_token_id") or POLYMARKET_UP_TOKEN_ID,
+        "down_token_id": prices.get("poly_down_token_id") or POLYMARKET_DOWN_TOKEN_ID,
+        "up_price": ticks_to_price(up_ticks),
+        "down_price": ticks_to_price(down_ticks),
+        "total_cost": ticks_to_price(total_ticks),
+        "profit": profit,
+        "profit_percent": profit * 100,
+        "size": units_to_size(size_units),
+        "expected_profit": edge_value / (PRICE_SCALE * SIZE_SCALE)
+    }
+    for key in ("market_id", "condition_id", "tick_size", "end_time"):
+        if prices.get(key):
+            opportunity[key] = prices[key]
+    return opportunity
+
+
+def detect_opportunities(prices: Dict) -> List[Dict]:
+    """
+    在同一批价格 / 订单簿上运行所有策略
+    
+    Args:
+        prices: get_books 返回的价格字典
+    
+    Returns:
+        套利机会列表（跨平台最多一个，完整组合最多一个）
+    """
+    opportunities = []
+    if prices.get("outcome_asks"):
+        # 检测器维护的增量组合簿只重算变化的结果；没有时按本次报价全量计算
+        book = prices.get("outcome_book")
+        if book is not None:
+            opportunity = book.detect()
+        else:
+            opportunity = detect_multi_outcome(prices["outcome_asks"], prices["outcome_names"], prices.get("market_id"))
+        if not opportunity:
+            return []
+        # 补充每条腿在所选平台上的 token_id，供执行器下单
+        for leg, outcome in zip(opportunity["legs"], prices.get("outcome_tokens") or []):
+            leg["token_id"] = outcome.get("poly_token_id" if leg["venue"] == "polymarket" else "opinion_token_id")
+        for key in ("condition_id", "tick_size", "end_time"):
+            if prices.get(key):
+                opportunity[key] = prices[key]
+        return [opportunity]
+    if prices.get("opinion_trade") is not None or prices.get("opinion_trade_ticks") is not None:
+        opportunity = detect_arbitrage(prices)
+        if opportunity:
+            opportunities.append(opportunity)
+    if Config.COMPLETE_SET_ENABLED:
+        try:
+            opportunity = detect_complete_set(prices)
+        except Exception as e:
+            logger.error(f"完整组合检测失败: {e}")
+            opportunity = None
+        if opportunity:
+            opportunities.append(opportunity)
+    return opportunities
+
 
 class ArbitrageDetector:
     """套利机会检测器"""
@@ -23,126 +307,219 @@ class ArbitrageDetector:
     def __init__(self):
         self.polymarket = PolymarketClient()
         self.opinion_trade = OpinionTradeClient()
+        self.stale_guard = StaleGuard()
+        # 多结果市场的增量组合簿: market_id -> MultiOutcomeBook
+        self.outcome_books: Dict[str, MultiOutcomeBook] = {}
+        # 配置 QUOTE_RECORD_FILE 时记录每个周期的双边报价，供 replay.py 回放
+        self.recorder = None
+        if Config.QUOTE_RECORD_FILE:
+            from replay import QuoteRecorder
+            self.recorder = QuoteRecorder(Config.QUOTE_RECORD_FILE)
     
-    def get_prices(self) -> Optional[Dict[str, float]]:
+    def get_books(self, market: Dict = None) -> Optional[Dict]:
         """
-        获取两个平台的价格
+        获取本周期的订单簿和价格（每个 Polymarket token 一次请求）
+        
+        返回的订单簿会被跨平台检测和 Polymarket 完整组合检测共用，不重复请求
+        
+        Args:
+            market: 市场配置（见 Config.load_markets），默认使用单市场配置
         
         Returns:
-            包含两个平台价格的字典
+            价格字典，包含两个 Polymarket 订单簿；Opinion.trade 价格获取失败时不含 opinion_trade
         """
         try:
+            market = market or {}
+            if market.get("outcomes"):
+                return self.get_outcome_books(market)
+            
+            up_token_id = market.get("poly_up_token_id") or POLYMARKET_UP_TOKEN_ID
+            down_token_id = market.get("poly_down_token_id") or POLYMARKET_DOWN_TOKEN_ID
+            
             # 使用配置的 token_id 直接获取价格
-            if not POLYMARKET_UP_TOKEN_ID or not POLYMARKET_DOWN_TOKEN_ID:
+            if not up_token_id or not down_token_id:
                 logger.error("缺少 POLYMARKET_UP_TOKEN_ID 或 POLYMARKET_DOWN_TOKEN_ID 配置")
                 return None
             
-            # 获取 Polymarket UP 价格（对应 YES）
-            poly_price_up = self.polymarket.get_best_price_from_token_id(POLYMARKET_UP_TOKEN_ID)
-            
-            # 获取 Polymarket DOWN 价格（对应 NO）
-            poly_price_down = self.polymarket.get_best_price_from_token_id(POLYMARKET_DOWN_TOKEN_ID)
-            
-            if poly_price_up is None:
-                logger.warning(f"无法获取 Polymarket UP 价格 (token_id: {POLYMARKET_UP_TOKEN_ID})")
-            if poly_price_down is None:
-                logger.warning(f"无法获取 Polymarket DOWN 价格 (token_id: {POLYMARKET_DOWN_TOKEN_ID})")
-            
-            if poly_price_up is None or poly_price_down is None:
+            # 获取 Polymarket UP / DOWN 订单簿（整数价格单位）
+            up_book = self.polymarket.get_book_ticks(up_token_id, Config.POLYMARKET_BOOK_DEPTH)
+            down_book = self.polymarket.get_book_ticks(down_token_id, Config.POLYMARKET_BOOK_DEPTH)
+            if not up_book or not down_book:
+                logger.warning(f"无法获取 Polymarket 订单簿 (UP: {up_token_id}, DOWN: {down_token_id})")
                 return None
+            quote_times = {
+                key: self.stale_guard.stamp("polymarket", book.get("received_at"),
+                                            book.get("received_wall"), book.get("venue_ts"))
+                for key, book in (("polymarket_up", up_book), ("polymarket_down", down_book))
+            }
             
-            # 获取 Opinion.trade 价格
-            opinion_price = self.opinion_trade.get_market_price()
-            
-            if opinion_price is None:
-                logger.warning("无法获取 Opinion.trade 价格")
-                return None
+            # 双边报价: 买入按 ask，卖出按 bid；UP 对应 YES，DOWN 对应 NO
+            up_quote = quote_from_book(up_book)
+            down_quote = quote_from_book(down_book)
+            poly_up_ticks, poly_down_ticks = up_quote.ask, down_quote.ask
             
-            logger.debug(f"价格获取成功 - Poly UP: {poly_price_up:.4f}, Poly DOWN: {poly_price_down:.4f}, Opinion: {opinion_price:.4f}")
+            if poly_up_ticks is None:
+                logger.warning(f"Polymarket UP 没有卖单 (token_id: {up_token_id})")
+            if poly_down_ticks is None:
+                logger.warning(f"Polymarket DOWN 没有卖单 (token_id: {down_token_id})")
             
-            return {
+            poly_price_up = None if poly_up_ticks is None else ticks_to_price(poly_up_ticks)
+            poly_price_down = None if poly_down_ticks is None else ticks_to_price(poly_down_ticks)
+            prices = {
                 "polymarket_up": poly_price_up,
                 "polymarket_down": poly_price_down,
                 "polymarket_yes": poly_price_up,  # 向后兼容
                 "polymarket_no": poly_price_down,  # 向后兼容
-                "opinion_trade": opinion_price
+                "polymarket_up_ticks": poly_up_ticks,
+                "polymarket_down_ticks": poly_down_ticks,
+                "polymarket_up_quote": up_quote,
+                "polymarket_down_quote": down_quote,
+                "polymarket_up_book": up_book,
+                "polymarket_down_book": down_book,
+                "poly_up_token_id": up_token_id,
+                "poly_down_token_id": down_token_id,
+                "quote_times": quote_times
             }
+            if market:
+                prices.update(market_fields(market))
+            
+            # 获取 Opinion.trade 报价
+            opinion_quote = self.opinion_trade.get_quote(market.get("opinion_up_token_id"))
+            # Opinion.trade 暂无平台时间戳，只记录收到时间
+            quote_times["opinion_trade"] = self.stale_guard.stamp("opinion")
+            
+            if opinion_quote is None or opinion_quote.ask is None:
+                logger.warning("无法获取 Opinion.trade 价格")
+                return prices
+            
+            opinion_price = ticks_to_price(opinion_quote.ask)
+            prices["opinion_trade"] = opinion_price
+            prices["opinion_trade_ticks"] = opinion_quote.ask
+            prices["opinion_trade_bid_ticks"] = opinion_quote.bid
+            prices["opinion_trade_quote"] = opinion_quote
+            if self.recorder:
+                self.recorder.record(prices)
+            logger.debug(f"价格获取成功 - Poly UP: {poly_price_up}, Poly DOWN: {poly_price_down}, Opinion: {opinion_price:.4f}")
+            return prices
         except Exception as e:
             logger.error(f"获取价格失败: {e}", exc_info=True)
             return None
     
+    def get_outcome_books(self, market: Dict) -> Optional[Dict]:
+        """
+        获取多结果市场每个结果在各平台的最优卖价
+        
+        Args:
+            market: 带 outcomes 列表的市场配置
+        
+        Returns:
+            价格字典: outcome_names / outcome_asks（平台名 -> 每个结果的 (价格, 数量) 或 None），
+            outcome_book 为该市场的增量组合簿
+        """
+        names = [outcome.get("name", str(i)) for i, outcome in enumerate(market["outcomes"])]
+        market_id = market.get("market_id")
+        outcome_book = self.outcome_books.get(market_id)
+        if outcome_book is None or outcome_book.outcomes != names:
+            outcome_book = self.outcome_books[market_id] = MultiOutcomeBook(names, ["polymarket", "opinion"], market_id)
+        
+        poly_asks, opinion_asks = [], []
+        for i, outcome in enumerate(market["outcomes"]):
+            poly_level = None
+            if outcome.get("poly_token_id"):
+                book = self.polymarket.get_book_ticks(outcome["poly_token_id"], depth=1)
+                if book and book["asks"]:
+                    poly_level = book["asks"][0]
+            poly_asks.append(poly_level)
+            outcome_book.update("polymarket", i, *(poly_level or (None,)))
+            
+            opinion_level = None
+            if outcome.get("opinion_token_id"):
+                opinion_quote = self.opinion_trade.get_quote(outcome["opinion_token_id"])
+                if opinion_quote is not None and opinion_quote.ask is not None:
+                    opinion_level = (opinion_quote.ask, opinion_quote.ask_size)
+            opinion_asks.append(opinion_level)
+            outcome_book.update("opinion", i, *(opinion_level or (None,)))
+        
+        prices = {
+            "outcome_names": names,
+            "outcome_asks": {"polymarket": poly_asks, "opinion": opinion_asks},
+            "outcome_tokens": market["outcomes"],
+            "outcome_book": outcome_book,
+        }
+        prices.update(market_fields(market))
+        return prices
+    
+    def get_prices(self, market: Dict = None) -> Optional[Dict[str, float]]:
+        """
+        获取两个平台的价格
+        
+        Args:
+            market: 市场配置（见 Config.load_markets），默认使用单市场配置
+        
+        Returns:
+            包含两个平台价格的字典，任一平台价格缺失时返回 None
+        """
+        prices = self.get_books(market)
+        if not prices or prices.get("opinion_trade") is None:
+            return None
+        return prices
+    
     def detect_arbitrage(self, prices: Dict) -> Optional[Dict]:
         """
         检测套利机会
         
         Args:
             prices: 价格字典
-            
+        
         Returns:
             套利机会信息，如果没有则返回None
         """
-        try:
-            poly_up = prices.get("polymarket_up") or prices.get("polymarket_yes")
-            poly_down = prices.get("polymarket_down") or prices.get("polymarket_no")
-            opinion = prices.get("opinion_trade")
-            
-            if not all([poly_up, poly_down, opinion]):
-                return None
-            
-            # 策略1: Polymarket UP + Opinion.trade DOWN
-            # Opinion.trade DOWN 价格 = 1 - UP 价格
-            strategy1_cost = poly_up + (1.0 - opinion)
-            strategy1_profit = 1.0 - strategy1_cost
-            
-            # 策略2: Polymarket DOWN + Opinion.trade UP
-            strategy2_cost = poly_down + opinion
-            strategy2_profit = 1.0 - strategy2_cost
-            
-            # 选择最佳策略
-            best_strategy = None
-            best_profit = 0
-            
-            if strategy1_cost < ARBITRAGE_MAX_SUM_PRICE and strategy1_profit >= MIN_PROFIT_MARGIN:
-                best_strategy = {
-                    "strategy": "Poly_UP + Opinion_DOWN",
-                    "poly_side": "UP",
-                    "poly_token_id": POLYMARKET_UP_TOKEN_ID,
-                    "opinion_side": "DOWN",
-                    "poly_price": poly_up,
-                    "opinion_price": 1.0 - opinion,
-                    "total_cost": strategy1_cost,
-                    "profit": strategy1_profit,
-                    "profit_percent": strategy1_profit * 100
-                }
-                best_profit = strategy1_profit
-            
-            if strategy2_cost < ARBITRAGE_MAX_SUM_PRICE and strategy2_profit >= MIN_PROFIT_MARGIN:
-                if strategy2_profit > best_profit:
-                    best_strategy = {
-                        "strategy": "Poly_DOWN + Opinion_UP",
-                        "poly_side": "DOWN",
-                        "poly_token_id": POLYMARKET_DOWN_TOKEN_ID,
-                        "opinion_side": "UP",
-                        "poly_price": poly_down,
-                        "opinion_price": opinion,
-                        "total_cost": strategy2_cost,
-                        "profit": strategy2_profit,
-                        "profit_percent": strategy2_profit * 100
-                    }
-            
-            return best_strategy
-        except Exception as e:
-            logger.error(f"套利检测失败: {e}")
-            return None
+        return detect_arbitrage(prices)
     
-    def check_arbitrage_opportunity(self) -> Optional[Dict]:
+    def check_opportunities(self, market: Dict = None) -> List[Dict]:
+        """
+        检查本周期的所有套利机会（跨平台 + Polymarket 完整组合），共用同一批订单簿
+        
+        Args:
+            market: 市场配置，默认使用单市场配置
+        
+        Returns:
+            套利机会列表
+        """
+        prices = self.get_books(market)
+        if not prices:
+            return []
+        
+        return self.detect_opportunities(prices)
+    
+    def detect_opportunities(self, prices: Dict) -> List[Dict]:
+        """
+        运行所有策略，并丢弃使用了过期报价的机会（见 stale_guard.py）
+        
+        Args:
+            prices: get_books 返回的价格字典
+        
+        Returns:
+            套利机会列表
+        """
+        quote_times = prices.get("quote_times") or {}
+        return [
+            opportunity for opportunity in detect_opportunities(prices)
+            if self.stale_guard.check(opportunity, [quote_times[leg] for leg in opportunity_legs(opportunity)
+                                                    if leg in quote_times])
+        ]
+    
+    def check_arbitrage_opportunity(self, market: Dict = None) -> Optional[Dict]:
         """
         检查套利机会（完整流程）
         
+        Args:
+            market: 市场配置，默认使用单市场配置
+        
         Returns:
             套利机会信息
         """
-        prices = self.get_prices()
+        prices = self.get_prices(market)
         if not prices:
             return None
         
@@ -1,23 +1,100 @@
 """
 套利执行器
+
+每个机会先生成下单计划（各条腿的下单参数、名义金额和交易记录），通过风控后再提交:
+- execute: 逐条腿顺序下单，前一条腿失败时不再下后面的腿
+- execute_batch: 同一周期的多个机会一起提交，每个平台按其批量下单上限合并成尽量少的请求，
+  不支持批量下单的平台（或整个批量请求失败时）并发逐单提交，结果按顺序映射回各个机会
 """
+import uuid
 import logging
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple, Callable, Iterable
 from polymarket_client import PolymarketClient
 from opinion_trade_client import OpinionTradeClient
-from config import MAX_POSITION_SIZE
-from utils import calculate_position_size
+from order_tracker import OrderTracker, TrackedOrder
+from unwind_engine import UnwindEngine, OPPOSITE_SIDE
+from positions import PositionLedger, market_key
+from risk_gate import RiskGate
+from stale_guard import StaleGuard
+from config import Config, MAX_POSITION_SIZE
+from sizing import size_opportunity, leg_rules, round_shares
+from ticks import PRICE_SCALE, ticks_to_price, price_to_ticks, size_to_units, units_to_size
 
 logger = logging.getLogger(__name__)
 
 
+def leg_notional(size: float, price: float) -> int:
+    """订单腿的名义金额（金额单位）"""
+    return size_to_units(size) * price_to_ticks(price) // PRICE_SCALE
+
+
 class ArbitrageExecutor:
     """套利执行器"""
     
-    def __init__(self):
-        self.polymarket = PolymarketClient()
-        self.opinion_trade = OpinionTradeClient()
+    def __init__(self, polymarket=None, opinion_trade=None):
+        """
+        Args:
+            polymarket: Polymarket 客户端，默认新建 PolymarketClient
+            opinion_trade: Opinion.trade 客户端，默认新建 OpinionTradeClient
+        """
+        self.polymarket = polymarket or PolymarketClient()
+        self.opinion_trade = opinion_trade or OpinionTradeClient()
         self.executed_trades = []
+        self.trades_by_id = {}
+        self.order_tracker = OrderTracker(on_fill=self._on_fill, on_close=self._on_close)
+        self.ledger = PositionLedger()
+        self.risk_gate = RiskGate()
+        self.unwind_engine = UnwindEngine(self.polymarket, self.opinion_trade)
+        self.unwind_reports = []
+        self.stale_guard = StaleGuard()
+        self.batch_stats = {"batches": 0, "orders": 0, "batch_requests": 0, "single_requests": 0}
+        self._submit_pool: Optional[ThreadPoolExecutor] = None
+        # 状态日志回调 (事件类型, 数据)，见 state_store.py
+        self.journal: Optional[Callable[[str, Dict], None]] = None
+        self._replaying = False
+    
+    def execute(self, opportunity: Dict, position_size: float = None) -> bool:
+        """
+        按机会类型执行
+        
+        Args:
+            opportunity: detect_opportunities 返回的套利机会
+            position_size: 持仓大小（USD），默认使用配置中的最大值
+        
+        Returns:
+            是否成功执行
+        """
+        plan = self._prepare(opportunity, position_size)
+        return plan is not None and self._settle(plan, self._submit_sequential)
+    
+    def execute_complete_set(self, opportunity: Dict, position_size: float = None) -> bool:
+        """
+        执行 Polymarket 完整组合套利（同时买入或卖出 UP 和 DOWN）
+        
+        Args:
+            opportunity: detect_complete_set 返回的套利机会
+            position_size: 持仓大小（USD），默认使用配置中的最大值
+        
+        Returns:
+            是否成功执行
+        """
+        plan = self._prepare(opportunity, position_size, self._plan_complete_set)
+        return plan is not None and self._settle(plan, self._submit_sequential)
+    
+    def execute_basket(self, opportunity: Dict, position_size: float = None) -> bool:
+        """
+        执行多结果市场组合套利（每个结果在最便宜的平台各买一份）
+        
+        Args:
+            opportunity: detect_multi_outcome 返回的套利机会
+            position_size: 持仓大小（USD），默认使用配置中的最大值
+        
+        Returns:
+            是否全部腿下单成功
+        """
+        plan = self._prepare(opportunity, position_size, self._plan_basket)
+        return plan is not None and self._settle(plan, self._submit_sequential)
     
     def execute_arbitrage(self, opportunity: Dict, position_size: float = None) -> bool:
         """
@@ -26,78 +103,596 @@ class ArbitrageExecutor:
         Args:
             opportunity: 套利机会信息
             position_size: 持仓大小（USD），默认使用配置中的最大值
-            
+        
         Returns:
             是否成功执行
         """
+        plan = self._prepare(opportunity, position_size, self._plan_arbitrage)
+        return plan is not None and self._settle(plan, self._submit_sequential)
+    
+    def execute_batch(self, items: List[Tuple[Dict, Optional[float]]]) -> List[bool]:
+        """
+        批量执行同一周期的多个机会
+        
+        所有机会的订单腿按平台分组一起提交；各条腿的结果映射回所属机会后，
+        按与 execute 相同的规则记录成功的交易、处理部分腿失败（单腿风险处理 / 撤回）。
+        先提交所有 Polymarket 腿，Polymarket 腿全部下单成功的机会再提交其余平台的腿，
+        与逐单执行一样不会出现只有 Opinion.trade 腿下单成功的情况
+        
+        Args:
+            items: [(机会, 持仓大小 USD 或 None), ...]
+        
+        Returns:
+            与 items 顺序对应的执行结果
+        """
+        plans = [self._prepare(opportunity, position_size) for opportunity, position_size in items]
+        active = [plan for plan in plans if plan is not None]
+        if not active:
+            return [False] * len(plans)
+        
+        for plan in active:
+            logger.info(plan["log"])
+        first = [leg for plan in active for leg in plan["legs"] if leg["venue"] == "polymarket"]
+        rest = []
+        try:
+            self._submit_legs(first)
+            rest = [leg for plan in active
+                    if all(leg["order_id"] for leg in plan["legs"] if leg["venue"] == "polymarket")
+                    for leg in plan["legs"] if leg["venue"] != "polymarket"]
+            self._submit_legs(rest)
+        except Exception as e:
+            # 已拿到订单ID的腿照常跟踪，其余按下单失败处理
+            logger.error(f"批量下单出错: {e}", exc_info=True)
+        self.batch_stats["batches"] += 1
+        self.batch_stats["orders"] += len(first) + len(rest)
+        return [plan is not None and self._settle(plan, self._finish_batch) for plan in plans]
+    
+    def _finish_batch(self, plan: Dict) -> bool:
+        """批量提交之后: 跟踪已下单的腿，全部成功时记录交易，否则处理部分失败"""
+        placed = [leg for leg in plan["legs"] if leg["order_id"]]
+        for leg in placed:
+            self._track_leg(plan, leg)
+        if len(placed) == len(plan["legs"]):
+            return self._record(plan)
+        return self._fail(plan, placed)
+    
+    def _settle(self, plan: Dict, submit) -> bool:
+        """
+        执行计划的提交 / 记录步骤，任何异常都按执行失败处理
+        
+        风控预留在腿交给订单跟踪器（由完结回调归还）或在 _fail 中归还之前都由这里负责，
+        出错时归还这些腿的预留并返回 False，调用方据此结束机会的执行状态、归还资金分配
+        """
+        try:
+            return submit(plan)
+        except Exception as e:
+            pending = [leg for leg in plan["legs"] if not leg["settled"]]
+            for leg in pending:
+                leg["settled"] = True
+            self.risk_gate.release(plan["market_id"], sum(leg["notional"] for leg in pending), len(pending))
+            orphaned = [leg["order_id"] for leg in pending if leg["order_id"]]
+            if orphaned:
+                logger.critical(f"执行出错，已下单但未跟踪的订单需要人工检查: {orphaned}")
+            logger.error(f"执行交易失败 ({plan['opportunity'].get('strategy')}): {e}", exc_info=True)
+            return False
+    
+    # ------------------------------------------------------------------
+    # 下单计划
+    # ------------------------------------------------------------------
+    
+    def _prepare(self, opportunity: Dict, position_size: float = None, builder=None) -> Optional[Dict]:
+        """下单前检查报价年龄，按机会类型（或指定的 builder）生成计划"""
+        # 检测到执行之间可能经过队列等待，下单前再次检查报价年龄
+        try:
+            if not self.stale_guard.check_execution(opportunity):
+                return None
+        except Exception as e:
+            logger.error(f"下单前检查失败 ({opportunity.get('strategy')}): {e}")
+            return None
+        weight = opportunity.get("stale_weight", 1.0)
+        if weight < 1.0:
+            position_size = (MAX_POSITION_SIZE if position_size is None else position_size) * weight
+        
+        if builder is not None:
+            return self._plan(builder, opportunity, position_size)
+        if opportunity.get("type") == "complete_set":
+            return self._plan(self._plan_complete_set, opportunity, position_size)
+        if opportunity.get("type") == "multi_outcome":
+            return self._plan(self._plan_basket, opportunity, position_size)
+        return self._plan(self._plan_arbitrage, opportunity, position_size)
+    
+    def _plan(self, builder, opportunity: Dict, position_size: float = None) -> Optional[Dict]:
+        """生成计划并通过风控预留；规模为 0、风控拒绝或出错时返回 None"""
         if position_size is None:
             position_size = MAX_POSITION_SIZE
-        
         try:
-            strategy = opportunity["strategy"]
-            poly_side = opportunity["poly_side"]
-            opinion_side = opportunity["opinion_side"]
-            poly_price = opportunity["poly_price"]
-            opinion_price = opportunity["opinion_price"]
-            
-            logger.info(f"开始执行套利: {strategy}")
-            logger.info(f"总成本: ${opportunity['total_cost']:.4f}, 预期利润: ${opportunity['profit']:.4f} ({opportunity['profit_percent']:.2f}%)")
-            
-            # 计算每个平台的持仓数量
-            # 按比例分配投资金额，确保总成本等于总投资
-            position_allocation = calculate_position_size(
-                position_size, poly_price, opinion_price
-            )
-            poly_amount = position_allocation["amount1"]
-            opinion_amount = position_allocation["amount2"]
-            
-            # 获取条件ID（如果可用）
-            condition_id = opportunity.get("condition_id", "condition_id_here")
-            
-            # 在 Polymarket 下单
-            poly_success = self.polymarket.place_order(
-                condition_id=condition_id,
-                outcome=poly_side,
-                size=poly_amount,
-                price=poly_price
-            )
-            
-            if not poly_success:
-                logger.error("Polymarket 下单失败，取消交易")
-                return False
-            
-            # 在 Opinion.trade 下单
-            opinion_success = self.opinion_trade.place_order(
-                topic_id="4866",
-                side=opinion_side,
-                amount=opinion_amount,
-                price=opinion_price
-            )
-            
-            if not opinion_success:
-                logger.error("Opinion.trade 下单失败，需要处理已执行的订单")
-                # TODO: 实现订单撤销逻辑
-                return False
-            
-            # 记录交易
-            trade_record = {
+            plan = builder(opportunity, position_size)
+        except Exception as e:
+            logger.error(f"生成下单计划失败 ({opportunity.get('strategy')}): {e}")
+            return None
+        if plan is None:
+            return None
+        
+        reason = self.risk_gate.acquire(plan["market_id"], sum(leg["notional"] for leg in plan["legs"]),
+                                        len(plan["legs"]))
+        if reason is not None:
+            logger.warning(f"风控拒绝下单 ({plan['market_id']}): {reason}")
+            return None
+        return plan
+    
+    @staticmethod
+    def _leg(leg: str, venue: str, shares: float, price: float, outcome: str, side: str = "BUY",
+             shares_units: int = None, price_ticks: int = None, **params) -> Dict:
+        """计划中的一条订单腿"""
+        if venue == "polymarket":
+            params = dict(outcome=outcome, size=shares, price=price, side=side, **params)
+        else:
+            params = dict(side=outcome, amount=shares, price=price, **params)
+        if shares_units is not None and price_ticks is not None:
+            notional = shares_units * price_ticks // PRICE_SCALE
+        else:
+            notional = leg_notional(shares, price)
+        return {"leg": leg, "venue": venue, "size": shares, "price": price, "outcome": outcome,
+                "side": side, "notional": notional, "params": params, "order_id": None,
+                # 提交的限价（价格单位），单腿处理的价格阶梯从这里出发
+                "price_ticks": price_to_ticks(price) if price_ticks is None else price_ticks,
+                # 风控预留已交给订单跟踪器或已归还
+                "settled": False}
+    
+    def _plan_complete_set(self, opportunity: Dict, position_size: float) -> Optional[Dict]:
+        side = opportunity["side"]
+        up_price, down_price = opportunity["up_price"], opportunity["down_price"]
+        sized = size_opportunity(opportunity, position_size)
+        if sized is None:
+            # 卖出完整组合: 收入按每份 total_cost 计，按订单簿可成交数量和已持有的完整组合封顶
+            held = self._sellable_sets(market_key(opportunity))
+            if held <= 0:
+                logger.info(f"没有可卖出的完整组合持仓，跳过: {opportunity['strategy']}")
+                return None
+            shares = round_shares(min(opportunity["size"], held, position_size / max(opportunity["total_cost"], 1.0)),
+                                  leg_rules("polymarket", opportunity.get("tick_size")))
+        else:
+            # 买入: 每份完整组合到期价值 1，两边份数相同
+            shares = units_to_size(sized.shares)
+            up_price, down_price = (ticks_to_price(price) for price in sized.prices)
+        if shares <= 0:
+            logger.warning(f"完整组合规模为 0，跳过: {opportunity['strategy']}")
+            return None
+        
+        condition_id = opportunity.get("condition_id", "condition_id_here")
+        return {
+            "kind": "complete_set",
+            "trade_id": uuid.uuid4().hex,
+            "opportunity": opportunity,
+            "market_id": market_key(opportunity),
+            "legs": [
+                self._leg("up", "polymarket", shares, up_price, "UP", side,
+                          condition_id=condition_id, token_id=opportunity.get("up_token_id")),
+                self._leg("down", "polymarket", shares, down_price, "DOWN", side,
+                          condition_id=condition_id, token_id=opportunity.get("down_token_id")),
+            ],
+            "record": {
+                "strategy": opportunity["strategy"],
+                "side": side,
+                "up_price": up_price,
+                "down_price": down_price,
+                "shares": shares,
+                "expected_profit": opportunity["profit"] * shares if sized is None else units_to_size(sized.expected_profit),
+            },
+            "log": f"开始执行完整组合套利: {opportunity['strategy']} {shares:.2f} 份",
+            "success_log": "完整组合套利执行成功",
+        }
+    
+    def _sellable_sets(self, market_id: str) -> float:
+        """
+        可以卖出的完整组合份数: Polymarket 上 UP 和 DOWN 多头的较小值，扣除未完结卖单的剩余数量
+        
+        不拆分 USDC，没有持仓时卖出机会只检测不执行
+        """
+        pending = {}
+        for order in self.order_tracker.open_orders():
+            if order.venue == "polymarket" and order.market_id == market_id and order.side == "SELL":
+                pending[order.outcome] = pending.get(order.outcome, 0.0) + max(0.0, order.size - order.filled_size)
+        available = []
+        for outcome in ("UP", "DOWN"):
+            position = self.ledger.position(market_id, outcome, "polymarket")
+            available.append((position["shares"] if position else 0.0) - pending.get(outcome, 0.0))
+        return max(0.0, min(available))
+    
+    def _plan_basket(self, opportunity: Dict, position_size: float) -> Optional[Dict]:
+        # 每份组合到期价值 1；各条腿份数相同，按各平台 tick / 最小下单量取整，按最小深度封顶
+        sized = size_opportunity(opportunity, position_size)
+        if not sized.shares:
+            logger.warning(f"组合规模为 0，跳过: {opportunity['strategy']} (原因: {sized.reason})")
+            return None
+        shares = units_to_size(sized.shares)
+        
+        market_id = market_key(opportunity)
+        self.ledger.register_market(market_id, (leg["outcome"] for leg in opportunity["legs"]))
+        legs = []
+        for i, (leg, price_ticks) in enumerate(zip(opportunity["legs"], sized.prices)):
+            price = ticks_to_price(price_ticks)
+            if leg["venue"] == "polymarket":
+                legs.append(self._leg(f"leg{i}", "polymarket", shares, price, leg["outcome"],
+                                      shares_units=sized.shares, price_ticks=price_ticks,
+                                      condition_id=opportunity.get("condition_id", "condition_id_here"),
+                                      token_id=leg.get("token_id")))
+            else:
+                legs.append(self._leg(f"leg{i}", leg["venue"], shares, price, leg["outcome"],
+                                      shares_units=sized.shares, price_ticks=price_ticks,
+                                      topic_id=leg.get("token_id") or "4866"))
+        return {
+            "kind": "multi_outcome",
+            "trade_id": uuid.uuid4().hex,
+            "opportunity": opportunity,
+            "market_id": market_id,
+            "legs": legs,
+            "record": {
+                "strategy": opportunity["strategy"],
+                "legs": opportunity["legs"],
+                "total_cost": ticks_to_price(sized.cost),
+                "shares": shares,
+                "expected_profit": units_to_size(sized.expected_profit),
+            },
+            "log": f"开始执行组合套利: {opportunity['strategy']} {shares:.2f} 份",
+            "success_log": "组合套利执行成功",
+        }
+    
+    def _plan_arbitrage(self, opportunity: Dict, position_size: float) -> Optional[Dict]:
+        strategy = opportunity["strategy"]
+        poly_side = opportunity["poly_side"]
+        opinion_side = opportunity["opinion_side"]
+        
+        # 两边下相同的份数（只有成对的份数到期价值 1），限价按各平台 tick 取整后仍需满足利润阈值
+        sized = size_opportunity(opportunity, position_size)
+        if not sized.shares:
+            logger.warning(f"套利规模为 0，跳过: {strategy} (原因: {sized.reason})")
+            return None
+        poly_ticks, opinion_ticks = sized.prices
+        poly_price, opinion_price = ticks_to_price(poly_ticks), ticks_to_price(opinion_ticks)
+        if poly_price != opportunity["poly_price"]:
+            logger.warning(f"Polymarket 价格 {opportunity['poly_price']} 不在 tick 网格上，调整为 {poly_price}")
+        shares = units_to_size(sized.shares)
+        
+        return {
+            "kind": "cross_venue",
+            "trade_id": uuid.uuid4().hex,
+            "opportunity": opportunity,
+            "market_id": market_key(opportunity),
+            "legs": [
+                self._leg("poly", "polymarket", shares, poly_price, poly_side,
+                          shares_units=sized.shares, price_ticks=poly_ticks,
+                          condition_id=opportunity.get("condition_id", "condition_id_here"),
+                          token_id=opportunity.get("poly_token_id")),
+                self._leg("opinion", "opinion", shares, opinion_price, opinion_side,
+                          shares_units=sized.shares, price_ticks=opinion_ticks,
+                          topic_id=opportunity.get("opinion_topic_id", "4866")),
+            ],
+            "record": {
                 "strategy": strategy,
                 "poly_side": poly_side,
                 "opinion_side": opinion_side,
                 "poly_price": poly_price,
                 "opinion_price": opinion_price,
                 "position_size": position_size,
-                "expected_profit": opportunity["profit"] * position_size,
-                "timestamp": self._get_timestamp()
-            }
-            
-            self.executed_trades.append(trade_record)
-            logger.info(f"套利交易执行成功: {trade_record}")
-            
-            return True
+                "shares": shares,
+                "expected_profit": units_to_size(sized.expected_profit),
+            },
+            "log": (f"开始执行套利: {strategy} {shares:.2f} 份, 总成本: ${ticks_to_price(sized.cost):.4f}, "
+                    f"预期利润: ${opportunity['profit']:.4f} ({opportunity['profit_percent']:.2f}%)"),
+            "success_log": "套利交易执行成功",
+        }
+    
+    # ------------------------------------------------------------------
+    # 提交
+    # ------------------------------------------------------------------
+    
+    def _client(self, venue: str):
+        return self.polymarket if venue == "polymarket" else self.opinion_trade
+    
+    def _place_one(self, leg: Dict) -> Optional[str]:
+        try:
+            return self._client(leg["venue"]).place_order(**leg["params"])
         except Exception as e:
-            logger.error(f"执行套利失败: {e}")
-            return False
+            logger.error(f"{leg['venue']} 下单失败: {e}")
+            return None
+    
+    def _submit_sequential(self, plan: Dict) -> bool:
+        """逐条腿下单，某条腿失败时停止并处理已下单的腿"""
+        logger.info(plan["log"])
+        placed = []
+        for leg in plan["legs"]:
+            leg["order_id"] = self._place_one(leg)
+            if not leg["order_id"]:
+                return self._fail(plan, placed)
+            placed.append(leg)
+            self._track_leg(plan, leg)
+        return self._record(plan)
+    
+    def _submit_legs(self, legs: List[Dict]):
+        """
+        并发提交一组订单腿，把订单ID写回每条腿的 order_id
+        
+        支持批量下单的客户端（batch_order_limit > 1 且提供 place_orders）按上限分块，每块一次请求；
+        其余平台逐单提交。整个批量请求失败的块退回逐单提交。
+        """
+        by_venue: Dict[str, List[Dict]] = {}
+        for leg in legs:
+            by_venue.setdefault(leg["venue"], []).append(leg)
+        
+        batches, singles = [], []
+        for venue, venue_legs in by_venue.items():
+            client = self._client(venue)
+            limit = getattr(client, "batch_order_limit", 0)
+            if limit > 1 and hasattr(client, "place_orders") and len(venue_legs) > 1:
+                batches.extend((client, venue_legs[start:start + limit])
+                               for start in range(0, len(venue_legs), limit))
+            else:
+                singles.extend(venue_legs)
+        
+        self.batch_stats["batch_requests"] += len(batches)
+        self.batch_stats["single_requests"] += len(singles)
+        fallback = []
+        for chunk_fallback in self._run_concurrently(
+                [lambda c=client, chunk=chunk: self._place_chunk(c, chunk) for client, chunk in batches] +
+                [lambda leg=leg: self._place_single(leg) for leg in singles]):
+            fallback.extend(chunk_fallback)
+        if fallback:
+            logger.warning(f"批量下单请求失败，改为逐单提交 {len(fallback)} 个订单")
+            self.batch_stats["single_requests"] += len(fallback)
+            self._run_concurrently([lambda leg=leg: self._place_single(leg) for leg in fallback])
+    
+    def _place_chunk(self, client, chunk: List[Dict]) -> List[Dict]:
+        """一次批量请求；请求整体失败时返回需要逐单提交的腿"""
+        try:
+            order_ids = client.place_orders([leg["params"] for leg in chunk])
+        except Exception as e:
+            logger.error(f"批量下单失败: {e}")
+            order_ids = None
+        if order_ids is None or len(order_ids) != len(chunk):
+            return chunk
+        for leg, order_id in zip(chunk, order_ids):
+            leg["order_id"] = order_id
+        return []
+    
+    def _place_single(self, leg: Dict) -> List[Dict]:
+        leg["order_id"] = self._place_one(leg)
+        return []
+    
+    def _run_concurrently(self, tasks: List) -> List:
+        if len(tasks) <= 1:
+            return [task() for task in tasks]
+        if self._submit_pool is None:
+            self._submit_pool = ThreadPoolExecutor(max_workers=Config.ORDER_SUBMIT_WORKERS,
+                                                   thread_name_prefix="order-submit")
+        return list(self._submit_pool.map(lambda task: task(), tasks))
+    
+    def _track_leg(self, plan: Dict, leg: Dict):
+        self._track_order(leg["order_id"], leg["venue"], plan["trade_id"], leg["leg"], leg["size"],
+                          leg["price"], plan["market_id"], leg["outcome"], leg["side"])
+        leg["settled"] = True
+    
+    def _record(self, plan: Dict) -> bool:
+        """所有腿下单成功: 记录交易"""
+        trade_id = plan["trade_id"]
+        trade_record = dict(plan["record"], trade_id=trade_id, timestamp=self._get_timestamp())
+        if plan["kind"] == "multi_outcome":
+            trade_record["order_ids"] = [leg["order_id"] for leg in plan["legs"]]
+        else:
+            for leg in plan["legs"]:
+                trade_record[f"{leg['leg']}_order_id"] = leg["order_id"]
+        trade_record["fills"] = {leg["leg"]: 0.0 for leg in plan["legs"]}
+        
+        self.executed_trades.append(trade_record)
+        self.trades_by_id[trade_id] = trade_record
+        # 用户频道推送可能早于交易记录创建，这里补齐已有的成交
+        for order in self.order_tracker.get_trade_orders(trade_id):
+            trade_record["fills"][order.leg] = order.filled_size
+        if self.journal:
+            try:
+                self.journal("trade", trade_record)
+            except OSError as e:
+                # 交易已经发生，写状态日志失败不能把它当作执行失败（只影响重启后的恢复）
+                logger.error(f"写入交易日志失败 ({trade_id}): {e}")
+        logger.info(f"{plan['success_log']}: {trade_record}")
+        return True
+    
+    def _fail(self, plan: Dict, placed: List[Dict]) -> bool:
+        """部分或全部腿下单失败: 归还风控预留，并处理已下单的腿"""
+        missing = [leg for leg in plan["legs"] if leg not in placed]
+        self.risk_gate.release(plan["market_id"], sum(leg["notional"] for leg in missing), len(missing))
+        for leg in missing:
+            leg["settled"] = True
+        failed = missing[0]
+        
+        if not placed:
+            logger.error(f"{failed['venue']} {failed['outcome']} 下单失败，取消交易")
+        elif plan["kind"] == "cross_venue":
+            # Polymarket 腿总是先下单，已下单的只会是 Polymarket 腿
+            logger.error("Opinion.trade 下单失败，开始处理 Polymarket 单腿风险")
+            self._unwind(plan)
+        elif plan["kind"] == "complete_set":
+            for leg in placed:
+                logger.error(f"Polymarket {failed['outcome']} 下单失败，撤回 {leg['outcome']} 腿")
+                self._reverse(plan, leg)
+        else:
+            # 已成交的腿不完整，组合不再保证到期价值 1
+            logger.critical(f"组合 {failed['outcome']}@{failed['venue']} 下单失败，"
+                            f"已下单 {len(placed)} 条腿存在单腿风险: {[leg['order_id'] for leg in placed]}")
+        return False
+    
+    def _reverse(self, plan: Dict, leg: Dict):
+        """
+        反向下同样数量的单撤回已下单的腿
+        
+        撤回单减少敞口，不经过风控检查（紧急停止时也要能撤回），但计入占用并跟踪成交，完结时归还
+        """
+        side = "SELL" if leg["side"] == "BUY" else "BUY"
+        self.risk_gate.reserve(plan["market_id"], leg["notional"], 1)
+        order_id = self._place_one(dict(leg, params=dict(leg["params"], side=side)))
+        if not order_id:
+            self.risk_gate.release(plan["market_id"], leg["notional"], 1)
+            logger.critical(f"撤回 {leg['venue']} {leg['outcome']} 腿失败，仓位裸露: {leg['order_id']} {leg['size']}")
+            return
+        self._track_order(order_id, leg["venue"], plan["trade_id"], f"{leg['leg']}_reversal", leg["size"],
+                          leg["price"], plan["market_id"], leg["outcome"], side)
+    
+    def _unwind(self, plan: Dict):
+        """跨平台套利 Opinion.trade 腿失败后处理 Polymarket 单腿风险"""
+        opportunity = plan["opportunity"]
+        poly_leg, opinion_leg = plan["legs"]
+        trade_id, market_id = plan["trade_id"], plan["market_id"]
+        report = self.unwind_engine.unwind(opportunity, poly_leg["size"], opinion_leg["size"],
+                                           poly_leg["price_ticks"], opinion_leg["price_ticks"])
+        report["trade_id"] = trade_id
+        report["timestamp"] = self._get_timestamp()
+        self.unwind_reports.append(report)
+        price = report["steps"][-1]["price"] if report["steps"] else None
+        poly_side, opinion_side = poly_leg["outcome"], opinion_leg["outcome"]
+        if report["action"] == "retry":
+            self._track_order(report["order_id"], "opinion", trade_id, "unwind",
+                              opinion_leg["size"], price, market_id, opinion_side)
+        elif report["action"] == "hedge":
+            self._track_order(report["order_id"], "polymarket", trade_id, "unwind",
+                              poly_leg["size"], price, market_id, OPPOSITE_SIDE.get(poly_side, poly_side))
+        elif report["action"]:
+            self._track_order(report["order_id"], "polymarket", trade_id, "unwind",
+                              poly_leg["size"], price, market_id, poly_side, "SELL")
+    
+    # ------------------------------------------------------------------
+    # 订单跟踪
+    # ------------------------------------------------------------------
+    
+    def _track_order(self, order_id, venue: str, trade_id: str, leg: str, size: float, price: float,
+                     market_id: str = None, outcome: str = None, side: str = "BUY"):
+        """把订单交给订单跟踪器（客户端返回 True 等非字符串结果时不跟踪）"""
+        if isinstance(order_id, str):
+            self.order_tracker.track(order_id, venue, trade_id, leg, size, price, market_id, outcome, side)
+        elif leg != "unwind":
+            # 无法跟踪的订单腿收不到成交和完结回调，留在预留里永远不会归还
+            logger.warning(f"{venue} 下单返回 {order_id!r}，无法跟踪该订单，不计入风控占用")
+            self.risk_gate.release(market_id, leg_notional(size, price), 1)
+    
+    def _on_fill(self, order: TrackedOrder, fill_delta: float):
+        """成交回调：把成交回写到交易记录，按限价记入持仓账本，已成交部分从风控预留转为持仓占用"""
+        trade_record = self.trades_by_id.get(order.trade_id)
+        if not self._replaying:
+            logger.info(f"订单成交: {order.venue} {order.order_id} +{fill_delta:.4f} "
+                        f"({order.filled_size:.4f}/{order.size:.4f}, {order.status})")
+        if trade_record is not None:
+            trade_record["fills"][order.leg] = order.filled_size
+        if order.outcome and order.price is not None:
+            self.ledger.apply_fill(order.market_id, order.outcome, order.venue, order.side,
+                                   fill_delta, order.price)
+            self._sync_position(order.market_id)
+        if order.leg != "unwind" and order.price is not None:
+            # 按累计成交计算，多次部分成交的取整误差不会累积
+            released = leg_notional(order.filled_size, order.price) - \
+                leg_notional(order.filled_size - fill_delta, order.price)
+            self.risk_gate.release(order.market_id, released, 0)
+    
+    def _on_close(self, order: TrackedOrder):
+        """订单完结回调：归还风控预留的腿数和未成交部分的名义金额"""
+        if order.leg == "unwind":
+            return
+        unfilled = leg_notional(order.size, order.price) - leg_notional(min(order.filled_size, order.size), order.price)
+        self.risk_gate.order_closed(order.market_id, max(0, unfilled))
+    
+    def _sync_position(self, market_id: str):
+        """把持仓账本中该市场占用的资金同步到风控"""
+        locked = self.ledger.locked(market_id).get(market_id, 0)
+        self.risk_gate.set_position(market_id, locked // PRICE_SCALE)
+    
+    def resolve_market(self, market_id: str, winning_outcome: str):
+        """市场结算: 更新持仓账本，该市场的持仓不再计入风控占用"""
+        self.ledger.resolve(market_id, winning_outcome)
+        self._sync_position(market_id)
+    
+    def refresh_orders(self, pushed: Iterable[str] = ()) -> int:
+        """
+        批量刷新未完结订单的状态（每个平台每批一次请求）
+        
+        Args:
+            pushed: 订单状态由推送（用户频道）更新的平台，不再轮询
+        
+        Returns:
+            发出的查询请求数
+        """
+        if not self.order_tracker.open_order_ids():
+            return 0
+        clients = {"polymarket": self.polymarket, "opinion": self.opinion_trade}
+        return self.order_tracker.poll({venue: client for venue, client in clients.items() if venue not in pushed})
+    
+    # ------------------------------------------------------------------
+    # 状态持久化（见 state_store.py）
+    # ------------------------------------------------------------------
+    
+    def get_state(self, max_trades: int = None) -> Dict:
+        """
+        可持久化的执行状态: 最近的交易记录、未完结订单、持仓账本和风控占用
+        
+        Args:
+            max_trades: 最多保留的交易记录数（仍有未完结订单的交易总是保留），None 表示全部
+        """
+        open_orders = self.order_tracker.open_orders()
+        trades = self.executed_trades if max_trades is None else self.executed_trades[-max_trades:]
+        kept = {trade.get("trade_id") for trade in trades}
+        pending = {order.trade_id for order in open_orders} - kept
+        if pending:
+            kept |= pending
+            trades = [trade for trade in self.executed_trades if trade.get("trade_id") in kept]
+        return {
+            "trades": trades,
+            "orders": [order.to_dict() for order in open_orders],
+            "ledger": self.ledger.get_state(),
+            "risk": self.risk_gate.get_state(),
+        }
+    
+    def restore_state(self, state: Dict):
+        """从 get_state 的结果恢复（在开始交易之前调用）"""
+        self.executed_trades = list(state["trades"])
+        self.trades_by_id = {trade["trade_id"]: trade for trade in self.executed_trades if "trade_id" in trade}
+        for data in state["orders"]:
+            self.order_tracker.restore(data)
+        self.ledger.restore_state(state["ledger"])
+        self.risk_gate.restore_state(state["risk"])
+        for market_id, locked in self.ledger.locked().items():
+            self.risk_gate.set_position(market_id, locked // PRICE_SCALE)
+    
+    def replay(self, events: List[Tuple[str, Dict]]) -> int:
+        """
+        按顺序重放状态日志中的事件（order / order_update / trade），不访问平台
+        
+        快照已包含的订单和交易（变化先于快照采集、日志晚于采集）跳过，order_update 是累计成交，重复应用无影响
+        
+        Returns:
+            应用的事件数
+        """
+        applied = 0
+        self._replaying = True
+        try:
+            for event_type, data in events:
+                if event_type == "order":
+                    if data["order_id"] in self.order_tracker.orders:
+                        continue
+                    self.order_tracker.restore(data)
+                    if data["leg"] != "unwind":
+                        self.risk_gate.reserve(data.get("market_id"), leg_notional(data["size"], data["price"]), 1)
+                elif event_type == "order_update":
+                    self.order_tracker.apply_update(data)
+                elif event_type == "trade":
+                    if data["trade_id"] in self.trades_by_id:
+                        continue
+                    self.executed_trades.append(data)
+                    self.trades_by_id[data["trade_id"]] = data
+                    for order in self.order_tracker.get_trade_orders(data["trade_id"]):
+                        data["fills"][order.leg] = order.filled_size
+                else:
+                    continue
+                applied += 1
+        finally:
+            self._replaying = False
+        return applied
     
     def _get_timestamp(self) -> str:
         """获取时间戳"""
@@ -0,0 +1,329 @@
+"""
+asyncio 运行时
+
+每个市场由三个协作任务组成：行情 -> 检测 -> 执行，任务之间通过有界队列连接，
+下游处理不过来时上游自动等待（背压）。停止时先取消行情和检测任务，
+再等待执行队列中已提交的订单处理完毕。
+
+执行器（订单跟踪、风控、持仓）不是线程安全的，各市场的执行、订单刷新、持仓估值和用户频道推送
+通过同一个锁串行进入执行器；行情获取仍在线程池中并行。
+任务异常退出时记录错误并重新启动，不会让某个市场静默停止。
+"""
+import asyncio
+import signal
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List
+from arbitrage_detector import ArbitrageDetector
+from arbitrage_executor import ArbitrageExecutor
+from order_tracker import PolymarketUserChannel
+from opportunity_tracker import OpportunityTracker
+from allocator import CapitalAllocator
+from positions import summary_lines
+import paper_trading
+import profiler
+from config import Config, POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class MarketPipeline:
+    """单个市场的行情 / 检测 / 执行流水线"""
+    
+    def __init__(self, market: Dict, queue_size: int):
+        self.market = market
+        self.market_id = market.get("market_id")
+        self.price_queue = asyncio.Queue(maxsize=queue_size)
+        self.execution_queue = asyncio.Queue(maxsize=queue_size)
+        self.feed_task = None
+        self.detect_task = None
+        self.execute_task = None
+
+
+class AsyncArbitrageBot:
+    """基于 asyncio 的套利机器人，每个市场独立运行"""
+    
+    def __init__(self, markets: List[Dict] = None, detector: ArbitrageDetector = None,
+                 executor: ArbitrageExecutor = None, poll_interval: float = None):
+        """
+        Args:
+            markets: 监控的市场，默认使用配置
+            detector: 使用的检测器，默认新建（测试时传入使用替身平台的检测器和执行器）
+            executor: 使用的执行器，默认新建
+            poll_interval: 行情轮询间隔（秒），默认使用配置 POLL_INTERVAL
+        """
+        if detector is None or executor is None:
+            # 验证配置
+            try:
+                Config.validate()
+            except ValueError as e:
+                logger.error(f"配置验证失败: {e}")
+                logger.error("请检查 .env 文件中的配置")
+                raise
+        
+        self.markets = markets if markets is not None else Config.load_markets()
+        self.detector = detector or ArbitrageDetector()
+        if executor is not None:
+            self.executor = executor
+        elif Config.PAPER_TRADING:
+            self.executor = ArbitrageExecutor(*paper_trading.install(self.detector))
+        else:
+            self.executor = ArbitrageExecutor()
+        self.poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+        # 执行器不是线程安全的，所有进入执行器的线程调用都持有该锁
+        self._executor_lock = asyncio.Lock()
+        self.user_channel = None
+        if Config.USE_USER_CHANNEL:
+            # Polymarket 订单状态由用户频道推送，不再每轮批量查询；其他平台照常轮询
+            self.user_channel = PolymarketUserChannel(self.executor.order_tracker)
+        self.tracker = OpportunityTracker()
+        self.allocator = CapitalAllocator()
+        self.pipelines: List[MarketPipeline] = []
+        self.profiler = profiler.SamplingProfiler()
+        self.profiler_admin = None
+        self._stop_event = None
+        self._loop = None
+        self.stats = {
+            "checks": 0,
+            "opportunities_found": 0,
+            "opportunities_suppressed": 0,
+            "opportunities_unfunded": 0,
+            "trades_executed": 0,
+            "trades_failed": 0,
+            "task_restarts": 0,
+        }
+    
+    async def run(self):
+        """运行直到 stop() 被调用或收到 SIGINT / SIGTERM"""
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        # 客户端是同步的 requests 实现，放在线程池中执行，线程数随市场数量增加
+        loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=max(4, len(self.markets) * 2),
+            thread_name_prefix="arb-io"
+        ))
+        self._stop_event = asyncio.Event()
+        self._install_signal_handlers(loop)
+        _, self.profiler_admin = profiler.install(self.profiler, signal_handler=False)
+        
+        logger.info("=" * 60)
+        logger.info("套利机器人启动 (asyncio 运行时)")
+        logger.info(f"市场数量: {len(self.markets)}")
+        logger.info(f"轮询间隔: {self.poll_interval} 秒")
+        logger.info(f"队列容量: {Config.ASYNC_QUEUE_SIZE}")
+        logger.info("=" * 60)
+        
+        if self.user_channel:
+            # 订阅所有市场
+            condition_ids = list(dict.fromkeys(m["condition_id"] for m in self.markets if m.get("condition_id")))
+            if condition_ids:
+                self.user_channel.markets = condition_ids
+            # 推送在 WebSocket 线程中到达，交给事件循环在执行器锁内处理
+            self.user_channel.dispatch = self._post_order_updates
+            self.user_channel.start()
+        
+        for market in self.markets:
+            pipeline = MarketPipeline(market, Config.ASYNC_QUEUE_SIZE)
+            pipeline.feed_task = self._spawn(f"feed-{pipeline.market_id}", lambda p=pipeline: self._feed(p))
+            pipeline.detect_task = self._spawn(f"detect-{pipeline.market_id}", lambda p=pipeline: self._detect(p))
+            pipeline.execute_task = self._spawn(f"execute-{pipeline.market_id}", lambda p=pipeline: self._execute(p))
+            self.pipelines.append(pipeline)
+        order_task = self._spawn("refresh-orders", self._refresh_orders)
+        
+        try:
+            await self._stop_event.wait()
+        finally:
+            order_task.cancel()
+            await asyncio.gather(order_task, return_exceptions=True)
+            await self._shutdown()
+    
+    def stop(self):
+        """请求停止（可从信号处理器或其他任务调用）"""
+        if self._stop_event and not self._stop_event.is_set():
+            logger.info("收到停止信号，正在关闭...")
+            self._stop_event.set()
+    
+    def _spawn(self, name: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        """启动一个受监督的任务"""
+        return asyncio.create_task(self._supervise(name, factory), name=name)
+    
+    async def _supervise(self, name: str, factory: Callable[[], Awaitable]):
+        """运行任务，异常退出时记录错误并在一个轮询间隔后重新启动；正常返回或被取消时结束"""
+        while True:
+            try:
+                return await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["task_restarts"] += 1
+                logger.error(f"任务 {name} 异常退出，{self.poll_interval} 秒后重新启动: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+    
+    async def _in_executor(self, func: Callable, *args):
+        """在线程池中调用执行器（同一时间只有一个线程进入执行器）"""
+        async with self._executor_lock:
+            return await asyncio.to_thread(func, *args)
+    
+    def _install_signal_handlers(self, loop):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows 不支持 add_signal_handler，依赖 KeyboardInterrupt
+                pass
+        if Config.PROFILE_SIGNAL and hasattr(signal, "SIGUSR1"):
+            # 收到 SIGUSR1 时开始一次采样分析（采样在后台线程进行，不阻塞事件循环）
+            loop.add_signal_handler(signal.SIGUSR1, self.profiler.start)
+        if hasattr(signal, "SIGUSR2"):
+            # 收到 SIGUSR2 时风控紧急停止，之后的机会都不再下单
+            loop.add_signal_handler(signal.SIGUSR2, self.executor.risk_gate.kill, "SIGUSR2")
+    
+    async def _feed(self, pipeline: MarketPipeline):
+        """行情任务：按轮询间隔获取价格，检测任务处理不过来时在 put 上等待"""
+        while True:
+            prices = await asyncio.to_thread(self.detector.get_books, pipeline.market)
+            self.stats["checks"] += 1
+            await pipeline.price_queue.put(prices)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), self.poll_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _detect(self, pipeline: MarketPipeline):
+        """检测任务：计算套利机会，通过机会跟踪器去重后交给执行任务"""
+        while True:
+            prices = await pipeline.price_queue.get()
+            opportunities = self.detector.detect_opportunities(prices) if prices else []
+            if prices:
+                await self._in_executor(self.executor.ledger.mark_prices, prices)
+            
+            for opportunity in opportunities:
+                if not self.tracker.should_fire(opportunity):
+                    self.stats["opportunities_suppressed"] += 1
+                    continue
+                self.stats["opportunities_found"] += 1
+                logger.info(f"发现套利机会: {pipeline.market_id} {opportunity['strategy']}, "
+                            f"预期利润: ${opportunity['profit']:.4f} ({opportunity['profit_percent']:.2f}%)")
+                self.tracker.mark_executing(opportunity)
+                await pipeline.execution_queue.put(opportunity)
+            
+            if prices:
+                # 没有取到订单簿时无法判断机会是否消失，保留其跟踪记录
+                self.tracker.close_missing(opportunities, market_id=self.tracker.market_of(pipeline.market))
+    
+    async def _execute(self, pipeline: MarketPipeline):
+        """执行任务：按顺序执行本市场的机会（与其他市场的执行通过执行器锁串行）"""
+        while True:
+            opportunity = await pipeline.execution_queue.get()
+            # 各市场独立执行，资金分配只负责在共享的平台余额内预留
+            allocations = self.allocator.allocate([opportunity])
+            if not allocations:
+                self.stats["opportunities_unfunded"] += 1
+                self.tracker.mark_result(opportunity, False)
+                pipeline.execution_queue.task_done()
+                continue
+            allocation = allocations[0]
+            try:
+                success = await self._in_executor(self.executor.execute, opportunity, allocation.position_size)
+                self.tracker.mark_result(opportunity, success)
+                if success:
+                    self.stats["trades_executed"] += 1
+                else:
+                    self.allocator.release(allocation)
+                    self.stats["trades_failed"] += 1
+                    logger.warning(f"套利交易执行失败: {pipeline.market_id}")
+            except Exception as e:
+                self.allocator.release(allocation)
+                self.tracker.mark_result(opportunity, False)
+                logger.error(f"执行任务错误 ({pipeline.market_id}): {e}", exc_info=True)
+            finally:
+                pipeline.execution_queue.task_done()
+    
+    async def _refresh_orders(self):
+        """订单任务：所有市场共用，每个轮询间隔批量刷新一次订单状态（用户频道推送的平台不轮询）"""
+        pushed = self.user_channel.venues if self.user_channel else ()
+        while True:
+            try:
+                await self._in_executor(self.executor.refresh_orders, pushed)
+            except Exception as e:
+                logger.error(f"刷新订单状态失败: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+    
+    def _post_order_updates(self, updates: List[Dict]):
+        """用户频道线程回调：把订单推送交给事件循环"""
+        asyncio.run_coroutine_threadsafe(self._apply_order_updates(updates), self._loop)
+    
+    async def _apply_order_updates(self, updates: List[Dict]):
+        """在执行器锁内写入用户频道推送的订单状态（成交回调会修改交易记录和持仓）"""
+        try:
+            await self._in_executor(self.executor.order_tracker.apply_updates, updates)
+        except Exception as e:
+            logger.error(f"处理用户频道推送失败: {e}", exc_info=True)
+    
+    async def _shutdown(self):
+        """取消行情和检测任务，等待已提交的订单执行完毕"""
+        upstream = [task for p in self.pipelines for task in (p.feed_task, p.detect_task)]
+        for task in upstream:
+            task.cancel()
+        await asyncio.gather(*upstream, return_exceptions=True)
+        
+        pending = sum(p.execution_queue.qsize() for p in self.pipelines)
+        if pending:
+            logger.info(f"等待 {pending} 个待执行的机会处理完毕...")
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(p.execution_queue.join() for p in self.pipelines)),
+                Config.ASYNC_DRAIN_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"执行队列在 {Config.ASYNC_DRAIN_TIMEOUT} 秒内未清空，强制停止")
+        
+        executors = [p.execute_task for p in self.pipelines]
+        for task in executors:
+            task.cancel()
+        await asyncio.gather(*executors, return_exceptions=True)
+        self.pipelines = []
+        if self.user_channel:
+            self.user_channel.stop()
+        self.profiler.stop()
+        if self.profiler_admin:
+            self.profiler_admin.close()
+            self.profiler_admin = None
+        self._log_stats()
+    
+    def _log_stats(self):
+        logger.info("=" * 60)
+        logger.info("套利机器人停止")
+        logger.info(f"统计信息:")
+        logger.info(f"  总检查次数: {self.stats['checks']}")
+        logger.info(f"  发现机会: {self.stats['opportunities_found']}")
+        logger.info(f"  冷却跳过: {self.stats['opportunities_suppressed']}")
+        logger.info(f"  执行交易: {self.stats['trades_executed']}")
+        logger.info(f"  执行失败: {self.stats['trades_failed']}")
+        logger.info(f"  余额不足未执行: {self.stats['opportunities_unfunded']}")
+        logger.info(f"  任务重启: {self.stats['task_restarts']}")
+        logger.info(f"  资金分配: {self.allocator.get_stats()}")
+        logger.info(f"  订单状态: {self.executor.order_tracker.get_stats()}")
+        logger.info(f"  下单前风控: {self.executor.risk_gate.get_stats()}")
+        fetch_stats = self.detector.polymarket.get_fetch_stats()
+        logger.info(f"  订单簿请求: {fetch_stats['fetches']} 次 (304: {fetch_stats['not_modified']}, "
+                    f"未变化: {fetch_stats['unchanged']}), 平均传输 {fetch_stats['avg_wire_bytes']:.0f} B, "
+                    f"平均解析 {fetch_stats['avg_parse_ms']:.3f} ms")
+        logger.info(f"  过期报价: 检测 {self.detector.stale_guard.get_stats()}, "
+                    f"执行前 {self.executor.stale_guard.get_stats()['rejected']}")
+        if Config.PAPER_TRADING:
+            logger.info(f"  模拟撮合: {self.executor.polymarket.exchange.get_stats()}")
+        for line in summary_lines(self.executor.ledger.snapshot(markets=False)):
+            logger.info(f"  {line}")
+        logger.info("=" * 60)
+
+
+def run(markets: List[Dict] = None):
+    """以 asyncio 运行时启动机器人"""
+    bot = AsyncArbitrageBot(markets)
+    try:
+        asyncio.run(bot.run())
+    except KeyboardInterrupt:
+        pass
+    return bot
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+热路径微基准与性能回归检查
+
+每个基准用固定的合成输入（固定随机种子）反复调用一个内层函数:
+- detect_arbitrage: 有机会（构造机会记录）/ 无机会两种输入
+- detect_opportunities: 一个市场完整的 get_books 结果（跨平台 + 完整组合）
+- parse_book: 50 档原始订单簿（价格为字符串，档位乱序），全部解析 / 只取最优一档
+- get_best_price_from_token_id: PolymarketClient 从原始 /book 返回到可成交价格（不发请求）
+- size_opportunity / size_matched_batch: 等份数下单规模（原 calculate_position_size）
+- plan_arbitrage: 执行器生成下单计划和交易记录
+
+测量用 timeit，每个基准重复多轮取最快一轮的单次耗时（纳秒），受调度噪声影响最小。
+同时测量一个固定的纯 Python 参考负载，比较时按参考负载的耗时比例换算，
+基线在另一台机器上保存时也能比较。
+
+用法:
+    python benchmarks.py --save            # 保存基线到 benchmarks_baseline.json
+    python benchmarks.py                   # 与基线比较，任一基准变慢超过 --threshold% 时退出码为 1
+    python benchmarks.py --only parse_book.full --threshold 10
+"""
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+from typing import Optional, Dict, List, Callable
+
+BASELINE_FILE = "benchmarks_baseline.json"
+REFERENCE = "reference"
+
+
+def _reference() -> Callable:
+    """与被测代码无关的固定负载（整数运算、字典和列表操作），用于换算机器速度"""
+    keys = [f"k{i}" for i in range(64)]
+    
+    def run():
+        table = {}
+        for i, key in enumerate(keys):
+            table[key] = i * 7 % 13
+        return sorted(table.values())[:8]
+    return run
+
+
+def _detect_arbitrage_hit() -> Callable:
+    from arbitrage_detector import detect_arbitrage
+    prices = {"polymarket_up": 0.45, "polymarket_down": 0.56, "opinion_trade": 0.52,
+              "market_id": "bench", "poly_up_token_id": "up", "poly_down_token_id": "down"}
+    assert detect_arbitrage(prices) is not None
+    return lambda: detect_arbitrage(prices)
+
+
+def _detect_arbitrage_miss() -> Callable:
+    from arbitrage_detector import detect_arbitrage
+    prices = {"polymarket_up": 0.51, "polymarket_down": 0.51, "opinion_trade": 0.50}
+    assert detect_arbitrage(prices) is None
+    return lambda: detect_arbitrage(prices)
+
+
+def _detect_opportunities() -> Callable:
+    from arbitrage_detector import ArbitrageDetector, detect_opportunities
+    from loadgen import LoadGenerator
+    load = LoadGenerator(num_markets=1, seed=7, stream_size=1)
+    detector = load.attach(ArbitrageDetector())
+    prices = detector.get_books(load.markets[0].market)
+    return lambda: detect_opportunities(prices)
+
+
+def _raw_book(depth: int = 50) -> Dict:
+    from loadgen import SyntheticMarket
+    up, _, _ = SyntheticMarket(0, random.Random(7), depth=depth).step()
+    return up
+
+
+def _parse_book_full() -> Callable:
+    from ticks import parse_book
+    orderbook = _raw_book()
+    return lambda: parse_book(orderbook)
+
+
+def _parse_book_top() -> Callable:
+    from ticks import parse_book
+    orderbook = _raw_book()
+    return lambda: parse_book(orderbook, 1)
+
+
+def _best_price() -> Callable:
+    from polymarket_client import PolymarketClient
+    orderbook = _raw_book()
+    client = PolymarketClient()
+    # 只替换网络请求: 每次返回同一份 /book 原始数据（不带 hash，每次都完整解析）
+    orderbook.pop("hash", None)
+    client._fetch_book = lambda token_id, cache_key=None, timeout=10: (orderbook, 0, 0, 0.0, (0.0, 0.0))
+    assert client.get_best_price_from_token_id("bench") is not None
+    return lambda: client.get_best_price_from_token_id("bench")
+
+
+def _opportunity() -> Dict:
+    from arbitrage_detector import detect_arbitrage
+    return detect_arbitrage({"polymarket_up": 0.45, "polymarket_down": 0.56, "opinion_trade": 0.52,
+                             "market_id": "bench"})
+
+
+def _size_opportunity() -> Callable:
+    from sizing import size_opportunity
+    opportunity = _opportunity()
+    return lambda: size_opportunity(opportunity, 10.0)
+
+
+def _size_matched_batch() -> Callable:
+    from sizing import size_matched_batch, leg_rules
+    rng = random.Random(7)
+    count = 100
+    budgets = [10_000_000] * count
+    prices = [[rng.randint(3000, 5000) for _ in range(count)], [rng.randint(4000, 5500) for _ in range(count)]]
+    depths = [[rng.randint(1, 500) * 1_000_000 for _ in range(count)] for _ in range(2)]
+    rules = (leg_rules("polymarket"), leg_rules("opinion"))
+    return lambda: size_matched_batch(budgets, prices, depths, rules)
+
+
+def _plan_arbitrage() -> Callable:
+    from arbitrage_executor import ArbitrageExecutor
+    from local_standin import StandInVenue
+    executor = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+    opportunity = _opportunity()
+    assert executor._plan_arbitrage(opportunity, 10.0) is not None
+    return lambda: executor._plan_arbitrage(opportunity, 10.0)
+
+
+# 名称 -> 返回被测调用的准备函数（准备开销不计入测量）
+BENCHMARKS: Dict[str, Callable[[], Callable]] = {
+    REFERENCE: _reference,
+    "detect_arbitrage.hit": _detect_arbitrage_hit,
+    "detect_arbitrage.miss": _detect_arbitrage_miss,
+    "detect_opportunities": _detect_opportunities,
+    "parse_book.full": _parse_book_full,
+    "parse_book.top": _parse_book_top,
+    "get_best_price_from_token_id": _best_price,
+    "size_opportunity": _size_opportunity,
+    "size_matched_batch.100": _size_matched_batch,
+    "plan_arbitrage": _plan_arbitrage,
+}
+
+
+def measure(fn: Callable, min_time: float = 0.2, repeats: int = 5) -> float:
+    """
+    单次调用耗时（纳秒）
+    
+    Args:
+        fn: 被测调用
+        min_time: 所有轮次的总测量时间（秒），据此确定每轮调用次数
+        repeats: 轮数，取最快一轮
+    """
+    timer = timeit.Timer(fn)
+    per_round = min_time / repeats
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= per_round / 10 or number >= 10 ** 7:
+            break
+        number *= 10
+    number = max(1, int(number * per_round / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeats, number=number)) / number * 1e9
+
+
+def run(names: List[str] = None, min_time: float = 0.2, repeats: int = 5) -> Dict[str, float]:
+    """
+    运行基准（总是包含参考负载，在开始和结束时各测一次取较快的一次）
+    
+    Returns:
+        名称 -> 单次调用耗时（纳秒）
+    """
+    selected = [REFERENCE] + [name for name in (names or BENCHMARKS) if name != REFERENCE]
+    results = {}
+    for name in selected:
+        if name not in BENCHMARKS:
+            raise ValueError(f"未知基准: {name}")
+        results[name] = measure(BENCHMARKS[name](), min_time, repeats)
+    results[REFERENCE] = min(results[REFERENCE], measure(BENCHMARKS[REFERENCE](), min_time, repeats))
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict, threshold: float,
+            normalize: bool = True) -> List[Dict]:
+    """
+    与基线比较
+    
+    Args:
+        results: run 的结果
+        baseline: load_baseline 的结果
+        threshold: 允许变慢的百分比
+        normalize: 是否按参考负载换算机器速度
+    
+    Returns:
+        每个基准一行: {"name", "ns", "baseline_ns", "change"（百分比，基线没有时为 None）, "regressed"}
+    """
+    scale = 1.0
+    base_results = baseline.get("results", {})
+    if normalize and results.get(REFERENCE) and base_results.get(REFERENCE):
+        scale = results[REFERENCE] / base_results[REFERENCE]
+    rows = []
+    for name, ns in results.items():
+        if name == REFERENCE:
+            continue
+        base_ns = base_results.get(name)
+        change = None if not base_ns else (ns / (base_ns * scale) - 1) * 100
+        rows.append({"name": name, "ns": ns, "baseline_ns": base_ns, "change": change,
+                     "regressed": change is not None and change > threshold})
+    return rows
+
+
+def load_baseline(path: str = BASELINE_FILE) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results: Dict[str, float], path: str = BASELINE_FILE, merge: bool = True):
+    """保存基线（只运行部分基准时合并到已有基线）"""
+    baseline = (load_baseline(path) if merge else None) or {}
+    stored = baseline.get("results", {})
+    stored.update({name: round(ns, 1) for name, ns in results.items()})
+    baseline = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": stored,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="热路径微基准与性能回归检查")
+    parser.add_argument("--save", action="store_true", help="保存结果为新基线")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件")
+    parser.add_argument("--threshold", type=float, default=25.0, help="允许变慢的百分比")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="只运行指定基准")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每个基准的测量时间（秒）")
+    parser.add_argument("--repeats", type=int, default=5, help="测量轮数（取最快一轮）")
+    parser.add_argument("--no-normalize", action="store_true", help="不按参考负载换算机器速度")
+    args = parser.parse_args()
+    
+    results = run(args.only, args.min_time, args.repeats)
+    if args.save:
+        save_baseline(results, args.baseline, merge=bool(args.only))
+        for name, ns in results.items():
+            print(f"{name:32s} {ns / 1000:10.3f} µs")
+        print(f"基线已保存: {args.baseline}")
+        return 0
+    
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"没有基线文件 {args.baseline}，先运行 python benchmarks.py --save")
+        baseline = {}
+    rows = compare(results, baseline, args.threshold, not args.no_normalize)
+    print(f"参考负载: {results[REFERENCE] / 1000:.3f} µs (基线 "
+          f"{baseline.get('results', {}).get(REFERENCE, 0) / 1000:.3f} µs)")
+    for row in rows:
+        change = "   新基准" if row["change"] is None else f"{row['change']:+8.1f}%"
+        mark = "  ❌ 回归" if row["regressed"] else ""
+        print(f"{row['name']:32s} {row['ns'] / 1000:10.3f} µs {change}{mark}")
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"性能回归超过 {args.threshold:.0f}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@
 配置文件
 """
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,20 +20,39 @@ class Config:
     # =========================
     # Polymarket 配置
     # =========================
-    POLYMARKET_API_BASE = "https://clob.polymarket.com"
+    POLYMARKET_API_BASE = os.getenv("POLYMARKET_API_BASE", "https://clob.polymarket.com")
+    # 多个 API 地址（逗号分隔，按优先级排列），自动切换到最快的健康地址；为空时只使用 POLYMARKET_API_BASE
+    POLYMARKET_API_BASES = [url.strip() for url in os.getenv("POLYMARKET_API_BASES", "").split(",")
+                            if url.strip()] or [POLYMARKET_API_BASE]
     POLYMARKET_EVENT_SLUG = os.getenv("POLYMARKET_EVENT_SLUG", "bitcoin-up-or-down-january-30-7am-et")
     POLYMARKET_CONDITION_ID = os.getenv("POLYMARKET_CONDITION_ID", "")
     POLYMARKET_UP_TOKEN_ID = os.getenv("POLYMARKET_UP_TOKEN_ID", "")
     POLYMARKET_DOWN_TOKEN_ID = os.getenv("POLYMARKET_DOWN_TOKEN_ID", "")
+    POLYMARKET_TICK_SIZE = os.getenv("POLYMARKET_TICK_SIZE", "0.01")  # 市场最小价格变动
+    POLYMARKET_MIN_ORDER_SIZE = float(os.getenv("POLYMARKET_MIN_ORDER_SIZE", "5"))  # 最小下单份数
+    POLYMARKET_SIZE_STEP = float(os.getenv("POLYMARKET_SIZE_STEP", "0.01"))  # 下单份数步长
+    # 订单簿每边只解析最优的 N 档（0 表示全部）
+    POLYMARKET_BOOK_DEPTH = int(os.getenv("POLYMARKET_BOOK_DEPTH", "10")) or None
     POLYMARKET_PRIVATE_KEY = os.getenv("POLYMARKET_PRIVATE_KEY", "")
+    # CLOB L2 API 凭证（用户频道 / 订单查询）
+    POLYMARKET_API_KEY = os.getenv("POLYMARKET_API_KEY", "")
+    POLYMARKET_API_SECRET = os.getenv("POLYMARKET_API_SECRET", "")
+    POLYMARKET_API_PASSPHRASE = os.getenv("POLYMARKET_API_PASSPHRASE", "")
+    POLYMARKET_ADDRESS = os.getenv("POLYMARKET_ADDRESS", "")  # API 凭证所属的钱包地址（POLY_ADDRESS 头）
     
     # =========================
     # Opinion.trade 配置
     # =========================
     OPINION_API_BASE = os.getenv("OPINION_API_BASE", "https://proxy.opinion.trade:8443")
+    # 多个 API 地址（逗号分隔，按优先级排列），为空时只使用 OPINION_API_BASE
+    OPINION_API_BASES = [url.strip() for url in os.getenv("OPINION_API_BASES", "").split(",")
+                         if url.strip()] or [OPINION_API_BASE]
     OPINION_API_KEY = os.getenv("OPINION_API_KEY", "")
     OPINION_UP_TOKEN_ID = os.getenv("OPINION_UP_TOKEN_ID", "")
     OPINION_DOWN_TOKEN_ID = os.getenv("OPINION_DOWN_TOKEN_ID", "")
+    OPINION_TICK_SIZE = os.getenv("OPINION_TICK_SIZE", "0.001")  # 最小价格变动
+    OPINION_MIN_ORDER_SIZE = float(os.getenv("OPINION_MIN_ORDER_SIZE", "1"))  # 最小下单份数
+    OPINION_SIZE_STEP = float(os.getenv("OPINION_SIZE_STEP", "0.01"))  # 下单份数步长
     
     # =========================
     # 套利参数
@@ -40,6 +60,151 @@ class Config:
     ARBITRAGE_MAX_SUM_PRICE = float(os.getenv("ARBITRAGE_MAX_SUM_PRICE", "1.0"))
     ARBITRAGE_ORDER_USDC = float(os.getenv("ARBITRAGE_ORDER_USDC", "10.0"))
     MIN_PROFIT_MARGIN = 0.01  # 最小利润边际（1%）
+    # 各平台可用于套利的余额（USD），为空表示不限制
+    POLYMARKET_BALANCE = float(os.getenv("POLYMARKET_BALANCE")) if os.getenv("POLYMARKET_BALANCE") else None
+    OPINION_BALANCE = float(os.getenv("OPINION_BALANCE")) if os.getenv("OPINION_BALANCE") else None
+    # 市场没有配置 end_time 时假定的资金占用时间（秒），用于机会的优先级排序
+    CAPITAL_LOCKUP_SECONDS = float(os.getenv("CAPITAL_LOCKUP_SECONDS", "3600"))
+    # Polymarket 同平台完整组合套利（UP + DOWN）
+    COMPLETE_SET_ENABLED = os.getenv("COMPLETE_SET_ENABLED", "true").lower() == "true"
+    
+    # 报价最大年龄（秒），超过后放弃机会；STALE_QUOTE_MODE=downweight 时超过一半按比例缩小下单规模
+    STALE_QUOTE_MAX_AGE = float(os.getenv("STALE_QUOTE_MAX_AGE", "2.0"))
+    STALE_QUOTE_MODE = os.getenv("STALE_QUOTE_MODE", "reject")
+    
+    # 纸面交易: 订单由本地模拟撮合（paper_trading.py），行情仍来自真实接口
+    PAPER_TRADING = os.getenv("PAPER_TRADING", "false").lower() == "true"
+    # 模拟下单延迟（秒）
+    PAPER_LATENCY = float(os.getenv("PAPER_LATENCY", "0.05"))
+    
+    # 双边报价记录文件（JSON Lines，供 replay.py 回放），为空时不记录
+    QUOTE_RECORD_FILE = os.getenv("QUOTE_RECORD_FILE", "")
+    
+    # 同一机会（市场 + 策略）两次下单的最短间隔（秒）
+    OPPORTUNITY_COOLDOWN = float(os.getenv("OPPORTUNITY_COOLDOWN", "30"))
+    # 冷却期内利润提高超过该值时允许再次下单
+    OPPORTUNITY_EDGE_CHANGE = float(os.getenv("OPPORTUNITY_EDGE_CHANGE", "0.005"))
+    # 只收到机会、不知道机会何时消失的运行时（多进程分片）超过该时间未再收到即视为结束（秒）
+    OPPORTUNITY_STALE_AFTER = float(os.getenv("OPPORTUNITY_STALE_AFTER", "10"))
+    
+    # =========================
+    # 订单跟踪
+    # =========================
+    ORDER_STATUS_BATCH_SIZE = int(os.getenv("ORDER_STATUS_BATCH_SIZE", "100"))  # 每次批量查询的订单数
+    USE_USER_CHANNEL = os.getenv("USE_USER_CHANNEL", "false").lower() == "true"  # 使用 Polymarket 用户频道推送
+    
+    # =========================
+    # 批量下单
+    # =========================
+    ORDER_BATCH_ENABLED = os.getenv("ORDER_BATCH_ENABLED", "false").lower() == "true"  # 同一周期的多个机会一起提交
+    POLYMARKET_BATCH_ORDER_LIMIT = int(os.getenv("POLYMARKET_BATCH_ORDER_LIMIT", "15"))  # POST /orders 每次最多订单数
+    ORDER_SUBMIT_WORKERS = int(os.getenv("ORDER_SUBMIT_WORKERS", "8"))  # 并发提交的线程数
+    
+    # =========================
+    # 状态持久化（快速重启）
+    # =========================
+    STATE_DIR = os.getenv("STATE_DIR", "state")  # 快照和状态日志目录，留空则不持久化
+    STATE_SNAPSHOT_INTERVAL = float(os.getenv("STATE_SNAPSHOT_INTERVAL", "60"))  # 快照间隔（秒）
+    STATE_MAX_TRADES = int(os.getenv("STATE_MAX_TRADES", "1000"))  # 快照保留的最近交易记录数
+    STATE_FSYNC = os.getenv("STATE_FSYNC", "false").lower() == "true"  # 每条日志都 fsync（防断电，较慢）
+    
+    # =========================
+    # 启动预检（preflight.py）
+    # =========================
+    PREFLIGHT_WORKERS = int(os.getenv("PREFLIGHT_WORKERS", "16"))  # 并行预检的线程数（API Key / 连接预热 / 首批订单簿）
+    
+    # =========================
+    # 多端点探测与切换（endpoints.py，配置多个 API 地址时生效）
+    # =========================
+    ENDPOINT_PROBE_INTERVAL = float(os.getenv("ENDPOINT_PROBE_INTERVAL", "5"))  # 后台探测间隔（秒）
+    ENDPOINT_PROBE_TIMEOUT = float(os.getenv("ENDPOINT_PROBE_TIMEOUT", "2"))  # 探测请求超时（秒）
+    ENDPOINT_EWMA_ALPHA = float(os.getenv("ENDPOINT_EWMA_ALPHA", "0.3"))  # RTT / 错误率的指数加权系数
+    ENDPOINT_ERROR_THRESHOLD = float(os.getenv("ENDPOINT_ERROR_THRESHOLD", "0.5"))  # 错误率达到该值视为不健康
+    ENDPOINT_SWITCH_MARGIN = float(os.getenv("ENDPOINT_SWITCH_MARGIN", "0.2"))  # 当前地址比最快地址慢不超过该比例时不切换
+    
+    # =========================
+    # 单腿风险处理
+    # =========================
+    UNWIND_TIME_BUDGET = float(os.getenv("UNWIND_TIME_BUDGET", "2.0"))  # 处理单腿风险的时间预算（秒）
+    UNWIND_PRICE_STEP = float(os.getenv("UNWIND_PRICE_STEP", "0.01"))  # 每次重试让出的价格
+    UNWIND_MAX_ATTEMPTS = int(os.getenv("UNWIND_MAX_ATTEMPTS", "3"))  # 每种处理方式的最多尝试次数
+    UNWIND_MAX_LOSS = float(os.getenv("UNWIND_MAX_LOSS", "0.02"))  # 重试 / 对冲允许的每份最大亏损
+    
+    # =========================
+    # 下单前风控（risk_gate.py），0 表示不限制
+    # =========================
+    RISK_MAX_MARKET_NOTIONAL = float(os.getenv("RISK_MAX_MARKET_NOTIONAL", "200"))  # 单个市场的名义金额上限（USD）
+    RISK_MAX_TOTAL_NOTIONAL = float(os.getenv("RISK_MAX_TOTAL_NOTIONAL", "1000"))  # 所有市场的名义金额上限（USD）
+    RISK_MAX_ORDERS_PER_SECOND = float(os.getenv("RISK_MAX_ORDERS_PER_SECOND", "10"))  # 每秒最多下单数
+    RISK_MAX_OPEN_LEGS = int(os.getenv("RISK_MAX_OPEN_LEGS", "20"))  # 同时未完结的订单腿上限
+    RISK_KILL_SWITCH = os.getenv("RISK_KILL_SWITCH", "false").lower() == "true"  # 启动即处于紧急停止状态
+    
+    # =========================
+    # 多市场 / 多进程分片
+    # =========================
+    # JSON 文件，内容为市场列表，每项包含 market_id / poly_up_token_id / poly_down_token_id 等
+    ARBITRAGE_MARKETS_FILE = os.getenv("ARBITRAGE_MARKETS_FILE", "")
+    SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(max(1, (os.cpu_count() or 2) - 2))))
+    
+    # =========================
+    # asyncio 运行时
+    # =========================
+    ASYNC_QUEUE_SIZE = int(os.getenv("ASYNC_QUEUE_SIZE", "1"))  # 各阶段之间的队列容量
+    ASYNC_DRAIN_TIMEOUT = float(os.getenv("ASYNC_DRAIN_TIMEOUT", "30"))  # 停止时等待订单执行完毕的最长时间
+    
+    # =========================
+    # 按需采样分析（profiler.py）
+    # =========================
+    PROFILE_SIGNAL = os.getenv("PROFILE_SIGNAL", "true").lower() == "true"  # 收到 SIGUSR1 时开始采样
+    PROFILE_ADMIN_PORT = int(os.getenv("PROFILE_ADMIN_PORT", "0"))  # 本地管理端口，0 表示不开启
+    PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "10"))  # 每次采样时长（秒）
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # 采样间隔（秒）
+    PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")  # 结果文件目录
+    
+    # =========================
+    # 飞行记录器（flight_recorder.py）
+    # =========================
+    FLIGHT_RECORDER_SIZE = int(os.getenv("FLIGHT_RECORDER_SIZE", "200"))  # 内存中保留的周期数
+    FLIGHT_RECORDER_DIR = os.getenv("FLIGHT_RECORDER_DIR", "flight_records")  # 写盘目录，留空则不写盘
+    FLIGHT_RECORDER_LATENCY_MS = float(os.getenv("FLIGHT_RECORDER_LATENCY_MS", "2000"))  # 周期耗时超过该值时写盘，0 表示不检查
+    FLIGHT_RECORDER_COOLDOWN = float(os.getenv("FLIGHT_RECORDER_COOLDOWN", "10"))  # 两次写盘的最短间隔（秒）
+    
+    @classmethod
+    def load_markets(cls) -> list:
+        """
+        加载要监控的市场列表
+        
+        未配置 ARBITRAGE_MARKETS_FILE 时，返回由单市场配置组成的列表
+        
+        Returns:
+            市场字典列表
+        """
+        if not cls.ARBITRAGE_MARKETS_FILE:
+            return [{
+                "market_id": cls.POLYMARKET_CONDITION_ID or cls.POLYMARKET_EVENT_SLUG,
+                "condition_id": cls.POLYMARKET_CONDITION_ID,
+                "poly_up_token_id": cls.POLYMARKET_UP_TOKEN_ID,
+                "poly_down_token_id": cls.POLYMARKET_DOWN_TOKEN_ID,
+                "opinion_up_token_id": cls.OPINION_UP_TOKEN_ID,
+                "opinion_down_token_id": cls.OPINION_DOWN_TOKEN_ID,
+                "tick_size": cls.POLYMARKET_TICK_SIZE,
+            }]
+        
+        with open(cls.ARBITRAGE_MARKETS_FILE, "r", encoding="utf-8") as f:
+            markets = json.load(f)
+        
+        for i, market in enumerate(markets):
+            # 多结果市场使用 outcomes 列表: [{"name": ..., "poly_token_id": ..., "opinion_token_id": ...}]
+            if market.get("outcomes"):
+                if any(not outcome.get("poly_token_id") and not outcome.get("opinion_token_id")
+                       for outcome in market["outcomes"]):
+                    raise ValueError(f"市场配置第 {i} 项的 outcomes 缺少 token_id")
+            elif not market.get("poly_up_token_id") or not market.get("poly_down_token_id"):
+                raise ValueError(f"市场配置第 {i} 项缺少 poly_up_token_id 或 poly_down_token_id")
+            market.setdefault("market_id", market.get("condition_id") or str(i))
+            market.setdefault("tick_size", cls.POLYMARKET_TICK_SIZE)
+        
+        return markets
     
     @classmethod
     def validate(cls):
@@ -0,0 +1,300 @@
+"""
+多端点延迟探测与自动切换
+
+每个平台可以配置多个 API 地址（POLYMARKET_API_BASES / OPINION_API_BASES，逗号分隔，按优先级排列）。
+EndpointPool 为每个地址维护:
+- RTT: 探测（HEAD base_url）测得的往返时间，指数加权平均
+- 错误率: 探测和实际请求的失败比例，指数加权平均
+- 连续失败次数
+
+请求发往最快的健康端点（没有连续失败且错误率低于阈值）。当前端点只比最快端点慢不到
+ENDPOINT_SWITCH_MARGIN 时不切换，避免在相近的端点之间来回切换。
+GET 请求遇到连接错误、超时或 5xx 时立即在下一个端点重试，调用方无感知；其他请求不重试。
+失败的端点在探测成功之前不再被选中。
+
+RTT 只取自探测而不取自实际请求，各端点按相同的请求比较，不受服务端处理耗时影响。
+同一平台的客户端共用一个端点池（shared_pool），后台探测线程由 start_probing 统一启动；
+只配置一个地址时不启动探测线程。
+"""
+import time
+import logging
+import threading
+import requests
+from typing import Optional, Dict, List
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """单个 API 地址的延迟和错误统计"""
+    
+    __slots__ = ("url", "rtt", "error_rate", "failures", "requests", "errors", "last_error")
+    
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.rtt: Optional[float] = None  # 秒，尚未探测成功时为 None
+        self.error_rate = 0.0
+        self.failures = 0  # 连续失败次数
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+    
+    def healthy(self, error_threshold: float) -> bool:
+        return self.failures == 0 and self.error_rate < error_threshold
+    
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "rtt_ms": None if self.rtt is None else round(self.rtt * 1000, 2),
+            "error_rate": round(self.error_rate, 3),
+            "failures": self.failures,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class EndpointPool:
+    """一个平台的多个 API 地址"""
+    
+    def __init__(self, name: str, urls: List[str], alpha: float = None, error_threshold: float = None,
+                 switch_margin: float = None, probe_timeout: float = None):
+        """
+        Args:
+            name: 平台名（日志用）
+            urls: API 地址列表，按优先级排列（都未探测时使用第一个）
+            alpha: RTT 和错误率的指数加权系数
+            error_threshold: 错误率达到该值的端点视为不健康
+            switch_margin: 当前端点比最快端点慢不超过该比例时不切换
+            probe_timeout: 探测请求超时（秒）
+        """
+        urls = list(dict.fromkeys(url.rstrip("/") for url in urls if url))
+        if not urls:
+            raise ValueError(f"{name} 没有配置 API 地址")
+        self.name = name
+        self.alpha = Config.ENDPOINT_EWMA_ALPHA if alpha is None else alpha
+        self.error_threshold = Config.ENDPOINT_ERROR_THRESHOLD if error_threshold is None else error_threshold
+        self.switch_margin = Config.ENDPOINT_SWITCH_MARGIN if switch_margin is None else switch_margin
+        self.probe_timeout = Config.ENDPOINT_PROBE_TIMEOUT if probe_timeout is None else probe_timeout
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.stats = {"switches": 0, "failovers": 0, "probes": 0}
+        self._current = self.endpoints[0]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[requests.Session] = None
+    
+    @property
+    def current(self) -> str:
+        """当前使用的 API 地址"""
+        return self._current.url
+    
+    def record(self, url: str, ok: bool, rtt: float = None, error: str = None):
+        """
+        记录一次探测或请求的结果，并重新选择端点
+        
+        Args:
+            url: 端点地址
+            ok: 是否成功
+            rtt: 探测测得的往返时间（秒），实际请求不传
+            error: 失败原因
+        """
+        with self._lock:
+            endpoint = next((e for e in self.endpoints if e.url == url), None)
+            if endpoint is None:
+                return
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.failures = 0
+                if rtt is not None:
+                    endpoint.rtt = rtt if endpoint.rtt is None else endpoint.rtt + self.alpha * (rtt - endpoint.rtt)
+            else:
+                endpoint.failures += 1
+                endpoint.errors += 1
+                endpoint.last_error = error
+            self._select()
+    
+    def _select(self):
+        """选择最快的健康端点（调用方持有锁）"""
+        healthy = [e for e in self.endpoints if e.healthy(self.error_threshold)]
+        current = self._current
+        if healthy:
+            best = min(healthy, key=lambda e: float("inf") if e.rtt is None else e.rtt)
+            if current in healthy and current is not best and current.rtt is not None and best.rtt is not None \
+                    and current.rtt <= best.rtt * (1 + self.switch_margin):
+                best = current
+        else:
+            # 全部不健康时选择最可能恢复的端点，不比当前端点好时不切换
+            key = lambda e: (e.failures, e.error_rate)
+            best = min(self.endpoints, key=key)
+            if key(best) >= key(current):
+                best = current
+        if best is not current:
+            self._current = best
+            self.stats["switches"] += 1
+            rtt = "未知" if best.rtt is None else f"{best.rtt * 1000:.1f} ms"
+            logger.warning(f"{self.name} 切换 API 地址: {current.url} -> {best.url} (RTT {rtt}, "
+                           f"原地址连续失败 {current.failures} 次, 错误率 {current.error_rate:.0%})")
+    
+    def _candidates(self) -> List[Endpoint]:
+        """请求依次尝试的端点: 当前端点、其他健康端点（按 RTT）、不健康端点（按失败次数）"""
+        with self._lock:
+            current = self._current
+            others = [e for e in self.endpoints if e is not current]
+        healthy = sorted((e for e in others if e.healthy(self.error_threshold)),
+                         key=lambda e: float("inf") if e.rtt is None else e.rtt)
+        unhealthy = sorted((e for e in others if not e.healthy(self.error_threshold)),
+                           key=lambda e: (e.failures, e.error_rate))
+        return [current] + healthy + unhealthy
+    
+    def request(self, session: requests.Session, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        向当前端点发送请求；GET 请求失败时依次在其他端点重试
+        
+        Args:
+            session: 发送请求的会话（客户端自己的会话，保留其请求头和连接池）
+            method: HTTP 方法
+            path: 以 / 开头的路径
+            **kwargs: 传给 session.request
+        
+        Returns:
+            第一个成功的响应；所有端点都返回 5xx 时返回最后一个响应
+        
+        Raises:
+            requests.RequestException: 所有端点都连接失败或超时
+        """
+        candidates = self._candidates()
+        if method.upper() != "GET":
+            candidates = candidates[:1]
+        last_error, last_response = None, None
+        for attempt, endpoint in enumerate(candidates):
+            endpoint.requests += 1
+            try:
+                response = session.request(method, endpoint.url + path, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(endpoint.url, False, error=str(e))
+                last_error = e
+                continue
+            if response.status_code >= 500:
+                self.record(endpoint.url, False, error=f"HTTP {response.status_code}")
+                last_response = response
+                continue
+            self.record(endpoint.url, True)
+            if attempt:
+                self.stats["failovers"] += 1
+                logger.info(f"{self.name} 请求 {path} 已切换到 {endpoint.url} (第 {attempt + 1} 个端点)")
+            return response
+        if last_response is not None:
+            return last_response
+        raise last_error
+    
+    def probe_once(self, session: requests.Session = None, timeout: float = None) -> Dict[str, Optional[int]]:
+        """
+        依次探测所有端点（HEAD base_url，任何非 5xx 响应都算可达）
+        
+        Args:
+            session: 探测使用的会话，默认使用端点池自己的会话（保持与各端点的连接）
+            timeout: 超时（秒），默认使用 probe_timeout
+        
+        Returns:
+            地址 -> HTTP 状态码，连接失败时为 None
+        """
+        if session is None:
+            if self._session is None:
+                self._session = requests.Session()
+            session = self._session
+        timeout = timeout or self.probe_timeout
+        results = {}
+        for endpoint in self.endpoints:
+            started = time.perf_counter()
+            try:
+                status = session.head(endpoint.url, timeout=timeout).status_code
+            except requests.RequestException as e:
+                self.record(endpoint.url, False, error=str(e))
+                results[endpoint.url] = None
+                continue
+            ok = status < 500
+            self.record(endpoint.url, ok, time.perf_counter() - started if ok else None,
+                        None if ok else f"HTTP {status}")
+            results[endpoint.url] = status
+        self.stats["probes"] += 1
+        return results
+    
+    def start(self, interval: float = None) -> bool:
+        """
+        启动后台探测线程（立即探测一次，之后每 interval 秒一次）
+        
+        Returns:
+            是否启动（只有一个地址或已在运行时不启动）
+        """
+        if len(self.endpoints) < 2 or self._thread is not None:
+            return False
+        interval = Config.ENDPOINT_PROBE_INTERVAL if interval is None else interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._probe_loop, args=(interval,),
+                                        name=f"probe-{self.name}", daemon=True)
+        self._thread.start()
+        return True
+    
+    def _probe_loop(self, interval: float):
+        while True:
+            try:
+                self.probe_once()
+            except Exception as e:
+                logger.error(f"{self.name} 端点探测失败: {e}")
+            if self._stop.wait(interval):
+                return
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.probe_timeout * len(self.endpoints) + 1)
+            self._thread = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, current=self._current.url,
+                        endpoints=[endpoint.to_dict() for endpoint in self.endpoints])
+
+
+# 平台名 -> 共用的端点池
+_pools: Dict[str, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def shared_pool(name: str, urls: List[str]) -> EndpointPool:
+    """同一平台的客户端共用一个端点池（第一次调用时创建）"""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = EndpointPool(name, urls)
+        return pool
+
+
+def start_probing(interval: float = None) -> List[str]:
+    """
+    启动所有共用端点池的后台探测
+    
+    Returns:
+        启动了探测的平台名
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.name for pool in pools if pool.start(interval)]
+
+
+def stop_probing():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.stop()
+
+
+def get_stats() -> Dict[str, Dict]:
+    """平台名 -> 端点池统计"""
+    with _pools_lock:
+        return {name: pool.get_stats() for name, pool in _pools.items()}
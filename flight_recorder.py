@@ -0,0 +1,174 @@
+"""
+周期飞行记录器
+
+出问题时日志里通常只有 _run_cycle 的最后一条消息。FlightRecorder 在内存中保留最近 N 个周期的记录
+（固定容量的环形缓冲区，旧记录被覆盖），每条记录包含:
+- 各市场的最优报价（买价 / 卖价及数量，整数单位）
+- 检测到的机会及其成本、利润，和每个机会的处理结果（冷却跳过 / 余额不足 / 执行成功 / 执行失败）
+- 各阶段耗时（获取订单簿、检测、资金分配、执行、订单刷新）
+
+正常运行时只在内存中追加，不做任何 I/O；出现执行失败、周期异常或耗时超过阈值时，
+把整个缓冲区写入 FLIGHT_RECORDER_DIR 下的 JSON 文件，保留异常前后的完整上下文。
+"""
+import os
+import json
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List
+from config import Config
+from replay import snapshot as quote_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 触发写盘的原因
+REASON_EXCEPTION = "exception"
+REASON_EXECUTION_FAILED = "execution_failed"
+REASON_LATENCY = "latency"
+
+
+class CycleTrace:
+    """单个检测周期的记录"""
+    
+    __slots__ = ("cycle", "wall_time", "books", "opportunities", "stages", "anomalies", "error", "_by_id", "_lap")
+    
+    def __init__(self, cycle: int):
+        self.cycle = cycle
+        self.wall_time = time.time()
+        self.books: List[Dict] = []
+        self.opportunities: List[Dict] = []
+        self.stages: Dict[str, float] = {}
+        self.anomalies: List[str] = []
+        self.error: Optional[str] = None
+        self._by_id: Dict[int, Dict] = {}
+        self._lap = time.perf_counter()
+    
+    def lap(self, stage: str):
+        """把上次计时以来的耗时累加到阶段（毫秒）"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._lap) * 1000
+        self._lap = now
+    
+    def book(self, prices: Dict):
+        """记录 get_books 返回的最优报价"""
+        if "outcome_asks" in prices:
+            self.books.append({"market_id": prices.get("market_id"), "outcome_asks": prices["outcome_asks"]})
+            return
+        record = quote_snapshot(prices)
+        if record is not None:
+            del record["ts"]
+            self.books.append(record)
+    
+    def opportunity(self, opportunity: Dict):
+        """记录检测到的机会"""
+        entry = {
+            "market_id": opportunity.get("market_id"),
+            "strategy": opportunity.get("strategy"),
+            "total_cost": opportunity.get("total_cost"),
+            "profit": opportunity.get("profit"),
+            "decision": None,
+        }
+        self.opportunities.append(entry)
+        self._by_id[id(opportunity)] = entry
+    
+    def decide(self, opportunity: Dict, decision: str, **detail):
+        """记录机会的处理结果"""
+        entry = self._by_id.get(id(opportunity))
+        if entry is not None:
+            entry["decision"] = decision
+            entry.update(detail)
+    
+    def flag(self, reason: str):
+        """标记本周期需要写盘"""
+        if reason not in self.anomalies:
+            self.anomalies.append(reason)
+    
+    @property
+    def total_ms(self) -> float:
+        return sum(self.stages.values())
+    
+    def to_dict(self) -> Dict:
+        return {
+            "cycle": self.cycle,
+            "wall_time": self.wall_time,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+            "books": self.books,
+            "opportunities": self.opportunities,
+            "anomalies": self.anomalies,
+            "error": self.error,
+        }
+
+
+class FlightRecorder:
+    """最近 N 个周期记录的环形缓冲区"""
+    
+    def __init__(self, capacity: int = None, output_dir: str = None, latency_ms: float = None,
+                 cooldown: float = None, clock=time.monotonic):
+        """
+        Args:
+            capacity: 保留的周期数
+            output_dir: 写盘目录，空字符串表示只保留在内存中
+            latency_ms: 周期耗时超过该值（毫秒）时写盘，0 表示不检查
+            cooldown: 两次写盘的最短间隔（秒），期间的异常周期留在缓冲区中由下一次写盘带上
+            clock: 单调时钟（测试可替换）
+        """
+        self.capacity = Config.FLIGHT_RECORDER_SIZE if capacity is None else capacity
+        self.output_dir = Config.FLIGHT_RECORDER_DIR if output_dir is None else output_dir
+        self.latency_ms = Config.FLIGHT_RECORDER_LATENCY_MS if latency_ms is None else latency_ms
+        self.cooldown = Config.FLIGHT_RECORDER_COOLDOWN if cooldown is None else cooldown
+        self.clock = clock
+        self.traces = deque(maxlen=self.capacity)
+        self.cycles = 0
+        self.last_file: Optional[str] = None
+        self.stats = {"dumps": 0, "suppressed": 0}
+        self._dumped_at: Optional[float] = None
+    
+    def begin(self) -> CycleTrace:
+        """开始记录一个周期（覆盖最旧的记录）"""
+        self.cycles += 1
+        trace = CycleTrace(self.cycles)
+        self.traces.append(trace)
+        return trace
+    
+    def finish(self, trace: CycleTrace) -> Optional[str]:
+        """
+        周期结束: 出现异常、执行失败或耗时超过阈值时写盘
+        
+        Returns:
+            写入的文件路径，没有写盘时返回 None
+        """
+        if trace.error is not None:
+            trace.flag(REASON_EXCEPTION)
+        if self.latency_ms and trace.total_ms > self.latency_ms:
+            trace.flag(REASON_LATENCY)
+        if not trace.anomalies:
+            return None
+        return self.dump("+".join(trace.anomalies))
+    
+    def dump(self, reason: str) -> Optional[str]:
+        """把缓冲区中的全部周期写入 JSON 文件"""
+        now = self.clock()
+        if self._dumped_at is not None and now - self._dumped_at < self.cooldown:
+            self.stats["suppressed"] += 1
+            return None
+        self._dumped_at = now
+        if not self.output_dir:
+            return None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, datetime.now().strftime(f"flight-%Y%m%d-%H%M%S-{self.cycles}.json"))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"reason": reason, "cycles": [trace.to_dict() for trace in self.traces]},
+                          f, ensure_ascii=False, default=str)
+        except OSError as e:
+            logger.error(f"写入飞行记录失败: {e}")
+            return None
+        self.stats["dumps"] += 1
+        self.last_file = path
+        logger.warning(f"飞行记录已写入 ({reason}, 最近 {len(self.traces)} 个周期): {path}")
+        return path
+    
+    def get_stats(self) -> Dict:
+        return dict(self.stats, cycles=self.cycles, buffered=len(self.traces))
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+合成订单簿负载生成器（检测器吞吐量压力测试）
+
+每个合成市场有一个随机游走的公允概率，Polymarket UP / DOWN 订单簿分别围绕
+公允概率和 1 - 公允概率生成（两者联动），Opinion.trade 报价在公允概率上叠加平台价差噪声，
+并以 dislocation_rate 的概率偏离一段距离，产生真实的套利信号。
+
+更新流预先生成并循环回放（生成开销不计入测量），每条更新驱动一次完整周期：
+ArbitrageDetector.get_books（订单簿解析）+ detect_opportunities。
+in-process 模式由合成行情源直接返回原始订单簿，http 模式通过本地替身 /book 服务
+（local_standin.StandInBookServer）走真实的 PolymarketClient 传输层。
+
+报告最大可持续更新速率、内存增长和延迟分位数（延迟从计划时间算起，包含排队）。
+
+用法:
+    python loadgen.py --markets 500 --rate 2000 --duration 5
+    python loadgen.py --markets 500 --ramp
+    python loadgen.py --mode http --ramp
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from typing import Optional, Dict, List, Tuple
+from arbitrage_detector import ArbitrageDetector
+from ticks import ONE, Quote, parse_book, size_to_units
+
+logger = logging.getLogger(__name__)
+
+# 可持续的判断: 实际速率不低于目标的比例
+SUSTAINED_RATIO = 0.95
+
+
+class SyntheticMarket:
+    """单个合成市场的行情状态"""
+    
+    def __init__(self, index: int, rng: random.Random, depth: int = 10,
+                 volatility: int = 20, dislocation_rate: float = 0.01):
+        """
+        Args:
+            index: 市场序号
+            rng: 随机数生成器
+            depth: 每边档位数
+            volatility: 公允概率每次更新的随机游走标准差（整数价格单位）
+            dislocation_rate: Opinion.trade 报价偏离（产生套利信号）的概率
+        """
+        self.rng = rng
+        self.depth = depth
+        self.volatility = volatility
+        self.dislocation_rate = dislocation_rate
+        self.market = {
+            "market_id": f"load-{index}",
+            "poly_up_token_id": f"load-{index}-up",
+            "poly_down_token_id": f"load-{index}-down",
+            "opinion_up_token_id": f"load-{index}-opinion",
+        }
+        self.fair = rng.randint(2000, 8000)
+        # Opinion.trade 相对 Polymarket 的平台价差（整数价格单位）
+        self.basis = rng.randint(-50, 50)
+        self.version = 0
+    
+    def step(self) -> Tuple[Dict, Dict, Quote]:
+        """
+        推进一步随机游走
+        
+        Returns:
+            (UP 原始订单簿, DOWN 原始订单簿, Opinion.trade 报价)，订单簿与 /book 接口格式相同
+        """
+        rng = self.rng
+        self.fair = min(9500, max(500, self.fair + int(rng.gauss(0, self.volatility))))
+        self.version += 1
+        spread = rng.choice((100, 100, 200, 300))
+        # UP ask + DOWN ask 略大于 1，与真实市场一致
+        up = self._raw_book(self.fair - spread // 2, self.fair + spread // 2)
+        down = self._raw_book(ONE - self.fair - spread // 2, ONE - self.fair + spread // 2)
+        
+        mid = self.fair + self.basis
+        if rng.random() < self.dislocation_rate:
+            mid += rng.choice((-1, 1)) * rng.randint(300, 600)
+        mid = min(9800, max(200, mid))
+        opinion_spread = rng.choice((100, 200))
+        opinion = Quote(mid - opinion_spread // 2, size_to_units(rng.randint(50, 500)),
+                        mid + opinion_spread // 2, size_to_units(rng.randint(50, 500)))
+        return up, down, opinion
+    
+    def _raw_book(self, bid: int, ask: int) -> Dict:
+        rng = self.rng
+        bids = [
+            {"price": f"{(bid - i * 100) / ONE:.4f}", "size": f"{rng.uniform(10, 1000):.2f}"}
+            for i in range(self.depth) if bid - i * 100 > 0
+        ]
+        asks = [
+            {"price": f"{(ask + i * 100) / ONE:.4f}", "size": f"{rng.uniform(10, 1000):.2f}"}
+            for i in range(self.depth) if ask + i * 100 < ONE
+        ]
+        # 接口返回的档位顺序不保证最优在前
+        return {
+            "hash": f"{self.market['market_id']}-{self.version}",
+            "timestamp": str(int(time.time() * 1000)),
+            "bids": bids[::-1],
+            "asks": asks[::-1],
+        }
+
+
+class SyntheticPolymarketFeed:
+    """in-process 模式的 Polymarket 行情源: 返回最新原始订单簿的解析结果"""
+    
+    def __init__(self):
+        self.books: Dict[str, Dict] = {}
+    
+    def get_book_ticks(self, token_id: str, depth: int = None) -> Optional[Dict]:
+        orderbook = self.books.get(token_id)
+        if orderbook is None:
+            return None
+        book = parse_book(orderbook, depth)
+        book["received_at"] = time.monotonic()
+        book["received_wall"] = time.time()
+        book["venue_ts"] = int(orderbook["timestamp"]) / 1000
+        return book
+
+
+class SyntheticOpinionFeed:
+    """Opinion.trade 行情源: 返回最新报价"""
+    
+    def __init__(self):
+        self.quotes: Dict[str, Quote] = {}
+    
+    def get_quote(self, token_id: str = None) -> Optional[Quote]:
+        return self.quotes.get(token_id)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50 / p90 / p99 / max（毫秒），最近秩法"""
+    if not samples:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        "p50": ordered[int(last * 0.50)] * 1000,
+        "p90": ordered[int(last * 0.90)] * 1000,
+        "p99": ordered[int(last * 0.99)] * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+def _rss_kb() -> Optional[int]:
+    """当前常驻内存（KB），无法获取时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # 非 Linux 平台只能取到峰值
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+
+class LoadGenerator:
+    """合成负载生成与测量"""
+    
+    def __init__(self, num_markets: int = 100, mode: str = "inprocess", seed: int = None,
+                 depth: int = 10, volatility: int = 20, dislocation_rate: float = 0.01,
+                 stream_size: int = 20000):
+        """
+        Args:
+            num_markets: 市场数量
+            mode: inprocess（直接返回原始订单簿）或 http（经本地替身 /book 服务）
+            seed: 随机数种子
+            depth: 每边档位数
+            volatility: 公允概率随机游走标准差（整数价格单位）
+            dislocation_rate: 每条更新产生 Opinion.trade 偏离的概率
+            stream_size: 预生成的更新条数（循环回放）
+        """
+        if mode not in ("inprocess", "http"):
+            raise ValueError(f"未知模式: {mode}")
+        self.mode = mode
+        rng = random.Random(seed)
+        self.markets = [
+            SyntheticMarket(i, rng, depth, volatility, dislocation_rate) for i in range(num_markets)
+        ]
+        self.stream = self._generate(rng, stream_size)
+        self.opinion_feed = SyntheticOpinionFeed()
+        self.poly_feed = None
+        self.server = None
+    
+    def _generate(self, rng: random.Random, stream_size: int) -> List[Tuple[SyntheticMarket, Dict, Dict, Quote]]:
+        stream = []
+        for _ in range(stream_size):
+            market = rng.choice(self.markets)
+            stream.append((market, *market.step()))
+        return stream
+    
+    def attach(self, detector: ArbitrageDetector) -> ArbitrageDetector:
+        """把检测器的行情源替换为合成行情（http 模式启动本地替身服务）"""
+        if self.mode == "http":
+            from local_standin import StandInBookServer
+            self.server = StandInBookServer().start()
+            detector.polymarket.base_url = self.server.url
+            self.poly_feed = self.server
+        else:
+            self.poly_feed = SyntheticPolymarketFeed()
+            detector.polymarket = self.poly_feed
+        detector.opinion_trade = self.opinion_feed
+        # 预热: 每个市场先有一份完整行情
+        for market in self.markets:
+            up, down, opinion = market.step()
+            self._apply(market, up, down, opinion)
+        return detector
+    
+    def close(self):
+        """关闭本地替身服务"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+    
+    def _apply(self, market: SyntheticMarket, up: Dict, down: Dict, opinion: Quote):
+        # 更新流是预生成后循环回放的，平台时间戳按回放时刻重写，否则会被当成过期报价
+        up["timestamp"] = down["timestamp"] = str(int(time.time() * 1000))
+        self.poly_feed.books[market.market["poly_up_token_id"]] = up
+        self.poly_feed.books[market.market["poly_down_token_id"]] = down
+        self.opinion_feed.quotes[market.market["opinion_up_token_id"]] = opinion
+    
+    def run(self, detector: ArbitrageDetector, rate: float = None, duration: float = 5.0,
+            max_updates: int = None) -> Dict:
+        """
+        按目标速率回放更新流并测量
+        
+        Args:
+            detector: 已 attach 的检测器
+            rate: 目标更新速率（次/秒），None 表示不限速（测量最大处理能力）
+            duration: 运行时间（秒）
+            max_updates: 最多处理的更新数
+        
+        Returns:
+            统计: target_rate / updates / elapsed / achieved_rate / opportunities /
+            latency_ms（从计划时间算起）/ service_ms（处理耗时）/ rss_growth_kb
+        """
+        interval = 1.0 / rate if rate else 0.0
+        stream, stream_len = self.stream, len(self.stream)
+        latencies, service_times = [], []
+        opportunities = 0
+        rss_before = _rss_kb()
+        
+        start = time.perf_counter()
+        deadline = start + duration
+        count = 0
+        while max_updates is None or count < max_updates:
+            if rate:
+                scheduled = start + count * interval
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    break
+            
+            market, up, down, opinion = stream[count % stream_len]
+            self._apply(market, up, down, opinion)
+            begin = time.perf_counter()
+            prices = detector.get_books(market.market)
+            if prices:
+                opportunities += len(detector.detect_opportunities(prices))
+            end = time.perf_counter()
+            
+            service_times.append(end - begin)
+            latencies.append(end - scheduled)
+            count += 1
+        elapsed = time.perf_counter() - start
+        
+        rss_after = _rss_kb()
+        return {
+            "mode": self.mode,
+            "markets": len(self.markets),
+            "target_rate": rate,
+            "updates": count,
+            "elapsed": elapsed,
+            "achieved_rate": count / elapsed if elapsed > 0 else 0.0,
+            "opportunities": opportunities,
+            "latency_ms": percentiles(latencies),
+            "service_ms": percentiles(service_times),
+            "rss_growth_kb": None if rss_before is None or rss_after is None else rss_after - rss_before,
+        }
+    
+    @staticmethod
+    def sustained(stats: Dict, max_p99_ms: float) -> bool:
+        """实际速率达到目标且 p99 延迟未超过上限"""
+        return (stats["achieved_rate"] >= stats["target_rate"] * SUSTAINED_RATIO
+                and stats["latency_ms"]["p99"] <= max_p99_ms)
+    
+    def find_max_rate(self, detector: ArbitrageDetector, start_rate: float = 100.0,
+                      duration: float = 2.0, max_p99_ms: float = 100.0, refine_steps: int = 3) -> Dict:
+        """
+        逐步提高目标速率（翻倍后二分细化），找到最大可持续更新速率
+        
+        Returns:
+            {"max_sustained_rate", "runs": 每次运行的统计}
+        """
+        # 预热（首次解析 / 连接建立），不计入结果
+        self.run(detector, None, duration, max_updates=200)
+        runs = []
+        good, bad = None, None
+        rate = start_rate
+        while bad is None:
+            stats = self.run(detector, rate, duration)
+            runs.append(stats)
+            logger.info(f"目标 {rate:.0f}/s: 实际 {stats['achieved_rate']:.0f}/s, "
+                        f"p99 {stats['latency_ms']['p99']:.2f} ms")
+            if self.sustained(stats, max_p99_ms):
+                good, rate = rate, rate * 2
+            else:
+                bad = rate
+        for _ in range(refine_steps if good else 0):
+            rate = (good + bad) / 2
+            stats = self.run(detector, rate, duration)
+            runs.append(stats)
+            if self.sustained(stats, max_p99_ms):
+                good = rate
+            else:
+                bad = rate
+        return {"max_sustained_rate": good or 0.0, "runs": runs}
+
+
+def _print_stats(stats: Dict):
+    latency, service = stats["latency_ms"], stats["service_ms"]
+    target = f"{stats['target_rate']:.0f}/s" if stats["target_rate"] else "不限速"
+    print(f"[{stats['mode']}] {stats['markets']} 个市场, 目标 {target}: "
+          f"实际 {stats['achieved_rate']:.0f} 次/秒 ({stats['updates']} 次, {stats['elapsed']:.2f}s), "
+          f"机会 {stats['opportunities']} 个")
+    print(f"  延迟 p50 {latency['p50']:.3f} / p90 {latency['p90']:.3f} / p99 {latency['p99']:.3f} / "
+          f"max {latency['max']:.3f} ms; 处理 p50 {service['p50']:.3f} / p99 {service['p99']:.3f} ms")
+    if stats["rss_growth_kb"] is not None:
+        print(f"  内存增长 {stats['rss_growth_kb']} KB")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="检测器合成负载压力测试")
+    parser.add_argument("--markets", type=int, default=100, help="市场数量")
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--rate", type=float, default=None, help="目标更新速率（次/秒），默认不限速")
+    parser.add_argument("--duration", type=float, default=5.0, help="每次运行时间（秒）")
+    parser.add_argument("--ramp", action="store_true", help="逐步提高速率，找到最大可持续速率")
+    parser.add_argument("--max-p99-ms", type=float, default=100.0, help="可持续速率允许的 p99 延迟")
+    parser.add_argument("--depth", type=int, default=10, help="每边档位数")
+    parser.add_argument("--dislocation-rate", type=float, default=0.01, help="Opinion.trade 偏离概率")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    # 检测器的逐条警告 / 机会日志会淹没输出，只保留错误
+    logging.basicConfig(level=logging.ERROR)
+    logger.setLevel(logging.INFO)
+    
+    generator = LoadGenerator(args.markets, args.mode, args.seed, args.depth,
+                              dislocation_rate=args.dislocation_rate)
+    detector = generator.attach(ArbitrageDetector())
+    try:
+        if args.ramp:
+            result = generator.find_max_rate(detector, duration=args.duration, max_p99_ms=args.max_p99_ms)
+            for stats in result["runs"]:
+                _print_stats(stats)
+            print(f"最大可持续更新速率: {result['max_sustained_rate']:.0f} 次/秒 (p99 <= {args.max_p99_ms} ms)")
+        else:
+            _print_stats(generator.run(detector, args.rate, args.duration))
+    finally:
+        generator.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
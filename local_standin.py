@@ -0,0 +1,273 @@
+"""
+本地替身平台
+
+在不访问真实 API 的情况下模拟 Polymarket / Opinion.trade 客户端的下单和订单查询接口，
+用于本地测试执行、订单跟踪等逻辑
+"""
+import gzip
+import json
+import time
+import hashlib
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Optional, Dict, List, Callable
+
+
+class StandInVenue:
+    """
+    本地替身平台
+    
+    实现与真实客户端相同的 place_order / get_order_statuses 接口，
+    成交和撤单由测试代码通过 fill() / cancel() 推进，
+    下单失败和延迟可通过 fail_next / fail_all / fail_batches / latency 注入
+    （延迟超过调用传入的 timeout 时等待 timeout 后抛出 TimeoutError，与真实客户端的请求超时一致）；
+    batch_order_limit > 0 时提供批量下单 place_orders
+    """
+    
+    def __init__(self, name: str, latency: float = 0.0, batch_order_limit: int = 0):
+        self.name = name
+        self.latency = latency
+        self.batch_order_limit = batch_order_limit
+        self.fail_next = 0
+        self.fail_all = False
+        self.fail_batches = 0
+        self.orders: Dict[str, Dict] = {}
+        self.prices: Dict[str, float] = {}
+        self.status_requests = 0
+        self.order_requests = 0
+        self.batch_sizes: List[int] = []
+        self._ids = itertools.count(1)
+        self._subscribers: List[Callable[[List[Dict]], None]] = []
+        self._lock = threading.Lock()
+    
+    def place_order(self, *args, **kwargs) -> Optional[str]:
+        """
+        下单（兼容两个客户端的参数名: size / amount, outcome / side）
+        
+        Returns:
+            订单ID，注入失败时返回 None
+        """
+        self._delay(kwargs.get("timeout"))
+        with self._lock:
+            self.order_requests += 1
+            return self._place(kwargs)
+    
+    def place_orders(self, orders: List[Dict]) -> Optional[List[Optional[str]]]:
+        """
+        批量下单（一次请求）
+        
+        Returns:
+            与 orders 顺序对应的订单ID；注入整批失败时返回 None
+        """
+        self._delay()
+        with self._lock:
+            self.order_requests += 1
+            if not 0 < len(orders) <= self.batch_order_limit:
+                raise ValueError(f"批量下单数量 {len(orders)} 超出上限 {self.batch_order_limit}")
+            if self.fail_batches > 0:
+                self.fail_batches -= 1
+                return None
+            self.batch_sizes.append(len(orders))
+            return [self._place(order) for order in orders]
+    
+    def _delay(self, timeout: float = None):
+        """模拟请求延迟"""
+        if not self.latency:
+            return
+        if timeout is not None and self.latency > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TimeoutError(f"{self.name} 请求超时 ({timeout:.3f} 秒)")
+        time.sleep(self.latency)
+    
+    def _place(self, kwargs: Dict) -> Optional[str]:
+        """登记一个订单（调用方持有锁）"""
+        if self.fail_all or self.fail_next > 0:
+            self.fail_next = max(0, self.fail_next - 1)
+            return None
+        order_id = f"{self.name}-{next(self._ids)}"
+        self.orders[order_id] = {
+            "order_id": order_id,
+            "outcome": kwargs.get("outcome", kwargs.get("side")),
+            "side": kwargs.get("side", "BUY") if "outcome" in kwargs else "BUY",
+            "size": kwargs.get("size", kwargs.get("amount")),
+            "price": kwargs.get("price"),
+            "status": "acked",
+            "filled_size": 0.0,
+        }
+        return order_id
+    
+    def get_best_price_from_token_id(self, token_id: str, side: str = "BUY",
+                                     timeout: float = None) -> Optional[float]:
+        """获取 prices 中设置的价格"""
+        self._delay(timeout)
+        return self.prices.get(token_id)
+    
+    def get_order_statuses(self, order_ids: List[str]) -> List[Dict]:
+        """批量查询订单状态"""
+        with self._lock:
+            self.status_requests += 1
+            return [self._status(self.orders[order_id]) for order_id in order_ids if order_id in self.orders]
+    
+    def subscribe(self, callback: Callable[[List[Dict]], None]):
+        """订阅订单状态推送（模拟用户频道）"""
+        self._subscribers.append(callback)
+    
+    def fill(self, order_id: str, size: float = None):
+        """成交指定数量，默认全部成交"""
+        with self._lock:
+            order = self.orders[order_id]
+            remaining = order["size"] - order["filled_size"]
+            order["filled_size"] += remaining if size is None else min(size, remaining)
+            order["status"] = "filled" if order["filled_size"] >= order["size"] else "partial"
+            update = self._status(order)
+        self._publish([update])
+    
+    def cancel(self, order_id: str):
+        """撤销订单"""
+        with self._lock:
+            order = self.orders[order_id]
+            order["status"] = "cancelled"
+            update = self._status(order)
+        self._publish([update])
+    
+    def _publish(self, updates: List[Dict]):
+        for callback in self._subscribers:
+            callback(updates)
+    
+    @staticmethod
+    def _status(order: Dict) -> Dict:
+        return {
+            "order_id": order["order_id"],
+            "status": order["status"],
+            "filled_size": order["filled_size"],
+        }
+
+
+class StandInBookServer:
+    """
+    本地替身 /book HTTP 服务
+    
+    在本机随机端口上提供与 Polymarket CLOB 相同格式的 /book 接口，
+    可开关 gzip 压缩和 ETag 条件请求，用于测试传输层逻辑；
+    latency 为每个请求的响应延迟，设置 api_key 时同时提供 Opinion.trade 的 /openapi/market（校验 apikey 头）；
+    opinion_books 中的订单簿通过 Opinion.trade 的 /openapi/token/orderbook 提供；
+    orders 中的 CLOB 订单对象通过 /data/orders（只列出 LIVE 订单，每页 page_size 个）和 /data/order/{id} 提供，
+    缺少 L2 认证头的请求返回 401
+    """
+    
+    L2_HEADERS = ("POLY_ADDRESS", "POLY_SIGNATURE", "POLY_TIMESTAMP", "POLY_API_KEY", "POLY_PASSPHRASE")
+    
+    def __init__(self, use_gzip: bool = True, use_etag: bool = True, latency: float = 0.0, api_key: str = None,
+                 page_size: int = 2):
+        self.books: Dict[str, Dict] = {}
+        self.opinion_books: Dict[str, Dict] = {}
+        self.orders: Dict[str, Dict] = {}
+        self.page_size = page_size
+        self.order_requests: List[str] = []
+        self.use_gzip = use_gzip
+        self.use_etag = use_etag
+        self.latency = latency
+        self.api_key = api_key
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "StandInBookServer":
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def _handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                # 预热连接: 只建立连接，不返回内容
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            
+            def do_GET(self):
+                request = urlparse(self.path)
+                token_id = parse_qs(request.query).get("token_id", [""])[0]
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if request.path == "/openapi/market" and server.api_key is not None:
+                    self.send_response(200 if self.headers.get("apikey") == server.api_key else 401)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if request.path.startswith("/data/order"):
+                    self._orders(request)
+                    return
+                if request.path == "/openapi/token/orderbook":
+                    book = server.opinion_books.get(token_id)
+                    self._json(200, {"code": 0, "msg": "success", "result": book} if book is not None
+                               else {"code": 404, "msg": "token not found", "result": None})
+                    return
+                if request.path != "/book" or token_id not in server.books:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                
+                body = json.dumps(server.books[token_id]).encode()
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if server.use_etag and self.headers.get("If-None-Match") == etag:
+                    server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if server.use_etag:
+                    self.send_header("ETag", etag)
+                if server.use_gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                server.bytes_sent += len(body)
+            
+            def _orders(self, request):
+                server.order_requests.append(request.path)
+                if not all(self.headers.get(name) for name in server.L2_HEADERS):
+                    self._json(401, {"error": "Unauthorized"})
+                elif request.path == "/data/orders":
+                    live = [order for order in server.orders.values() if order["status"] == "LIVE"]
+                    start = int(parse_qs(request.query).get("next_cursor", ["0"])[0])
+                    end = start + server.page_size
+                    self._json(200, {"data": live[start:end], "next_cursor": str(end) if end < len(live) else "LTE="})
+                else:
+                    self._json(200, server.orders.get(request.path[len("/data/order/"):]))
+            
+            def _json(self, status: int, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        return Handler
@@ -3,9 +3,21 @@
 """
 import time
 import logging
+import traceback
+import argparse
 from datetime import datetime
 from arbitrage_detector import ArbitrageDetector
 from arbitrage_executor import ArbitrageExecutor
+from opportunity_tracker import OpportunityTracker
+from allocator import CapitalAllocator
+from positions import summary_lines
+from order_tracker import PolymarketUserChannel
+from state_store import StateStore, restore_executor
+from flight_recorder import FlightRecorder, REASON_EXECUTION_FAILED
+from preflight import run_parallel, warm_up, breakdown
+import endpoints
+import paper_trading
+import profiler
 from config import Config, POLL_INTERVAL, LOG_LEVEL
 
 # 配置日志
@@ -25,6 +37,10 @@ class ArbitrageBot:
     """套利机器人主类"""
     
     def __init__(self):
+        # 启动各阶段耗时（毫秒），第一个检测周期结束后输出
+        self.startup_phases = {}
+        self._created_at = phase_started = time.perf_counter()
+        self._preflight_done = None
         # 验证配置
         try:
             Config.validate()
@@ -32,16 +48,35 @@ class ArbitrageBot:
             logger.error(f"配置验证失败: {e}")
             logger.error("请检查 .env 文件中的配置")
             raise
+        phase_started = self._phase("配置校验", phase_started)
         
         self.detector = ArbitrageDetector()
-        self.executor = ArbitrageExecutor()
+        if Config.PAPER_TRADING:
+            self.executor = ArbitrageExecutor(*paper_trading.install(self.detector))
+        else:
+            self.executor = ArbitrageExecutor()
+        phase_started = self._phase("创建客户端", phase_started)
+        self.markets = Config.load_markets()
+        self._phase("加载市场", phase_started)
+        self.tracker = OpportunityTracker()
+        self.allocator = CapitalAllocator()
+        self.user_channel = None
+        if Config.USE_USER_CHANNEL:
+            # Polymarket 订单状态由用户频道推送，不再每轮批量查询；其他平台照常轮询
+            self.user_channel = PolymarketUserChannel(self.executor.order_tracker)
+        self.profiler = profiler.SamplingProfiler()
+        self.profiler_admin = None
         self.running = False
         self.stats = {
             "checks": 0,
             "opportunities_found": 0,
+            "opportunities_suppressed": 0,
+            "opportunities_unfunded": 0,
             "trades_executed": 0,
-            "total_profit": 0.0
+            "expected_profit": 0.0
         }
+        self.state_store = StateStore() if Config.STATE_DIR else None
+        self.flight_recorder = FlightRecorder()
     
     def start(self):
         """启动机器人"""
@@ -54,11 +89,32 @@ class ArbitrageBot:
         logger.info(f"订单金额: ${Config.ARBITRAGE_ORDER_USDC}")
         logger.info("=" * 60)
         
+        first_books, preflight_steps = self._preflight()
         self.running = True
+        if self.user_channel:
+            # 订阅所有市场（恢复状态可能补充了市场列表）
+            condition_ids = list(dict.fromkeys(m["condition_id"] for m in self.markets if m.get("condition_id")))
+            if condition_ids:
+                self.user_channel.markets = condition_ids
+            self.user_channel.start()
+        # 配置了多个 API 地址的平台在后台探测延迟，请求自动切换到最快的健康地址
+        for name in endpoints.start_probing():
+            logger.info(f"{name} API 地址探测已启动: {endpoints.get_stats()[name]['current']}")
+        # 空闲时不采样，收到 SIGUSR1 或管理端口请求时才启动采样线程
+        _, self.profiler_admin = profiler.install(self.profiler)
+        self.executor.risk_gate.install_signal_handler()
         
         try:
             while self.running:
-                self._run_cycle()
+                self._run_cycle(first_books)
+                if first_books is not None:
+                    first_books = None
+                    self._phase("首个检测周期", self._preflight_done)
+                    logger.info(f"启动后 {(time.perf_counter() - self._created_at) * 1000:.0f} ms 完成首个检测周期")
+                    for line in breakdown(self.startup_phases, preflight_steps):
+                        logger.info(line)
+                if self.state_store and self.state_store.snapshot_due():
+                    self._write_snapshot()
                 time.sleep(POLL_INTERVAL)
         except KeyboardInterrupt:
             logger.info("收到停止信号，正在关闭...")
@@ -67,48 +123,240 @@ class ArbitrageBot:
             logger.error(f"运行时错误: {e}", exc_info=True)
             self.stop()
     
-    def _run_cycle(self):
-        """运行一个检测周期"""
+    def _phase(self, name: str, started: float) -> float:
+        """记录一个串行启动阶段的耗时，返回当前时间作为下一阶段的起点"""
+        now = time.perf_counter()
+        self.startup_phases[name] = (now - started) * 1000
+        return now
+    
+    def _preflight(self):
+        """
+        恢复持久化状态后并行执行启动时的网络准备
+        
+        状态恢复会改写市场列表并写快照，必须在获取订单簿之前完成；它只读本地磁盘，串行执行不影响总耗时。
+        
+        Returns:
+            (首批订单簿: 市场序号 -> 价格字典, 各步骤结果)
+        """
+        started = time.perf_counter()
+        if self.state_store:
+            try:
+                self._restore_state()
+            except Exception as e:
+                logger.error(f"恢复状态失败: {e}")
+            started = self._phase("恢复状态", started)
+        
+        tasks = [("Opinion.trade API Key", self.detector.opinion_trade.test_api_key)]
+        # 检测器的 Opinion.trade 会话已由 API Key 校验预热
+        for label, client in (("检测 Polymarket", self.detector.polymarket),
+                              ("执行 Polymarket", self.executor.polymarket),
+                              ("执行 Opinion.trade", self.executor.opinion_trade)):
+            tasks.append((f"预热连接 {label}", lambda client=client: warm_up(client)))
+        for i, market in enumerate(self.markets):
+            tasks.append((f"books:{i}", lambda market=market: self.detector.get_books(market)))
+        
+        steps = run_parallel(tasks)
+        self._preflight_done = self._phase("并行预检", started)
+        
+        if steps["Opinion.trade API Key"]["result"] is not True:
+            logger.error("Opinion.trade API Key 校验未通过，下单可能失败")
+        first_books = {int(name[len("books:"):]): step["result"] for name, step in steps.items()
+                       if name.startswith("books:") and step["result"]}
+        return first_books, steps
+    
+    def _run_cycle(self, prefetched: dict = None):
+        """
+        运行一个检测周期
+        
+        Args:
+            prefetched: 启动预检已获取的订单簿（市场序号 -> 价格字典），这些市场本周期不再请求
+        """
+        trace = self.flight_recorder.begin()
         try:
             self.stats["checks"] += 1
             
-            # 检测套利机会
-            opportunity = self.detector.check_arbitrage_opportunity()
+            # 检测所有市场的套利机会（每个市场跨平台 + Polymarket 完整组合共用同一批订单簿）
+            opportunities = []
+            fetched = set()
+            for i, market in enumerate(self.markets):
+                prices = prefetched.get(i) if prefetched else None
+                if prices is None:
+                    prices = self.detector.get_books(market)
+                trace.lap("books")
+                if not prices:
+                    continue
+                fetched.add(self.tracker.market_of(market))
+                trace.book(prices)
+                # 用本周期的报价标记已有持仓
+                self.executor.ledger.mark_prices(prices)
+                detected = self.detector.detect_opportunities(prices)
+                for opportunity in detected:
+                    trace.opportunity(opportunity)
+                opportunities.extend(detected)
+                trace.lap("detect")
             
-            if opportunity:
-                self.stats["opportunities_found"] += 1
-                logger.info(f"发现套利机会: {opportunity['strategy']}")
-                logger.info(f"  总成本: ${opportunity['total_cost']:.4f}")
-                logger.info(f"  预期利润: ${opportunity['profit']:.4f} ({opportunity['profit_percent']:.2f}%)")
-                
-                # 执行套利
-                success = self.executor.execute_arbitrage(opportunity)
-                
-                if success:
-                    self.stats["trades_executed"] += 1
-                    profit = opportunity["profit"] * 100  # 假设投资 $100
-                    self.stats["total_profit"] += profit
-                    logger.info(f"套利交易执行成功！预期利润: ${profit:.2f}")
+            # 本周期的候选机会按 每美元每秒预期利润 排序后在各平台余额内分配资金
+            candidates = []
+            for opportunity in opportunities:
+                if self._should_fire(opportunity):
+                    candidates.append(opportunity)
                 else:
-                    logger.warning("套利交易执行失败")
-            else:
+                    trace.decide(opportunity, "suppressed")
+            allocations = self.allocator.allocate(candidates)
+            self.stats["opportunities_unfunded"] += len(candidates) - len(allocations)
+            funded = {id(allocation.opportunity) for allocation in allocations}
+            for opportunity in candidates:
+                if id(opportunity) not in funded:
+                    trace.decide(opportunity, "unfunded")
+            trace.lap("allocate")
+            if allocations:
+                self._execute_allocations(allocations, trace)
+                trace.lap("execute")
+            
+            if not opportunities:
                 # 每100次检查打印一次状态
                 if self.stats["checks"] % 100 == 0:
                     logger.debug(f"检查中... (已检查 {self.stats['checks']} 次)")
+            
+            # 没有取到订单簿的市场无法判断机会是否消失，保留其跟踪记录
+            self.tracker.close_missing(opportunities, fetched=fetched)
+            
+            # 批量刷新未完结订单的状态
+            self.executor.refresh_orders(pushed=self.user_channel.venues if self.user_channel else ())
+            trace.lap("orders")
         
         except Exception as e:
+            trace.error = traceback.format_exc()
             logger.error(f"检测周期错误: {e}", exc_info=True)
+        finally:
+            self.flight_recorder.finish(trace)
+    
+    def _should_fire(self, opportunity: dict) -> bool:
+        """去重：同一价差仍在冷却期内时不重复下单"""
+        if not self.tracker.should_fire(opportunity):
+            self.stats["opportunities_suppressed"] += 1
+            logger.debug(f"套利机会仍在冷却中，跳过: {opportunity['strategy']}")
+            return False
+        self.stats["opportunities_found"] += 1
+        return True
+    
+    def _execute_allocations(self, allocations: list, trace=None):
+        """执行本周期分配到资金的套利机会（多个机会时一起批量下单）并更新统计"""
+        for allocation in allocations:
+            opportunity = allocation.opportunity
+            logger.info(f"发现套利机会: {opportunity['strategy']} ({opportunity.get('market_id', '')})")
+            logger.info(f"  总成本: ${opportunity['total_cost']:.4f}")
+            logger.info(f"  预期利润: ${opportunity['profit']:.4f} ({opportunity['profit_percent']:.2f}%)")
+            logger.info(f"  分配资金: ${allocation.position_size:.2f}")
+            self.tracker.mark_executing(opportunity)
+        
+        # 执行套利
+        executed_before = len(self.executor.executed_trades)
+        # 执行器内部把异常按执行失败处理；这里兜底，保证每个机会都结束执行状态、归还资金分配
+        try:
+            if Config.ORDER_BATCH_ENABLED and len(allocations) > 1:
+                results = self.executor.execute_batch(
+                    [(allocation.opportunity, allocation.position_size) for allocation in allocations]
+                )
+            else:
+                results = [self.executor.execute(allocation.opportunity, allocation.position_size)
+                           for allocation in allocations]
+        except Exception as e:
+            logger.error(f"执行套利出错: {e}", exc_info=True)
+            results = [False] * len(allocations)
+        
+        for allocation, success in zip(allocations, results):
+            self.tracker.mark_result(allocation.opportunity, success)
+            if trace is not None:
+                trace.decide(allocation.opportunity, "executed" if success else "failed",
+                             position_size=allocation.position_size)
+                if not success:
+                    trace.flag(REASON_EXECUTION_FAILED)
+            if not success:
+                self.allocator.release(allocation)
+                logger.warning(f"套利交易执行失败: {allocation.opportunity['strategy']}")
+        
+        new_trades = self.executor.executed_trades[executed_before:]
+        if new_trades:
+            profit = sum(trade["expected_profit"] for trade in new_trades)
+            self.stats["trades_executed"] += len(new_trades)
+            self.stats["expected_profit"] += profit
+            if self.state_store:
+                self.state_store.append("stats", self.stats)
+            logger.info(f"套利交易执行成功 {len(new_trades)} 笔！预期利润: ${profit:.2f}")
+    
+    def _restore_state(self):
+        """从上次运行的快照 + 状态日志恢复统计、交易、订单、持仓和市场映射（不访问平台）"""
+        snapshot, events = restore_executor(self.state_store, self.executor)
+        if snapshot is not None:
+            self.stats.update(snapshot["stats"])
+            # 配置中仍存在的市场补齐上次运行记录的字段
+            saved = {market["market_id"]: market for market in snapshot["markets"] if "market_id" in market}
+            for market in self.markets:
+                for key, value in saved.get(market.get("market_id"), {}).items():
+                    market.setdefault(key, value)
+        for event_type, data in events:
+            if event_type == "stats":
+                self.stats.update(data)
+        # 立即写一次快照，把重放过的日志压缩掉
+        self._write_snapshot()
+    
+    def _write_snapshot(self):
+        try:
+            # 在日志锁内采集，用户频道线程的订单更新不会落在采集和快照序号之间
+            self.state_store.write_snapshot(lambda: {
+                "stats": self.stats,
+                "markets": self.markets,
+                "executor": self.executor.get_state(Config.STATE_MAX_TRADES),
+            })
+        except OSError as e:
+            logger.error(f"写入状态快照失败: {e}")
     
     def stop(self):
         """停止机器人"""
         self.running = False
+        if self.user_channel:
+            self.user_channel.stop()
+        if self.state_store:
+            self._write_snapshot()
+            self.state_store.close()
+        endpoints.stop_probing()
+        self.profiler.stop()
+        if self.profiler_admin:
+            self.profiler_admin.close()
+            self.profiler_admin = None
         logger.info("=" * 60)
         logger.info("套利机器人停止")
         logger.info(f"统计信息:")
         logger.info(f"  总检查次数: {self.stats['checks']}")
         logger.info(f"  发现机会: {self.stats['opportunities_found']}")
+        logger.info(f"  冷却跳过: {self.stats['opportunities_suppressed']}")
+        logger.info(f"  余额不足未执行: {self.stats['opportunities_unfunded']}")
+        logger.info(f"  资金分配: {self.allocator.get_stats()}")
+        tracker_stats = self.tracker.get_stats()
+        logger.info(f"  机会平均持续: {tracker_stats['avg_duration']:.2f} 秒 (已结束 {tracker_stats['closed']} 个)")
         logger.info(f"  执行交易: {self.stats['trades_executed']}")
-        logger.info(f"  总利润: ${self.stats['total_profit']:.2f}")
+        logger.info(f"  订单状态: {self.executor.order_tracker.get_stats()}")
+        logger.info(f"  下单前风控: {self.executor.risk_gate.get_stats()}")
+        logger.info(f"  批量下单: {self.executor.batch_stats}")
+        logger.info(f"  飞行记录: {self.flight_recorder.get_stats()}")
+        fetch_stats = self.detector.polymarket.get_fetch_stats()
+        logger.info(f"  订单簿请求: {fetch_stats['fetches']} 次 (304: {fetch_stats['not_modified']}, "
+                    f"未变化: {fetch_stats['unchanged']}), 平均传输 {fetch_stats['avg_wire_bytes']:.0f} B, "
+                    f"平均解析 {fetch_stats['avg_parse_ms']:.3f} ms")
+        for name, pool in endpoints.get_stats().items():
+            if len(pool["endpoints"]) > 1:
+                logger.info(f"  {name} API 地址: 当前 {pool['current']}, 切换 {pool['switches']} 次, "
+                            f"请求改道 {pool['failovers']} 次, " +
+                            ", ".join(f"{e['url']} RTT " + ("未知" if e["rtt_ms"] is None else f"{e['rtt_ms']} ms") +
+                                      f" 错误率 {e['error_rate']:.0%}" for e in pool["endpoints"]))
+        logger.info(f"  过期报价: 检测 {self.detector.stale_guard.get_stats()}, "
+                    f"执行前 {self.executor.stale_guard.get_stats()['rejected']}")
+        if Config.PAPER_TRADING:
+            logger.info(f"  模拟撮合: {self.executor.polymarket.exchange.get_stats()}")
+        logger.info(f"  下单时预期利润: ${self.stats['expected_profit']:.2f}")
+        for line in summary_lines(self.executor.ledger.snapshot(markets=False)):
+            logger.info(f"  {line}")
         logger.info("=" * 60)
     
     def print_stats(self):
@@ -123,6 +371,19 @@ class ArbitrageBot:
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Polymarket & Opinion.trade 套利机器人")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="使用 asyncio 运行时（每个市场独立的行情 / 检测 / 执行任务）")
+    args = parser.parse_args()
+    
+    if args.use_async:
+        from async_runtime import run
+        try:
+            run()
+        except Exception as e:
+            logger.error(f"程序异常退出: {e}", exc_info=True)
+        return
+    
     bot = ArbitrageBot()
     
     try:
@@ -0,0 +1,135 @@
+"""
+多结果（N 选 1）市场套利检测
+
+N 个互斥结果中必有一个结算为 1，因此每个结果各买一份的总成本 < 1 即为套利。
+每个结果在各平台中取最低卖价，组成跨平台最便宜的组合，计算量为 O(N)。
+MultiOutcomeBook 在单个价格更新时只重算该结果的最优平台，组合成本 O(1) 更新。
+"""
+from typing import Optional, Dict, List, Tuple, Sequence
+from config import Config
+from ticks import ONE, PRICE_SCALE, SIZE_SCALE, price_to_ticks, ticks_to_price, units_to_size
+
+# 没有卖单时的占位价格（大于任何有效价格）
+NO_PRICE = ONE * 1000
+
+MAX_SUM_TICKS = price_to_ticks(Config.ARBITRAGE_MAX_SUM_PRICE)
+MIN_PROFIT_TICKS = price_to_ticks(Config.MIN_PROFIT_MARGIN)
+
+# 单个档位: (价格, 数量)，数量为 None 表示平台未提供深度
+Level = Optional[Tuple[int, Optional[int]]]
+
+
+def _build_opportunity(market_id: str, outcomes: Sequence[str], venues: Sequence[str],
+                       legs: List[Tuple[int, int, Optional[int]]], cost: int) -> Optional[Dict]:
+    """根据每个结果的最优平台构造机会字典，不满足阈值时返回 None"""
+    if not (cost < MAX_SUM_TICKS and ONE - cost >= MIN_PROFIT_TICKS):
+        return None
+    
+    sizes = [size for _, _, size in legs if size is not None]
+    size_units = min(sizes) if sizes else None
+    profit = ticks_to_price(ONE - cost)
+    opportunity = {
+        "type": "multi_outcome",
+        "strategy": f"Basket x{len(outcomes)}",
+        "legs": [
+            {
+                "outcome": outcomes[i],
+                "venue": venues[venue_index],
+                "price": ticks_to_price(price),
+                "price_ticks": price,
+                "size": None if size is None else units_to_size(size),
+            }
+            for i, (price, venue_index, size) in enumerate(legs)
+        ],
+        "total_cost": ticks_to_price(cost),
+        "total_cost_ticks": cost,
+        "profit": profit,
+        "profit_percent": profit * 100,
+        "size": None if size_units is None else units_to_size(size_units),
+    }
+    if size_units is not None:
+        opportunity["expected_profit"] = (ONE - cost) * size_units / (PRICE_SCALE * SIZE_SCALE)
+    if market_id:
+        opportunity["market_id"] = market_id
+    return opportunity
+
+
+def detect_multi_outcome(asks: Dict[str, Sequence[Level]], outcomes: Sequence[str],
+                         market_id: str = None) -> Optional[Dict]:
+    """
+    检测 N 选 1 市场的跨平台组合套利
+    
+    Args:
+        asks: 平台名 -> 每个结果的最优卖价 [(price_ticks, size_units) 或 None, ...]
+        outcomes: 结果名称，顺序与 asks 中的列表一致
+        market_id: 市场ID
+    
+    Returns:
+        套利机会信息（legs 为每个结果选择的平台和价格），没有则返回 None
+    """
+    venues = list(asks)
+    if not venues:
+        return None
+    
+    # 每个结果取各平台中的最低卖价: zip(*) 按结果转置，min 在 C 层完成比较
+    columns = zip(*(
+        [(level[0], v, level[1]) if level else (NO_PRICE, v, None) for level in asks[venue]]
+        for v, venue in enumerate(venues)
+    ))
+    legs = [min(column, key=lambda leg: leg[0]) for column in columns]
+    if len(legs) != len(outcomes) or any(price >= NO_PRICE for price, _, _ in legs):
+        return None
+    
+    return _build_opportunity(market_id, outcomes, venues, legs, sum(price for price, _, _ in legs))
+
+
+class MultiOutcomeBook:
+    """
+    N 选 1 市场的增量组合簿
+    
+    维护每个结果在各平台的最优卖价、当前最优平台和组合总成本，
+    单个价格更新只需 O(平台数) 重算该结果，组合总成本 O(1) 调整
+    """
+    
+    def __init__(self, outcomes: Sequence[str], venues: Sequence[str], market_id: str = None):
+        self.market_id = market_id
+        self.outcomes = list(outcomes)
+        self.venues = list(venues)
+        self._venue_index = {venue: i for i, venue in enumerate(self.venues)}
+        n = len(self.outcomes)
+        # asks[venue_index][outcome_index] = (price, size)
+        self.asks: List[List[Tuple[int, Optional[int]]]] = [[(NO_PRICE, None)] * n for _ in self.venues]
+        self.best: List[Tuple[int, int, Optional[int]]] = [(NO_PRICE, 0, None)] * n
+        self.total = NO_PRICE * n
+        self.missing = n
+    
+    def update(self, venue: str, outcome_index: int, price_ticks: Optional[int], size_units: Optional[int] = None):
+        """
+        更新某平台某结果的最优卖价
+        
+        Args:
+            venue: 平台名
+            outcome_index: 结果序号
+            price_ticks: 最优卖价，None 表示没有卖单
+            size_units: 该价格的数量
+        """
+        v = self._venue_index[venue]
+        level = (NO_PRICE, None) if price_ticks is None else (price_ticks, size_units)
+        if self.asks[v][outcome_index] == level:
+            return
+        self.asks[v][outcome_index] = level
+        
+        old_price = self.best[outcome_index][0]
+        new_price, new_venue = min(
+            ((self.asks[i][outcome_index][0], i) for i in range(len(self.venues))),
+            key=lambda item: item[0]
+        )
+        self.best[outcome_index] = (new_price, new_venue, self.asks[new_venue][outcome_index][1])
+        self.total += new_price - old_price
+        self.missing += (new_price >= NO_PRICE) - (old_price >= NO_PRICE)
+    
+    def detect(self) -> Optional[Dict]:
+        """用当前组合成本检测套利，O(1) 判断，只有满足阈值时才构造机会"""
+        if self.missing or self.total >= MAX_SUM_TICKS or ONE - self.total < MIN_PROFIT_TICKS:
+            return None
+        return _build_opportunity(self.market_id, self.outcomes, self.venues, list(self.best), self.total)
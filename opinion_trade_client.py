@@ -1,19 +1,29 @@
 """
 Opinion.trade API 客户端
+
+报价来自订单簿接口（GET /openapi/token/orderbook），取不到订单簿时不报价，不用单一价格充当双边报价。
+下单和订单状态查询尚未接入: place_order 返回失败，也不提供 get_order_statuses
+（OrderTracker 不轮询没有状态查询接口的平台）
 """
 import requests
 import logging
 from typing import Optional, Dict
-from config import OPINION_API_BASE, OPINION_API_KEY
+from config import Config, OPINION_API_KEY
+from endpoints import EndpointPool, shared_pool
+from ticks import Quote, parse_book, quote_from_book, ticks_to_price
 
 logger = logging.getLogger(__name__)
 
+# 单个 token 的订单簿
+ORDERBOOK_PATH = "/openapi/token/orderbook"
+
 
 class OpinionTradeClient:
     """Opinion.trade API 客户端"""
     
     def __init__(self):
-        self.base_url = OPINION_API_BASE
+        # 所有 Opinion.trade 客户端共用的 API 地址池（多个地址时自动切换）
+        self.endpoints = shared_pool("opinion", Config.OPINION_API_BASES)
         self.api_key = OPINION_API_KEY
         self.session = requests.Session()
         self.session.headers.update({
@@ -21,6 +31,16 @@ class OpinionTradeClient:
             "apikey": self.api_key,
         })
     
+    @property
+    def base_url(self) -> str:
+        """当前使用的 API 地址"""
+        return self.endpoints.current
+    
+    @base_url.setter
+    def base_url(self, url: str):
+        """固定使用单个 API 地址（不探测、不切换）"""
+        self.endpoints = EndpointPool("opinion", [url])
+    
     def test_api_key(self) -> bool:
         """
         测试 API Key 是否有效
@@ -29,10 +49,9 @@ class OpinionTradeClient:
             True 如果有效，False 如果无效
         """
         try:
-            url = f"{self.base_url}/openapi/market"
             params = {"limit": 1}
             
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.endpoints.request(self.session, "GET", "/openapi/market", params=params, timeout=10)
             
             if response.status_code == 200:
                 logger.info("✓ Opinion.trade API Key 有效")
@@ -47,23 +66,67 @@ class OpinionTradeClient:
             logger.error(f"测试 Opinion.trade API Key 失败: {e}")
             return False
     
-    def get_market_price(self) -> Optional[float]:
+    def get_book_ticks(self, token_id: str = None, depth: int = 1, timeout: float = 10) -> Optional[Dict]:
         """
-        获取市场价格（需要根据实际 API 实现）
+        获取订单簿（整数价格单位，见 ticks.parse_book）
+        
+        Args:
+            token_id: Opinion.trade token_id，默认使用配置中的 UP token
+            depth: 每边保留的档位数
+            timeout: 请求超时（秒）
         
         Returns:
-            价格（0-1之间）
+            {"bids": 价格从高到低, "asks": 价格从低到高}，获取失败返回 None
         """
+        token_id = token_id or Config.OPINION_UP_TOKEN_ID
+        if not token_id:
+            logger.warning("没有配置 Opinion.trade token_id，无法获取订单簿")
+            return None
         try:
-            # TODO: 根据实际 Opinion.trade API 实现
-            # 这里需要根据实际的 API 端点调整
-            logger.warning("Opinion.trade 价格获取功能需要根据实际 API 实现")
+            response = self.endpoints.request(self.session, "GET", ORDERBOOK_PATH,
+                                              params={"token_id": token_id}, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            if data.get("code") not in (None, 0):
+                logger.error(f"获取 Opinion.trade 订单簿失败 (token_id={token_id}): {data.get('msg')}")
+                return None
+            return parse_book(data.get("result") or {}, depth)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"获取 Opinion.trade 订单簿失败 (token_id={token_id}): {e}")
             return None
         except Exception as e:
-            logger.error(f"获取 Opinion.trade 价格失败: {e}")
+            logger.error(f"解析 Opinion.trade 订单簿失败 (token_id={token_id}): {e}")
             return None
     
-    def place_order(self, topic_id: str, side: str, amount: float, price: float) -> bool:
+    def get_quote(self, token_id: str = None, timeout: float = 10) -> Optional[Quote]:
+        """
+        获取双边报价（最优买价 / 卖价及数量，整数价格单位）
+        
+        Args:
+            token_id: Opinion.trade UP token_id，默认使用配置中的值
+            timeout: 请求超时（秒）
+        
+        Returns:
+            Quote，获取失败返回 None
+        """
+        book = self.get_book_ticks(token_id, depth=1, timeout=timeout)
+        return quote_from_book(book) if book else None
+    
+    def get_market_price(self, token_id: str = None) -> Optional[float]:
+        """
+        UP 最优卖价（买入时支付的价格）
+        
+        Args:
+            token_id: Opinion.trade UP token_id，默认使用配置中的值
+        
+        Returns:
+            价格（0-1之间），获取失败或没有卖单时返回 None
+        """
+        quote = self.get_quote(token_id)
+        return None if quote is None or quote.ask is None else ticks_to_price(quote.ask)
+    
+    def place_order(self, topic_id: str, side: str, amount: float, price: float,
+                    timeout: float = 10) -> Optional[str]:
         """
         下单
         
@@ -72,14 +135,11 @@ class OpinionTradeClient:
             side: 方向 (YES/NO)
             amount: 数量
             price: 价格
-            
+            timeout: 请求超时（秒），单腿处理时传入剩余的时间预算
+        
         Returns:
-            是否成功
+            订单ID，失败返回 None
         """
-        try:
-            logger.info(f"Opinion.trade 下单: {side} {amount} @ {price}")
-            # TODO: 实现实际的API调用
-            return True
-        except Exception as e:
-            logger.error(f"Opinion.trade 下单失败: {e}")
-            return False
+        # 下单接口尚未接入。返回失败而不是编造订单ID: 编造的订单永远不会完结，会一直占用风控额度
+        logger.error(f"Opinion.trade 下单接口尚未实现，订单未提交: {side} {amount} @ {price}")
+        return None
@@ -0,0 +1,207 @@
+"""
+套利机会状态跟踪
+
+按 (市场, 策略) 跟踪每个机会的状态，避免同一个持续存在的价差在每个轮询周期重复下单。
+机会结束后仍保留最近一次下单的时间和利润直到冷却期结束，价差短暂消失（或一个周期没有取到订单簿）
+后重新出现时不会绕过冷却。
+"""
+import time
+import logging
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 机会状态
+OPEN = "open"              # 已发现，等待执行
+EXECUTING = "executing"    # 订单执行中
+FILLED = "filled"          # 已成交，冷却期内不再重复下单
+COOLDOWN = "cooldown"      # 执行失败，冷却期内不再重试
+
+
+class TrackedOpportunity:
+    """单个被跟踪的套利机会"""
+    
+    __slots__ = ("key", "state", "first_seen", "last_seen", "last_fired_at",
+                 "fired_profit", "max_profit", "fire_count")
+    
+    def __init__(self, key: Tuple[str, str], now: float, profit: float):
+        self.key = key
+        self.state = OPEN
+        self.first_seen = now
+        self.last_seen = now
+        self.last_fired_at = None
+        self.fired_profit = None
+        self.max_profit = profit
+        self.fire_count = 0
+    
+    @property
+    def duration(self) -> float:
+        """机会已持续的时间（秒）"""
+        return self.last_seen - self.first_seen
+
+
+class OpportunityTracker:
+    """套利机会状态机：去重、冷却，并记录每个机会的持续时间"""
+    
+    def __init__(self, cooldown: float = None, edge_change: float = None, history_size: int = 1000):
+        """
+        Args:
+            cooldown: 同一机会两次下单之间的最短间隔（秒）
+            edge_change: 冷却期内允许再次下单所需的最小利润提高
+            history_size: 保留的已结束机会记录数量
+        """
+        self.cooldown = Config.OPPORTUNITY_COOLDOWN if cooldown is None else cooldown
+        self.edge_change = Config.OPPORTUNITY_EDGE_CHANGE if edge_change is None else edge_change
+        self.active: Dict[Tuple[str, str], TrackedOpportunity] = {}
+        self.history = deque(maxlen=history_size)
+        # 已结束但仍在冷却期内的机会: 键 -> (状态, 最近下单时间, 下单时利润)
+        self._fired: Dict[Tuple[str, str], Tuple[str, float, float]] = {}
+    
+    @staticmethod
+    def market_of(record: Dict) -> str:
+        """机会或市场配置对应的跟踪市场键"""
+        return record.get("market_id") or Config.POLYMARKET_EVENT_SLUG
+    
+    @classmethod
+    def key_of(cls, opportunity: Dict) -> Tuple[str, str]:
+        """机会的跟踪键: (market_id, strategy)"""
+        return (cls.market_of(opportunity), opportunity["strategy"])
+    
+    def should_fire(self, opportunity: Dict, now: float = None) -> bool:
+        """
+        记录一次机会观测，并判断是否应该执行
+        
+        Args:
+            opportunity: 检测到的套利机会
+            now: 当前单调时钟时间，默认 time.monotonic()
+        
+        Returns:
+            True 表示应该下单
+        """
+        now = time.monotonic() if now is None else now
+        key = self.key_of(opportunity)
+        profit = opportunity["profit"]
+        
+        tracked = self.active.get(key)
+        if tracked is None:
+            tracked = TrackedOpportunity(key, now, profit)
+            self.active[key] = tracked
+            fired = self._fired.pop(key, None)
+            if fired is None or now - fired[1] >= self.cooldown:
+                return True
+            # 冷却期内重新出现: 沿用上次下单的状态，按冷却规则判断
+            tracked.state, tracked.last_fired_at, tracked.fired_profit = fired
+        
+        tracked.last_seen = now
+        tracked.max_profit = max(tracked.max_profit, profit)
+        
+        if tracked.state == OPEN:
+            return True
+        if tracked.state == EXECUTING:
+            return False
+        
+        # FILLED / COOLDOWN: 冷却结束或利润显著提高才再次下单（利润下降不会再次下单）
+        if now - tracked.last_fired_at >= self.cooldown:
+            return True
+        if profit - tracked.fired_profit >= self.edge_change:
+            logger.info(f"机会 {key} 利润提高 {tracked.fired_profit:.4f} -> {profit:.4f}，再次执行")
+            return True
+        return False
+    
+    def mark_executing(self, opportunity: Dict, now: float = None):
+        """标记机会开始执行"""
+        now = time.monotonic() if now is None else now
+        tracked = self.active.get(self.key_of(opportunity))
+        if tracked is None:
+            return
+        tracked.state = EXECUTING
+        tracked.last_fired_at = now
+        tracked.fired_profit = opportunity["profit"]
+        tracked.fire_count += 1
+    
+    def mark_result(self, opportunity: Dict, success: bool):
+        """记录执行结果：成功进入 FILLED，失败进入 COOLDOWN"""
+        tracked = self.active.get(self.key_of(opportunity))
+        if tracked is None:
+            return
+        tracked.state = FILLED if success else COOLDOWN
+    
+    def close_missing(self, seen: Iterable[Dict], now: float = None, market_id: str = None,
+                      fetched: Iterable[str] = None):
+        """
+        结束本周期未再出现的机会，并记录其持续时间
+        
+        Args:
+            seen: 本周期检测到的机会列表
+            now: 当前单调时钟时间
+            market_id: 只处理该市场的机会（按市场独立检测时使用）
+            fetched: 本周期成功获取订单簿的市场（market_of），只处理这些市场的机会；
+                     没有取到订单簿的市场无法判断机会是否还在
+        """
+        now = time.monotonic() if now is None else now
+        seen_keys = {self.key_of(opportunity) for opportunity in seen}
+        candidates = [key for key in self.active if key not in seen_keys]
+        if market_id is not None:
+            candidates = [key for key in candidates if key[0] == market_id]
+        if fetched is not None:
+            fetched = set(fetched)
+            candidates = [key for key in candidates if key[0] in fetched]
+        for key in candidates:
+            self._close(key, now)
+        self._expire_fired(now)
+    
+    def close_stale(self, max_age: float = None, now: float = None):
+        """
+        结束超过 max_age 秒未再观测到的机会（只收到机会、不知道机会何时消失的运行时使用）
+        
+        Args:
+            max_age: 最长未观测时间（秒），默认使用配置 OPPORTUNITY_STALE_AFTER
+            now: 当前单调时钟时间
+        """
+        now = time.monotonic() if now is None else now
+        max_age = Config.OPPORTUNITY_STALE_AFTER if max_age is None else max_age
+        for key in [key for key, tracked in self.active.items() if now - tracked.last_seen > max_age]:
+            self._close(key, now)
+        self._expire_fired(now)
+    
+    def _close(self, key: Tuple[str, str], now: float):
+        """结束一个机会（执行中的不结束），冷却期内保留最近一次下单"""
+        tracked = self.active[key]
+        if tracked.state == EXECUTING:
+            return
+        del self.active[key]
+        if tracked.last_fired_at is not None and now - tracked.last_fired_at < self.cooldown:
+            self._fired[key] = (tracked.state, tracked.last_fired_at, tracked.fired_profit)
+        self.history.append({
+            "market_id": key[0],
+            "strategy": key[1],
+            "duration": tracked.duration,
+            "max_profit": tracked.max_profit,
+            "fire_count": tracked.fire_count,
+            "final_state": tracked.state,
+        })
+        logger.info(f"套利机会结束: {key[0]} {key[1]}, 持续 {tracked.duration:.2f} 秒, "
+                    f"下单 {tracked.fire_count} 次")
+    
+    def _expire_fired(self, now: float):
+        """丢弃冷却期已过的下单记录"""
+        expired = [key for key, (_, fired_at, _) in self._fired.items() if now - fired_at >= self.cooldown]
+        for key in expired:
+            del self._fired[key]
+    
+    def get(self, opportunity: Dict) -> Optional[TrackedOpportunity]:
+        """获取机会的跟踪记录"""
+        return self.active.get(self.key_of(opportunity))
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        durations = [record["duration"] for record in self.history]
+        return {
+            "active": len(self.active),
+            "cooling": len(self._fired),
+            "closed": len(durations),
+            "avg_duration": sum(durations) / len(durations) if durations else 0.0,
+            "max_duration": max(durations) if durations else 0.0,
+        }
@@ -0,0 +1,318 @@
+"""
+订单生命周期跟踪
+
+跟踪每一条腿的订单确认、部分成交和撤单，并把成交回写到对应的交易记录。
+状态更新来自批量订单查询（每个平台每轮一次请求）或用户频道推送，不逐单轮询。
+"""
+import time
+import json
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Optional, Dict, List, Set, Callable, Iterable, ContextManager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 订单状态
+PENDING = "pending"        # 已提交，未确认
+ACKED = "acked"            # 交易所已确认挂单
+PARTIAL = "partial"        # 部分成交
+FILLED = "filled"          # 完全成交
+CANCELLED = "cancelled"    # 已撤单
+REJECTED = "rejected"      # 被拒绝
+
+FINAL_STATES = (FILLED, CANCELLED, REJECTED)
+
+
+class TrackedOrder:
+    """单个被跟踪的订单"""
+    
+    __slots__ = ("order_id", "venue", "trade_id", "leg", "size", "price",
+                 "market_id", "outcome", "side",
+                 "status", "filled_size", "created_at", "updated_at")
+    
+    def __init__(self, order_id: str, venue: str, trade_id: str, leg: str, size: float, price: float,
+                 market_id: str = None, outcome: str = None, side: str = "BUY"):
+        self.order_id = order_id
+        self.venue = venue
+        self.trade_id = trade_id
+        self.leg = leg
+        self.size = size
+        self.price = price
+        self.market_id = market_id
+        self.outcome = outcome
+        self.side = side
+        self.status = PENDING
+        self.filled_size = 0.0
+        self.created_at = time.monotonic()
+        self.updated_at = self.created_at
+    
+    @property
+    def is_open(self) -> bool:
+        return self.status not in FINAL_STATES
+    
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class OrderTracker:
+    """订单生命周期跟踪器"""
+    
+    def __init__(self, on_fill: Callable[[TrackedOrder, float], None] = None,
+                 batch_size: int = None, on_close: Callable[[TrackedOrder], None] = None):
+        """
+        Args:
+            on_fill: 成交回调，参数为 (订单, 本次新增成交数量)
+            batch_size: 每次批量查询的最大订单数
+            on_close: 订单完结（成交 / 撤单 / 拒绝）回调
+        """
+        self.on_fill = on_fill
+        self.on_close = on_close
+        # 状态日志回调 (事件类型, 数据)，见 state_store.py
+        self.journal: Optional[Callable[[str, Dict], None]] = None
+        # 与状态快照采集互斥的锁（StateStore.attach 设置）: 订单变化、日志和成交 / 完结回调在同一临界区内完成，
+        # 快照不会采集到订单已变化而账本和风控还没更新的中间状态
+        self.state_lock: ContextManager = nullcontext()
+        self.batch_size = batch_size or Config.ORDER_STATUS_BATCH_SIZE
+        self.orders: Dict[str, TrackedOrder] = {}
+        self._by_trade: Dict[str, List[TrackedOrder]] = {}
+        self._open_by_venue: Dict[str, Dict[str, None]] = {}
+        # 客户端没有订单状态查询接口的平台（poll 已报错，不轮询）
+        self.unsupported: Set[str] = set()
+        self._lock = threading.Lock()
+    
+    def track(self, order_id: str, venue: str, trade_id: str, leg: str,
+              size: float, price: float, market_id: str = None, outcome: str = None,
+              side: str = "BUY") -> TrackedOrder:
+        """开始跟踪一个新订单（market_id / outcome / side 用于把成交记入持仓账本）"""
+        order = TrackedOrder(order_id, venue, trade_id, leg, size, price, market_id, outcome, side)
+        with self.state_lock:
+            with self._lock:
+                self._add(order)
+            if self.journal:
+                self.journal("order", order.to_dict())
+        return order
+    
+    def restore(self, data: Dict) -> TrackedOrder:
+        """从状态快照 / 日志恢复一个订单（不触发回调）"""
+        order = TrackedOrder(data["order_id"], data["venue"], data["trade_id"], data["leg"], data["size"],
+                             data["price"], data.get("market_id"), data.get("outcome"), data.get("side", "BUY"))
+        order.status = data.get("status", PENDING)
+        order.filled_size = data.get("filled_size", 0.0)
+        with self._lock:
+            self._add(order)
+        return order
+    
+    def _add(self, order: TrackedOrder):
+        self.orders[order.order_id] = order
+        self._by_trade.setdefault(order.trade_id, []).append(order)
+        if order.is_open:
+            self._open_by_venue.setdefault(order.venue, {})[order.order_id] = None
+    
+    def apply_update(self, update: Dict) -> Optional[TrackedOrder]:
+        """
+        应用一条订单状态更新
+        
+        Args:
+            update: {"order_id", "status", "filled_size"}，filled_size 为累计成交数量
+        
+        Returns:
+            更新后的订单，未跟踪的订单返回 None
+        """
+        with self.state_lock:
+            return self._apply_update(update)
+    
+    def _apply_update(self, update: Dict) -> Optional[TrackedOrder]:
+        fill_delta = 0.0
+        closed = False
+        with self._lock:
+            order = self.orders.get(update.get("order_id"))
+            if order is None or not order.is_open:
+                return order
+            previous_status = order.status
+            
+            filled_size = update.get("filled_size")
+            if filled_size is not None and filled_size > order.filled_size:
+                fill_delta = filled_size - order.filled_size
+                order.filled_size = filled_size
+            
+            status = update.get("status") or order.status
+            if status in (ACKED, PARTIAL) and order.filled_size > 0:
+                status = FILLED if order.filled_size >= order.size else PARTIAL
+            order.status = status
+            order.updated_at = time.monotonic()
+            
+            if not order.is_open:
+                self._open_by_venue.get(order.venue, {}).pop(order.order_id, None)
+                closed = True
+        
+        if self.journal and (fill_delta or status != previous_status):
+            self.journal("order_update", {"order_id": order.order_id, "status": status,
+                                          "filled_size": order.filled_size})
+        if fill_delta and self.on_fill:
+            try:
+                self.on_fill(order, fill_delta)
+            except Exception as e:
+                logger.error(f"成交回调失败 ({order.order_id}): {e}", exc_info=True)
+        if closed and self.on_close:
+            try:
+                self.on_close(order)
+            except Exception as e:
+                logger.error(f"订单完结回调失败 ({order.order_id}): {e}", exc_info=True)
+        return order
+    
+    def apply_updates(self, updates: Iterable[Dict]) -> int:
+        """批量应用状态更新，返回处理的条数"""
+        count = 0
+        for update in updates:
+            self.apply_update(update)
+            count += 1
+        return count
+    
+    def open_order_ids(self, venue: str = None) -> List[str]:
+        """获取未完结订单的ID"""
+        with self._lock:
+            if venue is not None:
+                return list(self._open_by_venue.get(venue, {}))
+            return [order_id for ids in self._open_by_venue.values() for order_id in ids]
+    
+    def poll(self, clients: Dict[str, object]) -> int:
+        """
+        通过批量查询刷新未完结订单
+        
+        Args:
+            clients: 平台名 -> 客户端；没有 get_order_statuses(order_ids) 的客户端不轮询
+        
+        Returns:
+            发出的查询请求数
+        """
+        requests_sent = 0
+        for venue, client in clients.items():
+            order_ids = self.open_order_ids(venue)
+            if not order_ids:
+                continue
+            query = getattr(client, "get_order_statuses", None)
+            if query is None:
+                # 每轮都会遇到，只在第一次报错；这些订单的成交和完结都收不到
+                if venue not in self.unsupported:
+                    self.unsupported.add(venue)
+                    logger.error(f"{venue} 客户端没有订单状态查询接口，{len(order_ids)} 个未完结订单无法更新")
+                continue
+            for start in range(0, len(order_ids), self.batch_size):
+                statuses = query(order_ids[start:start + self.batch_size])
+                requests_sent += 1
+                if statuses:
+                    self.apply_updates(statuses)
+        return requests_sent
+    
+    def open_orders(self) -> List[TrackedOrder]:
+        """未完结的订单"""
+        with self._lock:
+            return [self.orders[order_id] for ids in self._open_by_venue.values() for order_id in ids]
+    
+    def get_trade_orders(self, trade_id: str) -> List[TrackedOrder]:
+        """获取某笔交易的所有订单"""
+        with self._lock:
+            return list(self._by_trade.get(trade_id, []))
+    
+    def get_stats(self) -> Dict:
+        """按状态统计订单数量"""
+        with self._lock:
+            stats = {}
+            for order in self.orders.values():
+                stats[order.status] = stats.get(order.status, 0) + 1
+            return stats
+
+
+class PolymarketUserChannel:
+    """
+    Polymarket 用户频道（WebSocket）
+    
+    订阅账户的订单事件，把推送转换成 OrderTracker 的状态更新；
+    只覆盖 Polymarket 的订单，其他平台仍需轮询（见 ArbitrageExecutor.refresh_orders 的 pushed）
+    """
+    
+    URL = "wss://ws-subscriptions-clob.polymarket.com/ws/user"
+    # 推送覆盖的平台
+    venues = ("polymarket",)
+    
+    def __init__(self, tracker: OrderTracker, markets: List[str] = None):
+        """
+        Args:
+            tracker: 订单跟踪器
+            markets: 订阅的 condition_id 列表，默认使用配置 POLYMARKET_CONDITION_ID
+        """
+        self.tracker = tracker
+        self.markets = markets or [m for m in [Config.POLYMARKET_CONDITION_ID] if m]
+        # 推送的状态更新交给该函数处理，默认在 WebSocket 线程中直接写入订单跟踪器
+        self.dispatch: Optional[Callable[[List[Dict]], None]] = None
+        self.ws = None
+        self.thread = None
+    
+    @staticmethod
+    def parse_message(message: Dict) -> Optional[Dict]:
+        """把用户频道的 order 事件转换成状态更新"""
+        if message.get("event_type") != "order":
+            return None
+        event_type = message.get("type")
+        filled_size = float(message.get("size_matched") or 0)
+        if event_type == "CANCELLATION":
+            status = CANCELLED
+        elif filled_size <= 0:
+            status = ACKED
+        elif filled_size >= float(message.get("original_size") or 0):
+            status = FILLED
+        else:
+            status = PARTIAL
+        return {"order_id": message.get("id"), "status": status, "filled_size": filled_size}
+    
+    def _on_message(self, ws, raw: str):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return
+        messages = data if isinstance(data, list) else [data]
+        updates = [u for u in map(self.parse_message, messages) if u]
+        if not updates:
+            return
+        if self.dispatch:
+            self.dispatch(updates)
+        else:
+            self.tracker.apply_updates(updates)
+    
+    def _on_open(self, ws):
+        ws.send(json.dumps({
+            "type": "user",
+            "markets": self.markets,
+            "auth": {
+                "apiKey": Config.POLYMARKET_API_KEY,
+                "secret": Config.POLYMARKET_API_SECRET,
+                "passphrase": Config.POLYMARKET_API_PASSPHRASE,
+            },
+        }))
+        logger.info("Polymarket 用户频道已连接")
+    
+    def start(self):
+        """在后台线程中连接用户频道"""
+        import websocket
+        
+        self.ws = websocket.WebSocketApp(
+            self.URL,
+            on_open=self._on_open,
+            on_message=self._on_message,
+            on_error=lambda ws, e: logger.error(f"Polymarket 用户频道错误: {e}"),
+        )
+        self.thread = threading.Thread(
+            target=self.ws.run_forever,
+            kwargs={"ping_interval": 10, "reconnect": 5},
+            name="poly-user-channel",
+            daemon=True
+        )
+        self.thread.start()
+    
+    def stop(self):
+        """断开用户频道"""
+        if self.ws:
+            self.ws.close()
+            self.ws = None
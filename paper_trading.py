@@ -0,0 +1,485 @@
+"""
+模拟撮合（纸面交易）
+
+PaperExchange 为每个平台的每个 token 维护一本模拟订单簿：
+- 外部流动性来自实时或记录的订单簿快照（feed / feed_quote），每次快照整体替换
+- 自己的订单按价格优先、时间优先撮合，同价位排在外部流动性之后；未成交部分挂单，
+  之后的快照穿过挂单价时继续成交，因此会出现部分成交
+- 下单先立即返回订单ID，经过模拟延迟后才进入订单簿（事件按到达时间排序处理，不阻塞调用方）
+
+PaperPolymarketClient / PaperOpinionClient 实现与真实客户端相同的 place_order /
+get_order_statuses 接口，行情请求转发给真实客户端（或不转发），同时用返回的订单簿喂给模拟簿。
+"""
+import heapq
+import bisect
+import random
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, List, Tuple, Callable
+from config import Config
+from ticks import ONE, Quote, price_to_ticks, ticks_to_price, size_to_units, units_to_size
+
+logger = logging.getLogger(__name__)
+
+# 外部流动性在档位队列中的占位订单ID
+EXTERNAL = None
+
+# Opinion.trade 方向别名
+OUTCOME_ALIASES = {"YES": "UP", "NO": "DOWN"}
+
+
+class SimOrder:
+    """模拟订单"""
+    
+    __slots__ = ("order_id", "venue", "key", "side", "price", "size", "remaining", "filled_value", "status")
+    
+    def __init__(self, order_id: str, venue: str, key: str, side: str, price: int, size: int):
+        self.order_id = order_id
+        self.venue = venue
+        self.key = key
+        self.side = side
+        self.price = price
+        self.size = size
+        self.remaining = size
+        self.filled_value = 0
+        self.status = "pending"
+    
+    def to_status(self) -> Dict:
+        """与真实客户端 get_order_statuses 相同格式的状态，另含成交均价 avg_price"""
+        filled = self.size - self.remaining
+        return {
+            "order_id": self.order_id,
+            "status": self.status,
+            "filled_size": units_to_size(filled),
+            "avg_price": ticks_to_price(self.filled_value / filled) if filled else None,
+        }
+
+
+class SimBook:
+    """单个 token 的模拟订单簿（整数价格 / 数量单位）"""
+    
+    def __init__(self):
+        # 价格 -> 档位队列，元素为 [订单ID 或 EXTERNAL, 剩余数量, SimOrder 或 None]
+        self.levels = {"BUY": {}, "SELL": {}}
+        # 各方向有挂单的价格，升序
+        self.prices = {"BUY": [], "SELL": []}
+    
+    def best(self, side: str) -> Optional[int]:
+        """某方向的最优价格（BUY 最高，SELL 最低）"""
+        prices = self.prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == "BUY" else prices[0]
+    
+    def quote(self) -> Quote:
+        """当前双边报价"""
+        bid, ask = self.best("BUY"), self.best("SELL")
+        return Quote(
+            bid, None if bid is None else sum(entry[1] for entry in self.levels["BUY"][bid]),
+            ask, None if ask is None else sum(entry[1] for entry in self.levels["SELL"][ask]),
+        )
+    
+    def _add(self, side: str, price: int, entry: List, front: bool = False):
+        level = self.levels[side].get(price)
+        if level is None:
+            level = self.levels[side][price] = deque()
+            bisect.insort(self.prices[side], price)
+        if front:
+            level.appendleft(entry)
+        else:
+            level.append(entry)
+    
+    def _drop_level(self, side: str, price: int):
+        del self.levels[side][price]
+        prices = self.prices[side]
+        del prices[bisect.bisect_left(prices, price)]
+    
+    def replace_external(self, bids: List[Tuple[int, int]], asks: List[Tuple[int, int]]):
+        """用快照替换外部流动性，保留自己的挂单（外部流动性排在同价位挂单之前）"""
+        for side in ("BUY", "SELL"):
+            for price in list(self.levels[side]):
+                level = self.levels[side][price]
+                kept = deque(entry for entry in level if entry[0] is not EXTERNAL)
+                if kept:
+                    self.levels[side][price] = kept
+                else:
+                    self._drop_level(side, price)
+        for side, levels in (("BUY", bids), ("SELL", asks)):
+            for price, size in levels:
+                if size > 0:
+                    self._add(side, price, [EXTERNAL, size, None], front=True)
+    
+    def match(self, side: str, price: int, size: int,
+              on_fill: Callable[[SimOrder, int, int], None], taker: SimOrder = None) -> int:
+        """
+        用一张吃单与对手方撮合（价格优先，同价位时间优先）
+        
+        Args:
+            side: 吃单方向
+            price: 限价
+            size: 数量
+            on_fill: 自己的挂单被成交时的回调 (挂单, 成交数量, 成交价)
+            taker: 吃单本身（自己的订单时传入，用于成交回调）
+        
+        Returns:
+            剩余未成交数量
+        """
+        opposite = "SELL" if side == "BUY" else "BUY"
+        while size > 0:
+            best = self.best(opposite)
+            if best is None or (best > price if side == "BUY" else best < price):
+                break
+            level = self.levels[opposite][best]
+            while size > 0 and level:
+                entry = level[0]
+                fill = min(size, entry[1])
+                size -= fill
+                entry[1] -= fill
+                if entry[2] is not None:
+                    on_fill(entry[2], fill, best)
+                if taker is not None:
+                    on_fill(taker, fill, best)
+                if entry[1] == 0:
+                    level.popleft()
+            if not level:
+                self._drop_level(opposite, best)
+        return size
+    
+    def rest(self, order: SimOrder):
+        """挂单（排在同价位队尾）"""
+        self._add(order.side, order.price, [order.order_id, order.remaining, order])
+    
+    def cancel(self, order: SimOrder) -> bool:
+        """撤销挂单"""
+        level = self.levels[order.side].get(order.price)
+        if not level:
+            return False
+        for i, entry in enumerate(level):
+            if entry[2] is order:
+                del level[i]
+                if not level:
+                    self._drop_level(order.side, order.price)
+                return True
+        return False
+    
+    def uncross(self, on_fill: Callable[[SimOrder, int, int], None]):
+        """新快照穿过自己的挂单价时，挂单与外部流动性成交"""
+        while True:
+            bid, ask = self.best("BUY"), self.best("SELL")
+            if bid is None or ask is None or bid < ask:
+                return
+            bid_entry, ask_entry = self.levels["BUY"][bid][0], self.levels["SELL"][ask][0]
+            if bid_entry[2] is None and ask_entry[2] is None:
+                # 快照本身交叉（两边都是外部流动性），不处理
+                return
+            # 自己的挂单是被动方，以挂单价成交
+            price = bid if bid_entry[2] is not None else ask
+            fill = min(bid_entry[1], ask_entry[1])
+            for side, level_price, entry in (("BUY", bid, bid_entry), ("SELL", ask, ask_entry)):
+                entry[1] -= fill
+                if entry[2] is not None:
+                    on_fill(entry[2], fill, price)
+                if entry[1] == 0:
+                    level = self.levels[side][level_price]
+                    level.popleft()
+                    if not level:
+                        self._drop_level(side, level_price)
+
+
+class PaperExchange:
+    """
+    模拟撮合引擎
+    
+    所有平台共用一个事件队列；订单按 (到达时间, 序号) 处理，调用方下单不等待延迟
+    """
+    
+    def __init__(self, latency: float = None, jitter: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic, seed: int = None):
+        """
+        Args:
+            latency: 下单到进入订单簿的模拟延迟（秒）
+            jitter: 延迟的随机抖动上限（秒）
+            clock: 时钟函数，测试中可替换为可控时钟
+            seed: 抖动随机数种子
+        """
+        self.latency = Config.PAPER_LATENCY if latency is None else latency
+        self.jitter = jitter
+        self.clock = clock
+        self.books: Dict[Tuple[str, str], SimBook] = {}
+        self.orders: Dict[str, SimOrder] = {}
+        self.stats = {"orders": 0, "fills": 0, "filled_units": 0, "cancelled": 0}
+        self._events: List[Tuple[float, int, SimOrder]] = []
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._subscribers: List[Callable[[List[Dict]], None]] = []
+        self._updates: List[Dict] = []
+        self._lock = threading.RLock()
+    
+    def book(self, venue: str, key: str) -> SimBook:
+        """获取（或新建）模拟订单簿"""
+        book = self.books.get((venue, key))
+        if book is None:
+            book = self.books[(venue, key)] = SimBook()
+        return book
+    
+    def feed(self, venue: str, key: str, book: Dict):
+        """
+        用订单簿快照更新外部流动性
+        
+        Args:
+            venue: 平台名
+            key: 订单簿标识（Polymarket 为 token_id）
+            book: parse_book 格式的订单簿 {"bids": [(price_ticks, size_units)], "asks": [...]}
+        """
+        with self._lock:
+            self._advance()
+            sim_book = self.book(venue, key)
+            sim_book.replace_external(book.get("bids") or [], book.get("asks") or [])
+            sim_book.uncross(self._on_fill)
+            self._publish()
+    
+    def feed_quote(self, venue: str, key: str, quote: Quote, default_size: int = None):
+        """用双边报价（例如 replay 记录）更新外部流动性，缺少数量时使用 default_size"""
+        default_size = size_to_units(1000) if default_size is None else default_size
+        bids = [] if quote.bid is None else [(quote.bid, quote.bid_size or default_size)]
+        asks = [] if quote.ask is None else [(quote.ask, quote.ask_size or default_size)]
+        self.feed(venue, key, {"bids": bids, "asks": asks})
+    
+    def submit(self, venue: str, key: str, side: str, price: float, size: float) -> Optional[str]:
+        """
+        提交限价单，经过模拟延迟后进入订单簿
+        
+        Returns:
+            订单ID，参数无效时返回 None
+        """
+        price_ticks, size_units = price_to_ticks(price), size_to_units(size)
+        if size_units <= 0 or not 0 < price_ticks < ONE or side not in ("BUY", "SELL"):
+            logger.warning(f"模拟下单参数无效: {venue} {key} {side} {size} @ {price}")
+            return None
+        with self._lock:
+            order = SimOrder(f"paper-{venue}-{next(self._ids)}", venue, key, side, price_ticks, size_units)
+            self.orders[order.order_id] = order
+            self.stats["orders"] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            heapq.heappush(self._events, (self.clock() + delay, next(self._seq), order))
+            self._advance()
+            self._publish()
+            return order.order_id
+    
+    def cancel(self, order_id: str) -> bool:
+        """撤单（未到达或挂单中的订单）"""
+        with self._lock:
+            self._advance()
+            order = self.orders.get(order_id)
+            if order is None or order.status in ("filled", "cancelled"):
+                return False
+            if order.status != "pending":
+                self.book(order.venue, order.key).cancel(order)
+            order.status = "cancelled"
+            self.stats["cancelled"] += 1
+            self._updates.append(order.to_status())
+            self._publish()
+            return True
+    
+    def statuses(self, order_ids: List[str]) -> List[Dict]:
+        """批量查询订单状态"""
+        with self._lock:
+            self._advance()
+            self._publish()
+            return [self.orders[order_id].to_status() for order_id in order_ids if order_id in self.orders]
+    
+    def subscribe(self, callback: Callable[[List[Dict]], None]):
+        """订阅订单状态推送（与用户频道相同的更新格式）"""
+        self._subscribers.append(callback)
+    
+    def advance(self, now: float = None):
+        """处理到达时间不晚于 now 的订单"""
+        with self._lock:
+            self._advance(now)
+            self._publish()
+    
+    def _advance(self, now: float = None):
+        now = self.clock() if now is None else now
+        events = self._events
+        while events and events[0][0] <= now:
+            _, _, order = heapq.heappop(events)
+            if order.status == "cancelled":
+                continue
+            book = self.book(order.venue, order.key)
+            order.status = "acked"
+            # 吃单和挂单的剩余数量都在 _on_fill 中更新
+            book.match(order.side, order.price, order.remaining, self._on_fill, taker=order)
+            if order.remaining > 0:
+                book.rest(order)
+            if order.status == "acked":
+                self._updates.append(order.to_status())
+    
+    def _on_fill(self, order: SimOrder, fill: int, price: int):
+        order.remaining -= fill
+        order.filled_value += fill * price
+        order.status = "filled" if order.remaining == 0 else "partial"
+        self.stats["fills"] += 1
+        self.stats["filled_units"] += fill
+        self._updates.append(order.to_status())
+    
+    def _publish(self):
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, []
+        for callback in self._subscribers:
+            callback(updates)
+    
+    def get_stats(self) -> Dict:
+        """模拟撮合统计: orders / fills / filled_size / cancelled / pending（未到达的订单数）"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["filled_size"] = units_to_size(stats.pop("filled_units"))
+            stats["pending"] = len(self._events)
+            return stats
+
+
+class PaperPolymarketClient:
+    """
+    Polymarket 模拟客户端
+    
+    行情接口转发给真实客户端并用返回的订单簿喂给模拟簿；下单和订单查询由 PaperExchange 模拟
+    """
+    
+    venue = "polymarket"
+    
+    def __init__(self, exchange: PaperExchange, market_data=None):
+        """
+        Args:
+            exchange: 模拟撮合引擎
+            market_data: 提供行情的真实客户端（PolymarketClient），为空时只能通过 exchange.feed 喂数据
+        """
+        self.exchange = exchange
+        self.market_data = market_data
+    
+    def get_book_ticks(self, token_id: str, depth: int = None, timeout: float = 10) -> Optional[Dict]:
+        """获取订单簿，同时更新模拟簿"""
+        if self.market_data is None:
+            return None
+        book = self.market_data.get_book_ticks(token_id, depth, timeout)
+        if book:
+            self.exchange.feed(self.venue, token_id, book)
+        return book
+    
+    def get_quote(self, token_id: str, timeout: float = 10) -> Optional[Quote]:
+        """从模拟簿获取双边报价（含自己的挂单）"""
+        if self.market_data is not None:
+            self.get_book_ticks(token_id, depth=1, timeout=timeout)
+        book = self.exchange.books.get((self.venue, token_id))
+        return book.quote() if book else None
+    
+    def get_best_price_from_token_id(self, token_id: str, side: str = "BUY",
+                                     timeout: float = 10) -> Optional[float]:
+        """可成交价格: BUY 取最优卖价，SELL 取最优买价"""
+        quote = self.get_quote(token_id, timeout)
+        price = None if quote is None else (quote.ask if side == "BUY" else quote.bid)
+        return None if price is None else ticks_to_price(price)
+    
+    def place_order(self, condition_id: str, outcome: str, size: float, price: float,
+                    side: str = "BUY", token_id: str = None, timeout: float = 10) -> Optional[str]:
+        """模拟下单，订单簿按 token_id 区分（没有 token_id 时使用 condition_id:outcome）"""
+        key = token_id or f"{condition_id}:{outcome}"
+        logger.info(f"[模拟] Polymarket 下单: {side} {outcome} {size} @ {price}")
+        return self.exchange.submit(self.venue, key, side, price, size)
+    
+    def cancel_order(self, order_id: str) -> bool:
+        """模拟撤单"""
+        return self.exchange.cancel(order_id)
+    
+    def get_order_statuses(self, order_ids: List[str]) -> Optional[List[Dict]]:
+        """批量查询模拟订单状态"""
+        return self.exchange.statuses(order_ids)
+    
+    def __getattr__(self, name):
+        # 其余行情接口（市场信息等）直接使用真实客户端
+        if self.market_data is None:
+            raise AttributeError(name)
+        return getattr(self.market_data, name)
+
+
+class PaperOpinionClient:
+    """
+    Opinion.trade 模拟客户端
+    
+    Opinion.trade 只有 UP 报价，DOWN 的模拟簿由 UP 报价互补得到（DOWN ask = 1 - UP bid）
+    """
+    
+    venue = "opinion"
+    
+    def __init__(self, exchange: PaperExchange, market_data=None):
+        """
+        Args:
+            exchange: 模拟撮合引擎
+            market_data: 提供行情的真实客户端（OpinionTradeClient）
+        """
+        self.exchange = exchange
+        self.market_data = market_data
+    
+    def feed_quote(self, topic_id: str, quote: Quote):
+        """用 UP 报价更新 UP / DOWN 两本模拟簿"""
+        self.exchange.feed_quote(self.venue, f"{topic_id}:UP", quote)
+        self.exchange.feed_quote(self.venue, f"{topic_id}:DOWN", Quote(
+            None if quote.ask is None else ONE - quote.ask, quote.ask_size,
+            None if quote.bid is None else ONE - quote.bid, quote.bid_size,
+        ))
+    
+    def get_quote(self, token_id: str = None) -> Optional[Quote]:
+        """获取报价，同时更新模拟簿"""
+        if self.market_data is None:
+            return None
+        quote = self.market_data.get_quote(token_id)
+        if quote:
+            # 与执行器下单时使用的 topic_id 保持一致
+            self.feed_quote(token_id or Config.OPINION_UP_TOKEN_ID or "4866", quote)
+        return quote
+    
+    def get_market_price(self, token_id: str = None) -> Optional[float]:
+        """UP 最优卖价"""
+        quote = self.get_quote(token_id)
+        return None if quote is None or quote.ask is None else ticks_to_price(quote.ask)
+    
+    def place_order(self, topic_id: str, side: str, amount: float, price: float,
+                    timeout: float = 10) -> Optional[str]:
+        """模拟买入 side 方向（UP/DOWN/YES/NO）"""
+        outcome = OUTCOME_ALIASES.get(side, side)
+        logger.info(f"[模拟] Opinion.trade 下单: {outcome} {amount} @ {price}")
+        return self.exchange.submit(self.venue, f"{topic_id}:{outcome}", "BUY", price, amount)
+    
+    def cancel_order(self, order_id: str) -> bool:
+        """模拟撤单"""
+        return self.exchange.cancel(order_id)
+    
+    def get_order_statuses(self, order_ids: List[str]) -> Optional[List[Dict]]:
+        """批量查询模拟订单状态"""
+        return self.exchange.statuses(order_ids)
+    
+    def __getattr__(self, name):
+        if self.market_data is None:
+            raise AttributeError(name)
+        return getattr(self.market_data, name)
+
+
+def install(detector, exchange: PaperExchange = None) -> Tuple[PaperPolymarketClient, PaperOpinionClient]:
+    """
+    把检测器的客户端替换为模拟客户端（行情仍来自真实接口）
+    
+    Args:
+        detector: ArbitrageDetector
+        exchange: 模拟撮合引擎，默认新建
+    
+    Returns:
+        (Polymarket 模拟客户端, Opinion.trade 模拟客户端)，交给 ArbitrageExecutor 下单
+    """
+    exchange = exchange or PaperExchange()
+    detector.polymarket = PaperPolymarketClient(exchange, detector.polymarket)
+    detector.opinion_trade = PaperOpinionClient(exchange, detector.opinion_trade)
+    logger.warning("纸面交易模式: 订单由本地模拟撮合，不会发送到交易所")
+    return detector.polymarket, detector.opinion_trade
@@ -4,9 +4,17 @@ Polymarket API 客户端
 import requests
 import logging
 import json
-from typing import Optional, Dict
+import time
+import hmac
+import base64
+import hashlib
+import threading
+from typing import Optional, Dict, List, Tuple
+from ticks import Quote, parse_book, quote_from_book, ticks_to_price
+from endpoints import EndpointPool, shared_pool
+from order_tracker import ACKED, PARTIAL, FILLED, CANCELLED
 from config import (
-    POLYMARKET_API_BASE, 
+    Config,
     POLYMARKET_UP_TOKEN_ID, 
     POLYMARKET_DOWN_TOKEN_ID,
     POLYMARKET_EVENT_SLUG
@@ -14,16 +22,67 @@ from config import (
 
 logger = logging.getLogger(__name__)
 
+# 条件请求命中（304）时 _fetch_book 的返回值
+NOT_MODIFIED = object()
+
+# CLOB 订单接口: 账户的挂单列表（分页）/ 单个订单
+ORDERS_PATH = "/data/orders"
+ORDER_PATH = "/data/order/"
+# 分页结束时的 next_cursor
+END_CURSOR = "LTE="
+
+
+def _wire_bytes(response: requests.Response) -> int:
+    """响应在网络上传输的字节数（压缩后），取不到时退回解压后的长度"""
+    try:
+        wire = response.raw.tell() if response.raw is not None else 0
+    except Exception:
+        wire = 0
+    return wire or int(response.headers.get("Content-Length") or 0) or len(response.content)
+
+
+def _venue_timestamp(orderbook: Dict) -> Optional[float]:
+    """订单簿中的平台时间戳（毫秒字符串）转换为秒，没有时返回 None"""
+    try:
+        return int(orderbook["timestamp"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
 
 class PolymarketClient:
     """Polymarket API 客户端"""
     
     def __init__(self):
-        self.base_url = POLYMARKET_API_BASE
+        # 所有 Polymarket 客户端共用的 API 地址池（多个地址时自动切换）
+        self.endpoints = shared_pool("polymarket", Config.POLYMARKET_API_BASES)
         self.session = requests.Session()
         self.session.headers.update({
             "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
         })
+        # (token_id, depth) -> {"etag", "last_modified", "hash", "book"}，用于条件请求和跳过重复解析
+        self._book_cache: Dict[Tuple[str, Optional[int]], Dict] = {}
+        self.fetch_stats = {"fetches": 0, "not_modified": 0, "unchanged": 0,
+                            "wire_bytes": 0, "body_bytes": 0, "parse_ms": 0.0}
+        self.last_fetch: Optional[Dict] = None
+        # 批量下单（POST /orders）每次请求的最多订单数；实现 place_orders 之后生效，之前执行器逐单提交
+        self.batch_order_limit = Config.POLYMARKET_BATCH_ORDER_LIMIT
+        # CLOB L2 API 凭证（订单状态查询）
+        self.api_key = Config.POLYMARKET_API_KEY
+        self.api_secret = Config.POLYMARKET_API_SECRET
+        self.api_passphrase = Config.POLYMARKET_API_PASSPHRASE
+        self.address = Config.POLYMARKET_ADDRESS
+        self._lock = threading.Lock()
+    
+    @property
+    def base_url(self) -> str:
+        """当前使用的 API 地址"""
+        return self.endpoints.current
+    
+    @base_url.setter
+    def base_url(self, url: str):
+        """固定使用单个 API 地址（不探测、不切换）"""
+        self.endpoints = EndpointPool("polymarket", [url])
     
     def get_market_info(self, event_slug: str = None) -> Optional[Dict]:
         """
@@ -31,7 +90,7 @@ class PolymarketClient:
         
         Args:
             event_slug: 事件标识符（从URL中提取），默认使用配置中的值
-            
+        
         Returns:
             市场信息字典，包含价格等
         """
@@ -44,7 +103,7 @@ class PolymarketClient:
             params = {"slug": event_slug}
             
             logger.debug(f"请求 Polymarket API: {url} with params: {params}")
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.endpoints.request(self.session, "GET", "/markets", params=params, timeout=10)
             
             # 记录响应状态
             logger.debug(f"Polymarket API 响应状态: {response.status_code}")
@@ -76,29 +135,104 @@ class PolymarketClient:
             logger.error(f"获取 Polymarket 市场信息失败: {e}", exc_info=True)
             return None
     
+    def _fetch_book(self, token_id: str, cache_key: Tuple = None, timeout: float = 10):
+        """
+        请求 /book（压缩传输；有缓存的校验值时发送条件请求）
+        
+        Args:
+            token_id: CLOB token_id
+            cache_key: 条件请求使用的缓存键，为空时发送普通请求
+            timeout: 请求超时（秒）
+        
+        Returns:
+            (订单簿 JSON 或 NOT_MODIFIED, 传输字节数, 解压后字节数, JSON 解析耗时 ms, 收到时的 monotonic / wall 时间)；
+            失败返回 None
+        """
+        url = f"{self.base_url}/book"
+        params = {"token_id": token_id}
+        headers = {}
+        cached = self._book_cache.get(cache_key) if cache_key else None
+        if cached:
+            # 只有平台返回过 ETag / Last-Modified 时才发送条件请求
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
+        logger.debug(f"获取订单簿: {url}?token_id={token_id}")
+        response = self.endpoints.request(self.session, "GET", "/book", params=params, headers=headers, timeout=timeout)
+        received = (time.monotonic(), time.time())
+        
+        if response.status_code == 304:
+            return NOT_MODIFIED, _wire_bytes(response), 0, 0.0, received
+        if response.status_code == 404:
+            logger.warning(f"订单簿不存在 (404): token_id={token_id}")
+            return None
+        
+        response.raise_for_status()
+        content = response.content
+        parse_started = time.perf_counter()
+        # 先用 json.loads 解析整个响应体（省去 response.text 的解码），价格字段仍是字符串，之后由 ticks 转成整数
+        orderbook = json.loads(content)
+        parse_ms = (time.perf_counter() - parse_started) * 1000
+        
+        if cache_key:
+            entry = self._book_cache.setdefault(cache_key, {})
+            entry["etag"] = response.headers.get("ETag")
+            entry["last_modified"] = response.headers.get("Last-Modified")
+        return orderbook, _wire_bytes(response), len(content), parse_ms, received
+    
+    def _record_fetch(self, token_id: str, status: str, wire_bytes: int, body_bytes: int, parse_ms: float):
+        """记录单次订单簿请求的字节数和解析耗时"""
+        self.last_fetch = {
+            "token_id": token_id,
+            "status": status,
+            "wire_bytes": wire_bytes,
+            "body_bytes": body_bytes,
+            "parse_ms": parse_ms,
+        }
+        with self._lock:
+            stats = self.fetch_stats
+            stats["fetches"] += 1
+            stats["wire_bytes"] += wire_bytes
+            stats["body_bytes"] += body_bytes
+            stats["parse_ms"] += parse_ms
+            if status in ("not_modified", "unchanged"):
+                stats[status] += 1
+        logger.debug(f"订单簿 {token_id}: {status}, 传输 {wire_bytes} B / 解压 {body_bytes} B, 解析 {parse_ms:.3f} ms")
+    
+    def get_fetch_stats(self) -> Dict:
+        """
+        订单簿请求统计
+        
+        Returns:
+            fetches / not_modified（304）/ unchanged（hash 未变，跳过解析）/ wire_bytes / body_bytes / parse_ms，
+            以及每次请求的平均值 avg_wire_bytes / avg_parse_ms
+        """
+        with self._lock:
+            stats = dict(self.fetch_stats)
+        fetches = stats["fetches"] or 1
+        stats["avg_wire_bytes"] = stats["wire_bytes"] / fetches
+        stats["avg_parse_ms"] = stats["parse_ms"] / fetches
+        return stats
+    
     def get_orderbook(self, token_id: str) -> Optional[Dict]:
         """
         获取订单簿数据
         
         Args:
             token_id: Token ID (CLOB token_id)
-            
+        
         Returns:
             订单簿数据
         """
         try:
-            url = f"{self.base_url}/book"
-            params = {"token_id": token_id}
-            
-            logger.debug(f"获取订单簿: {url}?token_id={token_id}")
-            response = self.session.get(url, params=params, timeout=10)
-            
-            if response.status_code == 404:
-                logger.warning(f"订单簿不存在 (404): token_id={token_id}")
+            result = self._fetch_book(token_id)
+            if result is None:
                 return None
-            
-            response.raise_for_status()
-            return response.json()
+            orderbook, wire_bytes, body_bytes, parse_ms, _ = result
+            self._record_fetch(token_id, "full", wire_bytes, body_bytes, parse_ms)
+            return orderbook
         except requests.exceptions.RequestException as e:
             logger.error(f"获取 Polymarket 订单簿失败: {e}")
             if hasattr(e, 'response') and e.response is not None:
@@ -108,41 +242,117 @@ class PolymarketClient:
             logger.error(f"获取 Polymarket 订单簿失败: {e}")
             return None
     
-    def get_best_price_from_token_id(self, token_id: str) -> Optional[float]:
+    def get_book_ticks(self, token_id: str, depth: int = None, timeout: float = 10) -> Optional[Dict]:
         """
-        从 token_id 获取最佳买入价格
+        获取解析后的订单簿（整数价格单位，见 ticks.py）
+        
+        平台支持时使用条件请求，304 直接返回上次的结果；
+        返回体中的 hash 与上次相同时跳过档位解析
         
         Args:
             token_id: CLOB token_id
-            
+            depth: 每边保留的档位数，默认全部
+            timeout: 请求超时（秒）
+        
         Returns:
-            最佳买入价格（0-1之间）
+            {"bids": 价格从高到低, "asks": 价格从低到高}，元素为 (price_ticks, size_units)；
+            另含 received_at（time.monotonic）/ received_wall（time.time）/ venue_ts（平台时间戳，秒）
         """
+        cache_key = (token_id, depth)
         try:
-            orderbook = self.get_orderbook(token_id)
-            if not orderbook:
+            result = self._fetch_book(token_id, cache_key, timeout)
+            if result is None:
                 return None
+            orderbook, wire_bytes, body_bytes, parse_ms, (received_at, received_wall) = result
+            cached = self._book_cache.get(cache_key) or {}
+            
+            if orderbook is NOT_MODIFIED:
+                self._record_fetch(token_id, "not_modified", wire_bytes, 0, 0.0)
+                if cached.get("book") is None:
+                    return None
+                # 304 表示订单簿在收到时仍然有效
+                return dict(cached["book"], received_at=received_at, received_wall=received_wall)
+            
+            stamps = {
+                "received_at": received_at,
+                "received_wall": received_wall,
+                "venue_ts": _venue_timestamp(orderbook),
+            }
+            book_hash = orderbook.get("hash")
+            if book_hash and book_hash == cached.get("hash") and cached.get("book") is not None:
+                self._record_fetch(token_id, "unchanged", wire_bytes, body_bytes, parse_ms)
+                return dict(cached["book"], **stamps)
             
-            # 解析订单簿获取最佳买入价格（最高出价）
-            # Polymarket CLOB API 返回格式: {"bids": [[price, size], ...], "asks": [[price, size], ...]}
-            if "bids" in orderbook and orderbook["bids"]:
-                # bids 是 [[price, size], ...] 格式，按价格从高到低排序
-                best_bid = orderbook["bids"][0]
-                if isinstance(best_bid, list) and len(best_bid) > 0:
-                    price = float(best_bid[0])
-                    logger.debug(f"Token {token_id} 最佳买入价: {price}")
-                    return price
-                elif isinstance(best_bid, dict):
-                    price = float(best_bid.get("price", 0))
-                    logger.debug(f"Token {token_id} 最佳买入价: {price}")
-                    return price
+            parse_started = time.perf_counter()
+            # 价格字符串直接解析为整数，不经过 float
+            book = parse_book(orderbook, depth)
+            parse_ms += (time.perf_counter() - parse_started) * 1000
+            self._record_fetch(token_id, "full", wire_bytes, body_bytes, parse_ms)
             
-            logger.warning(f"Token {token_id} 订单簿中没有 bids")
+            entry = self._book_cache.setdefault(cache_key, {})
+            entry["hash"] = book_hash
+            entry["book"] = book
+            return dict(book, **stamps)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"获取 Polymarket 订单簿失败 (token_id={token_id}): {e}")
             return None
         except Exception as e:
-            logger.error(f"获取 Polymarket 最佳价格失败 (token_id={token_id}): {e}")
+            logger.error(f"解析 Polymarket 订单簿失败 (token_id={token_id}): {e}")
             return None
     
+    def get_quote(self, token_id: str, timeout: float = 10) -> Optional[Quote]:
+        """
+        获取双边报价（最优买价 / 卖价及数量，整数价格单位）
+        
+        Args:
+            token_id: CLOB token_id
+            timeout: 请求超时（秒）
+        
+        Returns:
+            Quote，获取失败返回 None
+        """
+        book = self.get_book_ticks(token_id, depth=1, timeout=timeout)
+        return quote_from_book(book) if book else None
+    
+    def get_best_price_ticks(self, token_id: str, side: str = "BUY", timeout: float = 10) -> Optional[int]:
+        """
+        从 token_id 获取可成交价格（整数价格单位，见 ticks.py）
+        
+        Args:
+            token_id: CLOB token_id
+            side: BUY 取最优卖价（买入时支付的价格），SELL 取最优买价
+            timeout: 请求超时（秒）
+        
+        Returns:
+            可成交价格，1.0 = ticks.ONE
+        """
+        quote = self.get_quote(token_id, timeout)
+        if not quote:
+            return None
+        
+        price_ticks = quote.ask if side == "BUY" else quote.bid
+        if price_ticks is None:
+            logger.warning(f"Token {token_id} 订单簿中没有 {'asks' if side == 'BUY' else 'bids'}")
+            return None
+        logger.debug(f"Token {token_id} {side} 可成交价: {price_ticks} ticks")
+        return price_ticks
+    
+    def get_best_price_from_token_id(self, token_id: str, side: str = "BUY",
+                                     timeout: float = 10) -> Optional[float]:
+        """
+        从 token_id 获取可成交价格
+        
+        Args:
+            token_id: CLOB token_id
+            side: BUY 取最优卖价，SELL 取最优买价
+            timeout: 请求超时（秒）
+        
+        Returns:
+            可成交价格（0-1之间）
+        """
+        price_ticks = self.get_best_price_ticks(token_id, side, timeout)
+        return None if price_ticks is None else ticks_to_price(price_ticks)
+    
     def get_best_price(self, condition_id: str, outcome: str = "YES") -> Optional[float]:
         """
         获取最佳价格（兼容旧接口）
@@ -150,14 +360,15 @@ class PolymarketClient:
         Args:
             condition_id: 条件ID 或 token_id
             outcome: 结果类型 (YES/NO/UP/DOWN)
-            
+        
         Returns:
             最佳价格（0-1之间）
         """
         # 如果传入的是 token_id，直接使用
         return self.get_best_price_from_token_id(condition_id)
     
-    def place_order(self, condition_id: str, outcome: str, size: float, price: float) -> bool:
+    def place_order(self, condition_id: str, outcome: str, size: float, price: float,
+                    side: str = "BUY", token_id: str = None, timeout: float = 10) -> Optional[str]:
         """
         下单
         
@@ -166,16 +377,96 @@ class PolymarketClient:
             outcome: 结果类型 (YES/NO)
             size: 数量
             price: 价格
-            
+            side: 买卖方向 (BUY/SELL)
+            token_id: 该结果的 CLOB token_id（CLOB 订单按 token_id 下单）
+            timeout: 请求超时（秒），单腿处理时传入剩余的时间预算
+        
+        Returns:
+            订单ID，失败返回 None
+        """
+        # CLOB 订单需要用私钥做 EIP-712 签名，尚未实现。返回失败而不是编造订单ID:
+        # 编造的订单永远不会完结，会一直占用风控的未完结腿数和名义金额
+        logger.error(f"Polymarket 下单接口尚未实现，订单未提交: {side} {outcome} {size} @ {price}")
+        return None
+    
+    @property
+    def has_api_credentials(self) -> bool:
+        """是否配置了 CLOB L2 API 凭证"""
+        return bool(self.api_key and self.api_secret and self.api_passphrase and self.address)
+    
+    def _l2_headers(self, method: str, path: str, body: str = "") -> Dict[str, str]:
+        """
+        CLOB L2 认证头: HMAC-SHA256(base64 解码的 secret, 时间戳 + 方法 + 路径 + 请求体)，
+        签名的路径不含查询参数
+        """
+        timestamp = str(int(time.time()))
+        digest = hmac.new(base64.urlsafe_b64decode(self.api_secret),
+                          (timestamp + method + path + body).encode(), hashlib.sha256).digest()
+        return {
+            "POLY_ADDRESS": self.address,
+            "POLY_SIGNATURE": base64.urlsafe_b64encode(digest).decode(),
+            "POLY_TIMESTAMP": timestamp,
+            "POLY_API_KEY": self.api_key,
+            "POLY_PASSPHRASE": self.api_passphrase,
+        }
+    
+    @staticmethod
+    def parse_order_status(order: Dict) -> Dict:
+        """把 CLOB 订单对象转换成 OrderTracker 的状态更新（与用户频道推送的 order 事件字段相同）"""
+        filled_size = float(order.get("size_matched") or 0)
+        status = (order.get("status") or "").upper()
+        if status in ("CANCELED", "CANCELLED"):
+            status = CANCELLED
+        elif status == "MATCHED" or (filled_size > 0 and filled_size >= float(order.get("original_size") or 0)):
+            status = FILLED
+        elif filled_size > 0:
+            status = PARTIAL
+        else:
+            status = ACKED
+        return {"order_id": order.get("id"), "status": status, "filled_size": filled_size}
+    
+    def get_order_statuses(self, order_ids: List[str], timeout: float = 10) -> Optional[List[Dict]]:
+        """
+        批量查询订单状态
+        
+        先分页查询账户的挂单列表（GET /data/orders，通常一次请求），
+        不在挂单列表中的订单已经完结，再逐个查询其最终成交数量（GET /data/order/{id}，每个订单只查一次）
+        
+        Args:
+            order_ids: 订单ID列表
+            timeout: 每个请求的超时（秒）
+        
         Returns:
-            是否成功
+            订单状态列表，每项包含 order_id / status / filled_size；没有配置 API 凭证或请求失败返回 None
         """
+        if not self.has_api_credentials:
+            logger.error("没有配置 Polymarket L2 API 凭证（POLYMARKET_API_KEY / SECRET / PASSPHRASE / ADDRESS），"
+                         "无法查询订单状态")
+            return None
+        wanted = set(order_ids)
+        statuses: Dict[str, Dict] = {}
         try:
-            # 这里需要实现实际的订单API调用
-            # 通常需要签名和认证
-            logger.info(f"Polymarket 下单: {outcome} {size} @ {price}")
-            # TODO: 实现实际的API调用
-            return True
-        except Exception as e:
-            logger.error(f"Polymarket 下单失败: {e}")
-            return False
+            cursor = ""
+            while cursor != END_CURSOR:
+                response = self.endpoints.request(
+                    self.session, "GET", ORDERS_PATH, params={"next_cursor": cursor} if cursor else None,
+                    headers=self._l2_headers("GET", ORDERS_PATH), timeout=timeout)
+                response.raise_for_status()
+                page = response.json()
+                for order in page.get("data") or []:
+                    if order.get("id") in wanted:
+                        statuses[order["id"]] = self.parse_order_status(order)
+                cursor = page.get("next_cursor") or END_CURSOR
+            
+            for order_id in (order_id for order_id in dict.fromkeys(order_ids) if order_id not in statuses):
+                path = ORDER_PATH + order_id
+                response = self.endpoints.request(self.session, "GET", path,
+                                                  headers=self._l2_headers("GET", path), timeout=timeout)
+                response.raise_for_status()
+                order = response.json()
+                if order:
+                    statuses[order_id] = self.parse_order_status(order)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"查询 Polymarket 订单状态失败: {e}")
+            return None
+        return list(statuses.values())
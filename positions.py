@@ -0,0 +1,397 @@
+"""
+持仓与敞口账本
+
+按 市场 / 结果 / 平台 记录持仓，每次成交 O(1) 更新（与历史成交数无关）:
+- 持仓份数（正数为多头，负数为空头）和平均成本
+- 已实现盈亏（平仓部分按平均成本结算）、未实现盈亏（按最新标记价）
+- 占用资金: 多头为持仓成本，空头为每份 (1 - 卖出价) 的赔付保证
+- 每个市场各结果的净敞口（跨平台合计）和已配齐的完整组合数
+
+市场、平台和全局的合计随每次成交 / 标记增量调整，snapshot() 不需要遍历成交历史。
+同一平台上配齐的完整组合（Polymarket 上同时持有所有结果）可以提前合并（merge）换回 USDC，
+市场结算后获胜结果可以赎回（redeem），两种情况都会在快照中标出。
+
+内部金额单位为 数量单位 × 价格单位（ticks.SIZE_SCALE × ticks.PRICE_SCALE），加减都是精确整数。
+"""
+import threading
+import logging
+from typing import Optional, Dict, List, Iterable, Tuple
+from ticks import ONE, PRICE_SCALE, SIZE_SCALE, price_to_ticks, size_to_units, units_to_size
+
+logger = logging.getLogger(__name__)
+
+# 二元市场的结果
+BINARY_OUTCOMES = ("UP", "DOWN")
+
+# 可以在同一平台上把完整组合合并回 USDC 的平台
+MERGEABLE_VENUES = ("polymarket",)
+
+VALUE_SCALE = PRICE_SCALE * SIZE_SCALE
+
+
+def to_usd(value: int) -> float:
+    """内部金额（数量单位 × 价格单位）转换为 USD"""
+    return value / VALUE_SCALE
+
+
+def summary_lines(snapshot: Dict) -> List[str]:
+    """账本快照的日志摘要"""
+    totals = snapshot["totals"]
+    lines = [f"持仓盈亏: 已实现 ${totals['realized_pnl']:.2f}, 未实现 ${totals['unrealized_pnl']:.2f}, "
+             f"占用资金 ${totals['locked']:.2f} ({snapshot['fills']} 笔成交)"]
+    for venue, venue_totals in snapshot["venues"].items():
+        lines.append(f"  {venue}: 占用 ${venue_totals['locked']:.2f}, 盈亏 ${venue_totals['total_pnl']:.2f}")
+    if snapshot["mergeable"]:
+        lines.append(f"可合并的完整组合: {snapshot['mergeable']}")
+    if snapshot["redeemable"]:
+        lines.append(f"可赎回: {snapshot['redeemable']}")
+    return lines
+
+
+def market_key(record: Dict) -> str:
+    """机会 / 价格字典对应的账本市场键"""
+    return record.get("market_id") or record.get("condition_id") or "default"
+
+
+class Position:
+    """单个 市场 / 结果 / 平台 的持仓"""
+    
+    __slots__ = ("market_id", "outcome", "venue", "shares", "cost", "mark", "realized")
+    
+    def __init__(self, market_id: str, outcome: str, venue: str):
+        self.market_id = market_id
+        self.outcome = outcome
+        self.venue = venue
+        self.shares = 0      # 数量单位，带符号
+        self.cost = 0        # 持仓成本（内部金额，与 shares 同号）
+        self.mark = None     # 标记价（价格单位），未标记时使用平均成本
+        self.realized = 0    # 已实现盈亏（内部金额）
+    
+    @property
+    def unrealized(self) -> int:
+        if self.mark is None or not self.shares:
+            return 0
+        return self.shares * self.mark - self.cost
+    
+    @property
+    def locked(self) -> int:
+        if self.shares >= 0:
+            return self.cost
+        # 空头: 结算时最多赔付每份 1，已收到卖出价
+        return -self.shares * ONE + self.cost
+    
+    def apply(self, signed_units: int, price_ticks: int) -> int:
+        """
+        按平均成本法应用一笔成交
+        
+        Returns:
+            本次已实现盈亏（内部金额）
+        """
+        realized = 0
+        if self.shares and (self.shares > 0) != (signed_units > 0):
+            # 先平掉方向相反的持仓
+            closing = min(abs(signed_units), abs(self.shares))
+            removed = self.cost * closing // abs(self.shares)
+            sign = 1 if self.shares > 0 else -1
+            realized = sign * closing * price_ticks - removed
+            self.cost -= removed
+            self.shares += closing * -sign
+            signed_units += closing * sign
+            if not self.shares:
+                self.cost = 0
+        if signed_units:
+            self.shares += signed_units
+            self.cost += signed_units * price_ticks
+        self.realized += realized
+        return realized
+    
+    def to_dict(self) -> Dict:
+        return {
+            "market_id": self.market_id,
+            "outcome": self.outcome,
+            "venue": self.venue,
+            "shares": units_to_size(self.shares),
+            "avg_price": self.cost / self.shares / PRICE_SCALE if self.shares else 0.0,
+            "mark": None if self.mark is None else self.mark / PRICE_SCALE,
+            "locked": to_usd(self.locked),
+            "realized_pnl": to_usd(self.realized),
+            "unrealized_pnl": to_usd(self.unrealized),
+        }
+
+
+class _Totals:
+    """一组持仓的合计（内部金额）"""
+    
+    __slots__ = ("locked", "realized", "unrealized")
+    
+    def __init__(self):
+        self.locked = 0
+        self.realized = 0
+        self.unrealized = 0
+    
+    def to_dict(self) -> Dict:
+        return {
+            "locked": to_usd(self.locked),
+            "realized_pnl": to_usd(self.realized),
+            "unrealized_pnl": to_usd(self.unrealized),
+            "total_pnl": to_usd(self.realized + self.unrealized),
+        }
+
+
+class _Market:
+    """单个市场的持仓索引和合计"""
+    
+    __slots__ = ("outcomes", "positions", "net", "totals", "complete_sets", "resolved")
+    
+    def __init__(self, outcomes: Tuple[str, ...]):
+        self.outcomes = outcomes
+        self.positions: Dict[Tuple[str, str], Position] = {}  # (结果, 平台) -> 持仓
+        self.net: Dict[str, int] = {}                          # 结果 -> 跨平台净份数
+        self.totals = _Totals()
+        self.complete_sets = 0
+        self.resolved: Optional[str] = None
+
+
+class PositionLedger:
+    """跨平台持仓账本"""
+    
+    def __init__(self):
+        self._markets: Dict[str, _Market] = {}
+        self._venues: Dict[str, _Totals] = {}
+        self._totals = _Totals()
+        self._mergeable: Dict[str, Dict[str, int]] = {}   # 市场 -> {平台: 可合并组合数}
+        self._redeemable: Dict[str, Dict[str, int]] = {}  # 市场 -> {平台: 可赎回份数}
+        self.fills = 0
+        self._lock = threading.Lock()
+    
+    def register_market(self, market_id: str, outcomes: Iterable[str]):
+        """登记市场的全部结果（多结果市场需要登记，默认按二元市场 UP / DOWN 处理）"""
+        with self._lock:
+            market = self._market(market_id)
+            market.outcomes = tuple(outcomes)
+            self._update_sets(market_id, market)
+    
+    def apply_fill(self, market_id: str, outcome: str, venue: str, side: str,
+                   size: float, price: float) -> Position:
+        """
+        应用一笔成交
+        
+        Args:
+            market_id: 市场键（见 market_key）
+            outcome: 结果
+            venue: 平台
+            side: BUY 或 SELL
+            size: 本次新增成交数量
+            price: 成交价
+        
+        Returns:
+            更新后的持仓
+        """
+        units = size_to_units(size)
+        if side == "SELL":
+            units = -units
+        price_ticks = price_to_ticks(price)
+        with self._lock:
+            market = self._market(market_id)
+            position = self._position(market, market_id, outcome, venue)
+            venue_totals = self._venues.setdefault(venue, _Totals())
+            old_locked, old_unrealized = position.locked, position.unrealized
+            
+            realized = position.apply(units, price_ticks)
+            if position.mark is None:
+                position.mark = price_ticks
+            
+            self._adjust(market, venue_totals, position.locked - old_locked,
+                         realized, position.unrealized - old_unrealized)
+            market.net[outcome] = market.net.get(outcome, 0) + units
+            self._update_sets(market_id, market)
+            self.fills += 1
+            return position
+    
+    def mark(self, market_id: str, outcome: str, venue: str, price_ticks: int):
+        """更新持仓的标记价（价格单位，只有已有持仓时生效）"""
+        with self._lock:
+            market = self._markets.get(market_id)
+            position = market.positions.get((outcome, venue)) if market else None
+            if position is None or market.resolved is not None:
+                return
+            old_unrealized = position.unrealized
+            position.mark = price_ticks
+            self._adjust(market, self._venues[venue], 0, 0, position.unrealized - old_unrealized)
+    
+    def mark_prices(self, prices: Dict):
+        """
+        用 ArbitrageDetector.get_books 返回的价格字典标记二元市场的持仓
+        
+        多头按可以卖出的买价标记；Opinion.trade 报价是 UP 的双边报价，DOWN 按 1 - UP 卖价计
+        """
+        market_id = market_key(prices)
+        if market_id not in self._markets:
+            return
+        for outcome in BINARY_OUTCOMES:
+            quote = prices.get(f"polymarket_{outcome.lower()}_quote")
+            if quote is not None and quote.bid is not None:
+                self.mark(market_id, outcome, "polymarket", quote.bid)
+        opinion_quote = prices.get("opinion_trade_quote")
+        if opinion_quote is not None:
+            if opinion_quote.bid is not None:
+                self.mark(market_id, "UP", "opinion", opinion_quote.bid)
+            if opinion_quote.ask is not None:
+                self.mark(market_id, "DOWN", "opinion", ONE - opinion_quote.ask)
+    
+    def resolve(self, market_id: str, winning_outcome: str):
+        """市场结算: 获胜结果按 1、其余按 0 标记，获胜的多头标记为可赎回"""
+        with self._lock:
+            market = self._markets.get(market_id)
+            if market is None:
+                return
+            for (outcome, venue), position in market.positions.items():
+                old_unrealized = position.unrealized
+                position.mark = ONE if outcome == winning_outcome else 0
+                self._adjust(market, self._venues[venue], 0, 0, position.unrealized - old_unrealized)
+            market.resolved = winning_outcome
+            self._update_sets(market_id, market)
+    
+    def position(self, market_id: str, outcome: str, venue: str) -> Optional[Dict]:
+        """单个持仓，没有时返回 None"""
+        with self._lock:
+            market = self._markets.get(market_id)
+            position = market.positions.get((outcome, venue)) if market else None
+            return position.to_dict() if position else None
+    
+    def locked(self, market_id: str = None) -> Dict[str, int]:
+        """
+        各市场持仓占用的资金（内部金额），供风控计入名义金额
+        
+        已结算的市场结果已确定，不再计入
+        
+        Args:
+            market_id: 只返回该市场，默认全部
+        """
+        with self._lock:
+            if market_id is not None:
+                market = self._markets.get(market_id)
+                markets = {market_id: market} if market is not None else {}
+            else:
+                markets = self._markets
+            return {key: market.totals.locked if market.resolved is None else 0 for key, market in markets.items()}
+    
+    def exposure(self, market_id: str) -> Dict[str, float]:
+        """市场各结果的跨平台净份数"""
+        with self._lock:
+            market = self._markets.get(market_id)
+            return {outcome: units_to_size(units) for outcome, units in market.net.items()} if market else {}
+    
+    def snapshot(self, markets: bool = True) -> Dict:
+        """
+        账本快照（使用增量维护的合计，不遍历成交历史）
+        
+        Args:
+            markets: 是否包含每个市场的明细
+        
+        Returns:
+            {"totals", "venues", "mergeable", "redeemable", "fills"[, "markets"]}
+        """
+        with self._lock:
+            snapshot = {
+                "totals": self._totals.to_dict(),
+                "venues": {venue: totals.to_dict() for venue, totals in self._venues.items()},
+                "mergeable": {market_id: {venue: units_to_size(sets) for venue, sets in venues.items()}
+                              for market_id, venues in self._mergeable.items()},
+                "redeemable": {market_id: {venue: units_to_size(shares) for venue, shares in venues.items()}
+                               for market_id, venues in self._redeemable.items()},
+                "fills": self.fills,
+            }
+            if markets:
+                snapshot["markets"] = {
+                    market_id: dict(
+                        market.totals.to_dict(),
+                        net={outcome: units_to_size(units) for outcome, units in market.net.items()},
+                        complete_sets=units_to_size(market.complete_sets),
+                        resolved=market.resolved,
+                    )
+                    for market_id, market in self._markets.items()
+                }
+            return snapshot
+    
+    def get_state(self) -> Dict:
+        """可持久化的完整状态（内部整数单位，见 state_store.py）"""
+        with self._lock:
+            return {
+                "markets": {
+                    market_id: {
+                        "outcomes": list(market.outcomes),
+                        "resolved": market.resolved,
+                        "positions": [[p.outcome, p.venue, p.shares, p.cost, p.mark, p.realized]
+                                      for p in market.positions.values()],
+                    }
+                    for market_id, market in self._markets.items()
+                },
+                "fills": self.fills,
+            }
+    
+    def restore_state(self, state: Dict):
+        """从 get_state 的结果重建账本（与持仓数成正比）"""
+        with self._lock:
+            self._markets, self._venues, self._totals = {}, {}, _Totals()
+            self._mergeable, self._redeemable = {}, {}
+            for market_id, data in state["markets"].items():
+                market = self._markets[market_id] = _Market(tuple(data["outcomes"]))
+                market.resolved = data["resolved"]
+                for outcome, venue, shares, cost, mark, realized in data["positions"]:
+                    position = self._position(market, market_id, outcome, venue)
+                    position.shares, position.cost, position.mark, position.realized = shares, cost, mark, realized
+                    self._adjust(market, self._venues.setdefault(venue, _Totals()),
+                                 position.locked, realized, position.unrealized)
+                    market.net[outcome] = market.net.get(outcome, 0) + shares
+                self._update_sets(market_id, market)
+            self.fills = state["fills"]
+    
+    def _market(self, market_id: str) -> _Market:
+        market = self._markets.get(market_id)
+        if market is None:
+            market = self._markets[market_id] = _Market(BINARY_OUTCOMES)
+        return market
+    
+    @staticmethod
+    def _position(market: _Market, market_id: str, outcome: str, venue: str) -> Position:
+        position = market.positions.get((outcome, venue))
+        if position is None:
+            position = market.positions[(outcome, venue)] = Position(market_id, outcome, venue)
+        return position
+    
+    def _adjust(self, market: _Market, venue_totals: _Totals, locked: int, realized: int, unrealized: int):
+        for totals in (market.totals, venue_totals, self._totals):
+            totals.locked += locked
+            totals.realized += realized
+            totals.unrealized += unrealized
+    
+    def _update_sets(self, market_id: str, market: _Market):
+        """重新计算一个市场的完整组合数和合并 / 赎回标记（与结果数成正比，与成交历史无关）"""
+        market.complete_sets = max(0, min(market.net.get(outcome, 0) for outcome in market.outcomes))
+        
+        mergeable = {}
+        if market.resolved is None:
+            for venue in MERGEABLE_VENUES:
+                sets = min(self._long(market, outcome, venue) for outcome in market.outcomes)
+                if sets > 0:
+                    mergeable[venue] = sets
+        if mergeable:
+            self._mergeable[market_id] = mergeable
+        else:
+            self._mergeable.pop(market_id, None)
+        
+        redeemable = {}
+        if market.resolved is not None:
+            for (outcome, venue), position in market.positions.items():
+                if outcome == market.resolved and position.shares > 0:
+                    redeemable[venue] = position.shares
+        if redeemable:
+            self._redeemable[market_id] = redeemable
+        else:
+            self._redeemable.pop(market_id, None)
+    
+    @staticmethod
+    def _long(market: _Market, outcome: str, venue: str) -> int:
+        position = market.positions.get((outcome, venue))
+        return position.shares if position is not None and position.shares > 0 else 0
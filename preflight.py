@@ -0,0 +1,91 @@
+"""
+并行启动预检
+
+启动时的网络准备彼此独立，逐个执行时首个检测周期要等所有请求依次完成。
+run_parallel 把这些步骤放进线程池同时执行，并记录每一步的耗时:
+- 校验 Opinion.trade API Key（OpinionTradeClient.test_api_key）
+- 预热各客户端会话的连接池（HEAD 请求建立 TCP / TLS 连接，之后的请求复用）；
+  配置了多个 API 地址时预热全部地址，同时得到各地址的首个 RTT（见 endpoints.py）
+- 获取所有市场的首批订单簿（结果直接交给第一个检测周期，不再重复请求）
+
+恢复持久化状态（见 state_store.py）会改写市场列表，由调用方在这些步骤之前串行完成。
+
+总耗时约等于最慢的一步，而不是各步之和。
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(client, timeout: float = 5.0) -> Optional[int]:
+    """
+    预热客户端会话的连接（HEAD base_url），不关心返回的状态码
+    
+    客户端有端点池时探测池中所有地址（记录 RTT，可能切换当前地址）
+    
+    Returns:
+        当前地址的 HTTP 状态码；客户端没有会话（替身 / 纸面交易）时返回 None
+    """
+    session, base_url = getattr(client, "session", None), getattr(client, "base_url", None)
+    if session is None or not base_url:
+        return None
+    endpoints = getattr(client, "endpoints", None)
+    if endpoints is not None:
+        return endpoints.probe_once(session, timeout).get(endpoints.current)
+    return session.head(base_url, timeout=timeout).status_code
+
+
+def run_parallel(tasks: List[Tuple[str, Callable]], workers: int = None) -> Dict[str, Dict]:
+    """
+    并行执行启动步骤
+    
+    Args:
+        tasks: [(步骤名, 无参调用), ...]
+        workers: 线程数，默认使用配置 PREFLIGHT_WORKERS
+    
+    Returns:
+        步骤名 -> {"ok", "ms", "result", "error"}；调用抛出异常时 ok 为 False，不影响其他步骤
+    """
+    workers = workers or Config.PREFLIGHT_WORKERS
+    
+    def timed(fn: Callable) -> Dict:
+        started = time.perf_counter()
+        try:
+            result, error = fn(), None
+        except Exception as e:
+            result, error = None, str(e)
+        return {"ok": error is None, "ms": (time.perf_counter() - started) * 1000,
+                "result": result, "error": error}
+    
+    if not tasks:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks)), thread_name_prefix="preflight") as pool:
+        futures = [(name, pool.submit(timed, fn)) for name, fn in tasks]
+        return {name: future.result() for name, future in futures}
+
+
+def breakdown(phases: Dict[str, float], steps: Dict[str, Dict], group_prefix: str = "books:") -> List[str]:
+    """
+    启动耗时明细的日志行
+    
+    Args:
+        phases: 串行阶段名 -> 耗时（毫秒）
+        steps: run_parallel 的结果；名称以 group_prefix 开头的步骤合并为一行（数量、最慢、失败数）
+    """
+    lines = [f"启动耗时: 共 {sum(phases.values()):.0f} ms (" +
+             ", ".join(f"{name} {ms:.0f} ms" for name, ms in phases.items()) + ")"]
+    grouped = [step for name, step in steps.items() if name.startswith(group_prefix)]
+    for name, step in steps.items():
+        if name.startswith(group_prefix):
+            continue
+        status = "✓" if step["ok"] and step["result"] is not False else f"✗ {step['error'] or step['result']}"
+        lines.append(f"  {name}: {step['ms']:.0f} ms {status}")
+    if grouped:
+        failed = sum(1 for step in grouped if not step["ok"] or not step["result"])
+        lines.append(f"  首批订单簿: {len(grouped)} 个市场, 最慢 {max(step['ms'] for step in grouped):.0f} ms, "
+                     f"失败 {failed} 个")
+    return lines
@@ -0,0 +1,293 @@
+"""
+按需采样分析器
+
+运行中的机器人收到 SIGUSR1 或请求本地管理端口的 /profile 时，启动一个采样线程，
+在 N 秒内每隔 PROFILE_INTERVAL 用 sys._current_frames() 抓取所有线程的调用栈，结束后输出:
+- 折叠调用栈（flame graph 的 collapsed 格式，每行 "线程;外层;...;内层 样本数"，
+  可直接交给 flamegraph.pl / speedscope）
+- 每个函数的热点计数（self: 位于栈顶的样本数，total: 出现在栈中的样本数）
+
+空闲时没有采样线程，信号处理函数和管理端口（阻塞在 accept）都不消耗 CPU；
+不需要重启，也不需要在外部 profiler 下运行。
+"""
+import os
+import sys
+import time
+import json
+import signal
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Optional, Dict, List, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 单次采样的最长时间（秒），防止误传过大的 seconds
+MAX_PROFILE_SECONDS = 300
+
+
+def frame_label(code) -> str:
+    """调用栈中一帧的名称: 函数名 (文件名:定义行号)"""
+    # collapsed 格式用 ';' 分隔帧、用最后一个空格分隔样本数
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """后台线程采样的调用栈分析器"""
+    
+    def __init__(self, seconds: float = None, interval: float = None, output_dir: str = None):
+        """
+        Args:
+            seconds: 默认采样时长（秒）
+            interval: 采样间隔（秒）
+            output_dir: 结果文件目录，为空时不写文件
+        """
+        self.seconds = Config.PROFILE_SECONDS if seconds is None else seconds
+        self.interval = Config.PROFILE_INTERVAL if interval is None else interval
+        self.output_dir = Config.PROFILE_OUTPUT_DIR if output_dir is None else output_dir
+        self.stacks: Counter = Counter()
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self.samples = 0
+        self.last_files: List[str] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+        self._lock = threading.Lock()
+    
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+    
+    def start(self, seconds: float = None) -> bool:
+        """
+        开始采样（不阻塞），seconds 秒后自动结束并输出结果
+        
+        Returns:
+            是否已开始；已有采样在进行时返回 False
+        """
+        seconds = self.seconds if seconds is None else seconds
+        seconds = max(0.0, min(float(seconds), MAX_PROFILE_SECONDS))
+        with self._lock:
+            if self.running:
+                logger.warning("采样已在进行中，忽略本次请求")
+                return False
+            self.stacks, self.self_counts, self.total_counts = Counter(), Counter(), Counter()
+            self.samples = 0
+            self._stop.clear()
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds,),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"开始采样分析: {seconds:.1f} 秒，间隔 {self.interval * 1000:.1f} ms")
+        return True
+    
+    def stop(self):
+        """提前结束采样"""
+        self._stop.set()
+    
+    def wait(self, timeout: float = None) -> bool:
+        """等待本次采样结束"""
+        return self._done.wait(timeout)
+    
+    def profile(self, seconds: float = None) -> bool:
+        """开始采样并等待结束（管理端口使用）"""
+        if not self.start(seconds):
+            return False
+        self.wait()
+        return True
+    
+    def _run(self, seconds: float):
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                self._sample(own)
+                self._stop.wait(self.interval)
+            self._finish()
+        except Exception as e:
+            logger.error(f"采样分析失败: {e}", exc_info=True)
+        finally:
+            self._done.set()
+    
+    def _sample(self, own: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack.reverse()
+            self.stacks[(names.get(thread_id, str(thread_id)),) + tuple(stack)] += 1
+            self.self_counts[stack[-1]] += 1
+            # 递归函数在同一个样本中只计一次
+            self.total_counts.update(set(stack))
+        self.samples += 1
+    
+    def collapsed(self) -> str:
+        """折叠调用栈文本（按样本数降序）"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+    
+    def hot_functions(self, top: int = 20) -> List[Tuple[str, int, int]]:
+        """
+        热点函数
+        
+        Returns:
+            [(函数, self 样本数, total 样本数), ...]，按 self 降序
+        """
+        return [(name, count, self.total_counts[name]) for name, count in self.self_counts.most_common(top)]
+    
+    def hot_report(self, top: int = 20) -> str:
+        """热点函数表格文本"""
+        total = sum(self.self_counts.values()) or 1
+        lines = [f"采样 {self.samples} 次，线程栈样本 {sum(self.self_counts.values())} 个",
+                 f"{'self':>8} {'self%':>7} {'total':>8} {'total%':>7}  函数"]
+        for name, own, inclusive in self.hot_functions(top):
+            lines.append(f"{own:>8} {own / total * 100:>6.1f}% {inclusive:>8} {inclusive / total * 100:>6.1f}%  {name}")
+        return "\n".join(lines) + "\n"
+    
+    def get_result(self) -> Dict:
+        """最近一次采样的结果摘要"""
+        return {
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "hot": self.hot_functions(10),
+            "files": list(self.last_files),
+        }
+    
+    def _finish(self):
+        logger.info(f"采样分析结束: {self.samples} 次采样")
+        for name, own, inclusive in self.hot_functions(5):
+            logger.info(f"  热点: {name} self={own} total={inclusive}")
+        self.last_files = []
+        if not self.output_dir:
+            return
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            prefix = os.path.join(self.output_dir, datetime.now().strftime("profile-%Y%m%d-%H%M%S"))
+            for path, text in ((prefix + ".folded", self.collapsed()), (prefix + ".hot.txt", self.hot_report(50))):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                self.last_files.append(path)
+            logger.info(f"采样结果已写入: {', '.join(self.last_files)}")
+        except OSError as e:
+            logger.error(f"写入采样结果失败: {e}")
+    
+    def install_signal_handler(self, sig: int = None) -> bool:
+        """
+        收到信号时开始一次默认时长的采样（只能在主线程调用）
+        
+        Returns:
+            是否安装成功（Windows 没有 SIGUSR1）
+        """
+        sig = sig if sig is not None else getattr(signal, "SIGUSR1", None)
+        if sig is None:
+            return False
+        try:
+            signal.signal(sig, lambda signum, frame: self.start())
+        except ValueError as e:
+            logger.warning(f"无法安装采样信号处理: {e}")
+            return False
+        logger.info(f"发送信号 {sig} (kill -USR1 {os.getpid()}) 开始采样分析")
+        return True
+
+
+class ProfilerAdminServer:
+    """
+    本地管理端口
+    
+    GET /profile?seconds=N          采样 N 秒后返回折叠调用栈
+    GET /profile?seconds=N&format=hot  返回热点函数表
+    GET /profile/last               最近一次结果摘要（JSON）
+    """
+    
+    def __init__(self, profiler: SamplingProfiler, port: int = None, host: str = "127.0.0.1"):
+        self.profiler = profiler
+        port = Config.PROFILE_ADMIN_PORT if port is None else port
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, name="profiler-admin", daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "ProfilerAdminServer":
+        self._thread.start()
+        logger.info(f"采样分析管理端口: {self.url}/profile?seconds={self.profiler.seconds:g}")
+        return self
+    
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def _handler(self):
+        profiler = self.profiler
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                request = urlparse(self.path)
+                query = parse_qs(request.query)
+                if request.path == "/profile/last":
+                    self._reply(200, json.dumps(profiler.get_result(), ensure_ascii=False), "application/json")
+                    return
+                if request.path != "/profile":
+                    self._reply(404, "not found\n")
+                    return
+                try:
+                    seconds = float(query.get("seconds", [profiler.seconds])[0])
+                except ValueError:
+                    self._reply(400, "invalid seconds\n")
+                    return
+                if not profiler.profile(seconds):
+                    self._reply(409, "profile already running\n")
+                    return
+                if query.get("format", [""])[0] == "hot":
+                    self._reply(200, profiler.hot_report())
+                else:
+                    self._reply(200, profiler.collapsed())
+            
+            def _reply(self, status: int, body: str, content_type: str = "text/plain; charset=utf-8"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, *args):
+                pass
+        
+        return Handler
+
+
+def install(profiler: SamplingProfiler = None, signal_handler: bool = True) -> Tuple[SamplingProfiler, Optional[ProfilerAdminServer]]:
+    """
+    按配置安装采样触发方式（PROFILE_SIGNAL / PROFILE_ADMIN_PORT）
+    
+    Args:
+        profiler: 分析器，默认新建
+        signal_handler: 是否安装信号处理（asyncio 运行时自己用 loop.add_signal_handler 安装）
+    
+    Returns:
+        (分析器, 管理端口服务或 None)
+    """
+    profiler = profiler or SamplingProfiler()
+    if signal_handler and Config.PROFILE_SIGNAL:
+        profiler.install_signal_handler()
+    admin = None
+    if Config.PROFILE_ADMIN_PORT:
+        try:
+            admin = ProfilerAdminServer(profiler).start()
+        except OSError as e:
+            logger.error(f"无法启动采样分析管理端口 {Config.PROFILE_ADMIN_PORT}: {e}")
+    return profiler, admin
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+双边报价记录与回放
+
+QuoteRecorder 把每个周期的双边报价写入 JSON Lines 文件（QUOTE_RECORD_FILE），
+replay 用同一批记录分别按旧模型（Polymarket 按最优买价 bid 买入）和
+正确模型（买入按最优卖价 ask）检测，统计旧模型中有多少信号是实际无法成交的幻影。
+
+用法:
+    python replay.py quotes.jsonl
+"""
+import sys
+import json
+import time
+import logging
+from typing import Optional, Dict, List
+from ticks import Quote
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot(prices: Dict) -> Optional[Dict]:
+    """
+    从 get_books 返回的价格字典提取一条报价记录
+    
+    Returns:
+        {"ts", "market_id", "up", "down", "opinion"}，报价为 [bid, bid_size, ask, ask_size]；缺少报价时返回 None
+    """
+    quotes = [prices.get(key) for key in ("polymarket_up_quote", "polymarket_down_quote", "opinion_trade_quote")]
+    if not all(quotes):
+        return None
+    return {
+        "ts": time.time(),
+        "market_id": prices.get("market_id"),
+        "up": list(quotes[0]),
+        "down": list(quotes[1]),
+        "opinion": list(quotes[2]),
+    }
+
+
+class QuoteRecorder:
+    """把双边报价追加写入 JSON Lines 文件"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+    
+    def record(self, prices: Dict):
+        """记录一个周期的报价，写入失败只记录日志"""
+        record = snapshot(prices)
+        if record is None:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self.count += 1
+        except OSError as e:
+            logger.error(f"写入报价记录失败: {e}")
+
+
+def classify(record: Dict) -> Optional[str]:
+    """
+    判断一条记录在两种模型下的检测结果
+    
+    Returns:
+        "confirmed"（按 ask 仍然是机会）/ "phantom"（只有按 bid 计价才是机会）/
+        "missed"（只有按 ask 计价才是机会）/ None（两种模型都没有机会或报价不完整）
+    """
+    from arbitrage_detector import detect_arbitrage_ticks
+    
+    up, down, opinion = Quote(*record["up"]), Quote(*record["down"]), Quote(*record["opinion"])
+    
+    legacy = None
+    if up.bid and down.bid and opinion.ask:
+        # 旧模型: Polymarket 最优买价当作买入价，Opinion.trade 只有单一价格
+        legacy = detect_arbitrage_ticks(up.bid, down.bid, opinion.ask)
+    current = None
+    if up.ask and down.ask and opinion.ask:
+        current = detect_arbitrage_ticks(up.ask, down.ask, opinion.ask, opinion.bid)
+    
+    if current is not None:
+        return "confirmed" if legacy is not None else "missed"
+    return "phantom" if legacy is not None else None
+
+
+def replay(records) -> Dict:
+    """
+    回放报价记录
+    
+    Args:
+        records: 报价记录（snapshot 的返回值）的可迭代对象
+    
+    Returns:
+        统计: snapshots / signals（旧模型信号数）/ phantoms / confirmed / missed / phantom_rate
+    """
+    stats = {"snapshots": 0, "signals": 0, "phantoms": 0, "confirmed": 0, "missed": 0}
+    for record in records:
+        stats["snapshots"] += 1
+        result = classify(record)
+        if result == "phantom":
+            stats["phantoms"] += 1
+        elif result == "confirmed":
+            stats["confirmed"] += 1
+        elif result == "missed":
+            stats["missed"] += 1
+    stats["signals"] = stats["phantoms"] + stats["confirmed"]
+    stats["phantom_rate"] = stats["phantoms"] / stats["signals"] if stats["signals"] else 0.0
+    return stats
+
+
+def load_records(path: str) -> List[Dict]:
+    """读取 JSON Lines 报价记录，跳过无法解析的行"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"跳过第 {line_number} 行: 无法解析")
+    return records
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 2:
+        print("用法: python replay.py <报价记录文件>")
+        return 1
+    
+    stats = replay(load_records(sys.argv[1]))
+    print(f"回放记录: {stats['snapshots']} 条")
+    print(f"旧模型信号（按 bid 买入）: {stats['signals']} 个")
+    print(f"  幻影信号: {stats['phantoms']} 个 ({stats['phantom_rate'] * 100:.1f}%)")
+    print(f"  按 ask 确认: {stats['confirmed']} 个")
+    print(f"仅新模型发现: {stats['missed']} 个")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
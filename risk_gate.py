@@ -0,0 +1,265 @@
+"""
+下单前风控
+
+ArbitrageExecutor 在每笔交易下第一条腿之前调用 RiskGate.acquire，一次性检查并预留:
+- 单市场名义金额上限、全局名义金额上限（未完结订单的未成交部分 + 持仓占用的资金）
+- 下单速率（令牌桶，容量为一秒的下单数）
+- 同时未完结的订单腿数量
+- 紧急停止开关
+
+所有上限在构造时换算成整数单位，运行时状态只有几个计数器和一个按市场的字典，
+每次检查都是 O(1)，只在一把锁内做整数比较和加减，不分配对象、不做 I/O。
+订单成交时已成交部分从订单预留转为持仓，持仓占用由执行器按持仓账本（positions.py）同步到 set_position，
+卖出平仓和市场结算后随账本减少；订单完结（成交 / 撤单 / 拒绝）时由订单跟踪器回调 order_closed，
+归还未成交部分的名义金额和腿数。
+
+python risk_gate.py 运行微基准，输出每次检查的耗时分位数。
+"""
+import os
+import time
+import signal
+import logging
+import argparse
+import threading
+from typing import Optional, Dict
+from config import Config
+from ticks import size_to_units, units_to_size
+
+logger = logging.getLogger(__name__)
+
+# 拒绝原因
+REASON_KILLED = "kill_switch"
+REASON_MARKET_NOTIONAL = "market_notional"
+REASON_TOTAL_NOTIONAL = "total_notional"
+REASON_RATE = "order_rate"
+REASON_OPEN_LEGS = "open_legs"
+
+
+class RiskGate:
+    """下单前风控闸门"""
+    
+    def __init__(self, max_market_notional: float = None, max_total_notional: float = None,
+                 max_orders_per_second: float = None, max_open_legs: int = None,
+                 killed: bool = None, clock=time.monotonic):
+        """
+        Args:
+            max_market_notional: 单个市场的名义金额上限（USD），0 表示不限制
+            max_total_notional: 全局名义金额上限（USD），0 表示不限制
+            max_orders_per_second: 每秒最多下单数，0 表示不限制
+            max_open_legs: 同时未完结的订单腿上限，0 表示不限制
+            killed: 初始是否处于紧急停止状态
+            clock: 单调时钟（测试可替换）
+        """
+        max_market_notional = Config.RISK_MAX_MARKET_NOTIONAL if max_market_notional is None else max_market_notional
+        max_total_notional = Config.RISK_MAX_TOTAL_NOTIONAL if max_total_notional is None else max_total_notional
+        rate = Config.RISK_MAX_ORDERS_PER_SECOND if max_orders_per_second is None else max_orders_per_second
+        max_open_legs = Config.RISK_MAX_OPEN_LEGS if max_open_legs is None else max_open_legs
+        
+        # 上限预先换算为金额单位；不限制时用 None，检查时只有一次比较
+        self.max_market = size_to_units(max_market_notional) if max_market_notional > 0 else None
+        self.max_total = size_to_units(max_total_notional) if max_total_notional > 0 else None
+        self.rate = float(rate) if rate > 0 else None
+        self.burst = max(self.rate, 1.0) if self.rate else None
+        self.max_open_legs = max_open_legs if max_open_legs > 0 else None
+        self.killed = Config.RISK_KILL_SWITCH if killed is None else killed
+        self.kill_reason = "RISK_KILL_SWITCH" if self.killed else None
+        self.clock = clock
+        
+        self.market_notional: Dict[str, int] = {}    # 未完结订单的预留
+        self.position_notional: Dict[str, int] = {}  # 持仓占用（来自持仓账本）
+        self.total_notional = 0                      # 两者合计
+        self.open_legs = 0
+        self._tokens = self.burst or 0.0
+        self._refilled_at = clock()
+        self.stats = {"accepted": 0, "rejected": 0, "rejected_by": {}}
+        self._lock = threading.Lock()
+    
+    def acquire(self, market_id: str, notional: int, legs: int) -> Optional[str]:
+        """
+        检查并预留一笔交易
+        
+        Args:
+            market_id: 市场键
+            notional: 所有腿的名义金额合计（金额单位）
+            legs: 订单腿数
+        
+        Returns:
+            None 表示通过（已预留）；否则为拒绝原因
+        """
+        with self._lock:
+            reason = None
+            if self.killed:
+                reason = REASON_KILLED
+            elif self.max_open_legs is not None and self.open_legs + legs > self.max_open_legs:
+                reason = REASON_OPEN_LEGS
+            else:
+                market_notional = self.market_notional.get(market_id, 0) + notional
+                if self.max_market is not None and \
+                        market_notional + self.position_notional.get(market_id, 0) > self.max_market:
+                    reason = REASON_MARKET_NOTIONAL
+                elif self.max_total is not None and self.total_notional + notional > self.max_total:
+                    reason = REASON_TOTAL_NOTIONAL
+                elif self.rate is not None:
+                    now = self.clock()
+                    tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                    self._refilled_at = now
+                    if tokens < legs:
+                        self._tokens = tokens
+                        reason = REASON_RATE
+                    else:
+                        self._tokens = tokens - legs
+            
+            if reason is not None:
+                self.stats["rejected"] += 1
+                self.stats["rejected_by"][reason] = self.stats["rejected_by"].get(reason, 0) + 1
+                return reason
+            
+            self.market_notional[market_id] = market_notional
+            self.total_notional += notional
+            self.open_legs += legs
+            self.stats["accepted"] += 1
+            return None
+    
+    def release(self, market_id: str, notional: int, legs: int):
+        """归还预留（下单失败的腿、已成交转为持仓的部分，或完结订单未成交的部分）"""
+        with self._lock:
+            reserved = self.market_notional.get(market_id, 0)
+            notional = min(notional, reserved)
+            if reserved - notional:
+                self.market_notional[market_id] = reserved - notional
+            else:
+                self.market_notional.pop(market_id, None)
+            self.total_notional -= notional
+            self.open_legs = max(0, self.open_legs - legs)
+    
+    def reserve(self, market_id: str, notional: int, legs: int):
+        """不做检查直接计入占用（从状态日志恢复已下单的订单腿）"""
+        with self._lock:
+            self.market_notional[market_id] = self.market_notional.get(market_id, 0) + notional
+            self.total_notional += notional
+            self.open_legs += legs
+    
+    def order_closed(self, market_id: str, unfilled_notional: int):
+        """一条订单腿完结: 归还腿数和未成交部分的名义金额（已成交部分已转为持仓占用）"""
+        self.release(market_id, unfilled_notional, 1)
+    
+    def set_position(self, market_id: str, notional: int):
+        """设置市场的持仓占用（金额单位，由持仓账本计算）"""
+        with self._lock:
+            old = self.position_notional.pop(market_id, 0)
+            if notional > 0:
+                self.position_notional[market_id] = notional
+            else:
+                notional = 0
+            self.total_notional += notional - old
+    
+    def kill(self, reason: str = "manual"):
+        """紧急停止: 之后所有交易都被拒绝，直到 reset()"""
+        with self._lock:
+            self.killed = True
+            self.kill_reason = reason
+        logger.critical(f"风控紧急停止: {reason}")
+    
+    def reset(self):
+        """解除紧急停止"""
+        with self._lock:
+            self.killed = False
+            self.kill_reason = None
+        logger.warning("风控紧急停止已解除")
+    
+    def install_signal_handler(self, sig: int = None) -> bool:
+        """
+        收到信号（默认 SIGUSR2）时紧急停止（只能在主线程调用）
+        
+        Returns:
+            是否安装成功（Windows 没有 SIGUSR2）
+        """
+        sig = sig if sig is not None else getattr(signal, "SIGUSR2", None)
+        if sig is None:
+            return False
+        def on_signal(signum, frame):
+            # 信号处理在主线程的任意位置执行，主线程可能正持有 _lock（不可重入），这里只设置标志不取锁
+            self.killed = True
+            self.kill_reason = f"signal {signum}"
+            logger.critical(f"风控紧急停止: {self.kill_reason}")
+        
+        try:
+            signal.signal(sig, on_signal)
+        except ValueError as e:
+            logger.warning(f"无法安装紧急停止信号处理: {e}")
+            return False
+        logger.info(f"发送信号 {sig} (kill -USR2 {os.getpid()}) 紧急停止下单")
+        return True
+    
+    def get_state(self) -> Dict:
+        """可持久化的占用状态（见 state_store.py）；持仓占用不保存，恢复后由执行器按账本重新同步"""
+        with self._lock:
+            return {"market_notional": dict(self.market_notional), "open_legs": self.open_legs,
+                    "killed": self.killed, "kill_reason": self.kill_reason}
+    
+    def restore_state(self, state: Dict):
+        """从 get_state 的结果恢复占用；紧急停止状态保留（重启不会自动解除）"""
+        with self._lock:
+            self.market_notional = {market_id: int(notional) for market_id, notional in state["market_notional"].items()}
+            self.position_notional = {}
+            self.total_notional = sum(self.market_notional.values())
+            self.open_legs = state["open_legs"]
+            if state.get("killed"):
+                self.killed = True
+                self.kill_reason = state.get("kill_reason")
+    
+    def get_stats(self) -> Dict:
+        """通过 / 拒绝计数和当前占用"""
+        with self._lock:
+            return dict(
+                self.stats,
+                rejected_by=dict(self.stats["rejected_by"]),
+                total_notional=units_to_size(self.total_notional),
+                position_notional=units_to_size(self.total_notional - sum(self.market_notional.values())),
+                open_legs=self.open_legs,
+                killed=self.killed,
+            )
+
+
+def benchmark(iterations: int = 200_000, markets: int = 1000) -> Dict[str, float]:
+    """
+    微基准: 在所有限制都开启时测量 acquire + release 一轮的耗时
+    
+    Returns:
+        {"mean_us", "p50_us", "p99_us", "max_us"}，单位微秒
+    """
+    gate = RiskGate(max_market_notional=1e9, max_total_notional=1e12,
+                    max_orders_per_second=1e9, max_open_legs=10 ** 9, killed=False)
+    market_ids = [f"market-{i}" for i in range(markets)]
+    notional = size_to_units(10)
+    samples = []
+    perf_counter_ns = time.perf_counter_ns
+    started = perf_counter_ns()
+    for i in range(iterations):
+        market_id = market_ids[i % markets]
+        t0 = perf_counter_ns()
+        gate.acquire(market_id, notional, 2)
+        gate.release(market_id, notional, 2)
+        samples.append(perf_counter_ns() - t0)
+    elapsed = perf_counter_ns() - started
+    samples.sort()
+    return {
+        "mean_us": elapsed / iterations / 1000,
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[int(len(samples) * 0.99)] / 1000,
+        "max_us": samples[-1] / 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下单前风控微基准")
+    parser.add_argument("--iterations", type=int, default=200_000, help="检查次数")
+    parser.add_argument("--markets", type=int, default=1000, help="市场数量")
+    args = parser.parse_args()
+    result = benchmark(args.iterations, args.markets)
+    print(f"acquire + release: 平均 {result['mean_us']:.2f} µs, p50 {result['p50_us']:.2f} µs, "
+          f"p99 {result['p99_us']:.2f} µs, 最大 {result['max_us']:.2f} µs ({args.iterations} 次)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+多进程分片运行时
+
+一个行情进程把各市场的价格写入共享内存，N 个检测进程各自扫描一部分市场，
+发现的套利机会通过队列交给唯一的执行进程，从而绕开单进程 GIL 的限制。
+"""
+import time
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from queue import Empty
+from typing import Optional, Dict, List
+from config import Config, POLL_INTERVAL, LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+
+# 共享内存中每个市场占用的槽位（均为 int64，价格为 ticks.py 中的整数价格单位）
+# seq 为顺序锁计数：奇数表示正在写入，偶数表示数据完整
+# 价格均为买入价（ask），opinion_trade_bid 为 Opinion.trade UP 的最优买价
+SLOT_FIELDS = ("seq", "polymarket_up", "polymarket_down", "opinion_trade", "opinion_trade_bid", "updated_at_ns")
+SLOT_WIDTH = len(SLOT_FIELDS)
+SEQ, POLY_UP, POLY_DOWN, OPINION, OPINION_BID, UPDATED_AT = range(SLOT_WIDTH)
+
+# 缺失价格的占位值
+MISSING = -1
+
+# 检测进程在没有新数据时的休眠时间（秒）
+IDLE_SLEEP = 0.001
+
+
+class SharedBookStore:
+    """基于共享内存的价格存储，单写多读，读端零拷贝"""
+    
+    def __init__(self, num_markets: int, name: str = None):
+        """
+        Args:
+            num_markets: 市场数量
+            name: 共享内存名称；为空时新建，否则挂载已存在的共享内存
+        """
+        self.num_markets = num_markets
+        self.owner = name is None
+        if self.owner:
+            size = max(1, num_markets) * SLOT_WIDTH * 8
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.view = self.shm.buf.cast("q")
+        if self.owner:
+            for i in range(num_markets):
+                base = i * SLOT_WIDTH
+                self.view[base + SEQ] = 0
+                for field in (POLY_UP, POLY_DOWN, OPINION, OPINION_BID, UPDATED_AT):
+                    self.view[base + field] = MISSING
+    
+    @property
+    def name(self) -> str:
+        return self.shm.name
+    
+    def write(self, index: int, poly_up: Optional[int], poly_down: Optional[int],
+              opinion: Optional[int], opinion_bid: Optional[int] = None):
+        """写入一个市场的整数价格（仅行情进程调用）"""
+        base = index * SLOT_WIDTH
+        view = self.view
+        view[base + SEQ] += 1
+        view[base + POLY_UP] = MISSING if poly_up is None else poly_up
+        view[base + POLY_DOWN] = MISSING if poly_down is None else poly_down
+        view[base + OPINION] = MISSING if opinion is None else opinion
+        view[base + OPINION_BID] = MISSING if opinion_bid is None else opinion_bid
+        view[base + UPDATED_AT] = time.time_ns()
+        view[base + SEQ] += 1
+    
+    def seq(self, index: int) -> int:
+        """获取市场的顺序号"""
+        return self.view[index * SLOT_WIDTH + SEQ]
+    
+    def read(self, index: int) -> Optional[tuple]:
+        """
+        读取一个市场的价格
+        
+        Returns:
+            (seq, poly_up, poly_down, opinion, opinion_bid, updated_at)，写入过程中读到的数据会重试
+        """
+        base = index * SLOT_WIDTH
+        view = self.view
+        for _ in range(100):
+            seq = view[base + SEQ]
+            if seq % 2:
+                continue
+            slot = tuple(view[base:base + SLOT_WIDTH])
+            if view[base + SEQ] == seq:
+                return slot
+        return None
+    
+    def close(self):
+        """释放共享内存"""
+        self.view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def partition_markets(num_markets: int, num_workers: int) -> List[List[int]]:
+    """按轮询方式把市场索引分配给各个检测进程"""
+    num_workers = max(1, min(num_workers, num_markets))
+    return [list(range(i, num_markets, num_workers)) for i in range(num_workers)]
+
+
+def _setup_process_logging():
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL),
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _feed_process(store_name: str, markets: List[Dict], stop_event, poll_interval: float):
+    """行情进程：轮询各市场价格并写入共享内存"""
+    _setup_process_logging()
+    from arbitrage_detector import ArbitrageDetector
+    
+    store = SharedBookStore(len(markets), name=store_name)
+    detector = ArbitrageDetector()
+    try:
+        while not stop_event.is_set():
+            for index, market in enumerate(markets):
+                if stop_event.is_set():
+                    break
+                prices = detector.get_prices(market) or {}
+                store.write(
+                    index,
+                    prices.get("polymarket_up_ticks"),
+                    prices.get("polymarket_down_ticks"),
+                    prices.get("opinion_trade_ticks"),
+                    prices.get("opinion_trade_bid_ticks")
+                )
+            stop_event.wait(poll_interval)
+    finally:
+        store.close()
+
+
+def _detector_process(store_name: str, markets: List[Dict], indices: List[int],
+                      opportunity_queue, stop_event):
+    """检测进程：扫描分配到的市场，只处理有更新的价格"""
+    _setup_process_logging()
+    from arbitrage_detector import detect_arbitrage, market_fields
+    from trigger_index import TriggerIndex
+    from stale_guard import StaleGuard, QuoteStamp
+    
+    store = SharedBookStore(len(markets), name=store_name)
+    triggers = TriggerIndex()
+    stale_guard = StaleGuard()
+    last_seq = {index: 0 for index in indices}
+    fields = {index: market_fields(markets[index]) for index in indices}
+    try:
+        while not stop_event.is_set():
+            updated = 0
+            for index in indices:
+                seq = store.seq(index)
+                if seq == last_seq[index]:
+                    continue
+                slot = store.read(index)
+                if slot is None:
+                    continue
+                last_seq[index] = slot[SEQ]
+                updated += 1
+                
+                poly_up, poly_down, opinion, opinion_bid = (
+                    price if price > 0 else None
+                    for price in (slot[POLY_UP], slot[POLY_DOWN], slot[OPINION], slot[OPINION_BID])
+                )
+                
+                # 触发价索引只重新计算变化的腿，未进入触发区间时不构造机会字典
+                if not triggers.update_market(index, poly_up, poly_down, opinion, opinion_bid):
+                    continue
+                prices = {
+                    "polymarket_up_ticks": poly_up,
+                    "polymarket_down_ticks": poly_down,
+                    "opinion_trade_ticks": opinion,
+                    "opinion_trade_bid_ticks": opinion_bid,
+                }
+                prices.update(fields[index])
+                opportunity = detect_arbitrage(prices)
+                if not opportunity:
+                    continue
+                # 槽位写入时间为墙上时钟，换算成单调时钟上的收到时间
+                age = max(0.0, time.time() - slot[UPDATED_AT] / 1e9)
+                stamp = QuoteStamp("shared_store", time.monotonic() - age, None, 0.0)
+                if stale_guard.check(opportunity, [stamp]):
+                    opportunity["price_updated_at"] = slot[UPDATED_AT] / 1e9
+                    opportunity_queue.put(opportunity)
+            
+            if not updated:
+                time.sleep(IDLE_SLEEP)
+    finally:
+        store.close()
+
+
+def _executor_process(opportunity_queue, stop_event, executor=None):
+    """
+    执行进程：串行执行所有检测进程发现的机会
+    
+    Args:
+        executor: 使用的执行器，默认新建 ArbitrageExecutor（测试时在同一进程内传入使用替身平台的执行器）
+    """
+    _setup_process_logging()
+    from arbitrage_executor import ArbitrageExecutor
+    from opportunity_tracker import OpportunityTracker
+    
+    executor = executor or ArbitrageExecutor()
+    tracker = OpportunityTracker()
+    refreshed_at = time.monotonic()
+    while not stop_event.is_set():
+        if time.monotonic() - refreshed_at >= POLL_INTERVAL:
+            # 每个轮询间隔批量刷新一次订单状态，完结的订单归还风控占用
+            refreshed_at = time.monotonic()
+            try:
+                executor.refresh_orders()
+            except Exception as e:
+                logger.error(f"刷新订单状态失败: {e}", exc_info=True)
+            # 检测进程只发送机会、不发送机会消失，长时间未再收到的机会视为结束
+            tracker.close_stale()
+        try:
+            opportunity = opportunity_queue.get(timeout=min(0.5, POLL_INTERVAL))
+        except Empty:
+            continue
+        if not tracker.should_fire(opportunity):
+            continue
+        logger.info(f"发现套利机会: {opportunity.get('market_id')} {opportunity['strategy']}")
+        tracker.mark_executing(opportunity)
+        try:
+            success = executor.execute(opportunity)
+        except Exception as e:
+            logger.error(f"执行套利出错: {e}", exc_info=True)
+            success = False
+        tracker.mark_result(opportunity, success)
+
+
+class ShardedRuntime:
+    """多进程分片运行时"""
+    
+    def __init__(self, markets: List[Dict] = None, num_workers: int = None,
+                 poll_interval: float = None):
+        self.markets = markets if markets is not None else Config.load_markets()
+        self.num_workers = num_workers or Config.SHARD_WORKERS
+        self.poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+        self.store = None
+        self.stop_event = mp.Event()
+        self.opportunity_queue = mp.Queue()
+        self.processes = []
+    
+    def start(self):
+        """启动行情、检测和执行进程"""
+        self.store = SharedBookStore(len(self.markets))
+        partitions = partition_markets(len(self.markets), self.num_workers)
+        
+        logger.info(f"分片运行时启动: {len(self.markets)} 个市场, {len(partitions)} 个检测进程")
+        
+        self.processes.append(mp.Process(
+            target=_feed_process,
+            args=(self.store.name, self.markets, self.stop_event, self.poll_interval),
+            name="feed"
+        ))
+        for i, indices in enumerate(partitions):
+            self.processes.append(mp.Process(
+                target=_detector_process,
+                args=(self.store.name, self.markets, indices, self.opportunity_queue, self.stop_event),
+                name=f"detector-{i}"
+            ))
+        self.processes.append(mp.Process(
+            target=_executor_process,
+            args=(self.opportunity_queue, self.stop_event),
+            name="executor"
+        ))
+        
+        for process in self.processes:
+            process.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止所有进程并释放共享内存"""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"进程 {process.name} 未能按时退出，强制终止")
+                process.terminate()
+        self.processes = []
+        if self.store:
+            self.store.close()
+            self.store = None
+        logger.info("分片运行时停止")
+
+
+def main():
+    """主函数"""
+    _setup_process_logging()
+    Config.validate()
+    runtime = ShardedRuntime()
+    runtime.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("收到停止信号，正在关闭...")
+    finally:
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
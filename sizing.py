@@ -0,0 +1,196 @@
+"""
+等份数下单规模计算
+
+套利只在两边持有相同份数时才锁定收益: 每一份 UP + DOWN（或 N 选 1 的每个结果各一份）到期价值 1，
+多出来的一边份数是裸露仓位。因此各条腿一律下相同的份数:
+    份数 = 预算 / 每份总成本
+再依次:
+- 每条腿的限价按该平台的 tick 向上取整（买入），用取整后的价格重新检查利润阈值，
+  取整吃掉利润时不下单
+- 按各腿可成交深度封顶
+- 向下取整到所有腿数量步长的公倍数，低于任一平台的最小下单量时不下单
+
+所有计算都在整数单位下进行（价格: ticks.PRICE_SCALE，数量 / 金额: ticks.SIZE_SCALE）。
+size_matched_batch 按列（每条腿一列）批量计算一个周期内的全部候选机会。
+"""
+import math
+from typing import Optional, Dict, List, NamedTuple, Sequence, Union
+from config import Config
+from ticks import ONE, PRICE_SCALE, price_to_ticks, size_to_units, units_to_size, tick_size_ticks, round_up_to_tick
+
+MAX_SUM_TICKS = price_to_ticks(Config.ARBITRAGE_MAX_SUM_PRICE)
+MIN_PROFIT_TICKS = price_to_ticks(Config.MIN_PROFIT_MARGIN)
+
+# 不满足条件时的原因
+REASON_EDGE = "edge"          # 价格取整后利润不足
+REASON_MIN_SIZE = "min_size"  # 份数低于最小下单量（预算或深度不足）
+
+
+class LegRules(NamedTuple):
+    """单个平台的下单规则（整数单位）"""
+    tick: int      # 价格 tick（价格单位）
+    min_size: int  # 最小下单数量（数量单位）
+    lot: int       # 数量步长（数量单位）
+
+
+class SizedLegs(NamedTuple):
+    """规模计算结果"""
+    shares: int                # 每条腿的份数（数量单位），0 表示不下单
+    prices: tuple              # 每条腿取整后的限价（价格单位）
+    cost: int                  # 每份总成本（价格单位）
+    reason: Optional[str]      # shares 为 0 时的原因
+    
+    @property
+    def notional(self) -> int:
+        """总花费（金额单位）"""
+        return self.shares * self.cost // PRICE_SCALE
+    
+    @property
+    def expected_profit(self) -> int:
+        """到期利润（金额单位）"""
+        return self.shares * (ONE - self.cost) // PRICE_SCALE
+
+
+def leg_rules(venue: str, tick_size=None) -> LegRules:
+    """
+    平台下单规则
+    
+    Args:
+        venue: polymarket 或 opinion
+        tick_size: 市场的价格 tick（Polymarket 每个市场不同），默认使用配置
+    """
+    if venue == "polymarket":
+        return LegRules(tick_size_ticks(tick_size or Config.POLYMARKET_TICK_SIZE),
+                        size_to_units(Config.POLYMARKET_MIN_ORDER_SIZE),
+                        size_to_units(Config.POLYMARKET_SIZE_STEP))
+    return LegRules(tick_size_ticks(tick_size or Config.OPINION_TICK_SIZE),
+                    size_to_units(Config.OPINION_MIN_ORDER_SIZE),
+                    size_to_units(Config.OPINION_SIZE_STEP))
+
+
+def round_shares(shares: float, rules: LegRules) -> float:
+    """把份数向下取整到数量步长，低于最小下单量时返回 0"""
+    units = size_to_units(shares)
+    units -= units % rules.lot if rules.lot > 1 else 0
+    return units_to_size(units) if units >= rules.min_size and units > 0 else 0.0
+
+
+def size_matched_batch(budgets: Sequence[int], prices: Sequence[Sequence[int]],
+                       depths: Sequence[Sequence[Optional[int]]] = None,
+                       rules: Sequence[Union[LegRules, Sequence[LegRules]]] = ()) -> List[SizedLegs]:
+    """
+    批量计算等份数下单规模（买入组合，每份到期价值 1）
+    
+    Args:
+        budgets: 每个候选的预算（金额单位）
+        prices: 每条腿一列，prices[k][i] 为第 i 个候选第 k 条腿的价格（价格单位）
+        depths: 与 prices 同形状的可成交数量（数量单位），None 表示没有深度信息
+        rules: 每条腿的下单规则；可以是整列共用的 LegRules，也可以是每个候选一个的列表
+    
+    Returns:
+        每个候选的 SizedLegs
+    """
+    count = len(budgets)
+    columns = []
+    for k, column in enumerate(prices):
+        rule = rules[k]
+        if isinstance(rule, LegRules):
+            tick = rule.tick
+            columns.append([round_up_to_tick(price, tick) for price in column])
+        else:
+            columns.append([round_up_to_tick(price, r.tick) for price, r in zip(column, rule)])
+    rounded = list(zip(*columns)) if columns else [()] * count
+    costs = [sum(row) for row in rounded]
+    caps = [min((d for d in row if d is not None), default=None) for row in zip(*depths)] if depths else [None] * count
+    
+    # 所有腿共用的规则可以只算一次
+    shared = all(isinstance(rule, LegRules) for rule in rules)
+    if shared:
+        shared_lot = math.lcm(*(rule.lot for rule in rules)) if rules else 1
+        shared_min = max((rule.min_size for rule in rules), default=0)
+    
+    limit = min(MAX_SUM_TICKS - 1, ONE - MIN_PROFIT_TICKS)
+    results = []
+    for i in range(count):
+        cost = costs[i]
+        if cost > limit or cost <= 0:
+            results.append(SizedLegs(0, rounded[i], cost, REASON_EDGE))
+            continue
+        if shared:
+            lot, min_size = shared_lot, shared_min
+        else:
+            leg_rules_i = [rule if isinstance(rule, LegRules) else rule[i] for rule in rules]
+            lot = math.lcm(*(rule.lot for rule in leg_rules_i))
+            min_size = max(rule.min_size for rule in leg_rules_i)
+        shares = budgets[i] * ONE // cost
+        if caps[i] is not None and caps[i] < shares:
+            shares = caps[i]
+        if lot > 1:
+            shares -= shares % lot
+        if shares <= 0 or shares < min_size:
+            results.append(SizedLegs(0, rounded[i], cost, REASON_MIN_SIZE))
+        else:
+            results.append(SizedLegs(shares, rounded[i], cost, None))
+    return results
+
+
+def size_matched(budget: int, prices: Sequence[int], depths: Sequence[Optional[int]] = None,
+                 rules: Sequence[LegRules] = ()) -> SizedLegs:
+    """
+    计算单个候选的等份数下单规模
+    
+    Args:
+        budget: 预算（金额单位）
+        prices: 每条腿的价格（价格单位）
+        depths: 每条腿的可成交数量（数量单位）
+        rules: 每条腿的下单规则
+    """
+    return size_matched_batch(
+        [budget], [[price] for price in prices],
+        [[depth] for depth in depths] if depths else None, rules
+    )[0]
+
+
+def opportunity_legs(opportunity: Dict) -> Optional[tuple]:
+    """
+    机会各条腿的 (价格, 深度, 规则)，用于规模计算；卖出组合等不适用时返回 None
+    
+    Returns:
+        (prices, depths, rules)
+    """
+    kind = opportunity.get("type")
+    tick_size = opportunity.get("tick_size")
+    if kind == "complete_set":
+        if opportunity.get("side") != "BUY":
+            return None
+        rules = leg_rules("polymarket", tick_size)
+        depth = size_to_units(opportunity["size"]) if opportunity.get("size") is not None else None
+        return ((price_to_ticks(opportunity["up_price"]), price_to_ticks(opportunity["down_price"])),
+                (depth, depth), (rules, rules))
+    if kind == "multi_outcome":
+        legs = opportunity["legs"]
+        # 没有逐腿深度时使用组合整体的可成交数量
+        sizes = [opportunity.get("size") if leg.get("size") is None else leg["size"] for leg in legs]
+        return (tuple(leg.get("price_ticks") or price_to_ticks(leg["price"]) for leg in legs),
+                tuple(None if size is None else size_to_units(size) for size in sizes),
+                tuple(leg_rules(leg["venue"], tick_size if leg["venue"] == "polymarket" else None) for leg in legs))
+    poly_size, opinion_size = opportunity.get("poly_size"), opportunity.get("opinion_size")
+    return ((opportunity.get("poly_price_ticks") or price_to_ticks(opportunity["poly_price"]),
+             opportunity.get("opinion_price_ticks") or price_to_ticks(opportunity["opinion_price"])),
+            (None if poly_size is None else size_to_units(poly_size),
+             None if opinion_size is None else size_to_units(opinion_size)),
+            (leg_rules("polymarket", tick_size), leg_rules("opinion")))
+
+
+def size_opportunity(opportunity: Dict, position_size: float) -> Optional[SizedLegs]:
+    """
+    按预算（USD）计算机会的等份数下单规模
+    
+    Returns:
+        SizedLegs；机会类型不适用（卖出组合）时返回 None
+    """
+    legs = opportunity_legs(opportunity)
+    if legs is None:
+        return None
+    prices, depths, rules = legs
+    return size_matched(size_to_units(position_size), prices, depths, rules)
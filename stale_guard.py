@@ -0,0 +1,191 @@
+"""
+过期报价保护
+
+每个订单簿 / 报价在收到时记录单调时钟时间（time.monotonic，不受系统时钟调整影响）、
+墙上时钟时间和平台返回的时间戳。VenueClock 用 (收到时间 - 平台时间戳) 估计平台时钟偏差
+加最小延迟（滑动窗口最小值），超出部分视为这条报价在到达前已经过去的额外时间。
+
+腿的年龄 = 收到至今的单调时间 + 到达前的额外延迟，超过 STALE_QUOTE_MAX_AGE 的腿：
+- reject 模式：丢弃整个机会
+- downweight 模式：年龄超过一半后按比例降低下单规模，超过上限仍丢弃
+"""
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, List, NamedTuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 估计时钟偏差使用的样本数
+CLOCK_WINDOW = 100
+# 延迟 EWMA 平滑系数
+LAG_ALPHA = 0.1
+
+
+class QuoteStamp(NamedTuple):
+    """报价时间戳"""
+    venue: str
+    received_at: float          # 收到时的 time.monotonic()
+    venue_ts: Optional[float]   # 平台返回的时间戳（秒），没有时为 None
+    lag: float                  # 相对平台最快到达样本的额外延迟（秒）
+
+
+class VenueClock:
+    """估计单个平台的时钟偏差和到达延迟"""
+    
+    __slots__ = ("samples", "lag_ewma", "observed")
+    
+    def __init__(self):
+        self.samples = deque(maxlen=CLOCK_WINDOW)
+        self.lag_ewma = 0.0
+        self.observed = 0
+    
+    @property
+    def offset(self) -> float:
+        """收到时间 - 平台时间戳的窗口最小值（时钟偏差 + 最小延迟，秒）"""
+        return min(self.samples) if self.samples else 0.0
+    
+    def observe(self, received_wall: float, venue_ts: float) -> float:
+        """
+        记录一个样本
+        
+        Returns:
+            该报价相对最快样本的额外延迟（秒）
+        """
+        delta = received_wall - venue_ts
+        self.samples.append(delta)
+        self.observed += 1
+        lag = delta - self.offset
+        self.lag_ewma += LAG_ALPHA * (lag - self.lag_ewma)
+        return lag
+
+
+class StaleGuard:
+    """过期报价检查与统计"""
+    
+    def __init__(self, max_age: float = None, mode: str = None):
+        """
+        Args:
+            max_age: 腿的最大年龄（秒）
+            mode: reject 或 downweight
+        """
+        self.max_age = Config.STALE_QUOTE_MAX_AGE if max_age is None else max_age
+        self.mode = (mode or Config.STALE_QUOTE_MODE).lower()
+        self.clocks: Dict[str, VenueClock] = {}
+        self.stats = {"checked": 0, "rejected": 0, "downweighted": 0}
+        self.rejected_by_venue: Dict[str, int] = {}
+    
+    def stamp(self, venue: str, received_at: float = None, received_wall: float = None,
+              venue_ts: float = None) -> QuoteStamp:
+        """
+        为收到的报价生成时间戳（有平台时间戳时同时更新时钟估计）
+        
+        Args:
+            venue: 平台名
+            received_at: 收到时的 time.monotonic()，默认当前
+            received_wall: 收到时的 time.time()，默认当前
+            venue_ts: 平台时间戳（秒）
+        """
+        received_at = time.monotonic() if received_at is None else received_at
+        lag = 0.0
+        if venue_ts is not None:
+            received_wall = time.time() if received_wall is None else received_wall
+            lag = self.clocks.setdefault(venue, VenueClock()).observe(received_wall, venue_ts)
+        return QuoteStamp(venue, received_at, venue_ts, lag)
+    
+    def age(self, stamp: QuoteStamp, now: float = None) -> float:
+        """腿的年龄（秒）"""
+        now = time.monotonic() if now is None else now
+        return now - stamp.received_at + stamp.lag
+    
+    def weight(self, age: float) -> float:
+        """按年龄计算下单规模权重，超过上限为 0"""
+        if age > self.max_age:
+            return 0.0
+        if self.mode != "downweight" or age <= self.max_age / 2:
+            return 1.0
+        return (self.max_age - age) / (self.max_age / 2)
+    
+    def check(self, opportunity: Dict, stamps: List[QuoteStamp], now: float = None) -> bool:
+        """
+        检查机会使用的各条腿是否过期
+        
+        通过时在机会中写入 quote_age_ms / quote_received_at / stale_weight，
+        供执行前再次检查和调整下单规模
+        
+        Args:
+            opportunity: 套利机会
+            stamps: 机会使用的各条腿的时间戳
+            now: 当前 time.monotonic()
+        
+        Returns:
+            是否可以继续执行
+        """
+        if not stamps:
+            return True
+        now = time.monotonic() if now is None else now
+        self.stats["checked"] += 1
+        ages = [(self.age(stamp, now), stamp) for stamp in stamps]
+        oldest, oldest_stamp = max(ages, key=lambda item: item[0])
+        
+        weight = self.weight(oldest)
+        if weight <= 0:
+            self._reject(oldest_stamp.venue, oldest, opportunity)
+            return False
+        if weight < 1.0:
+            self.stats["downweighted"] += 1
+        
+        opportunity["quote_age_ms"] = oldest * 1000
+        # 等效的最早收到时间（已扣除到达前的额外延迟），执行前用单调时钟再次检查
+        opportunity["quote_received_at"] = now - oldest
+        opportunity["stale_weight"] = weight
+        return True
+    
+    def check_execution(self, opportunity: Dict, now: float = None) -> bool:
+        """
+        执行前再次检查报价年龄（检测到执行之间可能经过了队列等待）
+        
+        Returns:
+            是否可以继续执行
+        """
+        received_at = opportunity.get("quote_received_at")
+        if received_at is None:
+            return True
+        now = time.monotonic() if now is None else now
+        age = now - received_at
+        if age > self.max_age:
+            self._reject("execute", age, opportunity)
+            return False
+        return True
+    
+    def _reject(self, venue: str, age: float, opportunity: Dict):
+        self.stats["rejected"] += 1
+        self.rejected_by_venue[venue] = self.rejected_by_venue.get(venue, 0) + 1
+        logger.warning(f"报价已过期，放弃机会: {opportunity.get('strategy')} "
+                       f"({venue} 年龄 {age * 1000:.0f} ms > {self.max_age * 1000:.0f} ms)")
+    
+    def get_stats(self) -> Dict:
+        """
+        过期检查统计
+        
+        Returns:
+            checked / rejected / downweighted / rejected_by_venue，
+            clocks 为各平台的时钟偏差估计 offset_ms 和平均额外延迟 lag_ms
+        """
+        stats = dict(self.stats)
+        stats["rejected_by_venue"] = dict(self.rejected_by_venue)
+        stats["clocks"] = {
+            venue: {"offset_ms": clock.offset * 1000, "lag_ms": clock.lag_ewma * 1000, "samples": clock.observed}
+            for venue, clock in self.clocks.items()
+        }
+        return stats
+
+
+def opportunity_legs(opportunity: Dict) -> List[str]:
+    """机会使用的报价（quote_times 中的键）"""
+    if opportunity.get("type") == "complete_set":
+        return ["polymarket_up", "polymarket_down"]
+    if opportunity.get("type") == "cross_venue":
+        return ["polymarket_up" if opportunity["poly_side"] == "UP" else "polymarket_down", "opinion_trade"]
+    return []
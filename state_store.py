@@ -0,0 +1,181 @@
+"""
+状态快照与追加日志（快速重启）
+
+重启后需要恢复的状态: 统计、交易记录、未完结订单、持仓账本、风控占用和市场映射。
+StateStore 在目录下维护两个文件:
+- snapshot.json: 定期写入的紧凑快照（先写临时文件再 os.replace，崩溃时旧快照仍然完整）
+- journal.jsonl: 两次快照之间的状态变化，每行一个事件 {"seq", "type", "data"}，写入后立即 flush
+
+事件类型:
+- order: 新跟踪的订单（OrderTracker.track）
+- order_update: 订单状态 / 累计成交变化（OrderTracker.apply_update），重放时重新驱动成交回调
+- trade: 交易记录（ArbitrageExecutor._record）
+- stats: 机器人统计
+
+启动时读取最新快照，再按序号重放日志中更新的事件，不访问任何平台；
+进程崩溃时最后一行可能只写了一半，读取时丢弃。写入快照后日志清空，
+快照记录了已包含的最后一个序号，清空前崩溃时重放会跳过已在快照中的事件。
+快照状态在持有日志锁时采集，采集之后的变化一定以更大的序号写入日志；
+订单跟踪器在同一个锁（可重入）内完成订单变化、写日志和成交 / 完结回调（更新账本和风控），
+快照不会落在订单已变化、账本和风控还没更新之间。其他变化先于采集、日志晚于采集的事件
+会在快照之上再重放一次，order / trade 事件重放时按编号去重。
+"""
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Optional, Dict, List, Tuple, Union, Callable
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.jsonl"
+SNAPSHOT_VERSION = 1
+
+
+class StateStore:
+    """快照 + 追加日志"""
+    
+    def __init__(self, directory: str = None, snapshot_interval: float = None,
+                 fsync: bool = None, clock=time.monotonic):
+        """
+        Args:
+            directory: 状态目录，默认使用配置 STATE_DIR
+            snapshot_interval: 快照间隔（秒）
+            fsync: 每条日志是否 fsync
+            clock: 单调时钟（测试可替换）
+        """
+        self.directory = directory or Config.STATE_DIR
+        self.snapshot_interval = Config.STATE_SNAPSHOT_INTERVAL if snapshot_interval is None else snapshot_interval
+        self.fsync = Config.STATE_FSYNC if fsync is None else fsync
+        self.clock = clock
+        self.snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(self.directory, JOURNAL_FILE)
+        self.seq = 0
+        self.stats = {"appended": 0, "snapshots": 0, "replayed": 0, "discarded": 0}
+        self._journal = None
+        self._snapshot_at = clock()
+        # 可重入: 订单跟踪器持有该锁时回调中还会写日志
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def load(self) -> Tuple[Optional[Dict], List[Tuple[str, Dict]]]:
+        """
+        读取最新快照和之后的日志事件
+        
+        Returns:
+            (快照或 None, [(事件类型, 数据), ...])
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                logger.warning(f"状态快照版本 {snapshot.get('version')} 不兼容，忽略")
+                snapshot = None
+        base_seq = snapshot["seq"] if snapshot else 0
+        
+        events = []
+        last_seq = base_seq
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 只有最后一行可能不完整（写入中崩溃），之后不会再有有效事件
+                        self.stats["discarded"] += 1
+                        logger.warning(f"状态日志末尾不完整，丢弃: {line[:80]!r}")
+                        break
+                    if entry["seq"] <= base_seq:
+                        continue
+                    events.append((entry["type"], entry["data"]))
+                    last_seq = entry["seq"]
+        self.seq = last_seq
+        self.stats["replayed"] = len(events)
+        return snapshot, events
+    
+    def append(self, event_type: str, data: Dict):
+        """追加一个事件（写入后 flush，可选 fsync）"""
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self.seq += 1
+            self._journal.write(json.dumps({"seq": self.seq, "type": event_type, "data": data},
+                                           ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self.stats["appended"] += 1
+    
+    def snapshot_due(self) -> bool:
+        """距离上次快照是否已超过快照间隔"""
+        return self.clock() - self._snapshot_at >= self.snapshot_interval
+    
+    def write_snapshot(self, state: Union[Dict, Callable[[], Dict]]):
+        """
+        原子写入快照并清空日志
+        
+        Args:
+            state: 可 JSON 序列化的完整状态，或返回它的无参调用；有其他线程并发写入日志时必须传调用，
+                   在持有日志锁时采集，与快照序号一致
+        """
+        with self._lock:
+            if callable(state):
+                state = state()
+            snapshot = dict(state, version=SNAPSHOT_VERSION, seq=self.seq)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"), default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # 快照已落盘，之前的日志不再需要
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_path, "w", encoding="utf-8")
+            self._snapshot_at = self.clock()
+            self.stats["snapshots"] += 1
+    
+    def attach(self, executor):
+        """把执行器和订单跟踪器的状态变化写入日志，订单更新与快照采集互斥"""
+        executor.journal = self.append
+        executor.order_tracker.journal = self.append
+        executor.order_tracker.state_lock = self._lock
+    
+    def detach(self, executor):
+        executor.journal = None
+        executor.order_tracker.journal = None
+        executor.order_tracker.state_lock = nullcontext()
+    
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+    
+    def get_stats(self) -> Dict:
+        return dict(self.stats, seq=self.seq)
+
+
+def restore_executor(store: StateStore, executor) -> Tuple[Optional[Dict], List[Tuple[str, Dict]]]:
+    """
+    从快照 + 日志恢复执行器，并开始记录之后的状态变化
+    
+    Returns:
+        (快照, 日志事件)，调用方据此恢复执行器之外的状态（统计、市场映射）
+    """
+    started = time.perf_counter()
+    snapshot, events = store.load()
+    if snapshot is not None:
+        executor.restore_state(snapshot["executor"])
+    executor.replay(events)
+    store.attach(executor)
+    if snapshot is not None or events:
+        logger.info(f"已从 {store.directory} 恢复状态: {len(executor.executed_trades)} 笔交易, "
+                    f"{len(executor.order_tracker.open_order_ids())} 个未完结订单, "
+                    f"重放 {len(events)} 个事件, 耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+    return snapshot, events
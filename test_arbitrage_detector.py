@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+套利检测测试
+使用固定价格验证检测逻辑，不访问真实 API
+"""
+import sys
+from arbitrage_detector import (
+    ArbitrageDetector, detect_arbitrage, detect_arbitrage_ticks, detect_complete_set, detect_opportunities
+)
+from multi_outcome import detect_multi_outcome, MultiOutcomeBook
+import random
+from replay import replay
+from stale_guard import StaleGuard, QuoteStamp
+from trigger_index import TriggerIndex, STRATEGY_LEGS
+from ticks import price_to_ticks, parse_levels, quote_from_book, parse_book, ONE, Quote
+from loadgen import LoadGenerator
+from sizing import size_matched, size_matched_batch, size_opportunity, leg_rules, LegRules
+from allocator import CapitalAllocator, score
+from opportunity_tracker import OpportunityTracker, FILLED
+import benchmarks
+import time
+
+
+def test_parse_prices_from_bytes():
+    """测试价格字符串 / bytes 直接解析为整数"""
+    assert price_to_ticks(b"0.485") == 4850
+    assert price_to_ticks("0.4855") == 4855
+    assert price_to_ticks("1") == 10000
+    assert price_to_ticks(0.1 + 0.2) == 3000
+    assert parse_levels([["0.48", "120.5"], {"price": "0.47", "size": "10"}], depth=1) == [(4800, 120500000)]
+
+
+def test_threshold_is_exact():
+    """测试总成本恰好在阈值边界时判断精确"""
+    # 浮点下 1.0 - (0.4 + (1.0 - 0.41)) < 0.01，整数价格单位下利润恰好为 1%
+    assert 1.0 - (0.4 + (1.0 - 0.41)) < 0.01
+    opportunity = detect_arbitrage({"polymarket_up": 0.4, "polymarket_down": 0.7, "opinion_trade": 0.41})
+    assert opportunity is not None
+    assert opportunity["total_cost_ticks"] == 9900
+    assert opportunity["strategy"] == "Poly_UP + Opinion_DOWN"
+    
+    # 总成本 1.0 不是套利
+    assert detect_arbitrage_ticks(9000, 3000, 7000) is None
+
+
+def test_best_strategy_selected():
+    """测试选择成本更低的策略"""
+    opportunity = detect_arbitrage({
+        "polymarket_up_ticks": 4000,
+        "polymarket_down_ticks": 5800,
+        "opinion_trade_ticks": 4500,
+        "market_id": "m1",
+    })
+    assert opportunity["strategy"] == "Poly_UP + Opinion_DOWN"
+    assert opportunity["total_cost_ticks"] == 9500
+    assert opportunity["market_id"] == "m1"
+    assert abs(opportunity["profit"] - 0.05) < 1e-12
+
+
+def _book(bids, asks):
+    """构造整数价格订单簿: [(价格, 数量), ...]"""
+    return {
+        "bids": [(price_to_ticks(p), size * 1_000_000) for p, size in bids],
+        "asks": [(price_to_ticks(p), size * 1_000_000) for p, size in asks],
+    }
+
+
+def test_complete_set_buy_with_depth():
+    """测试 UP ask + DOWN ask < 1 时买入完整组合，数量按可成交深度计算"""
+    prices = {
+        "polymarket_up_book": _book([("0.44", 100)], [("0.45", 30), ("0.46", 50), ("0.50", 100)]),
+        "polymarket_down_book": _book([("0.50", 100)], [("0.52", 60), ("0.53", 100)]),
+        "poly_up_token_id": "up",
+        "poly_down_token_id": "down",
+    }
+    opportunity = detect_complete_set(prices)
+    assert opportunity["side"] == "BUY"
+    assert opportunity["total_cost"] == 0.97
+    # 0.45+0.52 x30, 0.46+0.52 x30, 0.46+0.53 x20（0.99 仍满足 1% 利润），0.50+0.53 不满足
+    assert opportunity["size"] == 80
+    assert abs(opportunity["expected_profit"] - (30 * 0.03 + 30 * 0.02 + 20 * 0.01)) < 1e-9
+
+
+def test_complete_set_sell():
+    """测试 UP bid + DOWN bid > 1 时卖出完整组合"""
+    prices = {
+        "polymarket_up_book": _book([("0.55", 10), ("0.54", 10)], [("0.60", 10)]),
+        "polymarket_down_book": _book([("0.48", 15)], [("0.50", 10)]),
+    }
+    opportunity = detect_complete_set(prices)
+    assert opportunity["side"] == "SELL"
+    assert opportunity["size"] == 15
+    assert opportunity["strategy"] == "Sell Poly_UP + Poly_DOWN"
+
+
+def test_opportunities_share_books():
+    """测试同一批订单簿同时产生跨平台和完整组合机会"""
+    prices = {
+        "polymarket_up_ticks": 4400,
+        "polymarket_down_ticks": 5000,
+        "opinion_trade_ticks": 4700,
+        "polymarket_up_book": _book([("0.44", 100)], [("0.45", 30)]),
+        "polymarket_down_book": _book([("0.50", 100)], [("0.52", 60)]),
+    }
+    types = [opportunity["type"] for opportunity in detect_opportunities(prices)]
+    assert types == ["cross_venue", "complete_set"]
+    
+    del prices["opinion_trade_ticks"]
+    assert [o["type"] for o in detect_opportunities(prices)] == ["complete_set"]
+
+
+def test_buy_legs_use_asks():
+    """测试买入腿按 ask 计价，Opinion.trade DOWN 按 1 - UP bid 计价"""
+    up = quote_from_book(_book([("0.40", 10)], [("0.46", 10)]))
+    down = quote_from_book(_book([("0.50", 10)], [("0.55", 10)]))
+    assert (up.bid, up.ask, up.ask_size) == (4000, 4600, 10_000_000)
+    
+    # 按 bid 计价时 0.40 + (1 - 0.47) = 0.93，按 ask 计价 0.46 + (1 - 0.45) = 1.01
+    prices = {"polymarket_up_ticks": up.ask, "polymarket_down_ticks": down.ask,
+              "opinion_trade_ticks": 4700, "opinion_trade_bid_ticks": 4500}
+    assert detect_arbitrage(prices) is None
+    assert detect_arbitrage_ticks(up.bid, down.bid, 4700) is not None
+    
+    prices["opinion_trade_bid_ticks"] = 5500
+    opportunity = detect_arbitrage(prices)
+    assert opportunity["strategy"] == "Poly_UP + Opinion_DOWN"
+    assert opportunity["total_cost_ticks"] == 4600 + 4500
+
+
+def test_replay_counts_phantoms():
+    """测试回放统计旧模型（按 bid 买入）中的幻影信号"""
+    records = [
+        # 只有按 bid 计价才有机会
+        {"up": [4000, 1, 4600, 1], "down": [5000, 1, 5500, 1], "opinion": [4500, None, 4700, None]},
+        # 按 ask 计价仍有机会
+        {"up": [4000, 1, 4100, 1], "down": [5000, 1, 5500, 1], "opinion": [4500, None, 4700, None]},
+        # 两种模型都没有机会
+        {"up": [5000, 1, 5100, 1], "down": [5000, 1, 5100, 1], "opinion": [5000, None, 5000, None]},
+    ]
+    stats = replay(records)
+    assert stats["snapshots"] == 3
+    assert stats["signals"] == 2
+    assert stats["phantoms"] == 1 and stats["confirmed"] == 1
+    assert stats["phantom_rate"] == 0.5
+
+
+def test_trigger_index_matches_full_scan():
+    """测试触发价索引与逐个市场全量检测的结果一致"""
+    rng = random.Random(7)
+    index = TriggerIndex()
+    prices = {}
+    for market in range(200):
+        prices[market] = {leg: rng.randint(4000, 6000) for legs in STRATEGY_LEGS for leg in legs}
+        for leg, price in prices[market].items():
+            index.update(market, leg, price)
+    
+    def full_scan(strategy):
+        poly_leg, opinion_leg = STRATEGY_LEGS[strategy]
+        return sorted(market for market, legs in prices.items() if legs[poly_leg] + legs[opinion_leg] <= 9900)
+    
+    for _ in range(2000):
+        market, leg = rng.randrange(200), rng.choice(["polymarket_up", "polymarket_down", "opinion_up", "opinion_down"])
+        prices[market][leg] = rng.randint(4000, 6000)
+        crossed = index.update(market, leg, prices[market][leg])
+        for strategy in crossed:
+            assert market in index.triggered(strategy)
+    
+    for strategy in range(2):
+        assert sorted(index.triggered(strategy)) == full_scan(strategy)
+        nearest = index.nearest(strategy, 5)
+        assert [margin for margin, _ in nearest] == sorted(
+            (9900 - legs[STRATEGY_LEGS[strategy][0]] - legs[STRATEGY_LEGS[strategy][1]] for legs in prices.values()),
+            reverse=True)[:5]
+    for market, legs in prices.items():
+        found = detect_arbitrage_ticks(legs["polymarket_up"], legs["polymarket_down"],
+                                       legs["opinion_up"], 10000 - legs["opinion_down"])
+        assert (found is not None) == bool(index.armed(market))
+    
+    # 触发价 = 阈值 - 另一条腿价格
+    index.update(0, "opinion_down", 5000)
+    assert index.trigger_price(0, "polymarket_up") == 4900
+    index.update(0, "polymarket_up", 4901)
+    assert 0 not in index.triggered(0)
+    assert index.update(0, "polymarket_up", 4900) == [0]
+    assert index.armed(0)[0] == 0
+    
+    index.remove(0)
+    assert 0 not in index.triggered(0) and 0 not in index.triggered(1)
+
+
+def test_stale_quote_guard():
+    """测试按单调时钟和平台时间戳判断报价年龄，过期的腿被拒绝并计数"""
+    guard = StaleGuard(max_age=1.0, mode="reject")
+    # 平台时钟快 5 秒，正常延迟 50 ms，其中一条报价到达前延迟了 300 ms
+    for i in range(5):
+        guard.stamp("polymarket", received_at=100.0 + i, received_wall=1000.0 + i, venue_ts=1005.0 + i - 0.05)
+    late = guard.stamp("polymarket", received_at=106.0, received_wall=1006.0, venue_ts=1011.0 - 0.3)
+    assert abs(late.lag - 0.25) < 1e-9
+    clock = guard.get_stats()["clocks"]["polymarket"]
+    assert abs(clock["offset_ms"] + 4950) < 1e-6
+    
+    opinion = guard.stamp("opinion", received_at=106.5)
+    opportunity = {"strategy": "Poly_UP + Opinion_DOWN"}
+    assert guard.check(opportunity, [late, opinion], now=106.7)
+    assert abs(opportunity["quote_age_ms"] - 950) < 1e-6
+    assert opportunity["stale_weight"] == 1.0
+    
+    # 0.8 秒后 Polymarket 腿（含到达前延迟）超过 1 秒
+    assert not guard.check({"strategy": "x"}, [late, opinion], now=106.8)
+    assert guard.get_stats()["rejected_by_venue"] == {"polymarket": 1}
+    
+    # downweight: 超过一半年龄后按比例缩小
+    guard = StaleGuard(max_age=1.0, mode="downweight")
+    opportunity = {"strategy": "x"}
+    assert guard.check(opportunity, [QuoteStamp("opinion", 10.0, None, 0.0)], now=10.75)
+    assert abs(opportunity["stale_weight"] - 0.5) < 1e-9
+    assert guard.get_stats()["downweighted"] == 1
+    assert not guard.check_execution(opportunity, now=11.5)
+
+
+def test_multi_outcome_basket():
+    """测试 N 选 1 市场每个结果取最便宜平台组成组合"""
+    outcomes = ["A", "B", "C", "D"]
+    asks = {
+        "polymarket": [(2500, 40_000_000), (3000, 10_000_000), None, (1500, 25_000_000)],
+        "opinion": [(2400, None), (3100, None), (2700, None), None],
+    }
+    opportunity = detect_multi_outcome(asks, outcomes, "m1")
+    assert opportunity["type"] == "multi_outcome"
+    assert [(leg["outcome"], leg["venue"]) for leg in opportunity["legs"]] == [
+        ("A", "opinion"), ("B", "polymarket"), ("C", "opinion"), ("D", "polymarket")]
+    assert opportunity["total_cost_ticks"] == 9600
+    assert opportunity["size"] == 10.0
+    assert abs(opportunity["expected_profit"] - 0.4) < 1e-9
+    
+    # 任一结果在所有平台都没有卖单时无法组成组合
+    asks["opinion"][2] = None
+    assert detect_multi_outcome(asks, outcomes) is None
+    
+    # prices 中带 outcome_asks 时只做组合检测，并补充每条腿的 token_id
+    tokens = [{"poly_token_id": f"p{n}", "opinion_token_id": f"o{n}"} for n in outcomes]
+    asks["opinion"][2] = (2700, None)
+    prices = {"outcome_asks": asks, "outcome_names": outcomes, "outcome_tokens": tokens}
+    legs = detect_opportunities(prices)[0]["legs"]
+    assert [leg["token_id"] for leg in legs] == ["oA", "pB", "oC", "pD"]
+
+
+def test_multi_outcome_incremental_book():
+    """测试增量更新的组合成本与全量计算一致"""
+    outcomes = ["A", "B", "C"]
+    book = MultiOutcomeBook(outcomes, ["polymarket", "opinion"])
+    book.update("polymarket", 0, 3500, 5_000_000)
+    book.update("polymarket", 1, 3500, 5_000_000)
+    assert book.detect() is None
+    
+    book.update("opinion", 2, 2900)
+    assert book.total == 9900
+    assert book.detect()["total_cost_ticks"] == 9900
+    
+    book.update("opinion", 0, 3000)
+    book.update("polymarket", 0, None)
+    assert book.best[0][:2] == (3000, 1)
+    assert book.total == 9400
+    
+    book.update("opinion", 2, None)
+    assert book.missing == 1 and book.detect() is None
+    
+    asks = {"polymarket": [None, (3500, 5_000_000), None], "opinion": [(3000, None), None, None]}
+    book.update("polymarket", 2, 3000, 1_000_000)
+    asks["polymarket"][2] = (3000, 1_000_000)
+    assert book.detect() == detect_multi_outcome(asks, outcomes)
+    
+    # 检测器为每个多结果市场保留组合簿，每个周期只把取到的报价增量写入
+    books = {"p0": [(3500, 5_000_000)], "p1": [(3500, 5_000_000)], "p2": []}
+    quotes = {"o0": Quote(None, 0, 3000, None), "o2": Quote(None, 0, 2900, None)}
+    detector = ArbitrageDetector()
+    detector.polymarket.get_book_ticks = lambda token_id, depth=1: {"asks": books[token_id], "bids": []}
+    detector.opinion_trade.get_quote = lambda token_id: quotes.get(token_id)
+    market = {"market_id": "m1", "outcomes": [
+        {"name": name, "poly_token_id": f"p{i}", "opinion_token_id": f"o{i}"} for i, name in enumerate(outcomes)
+    ]}
+    prices = detector.get_books(market)
+    assert prices["outcome_book"] is detector.outcome_books["m1"]
+    opportunity = detector.detect_opportunities(prices)[0]
+    assert opportunity["total_cost_ticks"] == 9400
+    assert [leg["token_id"] for leg in opportunity["legs"]] == ["o0", "p1", "o2"]
+    
+    quotes["o2"] = Quote(None, 0, 3600, None)
+    prices = detector.get_books(market)
+    assert prices["outcome_book"] is detector.outcome_books["m1"]
+    assert detector.outcome_books["m1"].total == 10100
+    assert detector.detect_opportunities(prices) == []
+
+
+def test_load_generator_drives_detector():
+    """测试合成负载驱动检测器: UP / DOWN 联动，偏离产生机会，统计完整"""
+    generator = LoadGenerator(num_markets=20, seed=7, dislocation_rate=0.2, stream_size=500)
+    for _, up, down, _ in generator.stream[:50]:
+        up_ask, down_ask = parse_book(up)["asks"][0][0], parse_book(down)["asks"][0][0]
+        assert ONE <= up_ask + down_ask <= ONE + 300
+    
+    detector = generator.attach(ArbitrageDetector())
+    stats = generator.run(detector, rate=None, duration=30.0, max_updates=500)
+    assert stats["updates"] == 500
+    assert stats["opportunities"] > 0
+    latency = stats["latency_ms"]
+    assert 0 < latency["p50"] <= latency["p90"] <= latency["p99"] <= latency["max"]
+    # 回放时重写平台时间戳，合成报价不会被当成过期
+    assert detector.stale_guard.get_stats()["rejected"] == 0
+    
+    assert LoadGenerator.sustained(dict(stats, target_rate=stats["achieved_rate"]), latency["p99"])
+    assert not LoadGenerator.sustained(dict(stats, target_rate=stats["achieved_rate"] * 2), latency["p99"])
+
+
+def test_share_matched_sizing():
+    """测试两边份数相同，按 tick / 最小下单量 / 深度取整，取整后利润不足时不下单"""
+    poly, opinion = leg_rules("polymarket", "0.01"), leg_rules("opinion")
+    
+    # 0.455 按 0.01 tick 向上取整为 0.46，每份成本 0.96
+    sized = size_matched(10_000_000, (4550, 5000), rules=(poly, opinion))
+    assert sized.prices == (4600, 5000) and sized.cost == 9600
+    assert sized.shares == 10_410_000  # 10 / 0.96 = 10.4166... 向下取整到 0.01 份
+    assert sized.notional <= 10_000_000 and sized.expected_profit == 416_400
+    
+    # 取整前利润 1.4%，取整后只剩 0.5%
+    sized = size_matched(10_000_000, (4910, 4950), rules=(poly, opinion))
+    assert sized.shares == 0 and sized.reason == "edge"
+    
+    assert size_matched(10_000_000, (4600, 5000), (None, 6_000_000), (poly, opinion)).shares == 6_000_000
+    assert size_matched(3_000_000, (4600, 5000), rules=(poly, opinion)).reason == "min_size"
+    assert size_matched(100_000_000, (4600, 5000), (4_000_000, None), (poly, opinion)).reason == "min_size"
+    
+    # 数量步长取各腿的公倍数
+    coarse = LegRules(100, 0, 250_000)
+    assert size_matched(10_000_000, (4600, 5000), rules=(poly, coarse)).shares == 10_250_000
+    
+    opportunity = detect_arbitrage({"polymarket_up": 0.46, "polymarket_down": 0.6, "opinion_trade": 0.5,
+                                    "polymarket_up_quote": Quote(4500, 0, 4600, 7_000_000)})
+    opportunity_sized = size_opportunity(opportunity, 10.0)
+    assert opportunity["poly_size"] == 7.0 and opportunity_sized.shares == 7_000_000
+
+
+def test_sizing_batch_matches_scalar():
+    """测试批量规模计算与逐个计算一致"""
+    rng = random.Random(5)
+    poly, opinion = leg_rules("polymarket", "0.01"), leg_rules("opinion")
+    candidates = [
+        (rng.randint(1, 200) * 1_000_000, (rng.randint(3000, 5500), rng.randint(3000, 5500)),
+         (rng.choice([None, rng.randint(1, 50) * 1_000_000]), rng.choice([None, rng.randint(1, 50) * 1_000_000])))
+        for _ in range(500)
+    ]
+    batch = size_matched_batch(
+        [budget for budget, _, _ in candidates],
+        [[prices[k] for _, prices, _ in candidates] for k in range(2)],
+        [[depths[k] for _, _, depths in candidates] for k in range(2)],
+        (poly, opinion),
+    )
+    assert batch == [size_matched(budget, prices, depths, (poly, opinion)) for budget, prices, depths in candidates]
+    assert any(sized.shares for sized in batch) and any(sized.reason == "edge" for sized in batch)
+
+
+def test_allocator_ranks_and_respects_balances():
+    """测试资金按每美元每秒利润优先分配，余额不足时低优先级机会不执行，失败后归还资金"""
+    now = 1_700_000_000
+    # 利润 4%，30 天后结算
+    slow = detect_arbitrage({"polymarket_up": 0.46, "polymarket_down": 0.6, "opinion_trade": 0.5,
+                             "market_id": "slow", "end_time": now + 30 * 86400})
+    # 利润 2%，1 小时后结算
+    fast = detect_arbitrage({"polymarket_up": 0.48, "polymarket_down": 0.6, "opinion_trade": 0.5,
+                             "market_id": "fast", "end_time": now + 3600})
+    assert slow["profit"] > fast["profit"] and score(fast, now) > score(slow, now)
+    
+    allocations = CapitalAllocator({"polymarket": None, "opinion": None}, 10.0).allocate([slow, fast], now)
+    assert [allocation.opportunity["market_id"] for allocation in allocations] == ["fast", "slow"]
+    # 分配的预算交给执行器后得到相同的份数
+    assert all(size_opportunity(allocation.opportunity, allocation.position_size).shares == allocation.shares
+               for allocation in allocations)
+    
+    # Opinion 只有 5 USD: 高优先级机会按余额缩小到 10 份，剩下的不够最小下单量
+    allocator = CapitalAllocator({"polymarket": 5.0, "opinion": 5.0}, 10.0)
+    allocations = allocator.allocate([slow, fast], now)
+    assert len(allocations) == 1 and allocations[0].opportunity is fast
+    assert allocations[0].shares == 10_000_000 and allocations[0].reserved == {"polymarket": 4_800_000, "opinion": 5_000_000}
+    assert allocator.get_stats()["available"] == {"polymarket": 0.2, "opinion": 0.0}
+    assert allocator.get_stats()["unfunded"] == 1
+    
+    allocator.release(allocations[0])
+    assert [allocation.opportunity for allocation in allocator.allocate([slow], now)] == [slow]
+
+
+def test_allocator_scales_to_many_candidates():
+    """测试数千个候选机会的分配顺序与按得分排序一致"""
+    rng = random.Random(9)
+    now = 1_700_000_000
+    candidates = []
+    for i in range(5000):
+        poly, opinion = rng.randint(40, 47) / 100, rng.randint(400, 500) / 1000
+        opportunity = detect_arbitrage({"polymarket_up": poly, "polymarket_down": 0.9, "opinion_trade": opinion,
+                                        "market_id": f"m{i}", "end_time": now + rng.randint(600, 90 * 86400)})
+        if opportunity:
+            candidates.append(opportunity)
+    
+    started = time.perf_counter()
+    allocations = CapitalAllocator({"polymarket": None, "opinion": None}, 10.0).allocate(candidates, now)
+    elapsed = time.perf_counter() - started
+    scores = [allocation.score for allocation in allocations]
+    assert len(allocations) == len(candidates) and scores == sorted(scores, reverse=True)
+    
+    # 余额有限时只分配得分最高的一部分
+    allocator = CapitalAllocator({"polymarket": 100.0, "opinion": 100.0}, 10.0)
+    funded = allocator.allocate(candidates, now)
+    assert 0 < len(funded) < 30
+    assert [allocation.score for allocation in funded] == scores[:len(funded)]
+    assert elapsed < 5.0
+
+
+def test_benchmark_suite_flags_regressions():
+    """测试微基准全部可运行，按参考负载换算后变慢超过阈值的基准被标记为回归"""
+    results = benchmarks.run(min_time=0.005, repeats=1)
+    assert set(results) == set(benchmarks.BENCHMARKS)
+    assert all(ns > 0 for ns in results.values())
+    
+    # 机器整体慢一倍（参考负载也慢一倍）时不算回归；单个函数额外变慢 50% 时算回归
+    baseline = {"results": {"reference": 1000.0, "parse_book.full": 10_000.0, "detect_arbitrage.hit": 2000.0}}
+    current = {"reference": 2000.0, "parse_book.full": 30_000.0, "detect_arbitrage.hit": 4100.0, "plan_arbitrage": 5.0}
+    rows = {row["name"]: row for row in benchmarks.compare(current, baseline, threshold=25)}
+    assert rows["parse_book.full"]["regressed"] and abs(rows["parse_book.full"]["change"] - 50) < 1e-9
+    assert not rows["detect_arbitrage.hit"]["regressed"]
+    assert rows["plan_arbitrage"]["change"] is None and not rows["plan_arbitrage"]["regressed"]
+    assert benchmarks.compare(current, baseline, threshold=25, normalize=False)[1]["regressed"]
+
+
+def test_tracker_cooldown_survives_gaps():
+    """测试机会短暂消失或订单簿获取失败后重新出现时仍受冷却约束，长时间未观测的机会被清理"""
+    tracker = OpportunityTracker(cooldown=30, edge_change=0.005)
+    opportunity = {"market_id": "m1", "strategy": "Poly_UP + Opinion_DOWN", "profit": 0.02}
+    other = {"market_id": "m2", "strategy": "Poly_UP + Opinion_DOWN", "profit": 0.02}
+    for item in (opportunity, other):
+        assert tracker.should_fire(item, now=0)
+        tracker.mark_executing(item, now=0)
+        tracker.mark_result(item, True)
+    
+    # m2 的订单簿没有取到: 只结束 m1 的机会
+    tracker.close_missing([], now=1, fetched={"m1"})
+    assert tracker.get(opportunity) is None and tracker.get(other).state == FILLED
+    
+    # 冷却期内重新出现，利润未变化或下降时不再下单；利润显著提高时再次下单
+    assert not tracker.should_fire(opportunity, now=2)
+    assert tracker.get(opportunity).state == FILLED
+    assert not tracker.should_fire(dict(opportunity, profit=0.01), now=2)
+    assert tracker.should_fire(dict(opportunity, profit=0.03), now=3)
+    
+    # 冷却期结束后重新出现的机会立即下单，过期的下单记录被丢弃
+    tracker.close_missing([], now=4, fetched={"m1"})
+    assert tracker.get_stats()["cooling"] == 1
+    tracker.close_missing([], now=31)
+    assert tracker.get_stats()["cooling"] == 0
+    assert tracker.should_fire(opportunity, now=32)
+    
+    # 只收到机会的运行时: 超过 max_age 未观测的机会被结束，active 不会无限增长
+    for i in range(100):
+        tracker.should_fire({"market_id": f"s{i}", "strategy": "complete_set", "profit": 0.01}, now=40)
+    tracker.close_stale(max_age=10, now=45)
+    assert len(tracker.active) == 100
+    tracker.close_stale(max_age=10, now=51)
+    assert len(tracker.active) == 0
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        test_parse_prices_from_bytes,
+        test_threshold_is_exact,
+        test_best_strategy_selected,
+        test_complete_set_buy_with_depth,
+        test_complete_set_sell,
+        test_opportunities_share_books,
+        test_buy_legs_use_asks,
+        test_replay_counts_phantoms,
+        test_trigger_index_matches_full_scan,
+        test_stale_quote_guard,
+        test_multi_outcome_basket,
+        test_multi_outcome_incremental_book,
+        test_load_generator_drives_detector,
+        test_share_matched_sizing,
+        test_sizing_batch_matches_scalar,
+        test_allocator_ranks_and_respects_balances,
+        test_allocator_scales_to_many_candidates,
+        test_benchmark_suite_flags_regressions,
+        test_tracker_cooldown_survives_gaps,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
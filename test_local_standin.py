@@ -0,0 +1,1345 @@
+#!/usr/bin/env python3
+"""
+本地替身测试
+使用 local_standin 中的替身平台验证执行和订单跟踪逻辑，不访问真实 API
+"""
+import sys
+import time
+from local_standin import StandInVenue, StandInBookServer
+from polymarket_client import PolymarketClient
+from arbitrage_executor import ArbitrageExecutor
+from order_tracker import OrderTracker, PolymarketUserChannel
+from opinion_trade_client import OpinionTradeClient
+from unwind_engine import UnwindEngine
+from paper_trading import PaperExchange, PaperPolymarketClient, PaperOpinionClient
+from ticks import Quote, size_to_units
+from loadgen import LoadGenerator
+from arbitrage_detector import ArbitrageDetector
+from profiler import SamplingProfiler, ProfilerAdminServer
+from positions import PositionLedger
+from risk_gate import RiskGate, benchmark as risk_gate_benchmark
+from state_store import StateStore, restore_executor
+from flight_recorder import FlightRecorder
+from preflight import run_parallel, warm_up, breakdown
+from endpoints import EndpointPool
+from sharded_runtime import (SharedBookStore, _detector_process, _executor_process,
+                             SEQ, POLY_UP, POLY_DOWN, OPINION, OPINION_BID)
+from async_runtime import AsyncArbitrageBot
+import os
+import asyncio
+import json
+import signal
+import tempfile
+import threading
+import urllib.request
+import multiprocessing as mp
+
+OPPORTUNITY = {
+    "strategy": "Poly_UP + Opinion_DOWN",
+    "poly_side": "UP",
+    "opinion_side": "DOWN",
+    "poly_price": 0.45,
+    "opinion_price": 0.50,
+    "total_cost": 0.95,
+    "profit": 0.05,
+    "profit_percent": 5.0,
+    "poly_hedge_token_id": "down-token",
+}
+
+
+def test_order_fills_tied_to_trade_record():
+    """测试成交回写到交易记录"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    
+    assert executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    trade = executor.get_execution_history()[0]
+    
+    poly.fill(trade["poly_order_id"], 2.0)
+    opinion.fill(trade["opinion_order_id"])
+    executor.refresh_orders()
+    
+    trade = executor.trades_by_id[trade["trade_id"]]
+    assert trade["fills"]["poly"] == 2.0
+    assert trade["fills"]["opinion"] == opinion.orders[trade["opinion_order_id"]]["size"]
+    assert executor.order_tracker.orders[trade["poly_order_id"]].status == "partial"
+    assert executor.order_tracker.open_order_ids() == [trade["poly_order_id"]]
+
+
+def test_batched_status_queries():
+    """测试数百个未完结订单只需少量批量查询"""
+    venue = StandInVenue("poly")
+    tracker = OrderTracker(batch_size=100)
+    for i in range(350):
+        order_id = venue.place_order(size=1.0, price=0.5)
+        tracker.track(order_id, "polymarket", f"trade-{i}", "poly", 1.0, 0.5)
+    
+    for order_id in list(venue.orders)[:50]:
+        venue.cancel(order_id)
+    
+    assert tracker.poll({"polymarket": venue}) == 4
+    assert venue.status_requests == 4
+    assert len(tracker.open_order_ids("polymarket")) == 300
+    assert tracker.get_stats() == {"cancelled": 50, "acked": 300}
+
+
+def test_streaming_updates():
+    """测试用户频道式推送更新"""
+    venue = StandInVenue("poly")
+    fills = []
+    tracker = OrderTracker(on_fill=lambda order, delta: fills.append((order.order_id, delta)))
+    venue.subscribe(tracker.apply_updates)
+    
+    order_id = venue.place_order(size=3.0, price=0.4)
+    tracker.track(order_id, "polymarket", "trade-1", "poly", 3.0, 0.4)
+    venue.fill(order_id, 1.0)
+    venue.fill(order_id)
+    
+    assert fills == [(order_id, 1.0), (order_id, 2.0)]
+    assert tracker.orders[order_id].status == "filled"
+    assert not tracker.open_order_ids()
+    assert venue.status_requests == 0
+
+
+def test_refresh_skips_pushed_venues():
+    """测试用户频道只免去 Polymarket 的轮询，没有状态查询接口的客户端不轮询；未实现的下单接口返回失败而不是编造订单ID"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    assert executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    
+    assert executor.refresh_orders(pushed=PolymarketUserChannel.venues) == 1
+    assert poly.status_requests == 0 and opinion.status_requests == 1
+    
+    assert executor.refresh_orders() == 2
+    executor.opinion_trade = OpinionTradeClient()
+    assert executor.refresh_orders() == 1 and executor.refresh_orders() == 1
+    assert executor.order_tracker.unsupported == {"opinion"}
+    assert len(executor.order_tracker.open_order_ids("opinion")) == 1
+    
+    assert PolymarketClient().place_order("c", "UP", 5.0, 0.45, token_id="up") is None
+    assert OpinionTradeClient().place_order("t", "NO", 5.0, 0.5) is None
+
+
+def test_polymarket_order_status_query():
+    """测试 Polymarket 订单状态查询: 分页读取挂单列表，已完结的订单逐个查询最终成交"""
+    server = StandInBookServer(page_size=2).start()
+    try:
+        server.orders = {
+            "o1": {"id": "o1", "status": "LIVE", "original_size": "10", "size_matched": "0"},
+            "o2": {"id": "o2", "status": "LIVE", "original_size": "10", "size_matched": "4"},
+            "other": {"id": "other", "status": "LIVE", "original_size": "10", "size_matched": "0"},
+            "o3": {"id": "o3", "status": "MATCHED", "original_size": "10", "size_matched": "10"},
+            "o4": {"id": "o4", "status": "CANCELED", "original_size": "10", "size_matched": "2"},
+        }
+        client = PolymarketClient()
+        client.base_url = server.url
+        assert client.get_order_statuses(["o1"]) is None and not server.order_requests
+        
+        client.api_key, client.api_passphrase, client.address = "key", "pass", "0xabc"
+        client.api_secret = "c2VjcmV0LWtleS0xMjM0NQ=="
+        tracker = OrderTracker()
+        for order_id in ("o1", "o2", "o3", "o4"):
+            tracker.track(order_id, "polymarket", "trade-1", "poly", 10.0, 0.45)
+        assert tracker.poll({"polymarket": client}) == 1
+        assert server.order_requests == ["/data/orders", "/data/orders", "/data/order/o3", "/data/order/o4"]
+        statuses = {order_id: (order.status, order.filled_size) for order_id, order in tracker.orders.items()}
+        assert statuses == {"o1": ("acked", 0.0), "o2": ("partial", 4.0),
+                            "o3": ("filled", 10.0), "o4": ("cancelled", 2.0)}
+        assert sorted(tracker.open_order_ids()) == ["o1", "o2"]
+    finally:
+        server.close()
+
+
+def test_unwind_retries_failed_leg():
+    """测试 Opinion.trade 失败后以更差价格重试成功"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    opinion.fail_next = 1
+    
+    assert not executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    report = executor.unwind_reports[0]
+    assert report["resolved"] and report["action"] == "retry"
+    assert [step["success"] for step in report["steps"]] == [True]
+    assert abs(report["steps"][0]["price"] - 0.51) < 1e-9
+    assert len(opinion.orders) == 1
+
+
+def test_unwind_hedges_then_flattens():
+    """测试重试失败后在 Polymarket 对冲，对冲失败后平仓"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    opinion.fail_all = True
+    poly.prices["down-token"] = 0.53
+    engine = UnwindEngine(poly, opinion, time_budget=1.0, price_step=0.01, max_attempts=3, max_loss=0.02)
+    
+    report = engine.unwind(OPPORTUNITY, poly_size=5.0, opinion_size=5.0)
+    assert report["action"] == "hedge"
+    assert [step["step"] for step in report["steps"]] == ["retry", "retry", "retry", "hedge"]
+    assert poly.orders[report["order_id"]]["outcome"] == "DOWN"
+    
+    poly.fail_next = 3
+    report = engine.unwind(OPPORTUNITY, poly_size=5.0, opinion_size=5.0)
+    assert report["action"] == "flatten"
+    assert [step["step"] for step in report["steps"]][-4:] == ["hedge", "hedge", "hedge", "flatten"]
+    assert poly.orders[report["order_id"]]["side"] == "SELL"
+
+
+def test_unwind_ladder_on_tick_grid():
+    """测试单腿处理的价格阶梯从提交腿的取整限价出发，每步按平台 tick 取整"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    opinion.fail_all = True
+    poly.fail_next = 1
+    engine = UnwindEngine(poly, opinion, time_budget=1.0, price_step=0.005, max_attempts=2, max_loss=0.05)
+    # 机会价格不在网格上，计划把 Opinion.trade 腿取整到 0.501
+    opportunity = dict(OPPORTUNITY, opinion_price=0.5004, poly_hedge_token_id=None)
+    
+    report = engine.unwind(opportunity, poly_size=5.0, opinion_size=5.0, poly_ticks=4500, opinion_ticks=5010)
+    assert report["action"] == "flatten"
+    # Opinion.trade tick 0.001: 每步 0.005；Polymarket tick 0.01: 每步向上取整为 0.01
+    assert [(step["step"], step["price"]) for step in report["steps"]] == [
+        ("retry", 0.506), ("retry", 0.511), ("flatten", 0.44), ("flatten", 0.43)]
+    
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.unwind_engine = engine
+    assert not executor.execute_arbitrage(dict(OPPORTUNITY, opinion_price=0.5004), position_size=10.0)
+    assert executor.unwind_reports[-1]["steps"][0]["price"] == 0.506
+
+
+def test_unwind_time_budget():
+    """测试超出时间预算后停止处理"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion", latency=0.05)
+    opinion.fail_all = True
+    engine = UnwindEngine(poly, opinion, time_budget=0.08, price_step=0.01, max_attempts=5, max_loss=1.0)
+    
+    report = engine.unwind(OPPORTUNITY, poly_size=5.0, opinion_size=5.0)
+    assert not report["resolved"]
+    assert [step["step"] for step in report["steps"]] == ["retry", "retry"]
+    # 第二次重试只剩约 30 ms 预算，请求在预算用完时超时
+    assert report["steps"][0]["elapsed_ms"] >= 50 and report["steps"][1]["elapsed_ms"] < 50
+    assert report["elapsed_ms"] < 120
+    
+    # 单个请求比整个预算还慢: 下单和对冲价格请求都在预算内超时
+    poly.latency = opinion.latency = 10.0
+    poly.prices["down-token"] = 0.53
+    report = engine.unwind(OPPORTUNITY, poly_size=5.0, opinion_size=5.0)
+    assert not report["resolved"] and [step["step"] for step in report["steps"]] == ["retry"]
+    assert report["elapsed_ms"] < 150
+
+
+def test_complete_set_execution():
+    """测试完整组合在 Polymarket 上同时下两条腿"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    opportunity = {
+        "type": "complete_set", "strategy": "Poly_UP + Poly_DOWN", "side": "BUY",
+        "up_price": 0.45, "down_price": 0.52, "total_cost": 0.97,
+        "profit": 0.03, "profit_percent": 3.0, "size": 5.0,
+    }
+    
+    assert executor.execute(opportunity, position_size=100.0)
+    trade = executor.get_execution_history()[0]
+    assert trade["shares"] == 5.0
+    assert [(o["outcome"], o["side"]) for o in poly.orders.values()] == [("UP", "BUY"), ("DOWN", "BUY")]
+    assert not opinion.orders
+
+
+def test_complete_set_sell_requires_holdings():
+    """测试卖出完整组合按已持有的 UP / DOWN 封顶，没有持仓时不下单；各执行入口都检查报价年龄"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    buy = {
+        "type": "complete_set", "strategy": "Poly_UP + Poly_DOWN", "side": "BUY", "market_id": "cs",
+        "up_price": 0.45, "down_price": 0.52, "total_cost": 0.97, "profit": 0.03, "profit_percent": 3.0, "size": 5.0,
+    }
+    sell = dict(buy, side="SELL", up_price=0.55, down_price=0.50, total_cost=1.05, profit=0.05, size=10.0)
+    
+    assert not executor.execute_complete_set(sell, position_size=100.0)
+    assert not poly.orders
+    
+    assert executor.execute_complete_set(buy, position_size=100.0)
+    for order_id in list(poly.orders):
+        poly.fill(order_id)
+    executor.refresh_orders()
+    assert executor.execute(sell, position_size=100.0)
+    trade = executor.get_execution_history()[-1]
+    assert trade["shares"] == 5.0
+    assert [(o["outcome"], o["side"]) for o in poly.orders.values()][-2:] == [("UP", "SELL"), ("DOWN", "SELL")]
+    # 持仓已被未完结的卖单占用
+    assert not executor.execute_complete_set(sell, position_size=100.0)
+    assert len(poly.orders) == 4
+    
+    stale = dict(OPPORTUNITY, quote_received_at=time.monotonic() - 60)
+    assert not executor.execute_arbitrage(stale, position_size=10.0)
+    assert not executor.execute_complete_set(dict(buy, quote_received_at=stale["quote_received_at"]), 100.0)
+    assert len(poly.orders) == 4 and executor.stale_guard.get_stats()["rejected"] == 2
+
+
+def test_basket_execution():
+    """测试多结果组合每条腿在所选平台下单"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    opportunity = {
+        "type": "multi_outcome", "strategy": "Basket x3", "total_cost": 0.9,
+        "profit": 0.1, "profit_percent": 10.0, "size": 6.0,
+        "legs": [
+            {"outcome": "A", "venue": "polymarket", "price": 0.3},
+            {"outcome": "B", "venue": "opinion", "price": 0.3, "token_id": "oB"},
+            {"outcome": "C", "venue": "polymarket", "price": 0.3},
+        ],
+    }
+    
+    assert executor.execute(opportunity, position_size=100.0)
+    trade = executor.get_execution_history()[0]
+    assert trade["shares"] == 6.0
+    assert [o["outcome"] for o in poly.orders.values()] == ["A", "C"]
+    assert [o["outcome"] for o in opinion.orders.values()] == ["B"]
+    
+    opinion.fail_next = 1
+    assert not executor.execute(opportunity, position_size=100.0)
+    assert len(executor.get_execution_history()) == 1
+
+
+def test_opinion_quote_from_order_book():
+    """测试 Opinion.trade 双边报价取自订单簿，取不到订单簿时不报价（不用单一价格充当两边）"""
+    server = StandInBookServer().start()
+    try:
+        server.opinion_books["op-up"] = {
+            "bids": [{"price": "0.47", "size": "30"}, {"price": "0.48", "size": "12"}],
+            "asks": [{"price": "0.53", "size": "8"}, {"price": "0.51", "size": "20"}],
+        }
+        client = OpinionTradeClient()
+        client.base_url = server.url
+        assert client.get_quote("op-up") == Quote(4800, size_to_units(12), 5100, size_to_units(20))
+        assert client.get_market_price("op-up") == 0.51
+        assert client.get_quote("missing") is None and client.get_market_price("missing") is None
+        
+        server.opinion_books["one-sided"] = {"bids": [{"price": "0.47", "size": "30"}], "asks": []}
+        quote = client.get_quote("one-sided")
+        assert quote.bid == 4700 and quote.ask is None
+    finally:
+        server.close()
+
+
+def test_compressed_conditional_book_fetch():
+    """测试压缩传输、条件请求和深度截断"""
+    server = StandInBookServer().start()
+    try:
+        levels = [{"price": f"0.{i:02d}", "size": "100"} for i in range(1, 99)]
+        server.books["up"] = {"hash": "h1", "timestamp": "1700000000123", "bids": levels[:48], "asks": levels[50:]}
+        client = PolymarketClient()
+        client.base_url = server.url
+        
+        book = client.get_book_ticks("up", depth=3)
+        assert [price for price, _ in book["bids"]] == [4800, 4700, 4600]
+        assert [price for price, _ in book["asks"]] == [5100, 5200, 5300]
+        assert client.last_fetch["status"] == "full"
+        assert client.last_fetch["wire_bytes"] == server.bytes_sent
+        assert client.last_fetch["wire_bytes"] < client.last_fetch["body_bytes"]
+        assert book["venue_ts"] == 1700000000.123
+        
+        # 订单簿未变化: 304，不传输也不解析
+        assert client.get_book_ticks("up", depth=3)["asks"] == book["asks"]
+        assert server.not_modified == 1
+        assert client.last_fetch["status"] == "not_modified" and client.last_fetch["body_bytes"] == 0
+        
+        # 不支持条件请求的平台: hash 未变时跳过档位解析
+        server.use_etag = False
+        assert client.get_book_ticks("up", depth=3)["bids"] == book["bids"]
+        assert client.last_fetch["status"] == "unchanged"
+        
+        server.books["up"]["hash"] = "h2"
+        server.books["up"]["asks"] = levels[49:]
+        assert client.get_book_ticks("up", depth=3)["asks"][0][0] == 5000
+        
+        stats = client.get_fetch_stats()
+        assert stats["fetches"] == 4 and stats["not_modified"] == 1 and stats["unchanged"] == 1
+        assert client.get_book_ticks("missing") is None
+    finally:
+        server.close()
+
+
+def test_stale_opportunity_not_executed():
+    """测试检测后在队列中等待过久的机会在下单前被拒绝"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    opportunity = dict(OPPORTUNITY, quote_received_at=time.monotonic() - executor.stale_guard.max_age - 1)
+    
+    assert not executor.execute(opportunity, position_size=10.0)
+    assert not poly.orders and not opinion.orders
+    assert executor.stale_guard.get_stats()["rejected_by_venue"] == {"execute": 1}
+
+
+class ManualClock:
+    """可控时钟"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_paper_price_time_priority():
+    """测试模拟撮合: 同价位排在外部流动性之后，快照穿过挂单价时部分成交"""
+    exchange = PaperExchange(latency=0.0)
+    exchange.feed("polymarket", "up", {"bids": [(4500, size_to_units(5))], "asks": [(4700, size_to_units(3))]})
+    
+    order_id = exchange.submit("polymarket", "up", "BUY", 0.45, 4.0)
+    assert exchange.statuses([order_id])[0]["status"] == "acked"
+    
+    # 卖单只吃掉同价位的外部流动性，自己的订单不成交
+    exchange.feed("polymarket", "up", {"bids": [(4500, size_to_units(5))], "asks": [(4500, size_to_units(5))]})
+    assert exchange.statuses([order_id])[0]["filled_size"] == 0
+    
+    # 外部买单撤走后，新的卖单与自己的挂单成交
+    exchange.feed("polymarket", "up", {"bids": [], "asks": [(4400, size_to_units(1.5))]})
+    status = exchange.statuses([order_id])[0]
+    assert status["status"] == "partial" and status["filled_size"] == 1.5
+    assert status["avg_price"] == 0.45
+    
+    exchange.feed("polymarket", "up", {"bids": [], "asks": [(4500, size_to_units(10))]})
+    assert exchange.statuses([order_id])[0] == {
+        "order_id": order_id, "status": "filled", "filled_size": 4.0, "avg_price": 0.45,
+    }
+
+
+def test_paper_latency():
+    """测试模拟延迟: 订单到达前不成交，也可以在到达前撤单"""
+    clock = ManualClock()
+    exchange = PaperExchange(latency=0.05, clock=clock)
+    exchange.feed("polymarket", "up", {"bids": [], "asks": [(4700, size_to_units(10))]})
+    
+    first = exchange.submit("polymarket", "up", "BUY", 0.47, 2.0)
+    second = exchange.submit("polymarket", "up", "BUY", 0.47, 2.0)
+    assert [s["status"] for s in exchange.statuses([first, second])] == ["pending", "pending"]
+    assert exchange.cancel(second)
+    
+    clock.now = 0.06
+    assert [s["status"] for s in exchange.statuses([first, second])] == ["filled", "cancelled"]
+    assert exchange.get_stats()["pending"] == 0
+    assert exchange.books[("polymarket", "up")].quote().ask_size == size_to_units(8)
+
+
+def test_paper_executor_round_trip():
+    """测试执行器在模拟客户端上下单，成交通过批量查询回写"""
+    exchange = PaperExchange(latency=0.0)
+    poly, opinion = PaperPolymarketClient(exchange), PaperOpinionClient(exchange)
+    exchange.feed("polymarket", "up-token", {"bids": [], "asks": [(4500, size_to_units(100))]})
+    opinion.feed_quote("4866", Quote(5000, size_to_units(100), 5100, size_to_units(100)))
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    
+    opportunity = dict(OPPORTUNITY, poly_token_id="up-token")
+    assert executor.execute_arbitrage(opportunity, position_size=10.0)
+    trade = executor.get_execution_history()[0]
+    executor.refresh_orders()
+    
+    trade = executor.trades_by_id[trade["trade_id"]]
+    orders = executor.order_tracker.orders
+    assert trade["fills"]["poly"] == orders[trade["poly_order_id"]].size > 0
+    # Opinion.trade DOWN 卖价 = 1 - UP 买价 = 0.50，限价 0.50 可以成交
+    assert trade["fills"]["opinion"] == orders[trade["opinion_order_id"]].size > 0
+    assert not executor.order_tracker.open_order_ids()
+    assert exchange.books[("opinion", "4866:DOWN")].quote().ask_size < size_to_units(100)
+
+
+def test_paper_throughput():
+    """测试模拟撮合吞吐量（数千个订单）"""
+    exchange = PaperExchange(latency=0.0, seed=1)
+    exchange.feed("polymarket", "up", {
+        "bids": [(4000 - i * 10, size_to_units(50)) for i in range(20)],
+        "asks": [(4100 + i * 10, size_to_units(50)) for i in range(20)],
+    })
+    
+    start = time.perf_counter()
+    order_ids = []
+    for i in range(5000):
+        side = "BUY" if i % 2 else "SELL"
+        price = 0.39 + (i % 30) * 0.001 if side == "BUY" else 0.42 - (i % 30) * 0.001
+        order_ids.append(exchange.submit("polymarket", "up", side, round(price, 4), 1.0))
+    statuses = exchange.statuses(order_ids)
+    elapsed = time.perf_counter() - start
+    
+    assert len(statuses) == 5000
+    assert exchange.get_stats()["fills"] > 0
+    assert elapsed < 5.0, f"{elapsed:.2f}s"
+
+
+def test_load_generator_over_http():
+    """测试合成负载经本地替身 /book 服务驱动检测器"""
+    generator = LoadGenerator(num_markets=5, mode="http", seed=3, stream_size=50)
+    detector = generator.attach(ArbitrageDetector())
+    try:
+        stats = generator.run(detector, rate=None, duration=30.0, max_updates=50)
+        assert stats["updates"] == 50
+        # 预热 + 每次更新各请求 UP / DOWN 两个订单簿
+        assert generator.server.requests >= 100
+        assert detector.polymarket.get_fetch_stats()["fetches"] >= 100
+    finally:
+        generator.close()
+
+
+def _busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sampling_profiler_on_demand():
+    """测试按需采样: 空闲时没有采样线程，信号触发后输出折叠调用栈和热点计数"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        profiler = SamplingProfiler(seconds=0.3, interval=0.002, output_dir=output_dir)
+        threads_before = threading.active_count()
+        assert profiler.install_signal_handler(signal.SIGUSR1)
+        assert not profiler.running and threading.active_count() == threads_before
+        
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+        worker.start()
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            assert profiler.running
+            assert not profiler.start(0.1)  # 采样进行中，不重复启动
+            profiler.wait(timeout=30)
+        finally:
+            stop.set()
+            worker.join()
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        
+        assert profiler.samples > 0
+        busy = [line for line in profiler.collapsed().splitlines() if line.startswith("busy;")]
+        assert busy and all("_busy_loop (test_local_standin.py" in line for line in busy)
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) <= profiler.samples
+        loop = next(name for name in profiler.total_counts if name.startswith("_busy_loop"))
+        assert profiler.total_counts[loop] > 0
+        assert profiler.self_counts[loop] <= profiler.total_counts[loop]
+        assert sorted(os.path.splitext(f)[1] for f in os.listdir(output_dir)) == [".folded", ".txt"]
+
+
+def test_profiler_admin_endpoint():
+    """测试本地管理端口按需采样"""
+    profiler = SamplingProfiler(interval=0.002, output_dir="")
+    admin = ProfilerAdminServer(profiler, port=0).start()
+    try:
+        with urllib.request.urlopen(f"{admin.url}/profile?seconds=0.1&format=hot", timeout=30) as response:
+            report = response.read().decode("utf-8")
+        assert "self%" in report and profiler.samples > 0
+        with urllib.request.urlopen(f"{admin.url}/profile/last", timeout=30) as response:
+            assert b'"samples"' in response.read()
+    finally:
+        admin.close()
+    assert not profiler.running
+
+
+def test_position_ledger():
+    """测试持仓账本的盈亏、占用资金、完整组合和合并 / 赎回标记"""
+    ledger = PositionLedger()
+    ledger.apply_fill("m", "UP", "polymarket", "BUY", 10.0, 0.45)
+    ledger.apply_fill("m", "DOWN", "opinion", "BUY", 10.0, 0.50)
+    snapshot = ledger.snapshot()
+    assert snapshot["totals"]["locked"] == 9.5 and snapshot["totals"]["total_pnl"] == 0.0
+    # 跨平台配齐的组合只能持有到结算，不能合并
+    assert snapshot["markets"]["m"]["complete_sets"] == 10.0 and not snapshot["mergeable"]
+    
+    ledger.mark("m", "UP", "polymarket", 5000)
+    assert abs(ledger.snapshot()["totals"]["unrealized_pnl"] - 0.5) < 1e-9
+    
+    ledger.apply_fill("m", "UP", "polymarket", "SELL", 4.0, 0.55)
+    position = ledger.position("m", "UP", "polymarket")
+    assert position["shares"] == 6.0 and abs(position["realized_pnl"] - 0.4) < 1e-9
+    assert abs(position["avg_price"] - 0.45) < 1e-9
+    assert ledger.exposure("m") == {"UP": 6.0, "DOWN": 10.0}
+    
+    # Polymarket 上同时持有 UP 和 DOWN 时可以合并
+    ledger.apply_fill("m", "DOWN", "polymarket", "BUY", 8.0, 0.52)
+    snapshot = ledger.snapshot()
+    assert snapshot["mergeable"] == {"m": {"polymarket": 6.0}}
+    assert abs(snapshot["venues"]["polymarket"]["locked"] - (6 * 0.45 + 8 * 0.52)) < 1e-9
+    
+    ledger.resolve("m", "UP")
+    snapshot = ledger.snapshot()
+    assert snapshot["redeemable"] == {"m": {"polymarket": 6.0}} and not snapshot["mergeable"]
+    # 结算: UP 6 份得 6，卖出已实现 0.4，总成本 6*0.45 + 10*0.5 + 8*0.52
+    expected = 6 + 0.4 - (6 * 0.45 + 10 * 0.5 + 8 * 0.52)
+    assert abs(snapshot["totals"]["total_pnl"] - expected) < 1e-9
+    
+    # 空头平仓
+    ledger.apply_fill("s", "UP", "polymarket", "SELL", 5.0, 0.60)
+    assert abs(ledger.snapshot()["markets"]["s"]["locked"] - 2.0) < 1e-9
+    ledger.apply_fill("s", "UP", "polymarket", "BUY", 5.0, 0.50)
+    market = ledger.snapshot()["markets"]["s"]
+    assert market["locked"] == 0.0 and abs(market["realized_pnl"] - 0.5) < 1e-9
+    
+    # 快照只读取增量合计，与成交笔数无关
+    for i in range(20000):
+        ledger.apply_fill(f"bulk{i % 100}", "UP" if (i // 100) % 2 else "DOWN", "polymarket", "BUY", 1.0, 0.4)
+    started = time.perf_counter()
+    totals = ledger.snapshot(markets=False)["totals"]
+    assert time.perf_counter() - started < 0.05
+    assert ledger.fills == 20006 and len(ledger.snapshot()["mergeable"]) == 100
+    assert abs(totals["locked"] - (20000 * 0.4 + 6 * 0.45 + 10 * 0.5 + 8 * 0.52)) < 1e-6
+
+
+def test_ledger_follows_executor_fills():
+    """测试执行器的成交回调更新持仓账本"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    
+    assert executor.execute_arbitrage(dict(OPPORTUNITY, market_id="btc"), position_size=10.0)
+    trade = executor.get_execution_history()[0]
+    poly.fill(trade["poly_order_id"], 2.0)
+    opinion.fill(trade["opinion_order_id"], 3.0)
+    executor.refresh_orders()
+    
+    assert executor.ledger.exposure("btc") == {"UP": 2.0, "DOWN": 3.0}
+    snapshot = executor.ledger.snapshot()
+    assert snapshot["markets"]["btc"]["complete_sets"] == 2.0
+    assert abs(snapshot["totals"]["locked"] - (2 * 0.45 + 3 * 0.50)) < 1e-9
+    
+    # 重复推送同一累计成交量不重复记账
+    executor.refresh_orders()
+    assert executor.ledger.fills == 2
+
+
+def test_risk_gate_limits():
+    """测试风控的名义金额上限、下单速率、未完结腿数和紧急停止"""
+    clock = ManualClock()
+    gate = RiskGate(max_market_notional=30, max_total_notional=50, max_orders_per_second=4,
+                    max_open_legs=6, killed=False, clock=clock)
+    ten = size_to_units(10)
+    assert gate.acquire("a", ten, 2) is None
+    assert gate.acquire("a", ten * 2, 2) is None
+    assert gate.acquire("a", ten, 1) == "market_notional"
+    # 令牌桶容量 4，已用完
+    assert gate.acquire("b", ten, 2) == "order_rate"
+    clock.now += 0.5
+    assert gate.acquire("b", ten, 2) is None
+    assert gate.acquire("c", ten, 1) == "open_legs"
+    gate.release("c", 0, 2)
+    clock.now += 1.0
+    assert gate.acquire("c", ten * 2, 1) == "total_notional"
+    
+    gate.release("a", ten * 3, 0)
+    assert gate.acquire("c", ten * 2, 1) is None
+    gate.kill("测试")
+    assert gate.acquire("d", 0, 1) == "kill_switch"
+    gate.reset()
+    stats = gate.get_stats()
+    assert stats["accepted"] == 4 and stats["rejected_by"]["order_rate"] == 1
+    assert stats["total_notional"] == 30.0
+
+
+def test_risk_gate_releases_closed_legs():
+    """测试执行器在订单完结后归还风控占用，风控拒绝时不下单"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(max_market_notional=15, max_total_notional=0, max_orders_per_second=0,
+                                  max_open_legs=2, killed=False)
+    
+    assert executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    assert not executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    assert len(poly.orders) == 1 and executor.risk_gate.open_legs == 2
+    
+    # 两条腿完结: 腿数归还，已成交部分仍计入名义金额
+    trade = executor.get_execution_history()[0]
+    poly.fill(trade["poly_order_id"])
+    opinion.fill(trade["opinion_order_id"])
+    executor.refresh_orders()
+    stats = executor.risk_gate.get_stats()
+    assert stats["open_legs"] == 0 and abs(stats["total_notional"] - trade["shares"] * 0.95) < 1e-6
+    assert stats["position_notional"] == stats["total_notional"] and not executor.risk_gate.market_notional
+    assert stats["rejected_by"] == {"open_legs": 1}
+    # 单个市场持仓约 9.5 USD，再下一笔超过 15 USD 上限
+    assert not executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    assert executor.risk_gate.get_stats()["rejected_by"]["market_notional"] == 1
+    
+    # 市场结算后持仓不再占用额度
+    executor.resolve_market("default", "UP")
+    assert executor.risk_gate.get_stats()["total_notional"] == 0
+    assert executor.execute_arbitrage(dict(OPPORTUNITY, market_id="m2"), position_size=10.0)
+    trade = executor.get_execution_history()[-1]
+    # 部分成交后撤单: 已成交部分转为持仓，未成交部分归还，预留不残留
+    poly.fill(trade["poly_order_id"], 1.5)
+    poly.fill(trade["poly_order_id"], 1.25)
+    poly.cancel(trade["poly_order_id"])
+    opinion.cancel(trade["opinion_order_id"])
+    executor.refresh_orders()
+    assert not executor.risk_gate.market_notional and executor.risk_gate.open_legs == 0
+    assert abs(executor.risk_gate.get_stats()["total_notional"] - 2.75 * 0.45) < 1e-6
+    
+    # 客户端返回无法跟踪的订单ID时，不留下永远不会归还的占用
+    untracked = StandInVenue("untracked")
+    untracked.place_order = lambda *args, **kwargs: True
+    executor.polymarket = executor.opinion_trade = untracked
+    assert executor.execute_arbitrage(OPPORTUNITY, position_size=5.0)
+    assert not executor.risk_gate.market_notional and executor.risk_gate.open_legs == 0
+
+
+def test_kill_signal_while_gate_locked():
+    """测试紧急停止信号在主线程持有风控锁时到达也不会死锁"""
+    gate = RiskGate(0, 0, 0, 0, killed=False)
+    previous = signal.getsignal(signal.SIGUSR2)
+    try:
+        assert gate.install_signal_handler()
+        with gate._lock:
+            os.kill(os.getpid(), signal.SIGUSR2)
+            time.sleep(0.01)
+        assert gate.killed and gate.acquire("m", 0, 1) == "kill_switch"
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
+
+
+def test_risk_gate_latency():
+    """测试风控检查 + 归还只需要微秒级时间"""
+    result = risk_gate_benchmark(iterations=20000, markets=100)
+    assert result["p50_us"] < 50 and result["mean_us"] < 100
+
+
+def batch_opportunities(count: int) -> list:
+    """不同市场、不同 Polymarket 价格的跨平台机会"""
+    return [
+        dict(OPPORTUNITY, market_id=f"m{i}", poly_price=(40 + i) / 100, total_cost=(90 + i) / 100,
+             profit=(10 - i) / 100, poly_token_id=f"up-{i}")
+        for i in range(count)
+    ]
+
+
+def test_batch_execution_groups_orders_per_venue():
+    """测试批量执行按平台合并下单请求，并把每个订单映射回所属机会"""
+    poly, opinion = StandInVenue("poly", batch_order_limit=3), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    opportunities = batch_opportunities(4)
+    
+    results = executor.execute_batch([(opportunity, 10.0) for opportunity in opportunities])
+    assert results == [True] * 4
+    # Polymarket 4 个订单分成 3 + 1 两次请求；Opinion.trade 不支持批量，逐单并发提交
+    assert poly.batch_sizes == [3, 1] and poly.order_requests == 2
+    assert opinion.order_requests == 4
+    assert executor.batch_stats == {"batches": 1, "orders": 8, "batch_requests": 2, "single_requests": 4}
+    
+    trades = executor.get_execution_history()
+    assert [trade["poly_price"] for trade in trades] == [opportunity["poly_price"] for opportunity in opportunities]
+    for trade in trades:
+        assert poly.orders[trade["poly_order_id"]]["price"] == trade["poly_price"]
+        assert opinion.orders[trade["opinion_order_id"]]["outcome"] == "DOWN"
+    assert len(executor.order_tracker.open_order_ids()) == 8
+
+
+def test_execution_errors_release_reservations():
+    """测试执行中订单跟踪器 / 状态日志出错时返回失败，没交给订单跟踪器的腿归还风控预留"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    track = executor.order_tracker.track
+    
+    def track_polymarket_only(order_id, venue, *args, **kwargs):
+        if venue != "polymarket":
+            raise RuntimeError("跟踪失败")
+        return track(order_id, venue, *args, **kwargs)
+    
+    def broken_journal(event_type, data):
+        raise OSError("磁盘已满")
+    
+    def broken_place_order(*args, **kwargs):
+        raise ConnectionError("连接断开")
+    
+    poly.place_order = broken_place_order
+    assert executor.execute_batch([(opportunity, 10.0) for opportunity in batch_opportunities(2)]) == [False, False]
+    assert not executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    assert executor.risk_gate.get_state()["open_legs"] == 0
+    del poly.place_order
+    
+    executor.order_tracker.track = track_polymarket_only
+    assert not executor.execute_arbitrage(OPPORTUNITY, position_size=10.0)
+    assert executor.risk_gate.get_state()["open_legs"] == 1
+    assert executor.execute_batch([(opportunity, 10.0) for opportunity in batch_opportunities(2)]) == [False, False]
+    assert executor.risk_gate.get_state()["open_legs"] == 3
+    del executor.order_tracker.track
+    
+    assert not executor.executed_trades
+    # 交易已经下单成功，写状态日志失败不算执行失败
+    executor.journal = broken_journal
+    assert executor.execute(dict(OPPORTUNITY, market_id="m9"), position_size=10.0)
+    executor.journal = None
+    assert len(executor.executed_trades) == 1 and executor.risk_gate.get_state()["open_legs"] == 5
+    
+    # 已跟踪的订单完结后占用全部归还
+    for order in executor.order_tracker.open_orders():
+        (poly if order.venue == "polymarket" else opinion).cancel(order.order_id)
+    executor.refresh_orders()
+    state = executor.risk_gate.get_state()
+    assert state["open_legs"] == 0 and not state["market_notional"]
+
+
+def test_batch_execution_partial_failures():
+    """测试整批请求失败退回逐单提交，单条腿失败按单笔执行的规则处理"""
+    poly, opinion = StandInVenue("poly", batch_order_limit=15), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    
+    poly.fail_batches = 1
+    assert executor.execute_batch([(opportunity, 10.0) for opportunity in batch_opportunities(3)]) == [True] * 3
+    assert poly.batch_sizes == [] and poly.order_requests == 4
+    
+    # 一个机会的 Opinion.trade 腿失败: 该机会走单腿风险处理（以更差价格重试），其余机会正常记录
+    opinion.fail_next = 1
+    results = executor.execute_batch([(opportunity, 10.0) for opportunity in batch_opportunities(3)])
+    assert sorted(results) == [False, True, True]
+    assert len(executor.unwind_reports) == 1 and executor.unwind_reports[0]["action"] == "retry"
+    assert len(executor.get_execution_history()) == 5
+    
+    # 完整组合一条腿被拒绝: 撤回已下单的另一条腿
+    complete_set = {
+        "type": "complete_set", "strategy": "Poly_UP + Poly_DOWN", "side": "BUY", "market_id": "cs",
+        "up_price": 0.45, "down_price": 0.52, "total_cost": 0.97, "profit": 0.03, "profit_percent": 3.0, "size": 5.0,
+    }
+    poly.fail_next = 2
+    results = executor.execute_batch([(batch_opportunities(1)[0], 10.0), (complete_set, 10.0)])
+    assert results == [False, False]
+    poly.fail_next = 0
+    assert executor.execute_batch([(complete_set, 10.0)]) == [True]
+    
+    poly.orders.clear()
+    poly.fail_next = 1
+    assert executor.execute_batch([(complete_set, 10.0), (batch_opportunities(1)[0], 10.0)]) == [False, True]
+    reversal = list(poly.orders.values())[-1]
+    assert (reversal["outcome"], reversal["side"]) == ("DOWN", "SELL")
+    # 撤回单计入风控腿数并被跟踪，完结后归还
+    tracked = executor.order_tracker.orders[reversal["order_id"]]
+    assert (tracked.leg, tracked.side, tracked.market_id) == ("down_reversal", "SELL", "cs")
+    open_legs = executor.risk_gate.open_legs
+    poly.fill(reversal["order_id"])
+    executor.refresh_orders()
+    assert executor.risk_gate.open_legs == open_legs - 1
+    
+    # 撤回单也失败: 归还撤回单的预留，只留下已下单的那条腿
+    open_legs = executor.risk_gate.open_legs
+    poly.fail_next = 1
+    poly.place_order = lambda *args, **kwargs: None
+    assert executor.execute_batch([(complete_set, 10.0)]) == [False]
+    del poly.place_order
+    assert executor.risk_gate.open_legs == open_legs + 1
+    
+    # Polymarket 腿失败的跨平台机会不提交 Opinion.trade 腿（不会留下裸露的 Opinion.trade 仓位）
+    opinion_requests = opinion.order_requests
+    poly.fail_next = 1
+    assert executor.execute_batch([(opportunity, 10.0) for opportunity in batch_opportunities(2)]) == [False, True]
+    assert opinion.order_requests == opinion_requests + 1
+
+
+def _trading_executor(state_dir: str):
+    """带状态日志的执行器（风控不限制）"""
+    executor = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    store = StateStore(state_dir, snapshot_interval=60)
+    restore_executor(store, executor)
+    return executor, store
+
+
+def _trade_and_fill(executor: ArbitrageExecutor, count: int, offset: int):
+    for i in range(offset, offset + count):
+        assert executor.execute_arbitrage(dict(OPPORTUNITY, market_id=f"m{i % 5}"), position_size=10.0)
+        trade = executor.executed_trades[-1]
+        # 部分交易两边全部成交，部分只成交一半
+        executor.polymarket.fill(trade["poly_order_id"], None if i % 3 else 5.0)
+        if i % 2:
+            executor.opinion_trade.fill(trade["opinion_order_id"])
+    executor.refresh_orders()
+
+
+def _state_view(executor: ArbitrageExecutor) -> dict:
+    return {
+        "trades": [(trade["trade_id"], trade["fills"]) for trade in executor.executed_trades],
+        "open": sorted(executor.order_tracker.open_order_ids()),
+        "ledger": executor.ledger.snapshot(),
+        "risk": executor.risk_gate.get_state(),
+    }
+
+
+def test_state_restore_after_crash():
+    """测试崩溃后从快照 + 日志尾部恢复交易、订单、持仓和风控占用，不访问平台"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        executor, store = _trading_executor(state_dir)
+        _trade_and_fill(executor, 300, 0)
+        store.write_snapshot({"executor": executor.get_state()})
+        _trade_and_fill(executor, 300, 300)
+        expected = _state_view(executor)
+        assert len(expected["open"]) > 100 and expected["ledger"]["fills"] > 500
+        # 模拟崩溃: 不关闭日志，最后一行只写了一半
+        with open(store.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"seq": 999999, "type": "order_up')
+        
+        restored = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+        restored.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+        started = time.perf_counter()
+        snapshot, events = restore_executor(StateStore(state_dir), restored)
+        elapsed = time.perf_counter() - started
+        assert snapshot is not None and len(events) > 600
+        assert _state_view(restored) == expected
+        assert elapsed < 1.0, f"恢复耗时 {elapsed:.3f} 秒"
+        assert restored.polymarket.status_requests == 0 and restored.opinion_trade.order_requests == 0
+
+
+def test_state_snapshot_compacts_journal():
+    """测试快照写入后日志清空，清空前崩溃时重放跳过已在快照中的事件"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        executor, store = _trading_executor(state_dir)
+        _trade_and_fill(executor, 10, 0)
+        with open(store.journal_path, encoding="utf-8") as f:
+            journal_before = f.read()
+        store.write_snapshot({"executor": executor.get_state()})
+        assert os.path.getsize(store.journal_path) == 0
+        
+        # 快照已替换但日志还没清空时崩溃: 旧日志的事件都不应再次应用
+        with open(store.journal_path, "w", encoding="utf-8") as f:
+            f.write(journal_before)
+        restored = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+        restored.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+        _, events = restore_executor(StateStore(state_dir), restored)
+        assert events == []
+        assert _state_view(restored) == _state_view(executor)
+
+
+def test_state_snapshot_concurrent_update():
+    """测试快照采集期间其他线程的订单更新和新交易不会丢失，也不会在快照之上重复应用"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        executor, store = _trading_executor(state_dir)
+        _trade_and_fill(executor, 10, 0)
+        open_order = executor.order_tracker.open_orders()[0]
+        venue = executor.polymarket if open_order.venue == "polymarket" else executor.opinion_trade
+        
+        def update():
+            venue.fill(open_order.order_id)
+            executor.refresh_orders()
+            _trade_and_fill(executor, 1, 10)
+        
+        def capture():
+            state = {"executor": executor.get_state()}
+            # 采集之后、快照序号确定之前到达的更新（旧实现中这些事件的序号不大于快照序号，重放时被跳过）
+            worker.start()
+            time.sleep(0.05)
+            return state
+        
+        worker = threading.Thread(target=update)
+        store.write_snapshot(capture)
+        worker.join(5)
+        assert not open_order.is_open
+        
+        restored = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+        restored.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+        _, events = restore_executor(StateStore(state_dir), restored)
+        assert events
+        assert _state_view(restored) == _state_view(executor)
+        # 再次重放同一批事件: 已有的订单和交易按编号跳过
+        restored.replay(events)
+        assert _state_view(restored) == _state_view(executor)
+
+
+def test_state_snapshot_during_fill_callback():
+    """测试快照不会落在订单更新和成交回调之间（账本和风控与订单状态一起进入快照或一起重放）"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        executor, store = _trading_executor(state_dir)
+        _trade_and_fill(executor, 10, 0)
+        open_order = executor.order_tracker.open_orders()[0]
+        venue = executor.polymarket if open_order.venue == "polymarket" else executor.opinion_trade
+        on_fill = executor.order_tracker.on_fill
+        snapshotter = threading.Thread(target=lambda: store.write_snapshot(lambda: {"executor": executor.get_state()}))
+        
+        def delayed_fill(order, fill_delta):
+            # 订单已更新、日志已写入，账本和风控还没更新时请求快照
+            snapshotter.start()
+            time.sleep(0.05)
+            on_fill(order, fill_delta)
+        executor.order_tracker.on_fill = delayed_fill
+        venue.fill(open_order.order_id)
+        executor.refresh_orders()
+        snapshotter.join(5)
+        assert not open_order.is_open and store.stats["snapshots"] == 1
+        
+        restored = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+        restored.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+        restore_executor(StateStore(state_dir), restored)
+        assert _state_view(restored) == _state_view(executor)
+
+
+def test_flight_recorder_ring_buffer():
+    """测试飞行记录器只保留最近 N 个周期，正常周期不写盘"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        recorder = FlightRecorder(capacity=5, output_dir=output_dir, latency_ms=0, cooldown=0)
+        for _ in range(12):
+            trace = recorder.begin()
+            trace.lap("books")
+            assert recorder.finish(trace) is None
+        assert [trace.cycle for trace in recorder.traces] == [8, 9, 10, 11, 12]
+        assert os.listdir(output_dir) == []
+
+
+def test_flight_recorder_dumps_on_anomalies():
+    """测试执行失败、周期异常和耗时异常时写出缓冲区中的完整上下文"""
+    clock = ManualClock()
+    prices = {
+        "market_id": "m1",
+        "polymarket_up_quote": Quote(4400, 10_000_000, 4500, 20_000_000),
+        "polymarket_down_quote": Quote(5400, 5_000_000, 5600, 8_000_000),
+        "opinion_trade_quote": Quote(4900, 1_000_000, 5000, 3_000_000),
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        recorder = FlightRecorder(capacity=10, output_dir=output_dir, latency_ms=50, cooldown=5, clock=clock)
+        recorder.finish(recorder.begin())
+        trace = recorder.begin()
+        trace.book(prices)
+        opportunity = dict(OPPORTUNITY, market_id="m1")
+        trace.opportunity(opportunity)
+        trace.decide(opportunity, "failed", position_size=10.0)
+        trace.flag("execution_failed")
+        path = recorder.finish(trace)
+        
+        with open(path, encoding="utf-8") as f:
+            dump = json.load(f)
+        assert dump["reason"] == "execution_failed"
+        assert [cycle["cycle"] for cycle in dump["cycles"]] == [1, 2]
+        last = dump["cycles"][-1]
+        assert last["books"] == [{"market_id": "m1", "up": [4400, 10_000_000, 4500, 20_000_000],
+                                  "down": [5400, 5_000_000, 5600, 8_000_000],
+                                  "opinion": [4900, 1_000_000, 5000, 3_000_000]}]
+        assert last["opportunities"][0]["decision"] == "failed"
+        assert last["opportunities"][0]["total_cost"] == OPPORTUNITY["total_cost"]
+        
+        # 冷却期内的异常只计数，之后的耗时异常再次写盘并带上之前的周期
+        trace = recorder.begin()
+        trace.error = "Traceback: boom"
+        assert recorder.finish(trace) is None and recorder.stats["suppressed"] == 1
+        clock.now = 10.0
+        trace = recorder.begin()
+        trace.stages["books"] = 80.0
+        path = recorder.finish(trace)
+        with open(path, encoding="utf-8") as f:
+            dump = json.load(f)
+        assert dump["reason"] == "latency"
+        assert [cycle["error"] for cycle in dump["cycles"]][-2] == "Traceback: boom"
+        assert recorder.get_stats() == {"dumps": 2, "suppressed": 1, "cycles": 4, "buffered": 4}
+
+
+def test_parallel_preflight():
+    """测试启动预检并行执行: 总耗时约等于最慢的一步，首批订单簿可直接用于检测"""
+    book_server = StandInBookServer(latency=0.2).start()
+    opinion_server = StandInBookServer(latency=0.2, api_key="key-1").start()
+    try:
+        detector = ArbitrageDetector()
+        detector.polymarket.base_url = book_server.url
+        detector.opinion_trade.base_url = opinion_server.url
+        detector.opinion_trade.session.headers["apikey"] = "key-1"
+        markets = []
+        for i in range(6):
+            market = {"market_id": f"m{i}", "poly_up_token_id": f"up-{i}", "poly_down_token_id": f"down-{i}"}
+            book_server.books[f"up-{i}"] = {"bids": [["0.44", "10"]], "asks": [["0.45", "10"]]}
+            book_server.books[f"down-{i}"] = {"bids": [["0.53", "10"]], "asks": [["0.54", "10"]]}
+            markets.append(market)
+        
+        tasks = [("api_key", detector.opinion_trade.test_api_key),
+                 ("warm", lambda: warm_up(detector.polymarket)),
+                 ("broken", lambda: 1 / 0)]
+        tasks += [(f"books:{i}", lambda market=market: detector.get_books(market)) for i, market in enumerate(markets)]
+        started = time.perf_counter()
+        steps = run_parallel(tasks, workers=16)
+        elapsed = time.perf_counter() - started
+        
+        # 逐个执行约 0.2 * (2 + 6 * 2) = 2.8 秒；并行时最慢的一步是单个市场的两次订单簿请求
+        assert elapsed < 1.2, f"{elapsed:.2f}s"
+        assert steps["api_key"]["result"] is True and steps["warm"]["result"] == 200
+        assert not steps["broken"]["ok"] and "division" in steps["broken"]["error"]
+        assert all(steps[f"books:{i}"]["result"]["polymarket_up_ticks"] == 4500 for i in range(6))
+        
+        lines = breakdown({"配置校验": 1.0, "并行预检": elapsed * 1000}, steps)
+        assert "首批订单簿: 6 个市场" in lines[-1] and "失败 0 个" in lines[-1]
+        assert any(line.strip().startswith("broken") and "✗" in line for line in lines)
+        
+        detector.opinion_trade.session.headers["apikey"] = "wrong"
+        assert run_parallel([("api_key", detector.opinion_trade.test_api_key)])["api_key"]["result"] is False
+    finally:
+        book_server.close()
+        opinion_server.close()
+
+
+def test_endpoint_failover():
+    """测试多端点: 探测后使用最快的健康地址，当前地址失效时请求自动改道"""
+    slow = StandInBookServer(latency=0.1).start()
+    fast = StandInBookServer().start()
+    dead = StandInBookServer().start()
+    dead.close()
+    try:
+        for server in (slow, fast):
+            server.books["up"] = {"bids": [["0.44", "10"]], "asks": [["0.45", "10"]]}
+        pool = EndpointPool("polymarket", [slow.url, dead.url, fast.url], alpha=1.0, probe_timeout=1.0)
+        assert pool.current == slow.url
+        
+        client = PolymarketClient()
+        client.endpoints = pool
+        assert warm_up(client) == 200
+        assert pool.current == fast.url and client.base_url == fast.url
+        stats = {e["url"]: e for e in pool.get_stats()["endpoints"]}
+        assert stats[dead.url]["failures"] == 1 and stats[fast.url]["rtt_ms"] < stats[slow.url]["rtt_ms"]
+        
+        served = fast.requests
+        assert client.get_quote("up").ask == 4500
+        assert fast.requests == served + 1 and pool.stats["failovers"] == 0
+        
+        # 当前地址失效: 同一次调用改道到仍可用的地址，之后直接使用它
+        fast.close()
+        assert client.get_quote("up").ask == 4500
+        assert pool.current == slow.url and pool.stats["failovers"] == 1
+        served = slow.requests
+        assert client.get_quote("up").ask == 4500
+        assert slow.requests == served + 1 and pool.stats["failovers"] == 1
+        
+        # 后台探测: 找到更快的地址后切换
+        faster = StandInBookServer().start()
+        try:
+            pool = EndpointPool("opinion", [slow.url, faster.url], probe_timeout=1.0)
+            assert pool.start(interval=0.02)
+            deadline = time.monotonic() + 2
+            while pool.current != faster.url and time.monotonic() < deadline:
+                time.sleep(0.01)
+            pool.stop()
+            assert pool.current == faster.url and pool.stats["probes"] >= 1
+        finally:
+            faster.close()
+        
+        # 延迟接近时不来回切换，明显更快时切换
+        pool = EndpointPool("t", ["http://a", "http://b"], alpha=1.0, switch_margin=0.2)
+        pool.record("http://a", True, rtt=0.100)
+        pool.record("http://b", True, rtt=0.095)
+        assert pool.current == "http://a"
+        pool.record("http://b", True, rtt=0.050)
+        assert pool.current == "http://b" and pool.stats["switches"] == 1
+        assert not EndpointPool("single", ["http://a"]).start()
+    finally:
+        slow.close()
+
+
+def _seqlock_writer(store_name: str, num_markets: int, stop_event):
+    """另一个进程中持续写入市场 1，四个价格总是相同的值"""
+    store = SharedBookStore(num_markets, name=store_name)
+    try:
+        value = 0
+        while not stop_event.is_set():
+            value += 1
+            store.write(1, value, value, value, value)
+    finally:
+        store.close()
+
+
+def test_shared_store_seqlock():
+    """测试共享内存顺序锁: 写入中途不返回数据，并发写入时读不到新旧混合的槽位"""
+    store = SharedBookStore(2)
+    try:
+        store.write(0, 4500, 5400, 5000, 4900)
+        slot = store.read(0)
+        assert slot[SEQ] == 2 and slot[POLY_UP:OPINION_BID + 1] == (4500, 5400, 5000, 4900)
+        # 写入到一半（seq 为奇数）时读取放弃
+        store.view[SEQ] += 1
+        assert store.read(0) is None
+        store.view[SEQ] += 1
+        assert store.read(0) == (4,) + slot[1:]
+        
+        stop = mp.Event()
+        writer = mp.Process(target=_seqlock_writer, args=(store.name, 2, stop), name="seqlock-writer")
+        writer.start()
+        reads = 0
+        deadline = time.monotonic() + 0.5
+        try:
+            while time.monotonic() < deadline:
+                slot = store.read(1)
+                if slot is None or slot[SEQ] == 0:
+                    continue
+                assert slot[SEQ] % 2 == 0
+                assert slot[POLY_UP] == slot[POLY_DOWN] == slot[OPINION] == slot[OPINION_BID], slot
+                reads += 1
+        finally:
+            stop.set()
+            writer.join(5)
+        assert reads > 100 and writer.exitcode == 0
+    finally:
+        store.close()
+
+
+def test_sharded_worker_to_executor():
+    """测试分片运行时: 检测进程从共享内存读到价格，把机会经队列交给执行端下单"""
+    markets = [{"market_id": f"m{i}", "poly_up_token_id": f"up-{i}", "poly_down_token_id": f"down-{i}"}
+               for i in range(4)]
+    store = SharedBookStore(len(markets))
+    opportunity_queue, stop = mp.Queue(), mp.Event()
+    for i in range(len(markets)):
+        store.write(i, 5100, 5000, 5000, 4900)
+    # 只有 m2 有套利: Polymarket UP 0.45 + Opinion.trade DOWN (1 - 0.52) = 0.93
+    store.write(2, 4500, 5600, 5300, 5200)
+    
+    executor = ArbitrageExecutor(polymarket=StandInVenue("poly"), opinion_trade=StandInVenue("opinion"))
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    worker = mp.Process(target=_detector_process, name="detector-test",
+                        args=(store.name, markets, list(range(len(markets))), opportunity_queue, stop))
+    consumer = threading.Thread(target=_executor_process, args=(opportunity_queue, stop, executor))
+    worker.start()
+    consumer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not executor.executed_trades and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        worker.join(5)
+        consumer.join(5)
+        store.close()
+    
+    assert len(executor.executed_trades) == 1
+    trade = executor.executed_trades[0]
+    assert trade["strategy"] == "Poly_UP + Opinion_DOWN" and trade["poly_price"] == 0.45
+    orders = executor.order_tracker.get_trade_orders(trade["trade_id"])
+    assert {order.market_id for order in orders} == {"m2"}
+    assert worker.exitcode == 0
+
+
+def test_async_runtime_serializes_executor():
+    """测试 asyncio 运行时: 各市场的执行、订单刷新、持仓估值和用户频道推送都在执行器锁内串行进入执行器，
+    检测任务崩溃后重新启动，用户频道推送的平台不轮询"""
+    poly, opinion = StandInVenue("poly"), StandInVenue("opinion")
+    executor = ArbitrageExecutor(polymarket=poly, opinion_trade=opinion)
+    executor.risk_gate = RiskGate(0, 0, 0, 0, killed=False)
+    detector = ArbitrageDetector()
+    markets = [{"market_id": f"m{i}", "condition_id": f"c{i}"} for i in range(4)]
+    detector.get_books = lambda market: {"market_id": market["market_id"]}
+    crashed = set()
+    
+    def detect(prices):
+        # 每个市场第一次检测时崩溃
+        if prices["market_id"] not in crashed:
+            crashed.add(prices["market_id"])
+            raise RuntimeError("检测失败")
+        return [dict(OPPORTUNITY, market_id=prices["market_id"])]
+    detector.detect_opportunities = detect
+    
+    inside, peak = [0], [0]
+    counter_lock = threading.Lock()
+    outside_lock = []
+    
+    def serialized(func):
+        def wrapper(*args, **kwargs):
+            if not bot._executor_lock.locked():
+                outside_lock.append(func.__name__)
+            with counter_lock:
+                inside[0] += 1
+                peak[0] = max(peak[0], inside[0])
+            try:
+                time.sleep(0.01)
+                return func(*args, **kwargs)
+            finally:
+                with counter_lock:
+                    inside[0] -= 1
+        return wrapper
+    executor.execute = serialized(executor.execute)
+    executor.refresh_orders = serialized(executor.refresh_orders)
+    executor.ledger.mark_prices = serialized(executor.ledger.mark_prices)
+    pushed_threads = []
+    apply_updates = executor.order_tracker.apply_updates
+    
+    def apply_pushed(updates):
+        updates = list(updates)
+        pushed_threads.extend((threading.current_thread().name, u["order_id"]) for u in updates)
+        if not bot._executor_lock.locked():
+            outside_lock.append("apply_updates")
+        return apply_updates(updates)
+    
+    bot = AsyncArbitrageBot(markets, detector=detector, executor=executor, poll_interval=0.05)
+    bot.user_channel = PolymarketUserChannel(executor.order_tracker)
+    channel_markets = []
+    bot.user_channel.start = lambda: channel_markets.extend(bot.user_channel.markets)
+    bot.user_channel.stop = lambda: None
+    
+    order = None
+    
+    async def scenario():
+        runner = asyncio.create_task(bot.run())
+        deadline = time.monotonic() + 5
+        while len(executor.executed_trades) < len(markets) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        # 用户频道线程推送的订单状态交给事件循环，在执行器锁内写入
+        executor.order_tracker.apply_updates = apply_pushed
+        nonlocal order
+        order = next(o for o in executor.order_tracker.orders.values() if o.venue == "polymarket")
+        message = {"event_type": "order", "type": "CANCELLATION", "id": order.order_id}
+        pusher = threading.Thread(target=bot.user_channel._on_message, args=(None, json.dumps([message])))
+        pusher.start()
+        pusher.join()
+        # 至少再刷新一次订单状态
+        await asyncio.sleep(0.1)
+        bot.stop()
+        await runner
+    asyncio.run(scenario())
+    
+    assert {order.market_id for order in executor.order_tracker.orders.values()} == {f"m{i}" for i in range(4)}
+    assert peak[0] == 1 and outside_lock == []
+    assert [name.startswith("arb-io") for name, order_id in pushed_threads if order_id == order.order_id] == [True]
+    assert order.status == "cancelled"
+    assert bot.stats["task_restarts"] == len(markets)
+    assert channel_markets == ["c0", "c1", "c2", "c3"]
+    assert poly.status_requests == 0 and opinion.status_requests > 0
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        test_order_fills_tied_to_trade_record,
+        test_batched_status_queries,
+        test_streaming_updates,
+        test_refresh_skips_pushed_venues,
+        test_polymarket_order_status_query,
+        test_unwind_retries_failed_leg,
+        test_unwind_hedges_then_flattens,
+        test_unwind_ladder_on_tick_grid,
+        test_unwind_time_budget,
+        test_complete_set_execution,
+        test_complete_set_sell_requires_holdings,
+        test_basket_execution,
+        test_opinion_quote_from_order_book,
+        test_compressed_conditional_book_fetch,
+        test_stale_opportunity_not_executed,
+        test_paper_price_time_priority,
+        test_paper_latency,
+        test_paper_executor_round_trip,
+        test_paper_throughput,
+        test_load_generator_over_http,
+        test_sampling_profiler_on_demand,
+        test_profiler_admin_endpoint,
+        test_position_ledger,
+        test_ledger_follows_executor_fills,
+        test_risk_gate_limits,
+        test_risk_gate_releases_closed_legs,
+        test_kill_signal_while_gate_locked,
+        test_risk_gate_latency,
+        test_batch_execution_groups_orders_per_venue,
+        test_execution_errors_release_reservations,
+        test_batch_execution_partial_failures,
+        test_state_restore_after_crash,
+        test_state_snapshot_compacts_journal,
+        test_state_snapshot_concurrent_update,
+        test_state_snapshot_during_fill_callback,
+        test_flight_recorder_ring_buffer,
+        test_flight_recorder_dumps_on_anomalies,
+        test_parallel_preflight,
+        test_endpoint_failover,
+        test_shared_store_seqlock,
+        test_sharded_worker_to_executor,
+        test_async_runtime_serializes_executor,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
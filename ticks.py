@@ -0,0 +1,167 @@
+"""
+定点整数价格 / 数量表示
+
+价格统一用 1/PRICE_SCALE 为单位的整数表示（1.0 = 10000），每个市场的 tick_size
+也换算成同样的单位（0.01 = 100），因此跨平台价格可以直接用整数相加和比较，
+阈值判断不会出现浮点舍入误差。数量 / 金额使用 1e-6 精度（与 USDC 一致）。
+"""
+import heapq
+from typing import Union, Dict, List, Tuple, Iterable, NamedTuple, Optional
+
+PRICE_DECIMALS = 4
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+ONE = PRICE_SCALE  # 价格 1.0
+
+SIZE_DECIMALS = 6
+SIZE_SCALE = 10 ** SIZE_DECIMALS
+
+DEFAULT_TICK_SIZE = "0.01"
+
+Number = Union[str, bytes, int, float]
+
+
+def parse_fixed(value: Number, decimals: int) -> int:
+    """
+    把十进制数解析为定点整数
+    
+    字符串 / bytes 按数字逐位解析，不经过 float；多余的小数位四舍五入
+    
+    Args:
+        value: 数值，例如 b"0.485"、"12.5"、0.485
+        decimals: 小数位数
+    
+    Returns:
+        value * 10**decimals 对应的整数
+    """
+    scale = 10 ** decimals
+    if isinstance(value, int):
+        return value * scale
+    if isinstance(value, float):
+        return round(value * scale)
+    if isinstance(value, str):
+        value = value.encode()
+    
+    value = value.strip()
+    negative = value.startswith(b"-")
+    if negative or value.startswith(b"+"):
+        value = value[1:]
+    
+    whole, _, frac = value.partition(b".")
+    result = int(whole or b"0") * scale
+    if frac:
+        kept = frac[:decimals]
+        result += int(kept.ljust(decimals, b"0"))
+        if len(frac) > decimals and frac[decimals:decimals + 1] >= b"5":
+            result += 1
+    return -result if negative else result
+
+
+def price_to_ticks(value: Number) -> int:
+    """价格 -> 价格单位整数"""
+    return parse_fixed(value, PRICE_DECIMALS)
+
+
+def ticks_to_price(ticks: int) -> float:
+    """价格单位整数 -> 价格"""
+    return ticks / PRICE_SCALE
+
+
+def size_to_units(value: Number) -> int:
+    """数量 / 金额 -> 1e-6 精度整数"""
+    return parse_fixed(value, SIZE_DECIMALS)
+
+
+def units_to_size(units: int) -> float:
+    """1e-6 精度整数 -> 数量 / 金额"""
+    return units / SIZE_SCALE
+
+
+def tick_size_ticks(tick_size: Number = DEFAULT_TICK_SIZE) -> int:
+    """市场 tick_size 换算为价格单位，例如 0.01 -> 100"""
+    ticks = price_to_ticks(tick_size)
+    if ticks <= 0:
+        raise ValueError(f"无效的 tick_size: {tick_size}")
+    return ticks
+
+
+def round_down_to_tick(ticks: int, tick: int) -> int:
+    """向下取整到 tick 网格"""
+    return ticks - ticks % tick
+
+
+def round_up_to_tick(ticks: int, tick: int) -> int:
+    """向上取整到 tick 网格"""
+    return -((-ticks) // tick) * tick
+
+
+def _level_fields(level) -> Tuple[Number, Number]:
+    """取出档位的 (price, size)，兼容 [price, size] 和 {"price": ..., "size": ...}"""
+    if isinstance(level, dict):
+        return level.get("price", 0), level.get("size", 0)
+    return level[0], level[1] if len(level) > 1 else 0
+
+
+def parse_levels(levels: Iterable, depth: int = None) -> List[Tuple[int, int]]:
+    """
+    解析订单簿档位
+    
+    Args:
+        levels: [[price, size], ...] 或 [{"price": ..., "size": ...}, ...]
+        depth: 只解析前 depth 档，默认全部
+    
+    Returns:
+        [(price_ticks, size_units), ...]
+    """
+    parsed = []
+    for level in levels:
+        if depth is not None and len(parsed) >= depth:
+            break
+        price, size = _level_fields(level)
+        parsed.append((price_to_ticks(price), size_to_units(size)))
+    return parsed
+
+
+def _best_levels(levels: List, depth: int, highest: bool) -> List[Tuple[int, int]]:
+    """只解析全部价格，选出最优的 depth 档后再解析这些档位的数量"""
+    priced = [(price_to_ticks(_level_fields(level)[0]), i) for i, level in enumerate(levels)]
+    best = heapq.nlargest(depth, priced) if highest else heapq.nsmallest(depth, priced)
+    return [(price, size_to_units(_level_fields(levels[i])[1])) for price, i in best]
+
+
+def parse_book(orderbook: Dict, depth: int = None) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    解析完整订单簿，按最优价格排序
+    
+    接口返回的档位顺序不保证最优在前，因此指定 depth 时先按价格选出最优的 depth 档，
+    其余档位的数量不再解析
+    
+    Args:
+        orderbook: {"bids": [...], "asks": [...]}
+        depth: 每边保留的档位数，默认全部
+    
+    Returns:
+        {"bids": 价格从高到低, "asks": 价格从低到高}，元素为 (price_ticks, size_units)
+    """
+    bids, asks = orderbook.get("bids") or [], orderbook.get("asks") or []
+    if depth is None:
+        return {"bids": sorted(parse_levels(bids), reverse=True), "asks": sorted(parse_levels(asks))}
+    return {"bids": _best_levels(bids, depth, True), "asks": _best_levels(asks, depth, False)}
+
+
+class Quote(NamedTuple):
+    """
+    双边报价（整数价格单位 / 数量单位）
+    
+    买入按 ask 成交，卖出按 bid 成交；缺失的一边为 None
+    """
+    bid: Optional[int]
+    bid_size: Optional[int]
+    ask: Optional[int]
+    ask_size: Optional[int]
+
+
+def quote_from_book(book: Dict[str, List[Tuple[int, int]]]) -> Quote:
+    """从 parse_book 的结果取最优买价 / 卖价及数量"""
+    bid = book["bids"][0] if book.get("bids") else (None, None)
+    ask = book["asks"][0] if book.get("asks") else (None, None)
+    return Quote(bid[0], bid[1], ask[0], ask[1])
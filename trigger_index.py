@@ -0,0 +1,142 @@
+"""
+套利触发价索引
+
+每个市场的每个策略由一条 Polymarket 腿和一条 Opinion.trade 腿组成，另一条腿的价格
+决定了这条腿的触发价:
+    腿A + 腿B <= TRIGGER_LIMIT  <=>  腿A <= TRIGGER_LIMIT - 腿B
+TRIGGER_LIMIT 同时满足 total_cost < ARBITRAGE_MAX_SUM_PRICE 和 利润 >= MIN_PROFIT_MARGIN。
+
+索引保存每个策略的余量（TRIGGER_LIMIT - 总成本，即触发价与当前价格之差），
+并为每个策略维护当前余量非负（处于触发区间）的市场集合。单条腿的价格更新只重新计算
+该市场这一个策略的余量，O(1)；是否跨越触发价由余量的符号变化直接得到，不需要对其他市场重新计算。
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple, Hashable
+from arbitrage_detector import MAX_SUM_TICKS, MIN_PROFIT_TICKS, STRATEGIES
+from ticks import ONE
+
+# 总成本不超过该值时满足两个阈值（与 detect_arbitrage_ticks 的判断一致）
+TRIGGER_LIMIT = min(MAX_SUM_TICKS - 1, ONE - MIN_PROFIT_TICKS)
+
+# 每个策略的两条腿，顺序与 arbitrage_detector.STRATEGIES 一致
+# opinion_down 为买入 Opinion.trade DOWN 的价格（1 - UP bid），opinion_up 为 UP ask
+STRATEGY_LEGS = (
+    ("polymarket_up", "opinion_down"),
+    ("polymarket_down", "opinion_up"),
+)
+
+# 腿 -> (策略序号, 另一条腿)
+LEG_STRATEGY = {
+    leg: (index, legs[1 - position])
+    for index, legs in enumerate(STRATEGY_LEGS)
+    for position, leg in enumerate(legs)
+}
+
+
+class TriggerIndex:
+    """套利触发价索引"""
+    
+    def __init__(self):
+        # market -> {腿: 价格}
+        self._prices: Dict[Hashable, Dict[str, int]] = {}
+        # (market, 策略) -> 余量；两条腿都有价格时才存在
+        self._margins: Dict[Tuple[Hashable, int], int] = {}
+        # 每个策略处于触发区间的市场（dict 作为保持插入顺序的集合）
+        self._armed: List[Dict[Hashable, None]] = [{} for _ in STRATEGIES]
+    
+    def __len__(self) -> int:
+        return len(self._margins)
+    
+    def update(self, market: Hashable, leg: str, price_ticks: Optional[int]) -> List[int]:
+        """
+        更新一条腿的价格
+        
+        Args:
+            market: 市场标识（可哈希）
+            leg: STRATEGY_LEGS 中的腿名
+            price_ticks: 价格（整数价格单位），None 表示没有报价
+        
+        Returns:
+            本次更新后新进入触发区间的策略序号（之前未触发）
+        """
+        prices = self._prices.setdefault(market, {})
+        if price_ticks is None:
+            prices.pop(leg, None)
+        else:
+            prices[leg] = price_ticks
+        
+        strategy, other_leg = LEG_STRATEGY[leg]
+        key = (market, strategy)
+        armed = self._armed[strategy]
+        old_margin = self._margins.pop(key, None)
+        
+        other = prices.get(other_leg)
+        if price_ticks is None or other is None:
+            armed.pop(market, None)
+            return []
+        margin = TRIGGER_LIMIT - price_ticks - other
+        self._margins[key] = margin
+        if margin < 0:
+            armed.pop(market, None)
+            return []
+        armed[market] = None
+        return [strategy] if old_margin is None or old_margin < 0 else []
+    
+    def update_market(self, market: Hashable, poly_up: Optional[int], poly_down: Optional[int],
+                      opinion: Optional[int], opinion_bid: Optional[int] = None) -> List[int]:
+        """
+        用一组完整报价更新市场（只有变化的腿会重新计算余量）
+        
+        Args:
+            market: 市场标识
+            poly_up: Polymarket UP ask
+            poly_down: Polymarket DOWN ask
+            opinion: Opinion.trade UP ask
+            opinion_bid: Opinion.trade UP bid，默认与 opinion 相同
+        
+        Returns:
+            当前处于触发区间的策略序号
+        """
+        if opinion_bid is None:
+            opinion_bid = opinion
+        legs = {
+            "polymarket_up": poly_up,
+            "polymarket_down": poly_down,
+            "opinion_up": opinion,
+            "opinion_down": None if opinion_bid is None else ONE - opinion_bid,
+        }
+        prices = self._prices.get(market, {})
+        for leg, price in legs.items():
+            if prices.get(leg) != price:
+                self.update(market, leg, price)
+        return self.armed(market)
+    
+    def armed(self, market: Hashable) -> List[int]:
+        """市场当前处于触发区间的策略序号"""
+        return [strategy for strategy, armed in enumerate(self._armed) if market in armed]
+    
+    def triggered(self, strategy: int) -> List[Hashable]:
+        """某策略当前处于触发区间的所有市场，O(k)"""
+        return list(self._armed[strategy])
+    
+    def nearest(self, strategy: int, count: int = 10) -> List[Tuple[int, Hashable]]:
+        """某策略最接近触发（余量最大）的 count 个市场: [(余量, market), ...]，O(n)，仅用于诊断"""
+        return heapq.nlargest(count, ((margin, market) for (market, index), margin in self._margins.items()
+                                      if index == strategy), key=lambda entry: entry[0])
+    
+    def trigger_price(self, market: Hashable, leg: str) -> Optional[int]:
+        """
+        某条腿的触发价: 价格不高于该值时所在策略满足阈值
+        
+        Returns:
+            触发价（整数价格单位），另一条腿没有报价时返回 None
+        """
+        _, other_leg = LEG_STRATEGY[leg]
+        other = self._prices.get(market, {}).get(other_leg)
+        return None if other is None else TRIGGER_LIMIT - other
+    
+    def remove(self, market: Hashable):
+        """移除市场的所有条目"""
+        for leg in list(self._prices.get(market, {})):
+            self.update(market, leg, None)
+        self._prices.pop(market, None)
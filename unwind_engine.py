@@ -0,0 +1,166 @@
+"""
+单腿风险处理
+
+一条腿已成交、另一条腿失败时，在限定时间内依次尝试：
+1. 以更差的价格重试失败的腿
+2. 在已成交的平台上买入相反结果对冲（组成完整的 UP + DOWN）
+3. 卖出已成交的腿平仓
+每一步都记录耗时，超出时间预算后停止并报警。
+每个下单和对冲价格请求都以剩余预算作为超时，单个慢请求不会让处理超出预算。
+价格阶梯按整数价格单位计算: 从已提交腿取整后的限价出发，每步让出 price_step 向上取整到该平台的 tick，
+所有重试 / 对冲 / 平仓价格都在平台的 tick 网格上。
+"""
+import time
+import logging
+from typing import Optional, Dict, List
+from config import Config
+from sizing import leg_rules, LegRules
+from ticks import ONE, price_to_ticks, ticks_to_price
+
+logger = logging.getLogger(__name__)
+
+OPPOSITE_SIDE = {"UP": "DOWN", "DOWN": "UP", "YES": "NO", "NO": "YES"}
+
+
+class UnwindEngine:
+    """单腿风险处理引擎"""
+    
+    def __init__(self, polymarket, opinion_trade, time_budget: float = None,
+                 price_step: float = None, max_attempts: int = None, max_loss: float = None):
+        """
+        Args:
+            polymarket: Polymarket 客户端
+            opinion_trade: Opinion.trade 客户端
+            time_budget: 整个处理流程的时间预算（秒）
+            price_step: 每次重试让出的价格
+            max_attempts: 每种方式的最多尝试次数
+            max_loss: 允许的最大每份亏损（重试 / 对冲后总成本最多为 1 + max_loss）
+        """
+        self.polymarket = polymarket
+        self.opinion_trade = opinion_trade
+        self.time_budget = Config.UNWIND_TIME_BUDGET if time_budget is None else time_budget
+        self.price_step = Config.UNWIND_PRICE_STEP if price_step is None else price_step
+        self.max_attempts = Config.UNWIND_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.max_loss = Config.UNWIND_MAX_LOSS if max_loss is None else max_loss
+    
+    def _step_ticks(self, rules: LegRules) -> int:
+        """每步让出的价格（价格单位），向上取整到平台 tick 的整数倍"""
+        step = price_to_ticks(self.price_step)
+        return max(rules.tick, -(-step // rules.tick) * rules.tick)
+    
+    def unwind(self, opportunity: Dict, poly_size: float, opinion_size: float,
+               poly_ticks: int = None, opinion_ticks: int = None) -> Dict:
+        """
+        处理 Polymarket 已成交、Opinion.trade 失败的单腿风险
+        
+        Args:
+            opportunity: 原套利机会
+            poly_size: Polymarket 已成交的数量
+            opinion_size: Opinion.trade 未成交的数量
+            poly_ticks: Polymarket 腿提交的限价（价格单位，已按 tick 取整），默认取自机会
+            opinion_ticks: Opinion.trade 腿提交的限价（价格单位，已按 tick 取整），默认取自机会
+        
+        Returns:
+            处理报告: resolved / action / order_id / steps / elapsed_ms
+        """
+        started = time.perf_counter()
+        deadline = started + self.time_budget
+        steps: List[Dict] = []
+        poly_rules = leg_rules("polymarket", opportunity.get("tick_size"))
+        poly_step, opinion_step = self._step_ticks(poly_rules), self._step_ticks(leg_rules("opinion"))
+        if poly_ticks is None:
+            poly_ticks = opportunity.get("poly_price_ticks") or price_to_ticks(opportunity["poly_price"])
+        if opinion_ticks is None:
+            opinion_ticks = opportunity.get("opinion_price_ticks") or price_to_ticks(opportunity["opinion_price"])
+        max_cost = ONE + price_to_ticks(self.max_loss)
+        
+        def remaining() -> float:
+            return deadline - time.perf_counter()
+        
+        def run_step(name: str, price: float, place) -> Optional[str]:
+            step_started = time.perf_counter()
+            try:
+                order_id = place(price, remaining())
+            except Exception as e:
+                logger.error(f"单腿处理步骤 {name} 异常: {e}")
+                order_id = None
+            elapsed_ms = (time.perf_counter() - step_started) * 1000
+            steps.append({"step": name, "price": price, "success": bool(order_id), "elapsed_ms": elapsed_ms})
+            logger.info(f"单腿处理 {name} @ {price:.4f}: {'成功' if order_id else '失败'} ({elapsed_ms:.1f} ms)")
+            return order_id
+        
+        def report(action: Optional[str], order_id: Optional[str]) -> Dict:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            result = {
+                "resolved": action is not None,
+                "action": action,
+                "order_id": order_id,
+                "steps": steps,
+                "elapsed_ms": elapsed_ms,
+            }
+            if action:
+                logger.info(f"单腿风险已处理: {action}, 共 {len(steps)} 步, 耗时 {elapsed_ms:.1f} ms")
+            else:
+                logger.critical(f"单腿风险未能在 {self.time_budget} 秒内处理，"
+                                f"Polymarket {opportunity['poly_side']} 仓位裸露: {poly_size}")
+            return result
+        
+        # 1. 以更差的价格重试 Opinion.trade
+        for attempt in range(1, self.max_attempts + 1):
+            price_ticks = opinion_ticks + attempt * opinion_step
+            if remaining() <= 0 or poly_ticks + price_ticks > max_cost:
+                break
+            order_id = run_step("retry", ticks_to_price(price_ticks), lambda p, timeout: self.opinion_trade.place_order(
+                topic_id=opportunity.get("opinion_topic_id", "4866"),
+                side=opportunity["opinion_side"],
+                amount=opinion_size,
+                price=p,
+                timeout=timeout
+            ))
+            if order_id:
+                return report("retry", order_id)
+        
+        # 2. 在 Polymarket 买入相反结果对冲
+        hedge_token_id = opportunity.get("poly_hedge_token_id")
+        hedge_price = None
+        if hedge_token_id and remaining() > 0:
+            try:
+                hedge_price = self.polymarket.get_best_price_from_token_id(hedge_token_id, timeout=remaining())
+            except Exception as e:
+                logger.error(f"单腿处理获取对冲价格异常: {e}")
+        if hedge_price is not None:
+            # 订单簿价格本身在 tick 网格上
+            hedge_ticks = price_to_ticks(hedge_price)
+            for attempt in range(self.max_attempts):
+                price_ticks = hedge_ticks + attempt * poly_step
+                if remaining() <= 0 or poly_ticks + price_ticks > max_cost:
+                    break
+                order_id = run_step("hedge", ticks_to_price(price_ticks), lambda p, timeout: self.polymarket.place_order(
+                    condition_id=opportunity.get("condition_id", "condition_id_here"),
+                    outcome=OPPOSITE_SIDE.get(opportunity["poly_side"], opportunity["poly_side"]),
+                    size=poly_size,
+                    price=p,
+                    token_id=hedge_token_id,
+                    timeout=timeout
+                ))
+                if order_id:
+                    return report("hedge", order_id)
+        
+        # 3. 卖出 Polymarket 已成交的腿
+        for attempt in range(1, self.max_attempts + 1):
+            price_ticks = max(poly_rules.tick, poly_ticks - attempt * poly_step)
+            if remaining() <= 0:
+                break
+            order_id = run_step("flatten", ticks_to_price(price_ticks), lambda p, timeout: self.polymarket.place_order(
+                condition_id=opportunity.get("condition_id", "condition_id_here"),
+                outcome=opportunity["poly_side"],
+                size=poly_size,
+                price=p,
+                side="SELL",
+                token_id=opportunity.get("poly_token_id"),
+                timeout=timeout
+            ))
+            if order_id:
+                return report("flatten", order_id)
+        
+        return report(None, None)